@@ -0,0 +1,120 @@
+"""
+Controller for asynchronous PII jobs.
+
+POST /jobs accepts the same form as /handle-pii (plus an optional
+callback_url), persists the upload and returns a job id straight away.
+GET /jobs/{job_id} reports status and, once finished, the result.
+"""
+from fastapi import APIRouter, UploadFile, File, Form
+from typing import Dict, Optional
+import threading
+import logging
+
+from utility.exceptions import PIIException, InvalidInputTypeException
+from services.JobService import JobService, job_to_dict, validate_callback_url
+from controllers.PIIController import (
+    SUPPORTED_INPUT_TYPES,
+    process_pii_request,
+    _resolve_input_type,
+    _validate_input_ids,
+    _validate_file_size,
+    _success,
+    _error,
+)
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+async def _run_job(repo, job, document: UploadFile) -> Dict:
+    """JobService runner: the /handle-pii pipeline for one persisted upload."""
+    return await process_pii_request(
+        repo=repo,
+        resolved_type=job.input_type,
+        document=document,
+        assessment_id=job.assessment_id,
+        prospect_id=job.prospect_id,
+        caller_name=job.caller_name,
+        company_name=job.company_name,
+        company_website=job.company_website,
+        request_id=job.job_id,
+        created_by=job.created_by or "system",
+    )
+
+
+_job_service: Optional[JobService] = None
+_job_service_lock = threading.Lock()
+
+
+def get_job_service() -> JobService:
+    """Return the process-wide job service, creating it on first use."""
+    global _job_service
+    if _job_service is None:
+        with _job_service_lock:
+            if _job_service is None:
+                _job_service = JobService(runner=_run_job)
+    return _job_service
+
+
+# ============================================================
+# POST /jobs
+# ============================================================
+@router.post("/jobs")
+async def submit_job(
+    assessment_id: str = Form(...),
+    prospect_id: str = Form(...),
+    caller_name: str = Form(...),
+    input_type: Optional[str] = Form(None),
+    company_name: Optional[str] = Form(None),
+    company_website: Optional[str] = Form(None),
+    callback_url: Optional[str] = Form(None),
+    document: UploadFile = File(...),
+) -> Dict:
+    job_id = None
+    try:
+        resolved_type = _resolve_input_type(input_type, document.filename or "")
+        if resolved_type not in SUPPORTED_INPUT_TYPES:
+            raise InvalidInputTypeException(
+                f"Unsupported type: {resolved_type}. Allowed: {', '.join(SUPPORTED_INPUT_TYPES)}"
+            )
+        _validate_input_ids(assessment_id, prospect_id, caller_name)
+        _validate_file_size(document)
+        if callback_url:
+            validate_callback_url(callback_url)
+
+        job = await get_job_service().submit(
+            document=document,
+            assessment_id=assessment_id,
+            prospect_id=prospect_id,
+            caller_name=caller_name,
+            input_type=resolved_type,
+            company_name=company_name,
+            company_website=company_website,
+            callback_url=callback_url or None,
+        )
+        job_id = job.job_id
+        data = job_to_dict(job)
+        data["status_url"] = f"/v1/jobs/{job_id}"
+        return _success(data, f"{resolved_type.upper()} job accepted")
+
+    except PIIException as e:
+        logger.error(f"[{job_id}] {e}")
+        return _error(e, job_id)
+    except Exception as e:
+        logger.error(f"[{job_id}] Unexpected: {e}", exc_info=True)
+        return _error(PIIException(str(e), 500), job_id)
+
+
+# ============================================================
+# GET /jobs/{job_id}
+# ============================================================
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str) -> Dict:
+    try:
+        job = get_job_service().get_job(job_id)
+        return _success(job_to_dict(job), f"Job {job.status}")
+    except PIIException as e:
+        return _error(e, job_id)
+    except Exception as e:
+        logger.error(f"[{job_id}] Unexpected: {e}", exc_info=True)
+        return _error(PIIException(str(e), 500), job_id)
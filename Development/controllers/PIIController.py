@@ -4,13 +4,15 @@ Accepts documents in multiple formats, detects country via Tavily,
 applies country-specific PII detection, masks content, and returns
 the masked file renamed as <original_name>_masked.<ext>.
 """
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
+import asyncio
+import json
 import uuid
-import os
+import time
 import logging
 
 from utility.database import get_db_session
@@ -24,9 +26,14 @@ from utility.country_pii_config import DEFAULT_COUNTRY, SUPPORTED_COUNTRIES
 from repository.PIIRepository import PIIRepository
 from repository.CSVRepository import CSVRepository
 from utility.storage_config import is_csv_mode
-from utility.PresidioUtility import PresidioUtility
-from utility.TavilyCountrySearch import TavilyCountrySearch
-
+from utility.ExecutionPool import get_execution_pool
+from utility.DocumentIngestion import MAX_FILE_SIZE_MB, expand_batch_uploads
+from utility.TavilyCountrySearch import get_tavily_country_search
+from utility.OfflineCountryResolver import get_offline_country_resolver, OFFLINE_COUNTRY_RESOLVER_ENABLED
+from utility.CountryCache import get_country_cache, cache_key, STATUS_FOUND, STATUS_NOT_FOUND
+
+from services.BaseService import BaseService
+from services.BatchService import BatchService, input_type_of
 from services.PDFService import PDFService
 from services.DOCService import DOCService
 from services.DOCXService import DOCXService
@@ -37,18 +44,19 @@ from services.JSONService import JSONService
 from services.TavilyService import TavilyService
 from services.ImageService import ImageService
 from services.UnmaskService import UnmaskService
+from services.RecordStreamService import RecordStreamResponse, RecordStreamService
+from services.ConversationService import ConversationService
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 SUPPORTED_INPUT_TYPES = [
-    "pdf", "doc", "docx", "txt", "csv", "xlsx", "json",
+    "pdf", "doc", "docx", "txt", "csv", "xlsx", "json", "ndjson", "jsonl",
     "tavily", "png", "jpg", "jpeg", "tiff", "bmp",
 ]
-MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "50"))
 
 
-from utility.helpers import generate_request_id  # noqa: E402 – avoid circular imports
+from utility.helpers import generate_request_id, generate_batch_id  # noqa: E402 – avoid circular imports
 
 
 def _get_repository(db_session=None):
@@ -67,38 +75,96 @@ def _get_repository(db_session=None):
         return PIIRepository(db_session)
 
 
-def _detect_country(
+async def _detect_country(
     company_name: Optional[str],
     company_website: Optional[str],
     request_id: str,
 ) -> str:
-    """Use Tavily to resolve company -> country. Falls back to US."""
+    """
+    Resolve company -> country. Falls back to US.
+
+    The bundled gazetteer and the website's ccTLD are tried first; only the
+    rest goes to Tavily, through the country cache and on the event loop.
+    """
+    if not company_name and not company_website:
+        logger.info(f"[{request_id}] No company_name provided, defaulting to {DEFAULT_COUNTRY}")
+        return DEFAULT_COUNTRY
+
+    if OFFLINE_COUNTRY_RESOLVER_ENABLED:
+        match = get_offline_country_resolver().resolve(company_name, company_website)
+        if match:
+            logger.info(f"[{request_id}] Country detected: {match.country} ({match.source})")
+            return match.country
     if not company_name:
         logger.info(f"[{request_id}] No company_name provided, defaulting to {DEFAULT_COUNTRY}")
         return DEFAULT_COUNTRY
-    try:
-        tavily = TavilyCountrySearch()
-        ctx = company_website if company_website else None
-        result = tavily.search_prospect_country(company_name, ctx)
+
+    async def lookup():
+        result = await get_tavily_country_search().lookup_country_async(company_name, company_website or None)
         if result.matched_from_list and result.country:
-            logger.info(f"[{request_id}] Country detected: {result.country}")
-            return result.country
-    except Exception as e:
-        logger.error(f"[{request_id}] Tavily country detection error: {e}")
-    logger.info(f"[{request_id}] Defaulting to {DEFAULT_COUNTRY}")
+            return result.country, STATUS_FOUND
+        return None, STATUS_NOT_FOUND
+
+    outcome = await get_country_cache().resolve_async(cache_key(company_name, company_website), lookup)
+    if outcome.status == STATUS_FOUND:
+        logger.info(f"[{request_id}] Country detected: {outcome.country} ({outcome.source})")
+        return outcome.country
+    logger.info(f"[{request_id}] Defaulting to {DEFAULT_COUNTRY} ({outcome.status}, {outcome.source})")
     return DEFAULT_COUNTRY
 
 
+class _CountryDetection:
+    """
+    Country detection started in the background.
+
+    ``task`` resolves to the country and is handed to the services while
+    still pending, so detection overlaps ingestion and text extraction;
+    ``elapsed_ms`` is set once it finishes.
+    """
+
+    def __init__(self, company_name: Optional[str], company_website: Optional[str], request_id: str):
+        self.elapsed_ms: Optional[int] = None
+        self.task = asyncio.create_task(self._run(company_name, company_website, request_id))
+
+    async def _run(self, company_name, company_website, request_id) -> str:
+        start = time.perf_counter()
+        try:
+            return await _detect_country(company_name, company_website, request_id)
+        finally:
+            self.elapsed_ms = int((time.perf_counter() - start) * 1000)
+
+    def cancel(self) -> None:
+        if not self.task.done():
+            self.task.cancel()
+
+    def timings(self, country_wait_ms: int) -> Dict:
+        """
+        country_ms: how long detection took
+        country_wait_ms: how long the pipeline sat waiting for it
+        overlap_saved_ms: wall-clock time saved versus detecting first
+        """
+        country_ms = self.elapsed_ms or 0
+        return {
+            "country_ms": country_ms,
+            "country_wait_ms": country_wait_ms,
+            "overlap_saved_ms": max(0, country_ms - country_wait_ms),
+        }
+
+
 def _resolve_input_type(input_type: Optional[str], filename: str) -> str:
     """Resolve input_type from explicit param or file extension."""
     if input_type:
         return input_type.lower().strip()
-    ext = os.path.splitext(filename)[1].lstrip(".").lower()
-    return ext if ext else "txt"
+    return input_type_of(filename)
 
 
 def _validate_file_size(document: UploadFile) -> None:
-    """Validate uploaded file doesn't exceed size limit."""
+    """
+    Validate uploaded file doesn't exceed size limit.
+
+    Oversized bodies are normally rejected while streaming by
+    UploadSizeLimitMiddleware; this covers the file part on its own.
+    """
     document.file.seek(0, 2)
     size_mb = document.file.tell() / (1024 * 1024)
     document.file.seek(0)
@@ -118,6 +184,8 @@ def _route_to_service(input_type: str, repo, presidio):
         "csv": lambda: CSVService(repo, presidio),
         "xlsx": lambda: XLSXService(repo, presidio),
         "json": lambda: JSONService(repo, presidio),
+        "ndjson": lambda: JSONService(repo, presidio),
+        "jsonl": lambda: JSONService(repo, presidio),
         "tavily": lambda: TavilyService(repo, presidio),
     }
     # Image types
@@ -129,11 +197,65 @@ def _route_to_service(input_type: str, repo, presidio):
     return factory()
 
 
+async def process_pii_request(
+    repo,
+    resolved_type: str,
+    document: UploadFile,
+    assessment_id: str,
+    prospect_id: str,
+    caller_name: str,
+    company_name: Optional[str],
+    company_website: Optional[str],
+    request_id: str,
+    created_by: str = "system",
+) -> Dict:
+    """
+    Detect the country, check the assessment and run the document pipeline.
+
+    Country detection runs concurrently with the assessment check and text
+    extraction; only the cache lookup and NER wait for it.
+
+    Shared by /handle-pii and the background workers behind /jobs.
+
+    Returns:
+        The service result plus the detected ``country`` and ``timings``
+    """
+    executor = get_execution_pool()
+    detection = _CountryDetection(company_name, company_website, request_id)
+    try:
+        # Skip assessment validation in CSV mode
+        if not is_csv_mode():
+            await executor.run_blocking(repo.verify_assessment_exists, assessment_id)
+
+        kwargs = dict(
+            assessment_id=assessment_id,
+            prospect_id=prospect_id,
+            caller_name=caller_name,
+            document=document,
+            country=detection.task,
+            created_by=created_by,
+        )
+        # No engine of its own: the service borrows one from the pool for the
+        # Presidio stages only (worker processes own theirs)
+        service = _route_to_service(resolved_type, repo, None)
+        result = await service.process_document_async(executor, **kwargs)
+    finally:
+        detection.cancel()
+
+    result["timings"] = detection.timings(result["country_wait_ms"])
+    logger.info(
+        f"[{request_id}] Country detection took {result['timings']['country_ms']}ms, "
+        f"pipeline waited {result['country_wait_ms']}ms "
+        f"({result['timings']['overlap_saved_ms']}ms saved by overlapping)"
+    )
+    return result
+
+
 # ============================================================
 # POST /handle-pii
 # ============================================================
 @router.post("/handle-pii")
-def handle_pii(
+async def handle_pii(
     assessment_id: str = Form(...),
     prospect_id: str = Form(...),
     caller_name: str = Form(...),
@@ -155,26 +277,21 @@ def handle_pii(
         _validate_input_ids(assessment_id, prospect_id, caller_name)
         _validate_file_size(document)
 
-        # Detect country
-        country = _detect_country(company_name, company_website, request_id)
-
         # Init repository based on storage mode
         repo = _get_repository(db)
-        presidio = PresidioUtility()
-        
-        # Skip assessment validation in CSV mode
-        if not is_csv_mode():
-            repo.verify_assessment_exists(assessment_id)
 
-        service = _route_to_service(resolved_type, repo, presidio)
-        result = service.process_document(
+        result = await process_pii_request(
+            repo=repo,
+            resolved_type=resolved_type,
+            document=document,
             assessment_id=assessment_id,
             prospect_id=prospect_id,
             caller_name=caller_name,
-            document=document,
-            country=country,
-            created_by="system",
+            company_name=company_name,
+            company_website=company_website,
+            request_id=request_id,
         )
+        country = result["country"]
 
         ms = int((datetime.now() - start).total_seconds() * 1000)
         logger.info(f"[{request_id}] Done in {ms}ms")
@@ -183,8 +300,10 @@ def handle_pii(
             "request_id": result["request_id"],
             "processed_document": result["processed_document"],
             "entities_detected": result.get("entities_detected", 0),
+            "cache_hit": result.get("cache_hit", False),
             "country": country,
             "processing_time_ms": ms,
+            "timings": result["timings"],
         }, f"{resolved_type.upper()} processed successfully")
 
     except PIIException as e:
@@ -195,6 +314,218 @@ def handle_pii(
         return _error(PIIException(str(e), 500), request_id)
 
 
+# ============================================================
+# POST /handle-pii/batch
+# ============================================================
+@router.post("/handle-pii/batch")
+async def handle_pii_batch(
+    assessment_id: str = Form(...),
+    prospect_id: str = Form(...),
+    caller_name: str = Form(...),
+    company_name: Optional[str] = Form(None),
+    company_website: Optional[str] = Form(None),
+    documents: List[UploadFile] = File(...),
+    db: Session = Depends(get_db_session),
+) -> Dict:
+    """
+    Mask many documents (or the members of .zip uploads) for one assessment.
+
+    Country detection, repository setup and the assessment check run once;
+    detection starts first and overlaps zip expansion and extraction.
+    Documents then go through the pipeline concurrently, BATCH_CONCURRENCY at
+    a time, so one document's I/O overlaps another's CPU stages. Successful
+    documents are saved in one repository transaction; the manifest lists
+    every document with its outcome.
+    """
+    batch_id = generate_batch_id()
+    start = datetime.now()
+    executor = get_execution_pool()
+    files: List[UploadFile] = []
+    detection: Optional[_CountryDetection] = None
+    try:
+        _validate_input_ids(assessment_id, prospect_id, caller_name)
+        detection = _CountryDetection(company_name, company_website, batch_id)
+        files = await executor.run_blocking(expand_batch_uploads, documents)
+
+        repo = _get_repository(db)
+        if not is_csv_mode():
+            await executor.run_blocking(repo.verify_assessment_exists, assessment_id)
+
+        batch = BatchService(repo, executor, _route_to_service, batch_id, _validate_batch_document)
+        manifest, results = await batch.run(files, detection.task)
+        country = await detection.task
+        await executor.run_blocking(batch.save, results, assessment_id, prospect_id, caller_name)
+
+        ms = int((datetime.now() - start).total_seconds() * 1000)
+        logger.info(f"[{batch_id}] {len(results)}/{len(manifest)} documents done in {ms}ms")
+        # The first document to reach NER bounds what overlapping saved
+        timings = detection.timings(min((r["country_wait_ms"] for r in results), default=0))
+
+        return _success({
+            "batch_id": batch_id,
+            "country": country,
+            "documents": manifest,
+            "succeeded": len(results),
+            "failed": len(manifest) - len(results),
+            "processing_time_ms": ms,
+            "timings": timings,
+        }, f"Batch processed: {len(results)} of {len(manifest)} documents")
+
+    except PIIException as e:
+        logger.error(f"[{batch_id}] {e}")
+        return _error(e, batch_id)
+    except Exception as e:
+        logger.error(f"[{batch_id}] Unexpected: {e}", exc_info=True)
+        return _error(PIIException(str(e), 500), batch_id)
+    finally:
+        if detection is not None:
+            detection.cancel()
+        # Close the spooled members extracted from zip uploads
+        for f in files:
+            if f not in documents:
+                f.file.close()
+
+
+def _validate_batch_document(document: UploadFile, input_type: str) -> None:
+    """Reject a batch document of an unsupported type or over the size limit."""
+    if input_type not in SUPPORTED_INPUT_TYPES:
+        raise InvalidInputTypeException(f"Unsupported type: {input_type}")
+    _validate_file_size(document)
+
+
+# ============================================================
+# POST /records:stream
+# ============================================================
+@router.post("/records:stream")
+async def stream_records(
+    request: Request,
+    assessment_id: str,
+    prospect_id: str,
+    caller_name: str,
+    company_name: Optional[str] = None,
+    company_website: Optional[str] = None,
+    db: Session = Depends(get_db_session),
+):
+    """
+    Mask a chunked NDJSON body record by record, streaming masked NDJSON back.
+
+    The ids come as query parameters since the body is the records. Country
+    detection and the assessment check run once, before the first record;
+    the whole stream shares one mapping, saved as a single row under the
+    request id returned in the X-Request-ID header.
+    """
+    executor = get_execution_pool()
+    try:
+        _validate_input_ids(assessment_id, prospect_id, caller_name)
+        repo = _get_repository(db)
+        if not is_csv_mode():
+            await executor.run_blocking(repo.verify_assessment_exists, assessment_id)
+        country = await _detect_country(company_name, company_website, "records:stream")
+    except PIIException as e:
+        logger.error(f"[records:stream] {e}")
+        return _error(e, "records:stream")
+    except Exception as e:
+        logger.error(f"[records:stream] Unexpected: {e}", exc_info=True)
+        return _error(PIIException(str(e), 500), "records:stream")
+
+    service = RecordStreamService(repo, executor, country)
+    request_id = service.request_id
+    logger.info(f"[{request_id}] Record stream started ({country})")
+
+    async def body():
+        try:
+            async for masked in service.mask_stream(request.stream()):
+                yield masked
+        except PIIException as e:
+            # Headers are sent: the error goes out as the last line
+            logger.error(f"[{request_id}] {e}")
+            yield (json.dumps(_error(e, request_id)) + "\n").encode("utf-8")
+        except Exception as e:
+            logger.error(f"[{request_id}] Unexpected: {e}", exc_info=True)
+            yield (json.dumps(_error(PIIException(str(e), 500), request_id)) + "\n").encode("utf-8")
+        finally:
+            # Records already sent need the mapping to be unmasked: save it
+            # even when the client went away (shielded from cancellation)
+            try:
+                await asyncio.shield(executor.run_blocking(
+                    service.save, assessment_id, prospect_id, caller_name
+                ))
+            except Exception as e:
+                logger.error(f"[{request_id}] Mapping not saved: {e}", exc_info=True)
+
+    return RecordStreamResponse(body(), headers={"X-Request-ID": request_id})
+
+
+# ============================================================
+# WebSocket /handle-pii/session
+# ============================================================
+@router.websocket("/handle-pii/session")
+async def pii_session(
+    websocket: WebSocket,
+    assessment_id: str,
+    prospect_id: str,
+    caller_name: str,
+    company_name: Optional[str] = None,
+    company_website: Optional[str] = None,
+    db: Session = Depends(get_db_session),
+):
+    """
+    Mask a conversation over one WebSocket: each text frame is a message,
+    answered with its masked text.
+
+    Country detection and the assessment check run once, when the session
+    opens; every message shares one mapping, saved as a single row under
+    the request id sent in the opening frame when the socket closes.
+    """
+    await websocket.accept()
+    executor = get_execution_pool()
+    try:
+        _validate_input_ids(assessment_id, prospect_id, caller_name)
+        repo = _get_repository(db)
+        if not is_csv_mode():
+            await executor.run_blocking(repo.verify_assessment_exists, assessment_id)
+        country = await _detect_country(company_name, company_website, "session")
+    except PIIException as e:
+        logger.error(f"[session] {e}")
+        await websocket.send_json(_error(e, "session"))
+        await websocket.close(code=1008)
+        return
+    except Exception as e:
+        logger.error(f"[session] Unexpected: {e}", exc_info=True)
+        await websocket.send_json(_error(PIIException(str(e), 500), "session"))
+        await websocket.close(code=1011)
+        return
+
+    session = ConversationService(repo, executor, country)
+    request_id = session.request_id
+    logger.info(f"[{request_id}] Session started ({country})")
+    try:
+        await websocket.send_json(_success({"request_id": request_id, "country": country}, "Session started"))
+        while True:
+            text = await websocket.receive_text()
+            start = time.perf_counter()
+            try:
+                data = await session.mask(text)
+            except PIIException as e:
+                logger.error(f"[{request_id}] {e}")
+                await websocket.send_json(_error(e, request_id))
+                continue
+            data["processing_time_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            await websocket.send_json(_success(data, "Message masked"))
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"[{request_id}] Unexpected: {e}", exc_info=True)
+        await websocket.close(code=1011)
+    finally:
+        try:
+            await asyncio.shield(executor.run_blocking(
+                session.save, assessment_id, prospect_id, caller_name
+            ))
+        except Exception as e:
+            logger.error(f"[{request_id}] Mapping not saved: {e}", exc_info=True)
+
+
 # ============================================================
 # POST /unmask-pii
 # ============================================================
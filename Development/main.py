@@ -7,8 +7,19 @@ load_dotenv()  # Load .env before anything else
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from controllers.PIIController import router as pii_router
+from controllers.JobController import router as job_router, get_job_service
 from utility.database import create_tables
 from utility.storage_config import is_csv_mode, init_csv_storage, get_csv_data_path
+from utility.PresidioEnginePool import get_engine_pool
+from utility.ExecutionPool import get_execution_pool
+from utility.PDFPagePool import get_pdf_page_pool
+from services.LibreOfficePool import get_libreoffice_pool, remove_profiles
+from services.RecordStreamService import RECORD_STREAM_MAX_MB
+from utility.ResultCache import get_result_cache
+from utility.ConversionCache import get_conversion_cache
+from utility.TavilyCountrySearch import close_tavily_country_search
+from utility.DocumentIngestion import UploadSizeLimitMiddleware, MAX_BATCH_SIZE_MB, max_request_bytes
+import asyncio
 import uvicorn
 import logging
 
@@ -28,6 +39,15 @@ app = FastAPI(
     version="2.0.0",
 )
 
+# Reject oversized uploads before they are spooled (added first so CORS wraps the 413)
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    path_limits={
+        "/v1/handle-pii/batch": max_request_bytes(MAX_BATCH_SIZE_MB),
+        "/v1/records:stream": max_request_bytes(RECORD_STREAM_MAX_MB),
+    },
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -37,10 +57,11 @@ app.add_middleware(
 )
 
 app.include_router(pii_router, prefix="/v1", tags=["PII Processing"])
+app.include_router(job_router, prefix="/v1", tags=["PII Jobs"])
 
 
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
     try:
         if is_csv_mode():
             # Initialize CSV storage
@@ -50,11 +71,35 @@ def startup_event():
             # Initialize database
             create_tables()
             logger.info("Application started in DATABASE mode")
+
+        # Build the Presidio engines once, before the first request.
+        # In process mode every worker owns its engine instead.
+        executor = get_execution_pool()
+        executor.start()
+        if not executor.is_process_mode:
+            get_engine_pool().start()
+            # Warm LibreOffice instances for DOC/DOCX conversions.
+            # In process mode each worker starts its own on first use.
+            await asyncio.to_thread(get_libreoffice_pool().start)
+
+        # Background workers for /v1/jobs
+        await get_job_service().start()
     except Exception as e:
         logger.error(f"Startup failed: {e}")
         raise
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await get_job_service().stop()
+    await close_tavily_country_search()
+    get_engine_pool().stop()
+    get_execution_pool().stop()
+    get_pdf_page_pool().stop()
+    get_libreoffice_pool().stop()
+    remove_profiles()
+
+
 @app.get("/")
 def root():
     return {"status": "success", "message": "PII Anonymization API is running", "version": "2.0.0"}
@@ -62,7 +107,21 @@ def root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "service": "PII Anonymization API", "version": "2.0.0"}
+    executor = get_execution_pool().health()
+    engines = get_engine_pool().health()
+    ready = executor["running"] if executor["mode"] == "process" else engines["started"]
+    return {
+        "status": "healthy" if ready else "degraded",
+        "service": "PII Anonymization API",
+        "version": "2.0.0",
+        "execution": executor,
+        "engines": engines,
+        "pdf_pages": get_pdf_page_pool().health(),
+        "libreoffice": get_libreoffice_pool().health(),
+        "jobs": get_job_service().health(),
+        "result_cache": get_result_cache().health(),
+        "conversion_cache": get_conversion_cache().health(),
+    }
 
 
 if __name__ == "__main__":
@@ -3,13 +3,16 @@ CSV-based Repository for PII data operations
 Implements same interface as PIIRepository but uses CSV files instead of database
 """
 import os
-from typing import List, Optional, Dict
+from typing import Iterable, List, Optional, Dict
 from datetime import datetime
+import threading
 import logging
 
 from utility.csv_helpers import (
+    modify_csv_records,
     read_csv_records,
     write_csv_record,
+    write_csv_records,
     find_csv_record,
     find_csv_records,
     update_csv_record,
@@ -17,11 +20,29 @@ from utility.csv_helpers import (
     deserialize_json_from_csv,
     ensure_csv_file_exists
 )
-from utility.storage_config import get_pii_csv_path, PII_RECORDS_HEADERS
+from utility.storage_config import (
+    get_pii_csv_path,
+    get_jobs_csv_path,
+    PII_RECORDS_HEADERS,
+    PII_JOBS_HEADERS,
+)
 from utility.exceptions import DatabaseException
 
 logger = logging.getLogger(__name__)
 
+# Job rows are updated by several background workers; update_csv_record
+# rewrites the whole file, so serialize read-modify-write in this process
+_jobs_lock = threading.Lock()
+
+
+def _timestamp(value: Optional[datetime]) -> str:
+    """CSV form of a UTC datetime, as the created_at/modified_at columns"""
+    return value.isoformat() + "Z" if value else ""
+
+
+def _lease_expired(value: str, now: datetime) -> bool:
+    return not value or datetime.fromisoformat(value.rstrip("Z")) < now
+
 
 class PIIRecord:
     """Simple data class to mimic ORM record"""
@@ -48,13 +69,42 @@ class PIIRecord:
         self.is_active = data.get('is_active', 'True') == 'True'
 
 
+class JobRecord:
+    """Simple data class to mimic the pii_jobs ORM record"""
+    
+    def __init__(self, data: Dict):
+        self.job_id = data.get('job_id')
+        self.status = data.get('status')
+        self.assessment_id = data.get('assessment_id')
+        self.prospect_id = data.get('prospect_id')
+        self.caller_name = data.get('caller_name')
+        self.input_type = data.get('input_type')
+        self.filename = data.get('filename')
+        self.source_path = data.get('source_path')
+        self.company_name = data.get('company_name') or None
+        self.company_website = data.get('company_website') or None
+        self.callback_url = data.get('callback_url') or None
+        self.request_id = data.get('request_id') or None
+        self.result = deserialize_json_from_csv(data.get('result', ''))
+        self.error = data.get('error') or None
+        self.owner = data.get('owner') or None
+        self.lease_expires_at = data.get('lease_expires_at') or None
+        self.created_at = data.get('created_at')
+        self.created_by = data.get('created_by')
+        self.modified_at = data.get('modified_at')
+        self.modified_by = data.get('modified_by')
+        self.is_active = data.get('is_active', 'True') == 'True'
+
+
 class CSVRepository:
     """CSV-based repository for PII data operations"""
     
     def __init__(self):
         """Initialize CSV repository"""
         self.csv_path = get_pii_csv_path()
+        self.jobs_csv_path = get_jobs_csv_path()
         ensure_csv_file_exists(self.csv_path, PII_RECORDS_HEADERS)
+        ensure_csv_file_exists(self.jobs_csv_path, PII_JOBS_HEADERS)
         logger.info(f"CSVRepository initialized with file: {self.csv_path}")
     
     def verify_assessment_exists(self, assessment_id: str) -> bool:
@@ -119,25 +169,19 @@ class CSVRepository:
             PIIRecord object
         """
         try:
-            timestamp = datetime.utcnow().isoformat() + "Z"
-            
-            record = {
-                "request_id": request_id,
-                "assessment_id": assessment_id,
-                "prospect_id": prospect_id,
-                "input_type": input_type,
-                "caller_name": caller_name,
-                "country": country or "",
-                "processed_document": processed_document,
-                "output_text": output_text,
-                "anonymizing_mapping": serialize_json_for_csv(anonymizing_mapping),
-                "encrypted_key": encrypted_key or "",
-                "created_at": timestamp,
-                "created_by": created_by,
-                "modified_at": timestamp,
-                "modified_by": created_by,
-                "is_active": "True"
-            }
+            record = self._pii_row(
+                request_id=request_id,
+                assessment_id=assessment_id,
+                prospect_id=prospect_id,
+                input_type=input_type,
+                caller_name=caller_name,
+                country=country,
+                processed_document=processed_document,
+                output_text=output_text,
+                anonymizing_mapping=anonymizing_mapping,
+                encrypted_key=encrypted_key,
+                created_by=created_by,
+            )
             
             success = write_csv_record(self.csv_path, record, PII_RECORDS_HEADERS)
             
@@ -150,6 +194,62 @@ class CSVRepository:
         except Exception as e:
             raise DatabaseException(f"Failed to save PII details: {str(e)}")
     
+    def save_pii_details_batch(self, records: List[Dict]) -> List[PIIRecord]:
+        """
+        Save several PII records in one write
+        
+        Args:
+            records: save_pii_details() keyword arguments, one dict per record
+            
+        Returns:
+            List of PIIRecord objects
+        """
+        try:
+            rows = [self._pii_row(**record) for record in records]
+            
+            if not write_csv_records(self.csv_path, rows, PII_RECORDS_HEADERS):
+                raise DatabaseException("Failed to write PII records to CSV")
+            
+            logger.info(f"Saved {len(rows)} PII records to CSV")
+            return [PIIRecord(row) for row in rows]
+            
+        except Exception as e:
+            raise DatabaseException(f"Failed to save PII details: {str(e)}")
+    
+    @staticmethod
+    def _pii_row(
+        request_id: str,
+        assessment_id: str,
+        prospect_id: str,
+        input_type: str,
+        caller_name: str,
+        country: Optional[str],
+        processed_document: str,
+        output_text: str,
+        anonymizing_mapping: dict,
+        encrypted_key: Optional[str] = None,
+        created_by: str = "system"
+    ) -> Dict:
+        """Build the pii_records.csv row for one record"""
+        timestamp = datetime.utcnow().isoformat() + "Z"
+        return {
+            "request_id": request_id,
+            "assessment_id": assessment_id,
+            "prospect_id": prospect_id,
+            "input_type": input_type,
+            "caller_name": caller_name,
+            "country": country or "",
+            "processed_document": processed_document,
+            "output_text": output_text,
+            "anonymizing_mapping": serialize_json_for_csv(anonymizing_mapping),
+            "encrypted_key": encrypted_key or "",
+            "created_at": timestamp,
+            "created_by": created_by,
+            "modified_at": timestamp,
+            "modified_by": created_by,
+            "is_active": "True"
+        }
+    
     def get_pii_details(self, request_id: str) -> Optional[PIIRecord]:
         """
         Get PII details by request ID
@@ -251,3 +351,256 @@ class CSVRepository:
             
         except Exception as e:
             raise DatabaseException(f"Failed to update PII details: {str(e)}")
+
+    
+    # ==================== Jobs ====================
+    
+    def save_job(
+        self,
+        job_id: str,
+        assessment_id: str,
+        prospect_id: str,
+        caller_name: str,
+        input_type: str,
+        filename: str,
+        source_path: str,
+        company_name: Optional[str] = None,
+        company_website: Optional[str] = None,
+        callback_url: Optional[str] = None,
+        owner: Optional[str] = None,
+        lease_expires_at: Optional[datetime] = None,
+        created_by: str = "system"
+    ) -> JobRecord:
+        """
+        Save a newly queued job to CSV
+        
+        Args:
+            job_id: Unique job identifier
+            assessment_id: Assessment UUID
+            prospect_id: Prospect UUID
+            caller_name: Name of calling service
+            input_type: Type of input document
+            filename: Original upload filename
+            source_path: Where the upload is persisted until the job ends
+            company_name: Company used for country detection
+            company_website: Company website used for country detection
+            callback_url: Webhook notified when the job ends
+            owner: JobService instance holding the job
+            lease_expires_at: When the owner's hold lapses (UTC)
+            created_by: User who created the record
+            
+        Returns:
+            JobRecord object
+        """
+        try:
+            timestamp = datetime.utcnow().isoformat() + "Z"
+            
+            record = {
+                "job_id": job_id,
+                "status": "queued",
+                "assessment_id": assessment_id,
+                "prospect_id": prospect_id,
+                "caller_name": caller_name,
+                "input_type": input_type,
+                "filename": filename,
+                "source_path": source_path,
+                "company_name": company_name or "",
+                "company_website": company_website or "",
+                "callback_url": callback_url or "",
+                "request_id": "",
+                "result": "",
+                "error": "",
+                "owner": owner or "",
+                "lease_expires_at": _timestamp(lease_expires_at),
+                "created_at": timestamp,
+                "created_by": created_by,
+                "modified_at": timestamp,
+                "modified_by": created_by,
+                "is_active": "True"
+            }
+            
+            with _jobs_lock:
+                success = write_csv_record(self.jobs_csv_path, record, PII_JOBS_HEADERS)
+            
+            if not success:
+                raise DatabaseException("Failed to write job record to CSV")
+            
+            logger.info(f"Saved job record to CSV: {job_id}")
+            return JobRecord(record)
+            
+        except Exception as e:
+            raise DatabaseException(f"Failed to save job: {str(e)}")
+    
+    def get_job(self, job_id: str) -> Optional[JobRecord]:
+        """
+        Get job by ID
+        
+        Args:
+            job_id: Job identifier
+            
+        Returns:
+            JobRecord or None
+        """
+        try:
+            record_data = find_csv_record(self.jobs_csv_path, "job_id", job_id)
+            
+            if not record_data or record_data.get('is_active') != 'True':
+                return None
+            
+            return JobRecord(record_data)
+            
+        except Exception as e:
+            raise DatabaseException(f"Failed to retrieve job: {str(e)}")
+    
+    def get_jobs_by_status(self, statuses: Iterable[str]) -> List[JobRecord]:
+        """
+        Get all active jobs in any of *statuses*
+        
+        Args:
+            statuses: Job statuses to match
+            
+        Returns:
+            List of JobRecord objects
+        """
+        try:
+            wanted = set(statuses)
+            return [
+                JobRecord(data)
+                for data in read_csv_records(self.jobs_csv_path)
+                if data.get('status') in wanted and data.get('is_active') == 'True'
+            ]
+            
+        except Exception as e:
+            raise DatabaseException(f"Failed to retrieve jobs: {str(e)}")
+    
+    def claim_job(
+        self,
+        job_id: str,
+        owner: str,
+        statuses: Iterable[str],
+        status: str,
+        lease_expires_at: datetime
+    ) -> Optional[JobRecord]:
+        """
+        Take a job for *owner* in one locked read-modify-write
+        
+        The job is claimed if it is in one of *statuses* and unowned, already
+        held by *owner*, or held under a lease that has expired. Of several
+        instances claiming the same job, exactly one succeeds.
+        
+        Args:
+            job_id: Job identifier
+            owner: JobService instance claiming the job
+            statuses: Statuses the job may be claimed from
+            status: Status the claimed job is set to
+            lease_expires_at: When the new hold lapses (UTC)
+            
+        Returns:
+            The claimed JobRecord, or None if it is held elsewhere or gone
+        """
+        wanted = set(statuses)
+        now = datetime.utcnow()
+
+        def claim(record: Dict) -> bool:
+            if (
+                record.get('job_id') != job_id
+                or record.get('status') not in wanted
+                or record.get('is_active') != 'True'
+            ):
+                return False
+            if record.get('owner') not in ("", None, owner) and not _lease_expired(record.get('lease_expires_at'), now):
+                return False
+            record.update(
+                status=status, owner=owner, lease_expires_at=_timestamp(lease_expires_at), modified_by=owner
+            )
+            return True
+
+        try:
+            with _jobs_lock:
+                claimed = modify_csv_records(self.jobs_csv_path, claim, PII_JOBS_HEADERS)
+        except Exception as e:
+            raise DatabaseException(f"Failed to claim job: {str(e)}")
+        if claimed is None:
+            raise DatabaseException(f"Failed to claim job: {job_id}")
+        return JobRecord(claimed[0]) if claimed else None
+    
+    def renew_job_leases(
+        self,
+        owner: str,
+        statuses: Iterable[str],
+        lease_expires_at: datetime
+    ) -> int:
+        """
+        Extend the lease of every job *owner* holds in one of *statuses*
+        
+        Args:
+            owner: JobService instance holding the jobs
+            statuses: Statuses of the jobs still held
+            lease_expires_at: New end of the hold (UTC)
+            
+        Returns:
+            Number of jobs renewed
+        """
+        wanted = set(statuses)
+        expires = _timestamp(lease_expires_at)
+
+        def renew(record: Dict) -> bool:
+            if record.get('owner') != owner or record.get('status') not in wanted:
+                return False
+            record['lease_expires_at'] = expires
+            return True
+
+        try:
+            with _jobs_lock:
+                renewed = modify_csv_records(self.jobs_csv_path, renew, PII_JOBS_HEADERS)
+        except Exception as e:
+            raise DatabaseException(f"Failed to renew job leases: {str(e)}")
+        if renewed is None:
+            raise DatabaseException("Failed to renew job leases")
+        return len(renewed)
+    
+    def update_job(
+        self,
+        job_id: str,
+        modified_by: str,
+        **kwargs
+    ) -> JobRecord:
+        """
+        Update job record
+        
+        Args:
+            job_id: Job identifier
+            modified_by: User making the modification
+            **kwargs: Fields to update
+            
+        Returns:
+            Updated JobRecord
+        """
+        try:
+            updates = {}
+            for key, value in kwargs.items():
+                if key == "result":
+                    updates[key] = serialize_json_for_csv(value)
+                elif isinstance(value, datetime):
+                    updates[key] = _timestamp(value)
+                else:
+                    updates[key] = str(value) if value is not None else ""
+            
+            updates["modified_by"] = modified_by
+            
+            with _jobs_lock:
+                success = update_csv_record(
+                    self.jobs_csv_path,
+                    "job_id",
+                    job_id,
+                    updates,
+                    PII_JOBS_HEADERS
+                )
+            
+            if not success:
+                raise DatabaseException(f"Failed to update job record: {job_id}")
+            
+            return self.get_job(job_id)
+            
+        except Exception as e:
+            raise DatabaseException(f"Failed to update job: {str(e)}")
@@ -2,10 +2,11 @@
 Repository for PII database operations
 """
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import or_, select, update
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Optional
-from utility.ORM import PIIDetailsRecord, AssessmentDetailsRecord, ProspectDetailsRecord
+from datetime import datetime
+from typing import Iterable, List, Optional
+from utility.ORM import PIIDetailsRecord, AssessmentDetailsRecord, ProspectDetailsRecord, PIIJobRecord
 from utility.exceptions import DatabaseException, AssessmentNotFoundException
 import json
 
@@ -144,6 +145,39 @@ class PIIRepository:
             self.db_session.rollback()
             raise DatabaseException(f"Failed to save PII details: {str(e)}")
     
+    def save_pii_details_batch(self, records: List[dict]) -> List[PIIDetailsRecord]:
+        """
+        Save several PII records in one transaction
+        
+        Args:
+            records: save_pii_details() keyword arguments, one dict per record
+            
+        Returns:
+            List of saved PIIDetailsRecord
+        """
+        try:
+            pii_records = []
+            for record in records:
+                created_by = record.get("created_by", "system")
+                pii_records.append(PIIDetailsRecord(
+                    **record,
+                    modified_by=created_by,
+                    is_active=True
+                ))
+            
+            # All or nothing
+            self.db_session.add_all(pii_records)
+            self.db_session.commit()
+            
+            for pii_record in pii_records:
+                self.db_session.refresh(pii_record)
+            
+            return pii_records
+            
+        except SQLAlchemyError as e:
+            self.db_session.rollback()
+            raise DatabaseException(f"Failed to save PII details: {str(e)}")
+    
     def get_pii_details(self, request_id: str) -> Optional[PIIDetailsRecord]:
         """
         Get PII details by request ID
@@ -230,3 +264,234 @@ class PIIRepository:
         except SQLAlchemyError as e:
             self.db_session.rollback()
             raise DatabaseException(f"Failed to update PII details: {str(e)}")
+    
+    # ==================== Jobs ====================
+    
+    def save_job(
+        self,
+        job_id: str,
+        assessment_id: str,
+        prospect_id: str,
+        caller_name: str,
+        input_type: str,
+        filename: str,
+        source_path: str,
+        company_name: Optional[str] = None,
+        company_website: Optional[str] = None,
+        callback_url: Optional[str] = None,
+        owner: Optional[str] = None,
+        lease_expires_at: Optional[datetime] = None,
+        created_by: str = "system"
+    ) -> PIIJobRecord:
+        """
+        Save a newly queued job to database
+        
+        Args:
+            job_id: Unique job identifier
+            assessment_id: Assessment UUID
+            prospect_id: Prospect UUID
+            caller_name: Name of calling service
+            input_type: Type of input document
+            filename: Original upload filename
+            source_path: Where the upload is persisted until the job ends
+            company_name: Company used for country detection
+            company_website: Company website used for country detection
+            callback_url: Webhook notified when the job ends
+            owner: JobService instance holding the job
+            lease_expires_at: When the owner's hold lapses (UTC)
+            created_by: User who created the record
+            
+        Returns:
+            Saved PIIJobRecord
+        """
+        try:
+            job = PIIJobRecord(
+                job_id=job_id,
+                status="queued",
+                assessment_id=assessment_id,
+                prospect_id=prospect_id,
+                caller_name=caller_name,
+                input_type=input_type,
+                filename=filename,
+                source_path=source_path,
+                company_name=company_name,
+                company_website=company_website,
+                callback_url=callback_url,
+                owner=owner,
+                lease_expires_at=lease_expires_at,
+                created_by=created_by,
+                modified_by=created_by,
+                is_active=True
+            )
+            self.db_session.add(job)
+            self.db_session.commit()
+            self.db_session.refresh(job)
+            return job
+            
+        except SQLAlchemyError as e:
+            self.db_session.rollback()
+            raise DatabaseException(f"Failed to save job: {str(e)}")
+    
+    def get_job(self, job_id: str) -> Optional[PIIJobRecord]:
+        """
+        Get job by ID
+        
+        Args:
+            job_id: Job identifier
+            
+        Returns:
+            PIIJobRecord or None
+        """
+        try:
+            query = select(PIIJobRecord).where(
+                PIIJobRecord.job_id == job_id,
+                PIIJobRecord.is_active == True
+            )
+            result = self.db_session.execute(query)
+            return result.scalar_one_or_none()
+            
+        except SQLAlchemyError as e:
+            raise DatabaseException(f"Failed to retrieve job: {str(e)}")
+    
+    def get_jobs_by_status(self, statuses: Iterable[str]) -> List[PIIJobRecord]:
+        """
+        Get all active jobs in any of *statuses*
+        
+        Args:
+            statuses: Job statuses to match
+            
+        Returns:
+            List of PIIJobRecord
+        """
+        try:
+            query = select(PIIJobRecord).where(
+                PIIJobRecord.status.in_(list(statuses)),
+                PIIJobRecord.is_active == True
+            )
+            result = self.db_session.execute(query)
+            return result.scalars().all()
+            
+        except SQLAlchemyError as e:
+            raise DatabaseException(f"Failed to retrieve jobs: {str(e)}")
+    
+    def claim_job(
+        self,
+        job_id: str,
+        owner: str,
+        statuses: Iterable[str],
+        status: str,
+        lease_expires_at: datetime
+    ) -> Optional[PIIJobRecord]:
+        """
+        Take a job for *owner* in one conditional update
+        
+        The job is claimed if it is in one of *statuses* and unowned, already
+        held by *owner*, or held under a lease that has expired. Of several
+        instances claiming the same job, exactly one succeeds.
+        
+        Args:
+            job_id: Job identifier
+            owner: JobService instance claiming the job
+            statuses: Statuses the job may be claimed from
+            status: Status the claimed job is set to
+            lease_expires_at: When the new hold lapses (UTC)
+            
+        Returns:
+            The claimed PIIJobRecord, or None if it is held elsewhere or gone
+        """
+        try:
+            claimed = self.db_session.execute(
+                update(PIIJobRecord)
+                .where(
+                    PIIJobRecord.job_id == job_id,
+                    PIIJobRecord.status.in_(list(statuses)),
+                    PIIJobRecord.is_active == True,
+                    or_(
+                        PIIJobRecord.owner.is_(None),
+                        PIIJobRecord.owner == owner,
+                        PIIJobRecord.lease_expires_at < datetime.utcnow(),
+                    ),
+                )
+                .values(status=status, owner=owner, lease_expires_at=lease_expires_at, modified_by=owner)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            self.db_session.commit()
+            if not claimed:
+                return None
+            self.db_session.expire_all()
+            return self.get_job(job_id)
+            
+        except SQLAlchemyError as e:
+            self.db_session.rollback()
+            raise DatabaseException(f"Failed to claim job: {str(e)}")
+    
+    def renew_job_leases(
+        self,
+        owner: str,
+        statuses: Iterable[str],
+        lease_expires_at: datetime
+    ) -> int:
+        """
+        Extend the lease of every job *owner* holds in one of *statuses*
+        
+        Args:
+            owner: JobService instance holding the jobs
+            statuses: Statuses of the jobs still held
+            lease_expires_at: New end of the hold (UTC)
+            
+        Returns:
+            Number of jobs renewed
+        """
+        try:
+            renewed = self.db_session.execute(
+                update(PIIJobRecord)
+                .where(PIIJobRecord.owner == owner, PIIJobRecord.status.in_(list(statuses)))
+                .values(lease_expires_at=lease_expires_at)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            self.db_session.commit()
+            return renewed
+            
+        except SQLAlchemyError as e:
+            self.db_session.rollback()
+            raise DatabaseException(f"Failed to renew job leases: {str(e)}")
+    
+    def update_job(
+        self,
+        job_id: str,
+        modified_by: str,
+        **kwargs
+    ) -> PIIJobRecord:
+        """
+        Update job record
+        
+        Args:
+            job_id: Job identifier
+            modified_by: User making the modification
+            **kwargs: Fields to update
+            
+        Returns:
+            Updated PIIJobRecord
+        """
+        try:
+            query = select(PIIJobRecord).where(PIIJobRecord.job_id == job_id)
+            result = self.db_session.execute(query)
+            job = result.scalar_one_or_none()
+            
+            if not job:
+                raise DatabaseException(f"Job not found: {job_id}")
+            
+            for key, value in kwargs.items():
+                if hasattr(job, key):
+                    setattr(job, key, value)
+            
+            job.modified_by = modified_by
+            
+            self.db_session.commit()
+            self.db_session.refresh(job)
+            
+            return job
+            
+        except SQLAlchemyError as e:
+            self.db_session.rollback()
+            raise DatabaseException(f"Failed to update job: {str(e)}")
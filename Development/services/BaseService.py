@@ -1,16 +1,49 @@
 """
 Base service with shared logic for all document processors.
 Handles: read bytes, detect PII, anonymize, save to DB, cleanup.
+
+process_document_async() awaits the CPU-bound stages through an
+ExecutionPool so they can run in worker processes with per-stage timeouts,
+then saves the result; run_pipeline_async() is the same pipeline without
+the save (batches save their documents together).
+
+The upload is wrapped in an IngestedDocument: its bytes are read once and
+services that need a filesystem path share one materialized copy.
+
+The async pipeline also accepts the country as a still-running task, so the
+controller's country detection overlaps ingestion and text extraction; only
+the cache lookup and NER wait for it.
+
+A service built without an engine (presidio=None) borrows a pooled one for
+the Presidio stages only: ingestion, extraction and the build of one request
+leave it free for the detection of another.
+
+Services whose _use_streaming() accepts a document (very large PDFs) mask it
+piece by piece in _mask_streaming() instead; the anonymized text is then
+written to a file beside the masked document and output_text refers to it.
+
+Services that convert the upload first (DOC/DOCX -> PDF, CSV -> XLSX) get
+the converted bytes from _converted(): the conversion runs once per request,
+its file shared by extraction and masking, and is reused across requests
+through the ConversionCache.
 """
+from contextlib import asynccontextmanager, contextmanager
 from fastapi import UploadFile
-from typing import Dict, Optional
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Tuple, Union
+import asyncio
 import os
 import tempfile
+import time
 import logging
 
 from repository.PIIRepository import PIIRepository
 from utility.PresidioUtility import PresidioUtility
-from utility.exceptions import DocumentProcessingException
+from utility.ExecutionPool import ExecutionPool
+from utility.DocumentIngestion import IngestedDocument, materialized_path
+from utility.DocumentModel import ExtractedDocument
+from utility.ConversionCache import get_conversion_cache
+from utility.ResultCache import get_result_cache
+from utility.exceptions import DocumentProcessingException, PIIException
 from utility.helpers import generate_request_id
 
 logger = logging.getLogger(__name__)
@@ -19,9 +52,27 @@ logger = logging.getLogger(__name__)
 class BaseService:
     """Abstract base for every document-type service."""
 
+    # Services that hand the original file to an external tool set this so
+    # the upload is materialized once, before any stage runs
+    needs_source_path = False
+    # Suffix of the format services that convert the upload work on ('.pdf')
+    converted_suffix: Optional[str] = None
+
     def __init__(self, repository: PIIRepository, presidio: PresidioUtility):
         self.repository = repository
         self.presidio = presidio
+        self.source: Optional[IngestedDocument] = None
+
+    def __getstate__(self) -> Dict:
+        """
+        Pickle without the repository (DB session) and the Presidio engine.
+
+        Worker processes re-attach their own engine, see ExecutionPool.
+        """
+        state = self.__dict__.copy()
+        state["repository"] = None
+        state["presidio"] = None
+        return state
 
     # -- subclasses MUST implement these --
     def _validate(self, document: UploadFile) -> None:
@@ -37,80 +88,355 @@ class BaseService:
         """Write the masked file to *out_path*."""
         raise NotImplementedError
 
+    # -- structured formats override these instead --
+    def _extract_document(self, raw: bytes, filename: str) -> ExtractedDocument:
+        """Text plus its offset -> location index (default: one segment)."""
+        return ExtractedDocument.from_text(self._extract_text(raw, filename))
+
+    def _build_masked_document(
+        self, raw: bytes, extracted: ExtractedDocument, anon: Dict, out_path: str
+    ) -> None:
+        """
+        Write the masked file to *out_path* from the anonymize_text() result.
+
+        Structured formats apply ``anon["spans"]`` by location through
+        *extracted*; the default writes the anonymized text.
+        """
+        self._build_masked_output(raw, anon["mapping"], anon["anonymized_text"], out_path)
+
+    # -- services that can mask a document piece by piece override these --
+    def _use_streaming(self, source: IngestedDocument) -> bool:
+        """True if *source* is too large to hold its text in memory at once."""
+        return False
+
+    def _mask_streaming(self, source: IngestedDocument, country: str, out_path: str) -> Dict:
+        """
+        Detect, anonymize and mask *source* piece by piece into *out_path*.
+
+        The anonymized text is written to streamed_text_path(out_path).
+
+        Returns:
+            Dict with mapping, encryption_key and entities_count
+        """
+        raise NotImplementedError
+
+    def _ingest(self, document: UploadFile, request_id: str) -> IngestedDocument:
+        self.source = IngestedDocument(document, request_id)
+        if self.needs_source_path:
+            self.source.materialize()
+        if self.converted_suffix:
+            # Registered here so every stage, in any process, uses one file
+            self.source.artifact_path(self.converted_suffix)
+        return self.source
+
+    def _release_source(self) -> None:
+        if self.source is not None:
+            self.source.cleanup()
+            self.source = None
+
+    @contextmanager
+    def _input_path(self, raw: bytes, suffix: str) -> Iterator[str]:
+        """Yield a path holding *raw*, reusing the request's source file when possible."""
+        with materialized_path(raw, suffix, self.source) as path:
+            yield path
+
+    def _converted(self, raw: bytes, suffix: str, convert: Callable[[str], str]) -> bytes:
+        """
+        Return *raw* converted to ``converted_suffix``, converting at most once.
+
+        Args:
+            raw: Original document bytes
+            suffix: Extension of the original document ('.docx')
+            convert: Converts the file at a path; returns the converted file's path
+
+        Returns:
+            Converted document bytes, from this request's artifact, the
+            conversion cache or a fresh conversion, in that order
+        """
+        artifact = self.source.artifact_path(self.converted_suffix) if self.source is not None else None
+        if artifact and os.path.exists(artifact):
+            with open(artifact, "rb") as f:
+                return f.read()
+
+        cache = get_conversion_cache()
+        key = cache.make_key(raw, self.converted_suffix)
+        data = cache.get(key, raw)
+        if data is None:
+            with self._input_path(raw, suffix) as input_path:
+                converted_path = convert(input_path)
+            try:
+                with open(converted_path, "rb") as f:
+                    data = f.read()
+            finally:
+                if os.path.exists(converted_path):
+                    os.unlink(converted_path)
+            cache.put(key, raw, data)
+
+        if artifact:
+            staging = f"{artifact}.partial"
+            with open(staging, "wb") as f:
+                f.write(data)
+            os.replace(staging, artifact)
+        return data
+
+    def _cache_kind(self, ext: str) -> str:
+        """What, besides the bytes, decides the output: the service and the extension."""
+        return f"{type(self).__name__}:{ext.lower()}"
+
     @staticmethod
     def _masked_filename(original: str) -> str:
         """'report.pdf' -> 'report_masked.pdf'"""
         name, ext = os.path.splitext(original)
         return f"{name}_masked{ext}"
 
-    def process_document(
+    async def run_pipeline_async(
         self,
-        assessment_id: str,
-        prospect_id: str,
-        caller_name: str,
+        executor: ExecutionPool,
         document: UploadFile,
-        country: str,
-        created_by: str,
+        country: Union[str, Awaitable[str]],
     ) -> Dict:
-        temp_path: Optional[str] = None
+        """
+        Run extract -> detect -> anonymize -> build for *document*, each
+        CPU-bound stage awaited on *executor*, without persisting anything.
+
+        Args:
+            executor: Pool the CPU-bound stages run on
+            document: The upload
+            country: The country, or an asyncio Task/Future resolving to it.
+                While it is pending, extraction runs concurrently with it.
+
+        Returns:
+            Dict with request_id, input_type, processed_document, output_text,
+            mapping, encryption_key, entities_count, cache_hit, the resolved
+            country and country_wait_ms (time the pipeline sat idle waiting
+            for the country)
+        """
         out_path: Optional[str] = None
+        extract_task: Optional[asyncio.Future] = None
         try:
             request_id = generate_request_id()
             self._validate(document)
 
-            raw = document.file.read()
-            document.file.seek(0)
-
-            original_name = document.filename or "document"
-            ext = os.path.splitext(original_name)[1]
-            
-            # Use system temp directory (works on Windows and Unix)
+            source = await executor.run_blocking(self._ingest, document, request_id)
+            original_name = source.filename
+            ext = source.ext
             temp_dir = tempfile.gettempdir()
-            temp_path = os.path.join(temp_dir, f"{request_id}_original{ext}")
-            
-            with open(temp_path, "wb") as f:
-                f.write(raw)
-
-            # Extract text
-            text = self._extract_text(raw, original_name)
-
-            # Detect & anonymize
-            entities = self.presidio.detect_pii(text, country=country)
-            anon = self.presidio.anonymize_text(text, entities)
-
-            # Build masked output
             masked_name = self._masked_filename(original_name)
             out_path = os.path.join(temp_dir, f"{request_id}_{masked_name}")
-            self._build_masked_output(raw, anon["mapping"], anon["anonymized_text"], out_path)
-
-            # Persist
-            self.repository.save_pii_details(
-                request_id=request_id,
-                assessment_id=assessment_id,
-                prospect_id=prospect_id,
-                input_type=ext.lstrip(".") or "txt",
-                caller_name=caller_name,
-                country=country,
-                processed_document=out_path,
-                output_text=anon["anonymized_text"],
-                anonymizing_mapping=anon["mapping"],
-                encrypted_key=anon["encryption_key"],
-                created_by=created_by,
-            )
 
-            # Cleanup temp
-            if temp_path and os.path.exists(temp_path):
-                os.remove(temp_path)
+            if await executor.run_blocking(self._use_streaming, source):
+                # Page-by-page masking needs the country up front and skips the cache
+                wait_start = time.perf_counter()
+                country, country_ready_at = await self._await_country(country)
+                country_wait_ms = _elapsed_ms(wait_start, country_ready_at)
+                async with self._engine(executor):
+                    anon = await executor.run_service_stage(
+                        "stream", self, "_mask_streaming", source, country, out_path,
+                    )
+                anon["anonymized_text"] = streamed_output_text(out_path)
+                cache_hit = False
+            else:
+                raw = await executor.run_blocking(source.read)
+                cache = get_result_cache()
+                if not isinstance(country, str) and not country.done():
+                    # Extraction does not depend on the country: start it now
+                    extract_task = asyncio.ensure_future(
+                        self._extract_stage(executor, raw, original_name)
+                    )
+                wait_start = time.perf_counter()
+                country, country_ready_at = await self._await_country(country)
+
+                # Identical uploads skip the heavy stages (fresh key on every hit)
+                cache_key = None
+                anon = None
+                if cache.enabled:
+                    async with self._engine(executor):
+                        version = await executor.run_presidio_stage(
+                            "detect", self.presidio, "profile_version", country
+                        )
+                    cache_key = cache.make_key(raw, self._cache_kind(ext), country, version)
+                    anon = await executor.run_blocking(cache.get, cache_key, raw, out_path)
+                cache_hit = anon is not None
+
+                if cache_hit:
+                    country_wait_ms = _elapsed_ms(wait_start, country_ready_at)
+                    if extract_task is not None:
+                        _discard(extract_task)
+                else:
+                    if extract_task is not None:
+                        extracted, extracted_at = await extract_task
+                        # NER only waited for whatever the country took beyond extraction
+                        country_wait_ms = _elapsed_ms(extracted_at, country_ready_at)
+                    else:
+                        country_wait_ms = _elapsed_ms(wait_start, country_ready_at)
+                        extracted, _ = await self._extract_stage(executor, raw, original_name)
+                    async with self._engine(executor):
+                        entities = await executor.detect_pii(self.presidio, extracted.text, "en", country)
+                        anon = await executor.run_presidio_stage(
+                            "anonymize", self.presidio, "anonymize_text", extracted.text, entities
+                        )
+                    await executor.run_service_stage(
+                        "build", self, "_build_masked_document", raw, extracted, anon, out_path,
+                    )
+                    if cache_key:
+                        await executor.run_blocking(
+                            cache.put, cache_key, raw, out_path, anon["anonymized_text"],
+                            anon["mapping"], anon["encryption_key"], entities,
+                        )
 
             return {
+                "cache_hit": cache_hit,
                 "request_id": request_id,
+                "input_type": ext.lstrip(".") or "txt",
                 "processed_document": out_path,
-                "entities_detected": anon["entities_count"],
+                "output_text": anon["anonymized_text"],
+                "mapping": anon["mapping"],
+                "encryption_key": anon["encryption_key"],
+                "entities_count": anon["entities_count"],
+                "country": country,
+                "country_wait_ms": country_wait_ms,
             }
-        except Exception as e:
-            for p in (temp_path, out_path):
-                if p and os.path.exists(p):
-                    os.remove(p)
-            if isinstance(e, DocumentProcessingException):
+        except BaseException as e:
+            # BaseException so that a cancelled request also cleans up
+            if extract_task is not None:
+                _discard(extract_task)
+            if out_path:
+                remove_masked_outputs(out_path)
+            if isinstance(e, PIIException) or not isinstance(e, Exception):
                 raise
             raise DocumentProcessingException(f"Processing failed: {e}")
+        finally:
+            self._release_source()
+
+    @asynccontextmanager
+    async def _engine(self, executor: ExecutionPool) -> AsyncIterator[Optional[PresidioUtility]]:
+        """
+        Hold an engine as self.presidio for the Presidio stages in the block.
+
+        A service built without one (presidio=None) borrows it from
+        *executor* for the block only, so extraction, the build and the
+        save do not keep a pooled engine from other requests.
+        """
+        if self.presidio is not None or executor.is_process_mode:
+            yield self.presidio
+            return
+        async with executor.engine() as presidio:
+            self.presidio = presidio
+            try:
+                yield presidio
+            finally:
+                self.presidio = None
+
+    async def _extract_stage(
+        self, executor: ExecutionPool, raw: bytes, filename: str
+    ) -> Tuple[ExtractedDocument, float]:
+        """Extract the document; also returns when extraction finished (perf_counter)."""
+        extracted = await executor.run_service_stage("extract", self, "_extract_document", raw, filename)
+        return extracted, time.perf_counter()
+
+    @staticmethod
+    async def _await_country(country: Union[str, Awaitable[str]]) -> Tuple[str, float]:
+        """Resolve *country*; also returns when it became available (perf_counter)."""
+        if isinstance(country, str):
+            return country, time.perf_counter()
+        if asyncio.isfuture(country):
+            # shield: a cancelled document must not cancel a task shared by a batch
+            country = asyncio.shield(country)
+        return await country, time.perf_counter()
+
+    @staticmethod
+    def pii_record(
+        result: Dict,
+        assessment_id: str,
+        prospect_id: str,
+        caller_name: str,
+        country: str,
+        created_by: str,
+    ) -> Dict:
+        """Repository save_pii_details() arguments for a run_pipeline_async() result."""
+        return dict(
+            request_id=result["request_id"],
+            assessment_id=assessment_id,
+            prospect_id=prospect_id,
+            input_type=result["input_type"],
+            caller_name=caller_name,
+            country=country,
+            processed_document=result["processed_document"],
+            output_text=result["output_text"],
+            anonymizing_mapping=result["mapping"],
+            encrypted_key=result["encryption_key"],
+            created_by=created_by,
+        )
+
+    async def process_document_async(
+        self,
+        executor: ExecutionPool,
+        assessment_id: str,
+        prospect_id: str,
+        caller_name: str,
+        document: UploadFile,
+        country: Union[str, Awaitable[str]],
+        created_by: str,
+    ) -> Dict:
+        """
+        run_pipeline_async() followed by the repository write, run off the
+        event loop. *country* may be a pending task, as for
+        run_pipeline_async().
+        """
+        result = await self.run_pipeline_async(executor, document, country)
+        try:
+            await executor.run_blocking(
+                self.repository.save_pii_details,
+                **self.pii_record(
+                    result, assessment_id, prospect_id, caller_name, result["country"], created_by
+                ),
+            )
+        except BaseException as e:
+            remove_masked_outputs(result["processed_document"])
+            if isinstance(e, PIIException) or not isinstance(e, Exception):
+                raise
+            raise DocumentProcessingException(f"Processing failed: {e}")
+
+        return {
+            "request_id": result["request_id"],
+            "processed_document": result["processed_document"],
+            "entities_detected": result["entities_count"],
+            "cache_hit": result["cache_hit"],
+            "country": result["country"],
+            "country_wait_ms": result["country_wait_ms"],
+        }
+
+
+def _discard(task: asyncio.Future) -> None:
+    """Cancel a task whose result is no longer needed (or consume its error)."""
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()
+
+
+def _elapsed_ms(start: float, end: float) -> int:
+    return max(0, int((end - start) * 1000))
+
+
+# ============================================================
+# Streamed output text
+# ============================================================
+# output_text of a streamed document: a reference to the text file
+STREAMED_OUTPUT_PREFIX = "file://"
+
+
+def streamed_text_path(out_path: str) -> str:
+    """Where _mask_streaming() writes the anonymized text of *out_path*."""
+    return os.path.splitext(out_path)[0] + ".txt"
+
+
+def streamed_output_text(out_path: str) -> str:
+    return STREAMED_OUTPUT_PREFIX + streamed_text_path(out_path)
+
+
+def remove_masked_outputs(out_path: str) -> None:
+    """Remove a masked document and the streamed text written beside it, if any."""
+    for path in (out_path, streamed_text_path(out_path)):
+        if os.path.exists(path):
+            os.remove(path)
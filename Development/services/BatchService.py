@@ -0,0 +1,140 @@
+"""
+Batch masking: many documents for one assessment, saved together.
+
+The /handle-pii/batch endpoint detects the country, sets up the repository
+and checks the assessment once, then hands the documents to a BatchService.
+Documents go through BaseService.run_pipeline_async() concurrently,
+BATCH_CONCURRENCY at a time, so one document's I/O overlaps another's CPU
+stages. A document that fails is reported in the manifest and does not stop
+the others; the successful ones are saved with save_pii_details_batch(),
+one transaction (one locked CSV append) for the whole batch.
+"""
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+import asyncio
+import os
+import logging
+
+from fastapi import UploadFile
+
+from services.BaseService import BaseService, remove_masked_outputs
+from utility.ExecutionPool import ExecutionPool
+from utility.exceptions import PIIException
+
+logger = logging.getLogger(__name__)
+
+# Documents of one batch processed concurrently
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+
+def input_type_of(filename: str) -> str:
+    """Input type from a file's extension ("txt" without one)."""
+    ext = os.path.splitext(filename)[1].lstrip(".").lower()
+    return ext if ext else "txt"
+
+
+class BatchService:
+    """Run the documents of one batch and save the successful ones together."""
+
+    def __init__(
+        self,
+        repository,
+        executor: ExecutionPool,
+        route: Callable[[str, object, object], BaseService],
+        batch_id: str,
+        validate: Optional[Callable[[UploadFile, str], None]] = None,
+        concurrency: Optional[int] = None,
+    ):
+        """
+        Args:
+            repository: PIIRepository or CSVRepository
+            executor: Pool the CPU-bound stages run on
+            route: Service for (input_type, repository, presidio)
+            batch_id: Batch identifier, for logging
+            validate: Raises a PIIException for a document that cannot be
+                      processed, given the document and its input type
+            concurrency: Documents in flight at once (default BATCH_CONCURRENCY)
+        """
+        self.repository = repository
+        self.executor = executor
+        self.route = route
+        self.batch_id = batch_id
+        self.validate = validate
+        self.concurrency = BATCH_CONCURRENCY if concurrency is None else concurrency
+
+    async def run(
+        self, documents: List[UploadFile], country: Union[str, Awaitable[str]]
+    ) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Run every document through the pipeline, nothing persisted.
+
+        Returns:
+            The manifest (one entry per document, in order) and the
+            run_pipeline_async() results of the documents that succeeded
+        """
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+        outcomes = await asyncio.gather(*(
+            self.run_document(semaphore, document, country) for document in documents
+        ))
+        return [entry for entry, _ in outcomes], [result for _, result in outcomes if result is not None]
+
+    async def run_document(
+        self,
+        semaphore: asyncio.Semaphore,
+        document: UploadFile,
+        country: Union[str, Awaitable[str]],
+    ) -> Tuple[Dict, Optional[Dict]]:
+        """Run one document; returns its manifest entry and pipeline result (None on failure)."""
+        filename = document.filename or "document"
+        input_type = input_type_of(filename)
+        entry = {"filename": filename, "input_type": input_type}
+        try:
+            if self.validate is not None:
+                self.validate(document, input_type)
+
+            async with semaphore:
+                # The service borrows an engine for its Presidio stages only, so
+                # documents in flight are not capped by the engine pool's size
+                service = self.route(input_type, self.repository, None)
+                result = await service.run_pipeline_async(self.executor, document, country)
+
+            entry.update(
+                status="succeeded",
+                request_id=result["request_id"],
+                processed_document=result["processed_document"],
+                entities_detected=result["entities_count"],
+                cache_hit=result["cache_hit"],
+            )
+            return entry, result
+        except PIIException as e:
+            logger.error(f"[{self.batch_id}] {filename}: {e}")
+            entry.update(status="failed", error=e.message)
+        except Exception as e:
+            logger.error(f"[{self.batch_id}] {filename}: unexpected {e}", exc_info=True)
+            entry.update(status="failed", error=str(e))
+        return entry, None
+
+    def save(
+        self,
+        results: List[Dict],
+        assessment_id: str,
+        prospect_id: str,
+        caller_name: str,
+        created_by: str = "system",
+    ) -> None:
+        """
+        Persist *results* in one repository transaction.
+
+        If the save fails the masked documents are removed: no row points at
+        them and they would otherwise stay in the temp directory.
+        """
+        if not results:
+            return
+        try:
+            self.repository.save_pii_details_batch([
+                BaseService.pii_record(r, assessment_id, prospect_id, caller_name, r["country"], created_by)
+                for r in results
+            ])
+        except BaseException:
+            for r in results:
+                remove_masked_outputs(r["processed_document"])
+            raise
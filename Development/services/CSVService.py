@@ -1,38 +1,60 @@
 """
-CSV Service – Handle CSV files by converting to XLSX first.
+CSV Service – mask PII in CSV files cell by cell with the csv module.
 
-This service converts CSV files to XLSX using LibreOffice, then processes
-them through the XLSXService for cell-by-cell PII masking.
-This ensures better formatting preservation and consistent handling.
+The file's encoding and dialect (delimiter, quoting) are detected once and
+the masked file is written back in the same ones, so the output is the
+input CSV with its PII cells rewritten. CSV_OUTPUT_FORMAT=xlsx writes the
+masked rows to a workbook instead (values stay text, so IDs keep their
+leading zeros).
+
+Files from CSV_STREAMING_MIN_MB up are never held whole: rows are read in
+batches of CSV_BATCH_ROWS, their distinct cell values analyzed once per
+batch (see CellAnonymizer) and the masked rows written as they are done.
 """
+from contextlib import contextmanager
 from fastapi import UploadFile
-import tempfile
+from typing import Dict, Iterable, Iterator, List, Tuple
+import codecs
+import csv
+import io
+import itertools
+import logging
 import os
 
-from services.BaseService import BaseService
-from services.LibreOfficeConverter import LibreOfficeConverter, ConversionException
-from services.XLSXService import XLSXService
+import openpyxl
+
+from services.BaseService import BaseService, remove_masked_outputs, streamed_text_path
+from utility.CellAnonymizer import CellAnonymizer
+from utility.DocumentIngestion import IngestedDocument
+from utility.DocumentModel import DocumentBuilder, ExtractedDocument, apply_spans
 from utility.exceptions import FileValidationException, DocumentProcessingException
 
+logger = logging.getLogger(__name__)
+
+CSV_STREAMING_MIN_MB = float(os.getenv("CSV_STREAMING_MIN_MB", "10"))
+CSV_BATCH_ROWS = int(os.getenv("CSV_BATCH_ROWS", "1000"))
+# "csv" (default) or "xlsx"
+CSV_OUTPUT_FORMAT = os.getenv("CSV_OUTPUT_FORMAT", "csv").lower()
+
+# Tried in order (utf-8-sig when the file starts with a BOM); latin-1 decodes any byte sequence
+_ENCODINGS = ("utf-8", "cp1252", "latin-1")
+_SNIFF_BYTES = 64 * 1024
+_READ_BYTES = 1024 * 1024
+# Within a row cells are joined by spaces, rows by newlines
+_CELL_SEPARATOR = " "
+_ROW_SEPARATOR = "\n"
+
 
 class CSVService(BaseService):
     """
     Service for processing CSV files.
-    
+
     Workflow:
-    1. Save uploaded CSV file to temp location
-    2. Convert CSV to XLSX using LibreOffice
-    3. Process XLSX through XLSXService
-    4. Return anonymized XLSX
-    
-    Note: Output will be XLSX format, not CSV. This is intentional
-    to ensure better formatting preservation and consistent cell-based masking.
+    1. Detect the encoding and dialect of the CSV file
+    2. Read its rows (in batches for large files)
+    3. Detect PII in the cell values
+    4. Write the masked rows as CSV (or XLSX)
     """
-    
-    def __init__(self, repository, presidio):
-        super().__init__(repository, presidio)
-        self.converter = LibreOfficeConverter()
-        self.xlsx_service = XLSXService(repository, presidio)
 
     def _validate(self, document: UploadFile) -> None:
         """Validate that the file is a CSV file."""
@@ -40,99 +62,154 @@ class CSVService(BaseService):
         if not fn.endswith(".csv"):
             raise FileValidationException("File must be a .csv file")
 
+    @staticmethod
+    def _masked_filename(original: str) -> str:
+        """'export.csv' -> 'export_masked.csv' (or '.xlsx' for XLSX output)"""
+        name, ext = os.path.splitext(original)
+        return f"{name}_masked{'.xlsx' if CSV_OUTPUT_FORMAT == 'xlsx' else ext}"
+
+    def _cache_kind(self, ext: str) -> str:
+        return f"{super()._cache_kind(ext)}:{CSV_OUTPUT_FORMAT}"
+
     def _extract_text(self, raw: bytes, filename: str) -> str:
-        """
-        Extract text from CSV file by converting to XLSX first.
-        
-        Args:
-            raw: Raw CSV file bytes
-            filename: Original filename
-            
-        Returns:
-            Extracted text
-        """
+        return self._extract_document(raw, filename).text
+
+    def _extract_document(self, raw: bytes, filename: str) -> ExtractedDocument:
+        """Non-blank cells; each cell is a segment located by (row, column)."""
         try:
-            # Save CSV to temp file
-            with tempfile.NamedTemporaryFile(
-                suffix='.csv',
-                delete=False
-            ) as temp_csv:
-                temp_csv.write(raw)
-                temp_csv_path = temp_csv.name
-            
-            try:
-                # Convert to XLSX
-                temp_xlsx_path = self.converter.convert_csv_to_xlsx(temp_csv_path)
-                
-                try:
-                    # Extract text from XLSX
-                    with open(temp_xlsx_path, 'rb') as f:
-                        xlsx_bytes = f.read()
-                    
-                    text = self.xlsx_service._extract_text(xlsx_bytes, filename)
-                    
-                    return text
-                    
-                finally:
-                    # Clean up temp XLSX
-                    if os.path.exists(temp_xlsx_path):
-                        os.unlink(temp_xlsx_path)
-            finally:
-                # Clean up temp CSV
-                if os.path.exists(temp_csv_path):
-                    os.unlink(temp_csv_path)
-                    
-        except ConversionException as e:
-            raise DocumentProcessingException(f"CSV to XLSX conversion failed: {e}")
+            text, _ = _decode(raw)
+            builder = DocumentBuilder(separator=_CELL_SEPARATOR)
+            for row_num, row in enumerate(csv.reader(io.StringIO(text, newline=""), _sniff(text))):
+                separator = _ROW_SEPARATOR
+                for col_num, value in enumerate(row):
+                    if value.strip():
+                        builder.add(value, (row_num, col_num), separator)
+                        separator = None
+            return builder.build()
         except Exception as e:
-            raise DocumentProcessingException(f"CSV text extraction failed: {e}")
+            raise DocumentProcessingException(f"CSV parse failed: {e}")
+
+    def _build_masked_document(self, raw, extracted, anon, out_path):
+        """Write every row back, rewriting only the cells that contain a detected span."""
+        try:
+            masked = {
+                extracted.locations[index]: apply_spans(extracted.segment_text(index), spans)
+                for index, spans in extracted.segment_spans(anon["spans"])
+            }
+            text, encoding = _decode(raw)
+            dialect = _sniff(text)
+            rows = csv.reader(io.StringIO(text, newline=""), dialect)
+            with _row_writer(out_path, encoding, dialect) as write:
+                for row_num, row in enumerate(rows):
+                    write([masked.get((row_num, col_num), value) for col_num, value in enumerate(row)])
+        except Exception as e:
+            raise DocumentProcessingException(f"CSV masking failed: {e}")
 
-    def _build_masked_output(self, raw, mapping, anonymized_text, out_path):
+    # ------------------------------------------------------------------
+    # Streaming
+    # ------------------------------------------------------------------
+    def _use_streaming(self, source: IngestedDocument) -> bool:
+        if source.size < CSV_STREAMING_MIN_MB * 1024 * 1024:
+            return False
+        source.materialize()  # the stream stage may run in a worker process
+        return True
+
+    def _mask_streaming(self, source: IngestedDocument, country: str, out_path: str) -> Dict:
         """
-        Build masked output by converting to XLSX and masking.
-        
-        Args:
-            raw: Original CSV file bytes
-            mapping: PII mapping (not used directly)
-            anonymized_text: Text with PII replaced by tags
-            out_path: Output file path (will be XLSX)
+        Mask the CSV batch by batch with bounded memory.
+
+        Each batch of CSV_BATCH_ROWS rows is masked by one CellAnonymizer
+        call and written out, with its anonymized text, before the next
+        batch is read.
         """
+        path = source.path
         try:
-            # Save CSV to temp file
-            with tempfile.NamedTemporaryFile(
-                suffix='.csv',
-                delete=False
-            ) as temp_csv:
-                temp_csv.write(raw)
-                temp_csv_path = temp_csv.name
-            
-            try:
-                # Convert to XLSX
-                temp_xlsx_path = self.converter.convert_csv_to_xlsx(temp_csv_path)
-                
-                try:
-                    # Read XLSX bytes
-                    with open(temp_xlsx_path, 'rb') as f:
-                        xlsx_bytes = f.read()
-                    
-                    # Process through XLSX service
-                    self.xlsx_service._build_masked_output(
-                        xlsx_bytes,
-                        mapping,
-                        anonymized_text,
-                        out_path
-                    )
-                    
-                finally:
-                    # Clean up temp XLSX
-                    if os.path.exists(temp_xlsx_path):
-                        os.unlink(temp_xlsx_path)
-            finally:
-                # Clean up temp CSV
-                if os.path.exists(temp_csv_path):
-                    os.unlink(temp_csv_path)
-                    
-        except ConversionException as e:
-            raise DocumentProcessingException(f"CSV to XLSX conversion failed: {e}")
+            encoding = _detect_encoding(path)
+            with open(path, "r", encoding=encoding, newline="") as f:
+                dialect = _sniff(f.read(_SNIFF_BYTES))
+            masker = CellAnonymizer(self.presidio, country)
+            rows_written = 0
+            with open(path, "r", encoding=encoding, newline="") as f, \
+                    _row_writer(out_path, encoding, dialect) as write, \
+                    open(streamed_text_path(out_path), "w", encoding="utf-8") as text_out:
+                for batch in _batches(csv.reader(f, dialect), CSV_BATCH_ROWS):
+                    masked = iter(masker.mask([value for row in batch for value in row]))
+                    for row in batch:
+                        masked_row = [next(masked) for _ in row]
+                        write(masked_row)
+                        cells = _CELL_SEPARATOR.join(v for v in masked_row if v.strip())
+                        if cells:
+                            text_out.write((_ROW_SEPARATOR if rows_written else "") + cells)
+                            rows_written += 1
+            logger.info(
+                f"Streamed CSV: {rows_written} rows, {masker.analyzed} distinct values analyzed, "
+                f"{masker.entities_count} entities"
+            )
+            return masker.result()
         except Exception as e:
-            raise DocumentProcessingException(f"CSV masking failed: {e}")
+            remove_masked_outputs(out_path)
+            raise DocumentProcessingException(f"CSV streaming failed: {e}")
+
+
+# ============================================================
+# Helpers
+# ============================================================
+def _decode(raw: bytes) -> Tuple[str, str]:
+    """The CSV text and the encoding it was read with."""
+    if raw.startswith(codecs.BOM_UTF8):
+        return raw.decode("utf-8-sig"), "utf-8-sig"
+    for encoding in _ENCODINGS:
+        try:
+            return raw.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    raise DocumentProcessingException("CSV encoding not recognised")
+
+
+def _detect_encoding(path: str) -> str:
+    """First of _ENCODINGS that decodes the whole file, read in blocks."""
+    with open(path, "rb") as f:
+        if f.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8:
+            return "utf-8-sig"
+    for encoding in _ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(_READ_BYTES), b""):
+                    decoder.decode(block)
+            decoder.decode(b"", final=True)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    raise DocumentProcessingException("CSV encoding not recognised")
+
+
+def _sniff(sample: str):
+    """The CSV dialect of *sample* (its start is enough); Excel's when unclear."""
+    try:
+        return csv.Sniffer().sniff(sample[:_SNIFF_BYTES], delimiters=",;\t|")
+    except csv.Error:
+        return csv.excel
+
+
+def _batches(rows: Iterable[List[str]], size: int) -> Iterator[List[List[str]]]:
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+@contextmanager
+def _row_writer(out_path: str, encoding: str, dialect):
+    """Yield a function writing one row to *out_path*, as CSV or XLSX per CSV_OUTPUT_FORMAT."""
+    if CSV_OUTPUT_FORMAT == "xlsx":
+        # Write-only workbooks stream rows to disk instead of keeping them
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet("Sheet1")
+        yield ws.append
+        wb.save(out_path)
+        return
+    with open(out_path, "w", encoding=encoding, newline="") as f:
+        yield csv.writer(f, dialect).writerow
@@ -0,0 +1,146 @@
+"""
+Stateful anonymization of a conversation, message by message.
+
+Chat transcripts used to go through /handle-pii one message at a time,
+each with its own request id, key and mapping, so the same person got a
+different tag on every turn. A ConversationService holds one session
+instead: one ConsistentAnonymizer for every message, one mapping row saved
+when the session ends.
+
+Each message is analyzed together with the last CONVERSATION_CONTEXT_CHARS
+characters of the conversation before it (a sliding window), so a name
+answering "what's your name?" is seen in context; entities found in the
+context were masked with their own message and are not tagged again.
+Only the window's tail is kept, so memory does not grow with the
+conversation beyond its mapping.
+"""
+from typing import Dict, List
+import os
+import logging
+
+from presidio_analyzer import RecognizerResult
+
+from utility.DocumentModel import apply_spans
+from utility.ExecutionPool import ExecutionPool
+from utility.PresidioUtility import ConsistentAnonymizer
+from utility.country_pii_config import DEFAULT_COUNTRY
+from utility.helpers import generate_request_id
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_CONTEXT_CHARS = int(os.getenv("CONVERSATION_CONTEXT_CHARS", "300"))
+# Between messages in the analysis window
+_SEPARATOR = "\n"
+
+
+class ConversationService:
+    """Mask the messages of one conversation with a consistent tag mapping."""
+
+    def __init__(
+        self,
+        repository,
+        executor: ExecutionPool,
+        country: str = DEFAULT_COUNTRY,
+        language: str = "en",
+        context_chars: int = CONVERSATION_CONTEXT_CHARS,
+    ):
+        """
+        Args:
+            repository: PIIRepository or CSVRepository for the mapping row
+            executor: Runs detection (on the worker engines in process mode)
+            country: Country name for country-specific entities
+            language: Language code
+            context_chars: Characters of earlier messages analyzed with each message
+        """
+        self.repository = repository
+        self.executor = executor
+        self.country = country
+        self.language = language
+        self.context_chars = context_chars
+        self.request_id = generate_request_id()
+
+        self.encryption_key = os.urandom(16).hex()
+        self.mapper = ConsistentAnonymizer(crypto_key=self.encryption_key)
+        self.messages = 0
+        self.entities_count = 0
+        # Highest-scoring entity per type: all the mapping metadata needs
+        self._best: Dict[str, RecognizerResult] = {}
+        self._context = ""  # tail of the conversation so far, unmasked
+
+    async def mask(self, text: str) -> Dict:
+        """
+        Mask the next message.
+
+        Returns:
+            ``message_id`` (0-based), the masked ``text`` and ``entities_detected``
+        """
+        offset = len(self._context) + len(_SEPARATOR) if self._context else 0
+        window = f"{self._context}{_SEPARATOR}{text}" if self._context else text
+        entities: List[RecognizerResult] = []
+        if text.strip():
+            entities = await self.executor.run_pooled_presidio_stage(
+                "detect", "detect_pii", window, self.language, self.country
+            )
+
+        spans = []
+        for entity in sorted(entities, key=lambda e: e.start):
+            # Context text was masked with its own message; an entity running
+            # on into this one ("John" / "Smith") is masked from here on
+            if entity.end <= offset:
+                continue
+            start = max(entity.start, offset)
+            best = self._best.get(entity.entity_type)
+            if best is None or entity.score > best.score:
+                self._best[entity.entity_type] = entity
+            tag = self.mapper.operator_logic(window[start:entity.end], entity.entity_type)
+            spans.append((start - offset, entity.end - offset, tag))
+
+        self._context = _tail(window, self.context_chars)
+        message_id = self.messages
+        self.messages += 1
+        self.entities_count += len(spans)
+        return {"message_id": message_id, "text": apply_spans(text, spans), "entities_detected": len(spans)}
+
+    def result(self) -> Dict:
+        """Mapping, encryption key and entity count, as anonymize_text() returns them."""
+        if not self.mapper.tag_to_encrypted:
+            return {"mapping": {}, "encryption_key": "", "entities_count": 0}
+        return {
+            "mapping": self.mapper.get_mapping_with_metadata(list(self._best.values())),
+            "encryption_key": self.encryption_key,
+            "entities_count": self.entities_count,
+        }
+
+    def save(self, assessment_id: str, prospect_id: str, caller_name: str, created_by: str = "system") -> Dict:
+        """Persist the session's mapping as one repository row; returns result()."""
+        result = self.result()
+        self.repository.save_pii_details(
+            request_id=self.request_id,
+            assessment_id=assessment_id,
+            prospect_id=prospect_id,
+            input_type="txt",
+            caller_name=caller_name,
+            country=self.country,
+            # Masked messages went back to the caller; nothing is stored
+            processed_document="",
+            output_text="",
+            anonymizing_mapping=result["mapping"],
+            encrypted_key=result["encryption_key"],
+            created_by=created_by,
+        )
+        logger.info(
+            f"[{self.request_id}] Session of {self.messages} messages saved "
+            f"({self.entities_count} entities)"
+        )
+        return result
+
+
+def _tail(text: str, chars: int) -> str:
+    """The last *chars* characters of *text*, from a word boundary."""
+    if len(text) <= chars:
+        return text
+    tail = text[-chars:] if chars > 0 else ""
+    if not tail or text[-chars - 1].isspace():
+        return tail
+    cut = next((i for i, ch in enumerate(tail) if ch.isspace()), len(tail))
+    return tail[cut:].lstrip()
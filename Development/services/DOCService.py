@@ -5,12 +5,11 @@ This service converts .doc files to PDF using LibreOffice, then processes
 them through the PDFService for precise coordinate-based PII redaction.
 """
 from fastapi import UploadFile
-import tempfile
-import os
 
 from services.BaseService import BaseService
 from services.LibreOfficeConverter import LibreOfficeConverter, ConversionException
 from services.PDFService import PDFService
+from utility.DocumentModel import ExtractedDocument
 from utility.exceptions import FileValidationException, DocumentProcessingException
 
 
@@ -25,6 +24,9 @@ class DOCService(BaseService):
     4. Return anonymized PDF
     """
     
+    needs_source_path = True
+    converted_suffix = '.pdf'
+
     def __init__(self, repository, presidio):
         super().__init__(repository, presidio)
         self.converter = LibreOfficeConverter()
@@ -36,7 +38,7 @@ class DOCService(BaseService):
         if not fn.endswith(".doc"):
             raise FileValidationException("File must be a .doc file")
     
-    def _extract_text(self, raw: bytes, filename: str) -> str:
+    def _extract_document(self, raw: bytes, filename: str) -> ExtractedDocument:
         """
         Extract text from .doc file by converting to PDF first.
         
@@ -45,89 +47,31 @@ class DOCService(BaseService):
             filename: Original filename
             
         Returns:
-            Extracted text
+            Extracted text, located in the converted PDF
         """
         try:
-            # Save .doc to temp file
-            with tempfile.NamedTemporaryFile(
-                suffix='.doc',
-                delete=False
-            ) as temp_doc:
-                temp_doc.write(raw)
-                temp_doc_path = temp_doc.name
-            
-            try:
-                # Convert to PDF
-                temp_pdf_path = self.converter.convert_to_pdf(temp_doc_path)
-                
-                try:
-                    # Extract text from PDF
-                    with open(temp_pdf_path, 'rb') as f:
-                        pdf_bytes = f.read()
-                    
-                    text = self.pdf_service._extract_text(pdf_bytes, filename)
-                    
-                    return text
-                    
-                finally:
-                    # Clean up temp PDF
-                    if os.path.exists(temp_pdf_path):
-                        os.unlink(temp_pdf_path)
-            finally:
-                # Clean up temp DOC
-                if os.path.exists(temp_doc_path):
-                    os.unlink(temp_doc_path)
-                    
+            # Converted once per request; masking reuses the same file
+            pdf_bytes = self._converted(raw, '.doc', self.converter.convert_to_pdf)
+            return self.pdf_service._extract_document(pdf_bytes, filename)
         except ConversionException as e:
             raise DocumentProcessingException(f"DOC to PDF conversion failed: {e}")
         except Exception as e:
             raise DocumentProcessingException(f"DOC text extraction failed: {e}")
     
-    def _build_masked_output(self, raw, mapping, anonymized_text, out_path):
+    def _build_masked_document(self, raw, extracted, anon, out_path):
         """
         Build masked output by converting to PDF and redacting.
         
         Args:
             raw: Original .doc file bytes
-            mapping: PII mapping (not used directly)
-            anonymized_text: Text with PII replaced by tags
+            extracted: The document returned by _extract_document()
+            anon: anonymize_text() result; its spans locate the PII
             out_path: Output file path (will be PDF)
         """
         try:
-            # Save .doc to temp file
-            with tempfile.NamedTemporaryFile(
-                suffix='.doc',
-                delete=False
-            ) as temp_doc:
-                temp_doc.write(raw)
-                temp_doc_path = temp_doc.name
-            
-            try:
-                # Convert to PDF
-                temp_pdf_path = self.converter.convert_to_pdf(temp_doc_path)
-                
-                try:
-                    # Read PDF bytes
-                    with open(temp_pdf_path, 'rb') as f:
-                        pdf_bytes = f.read()
-                    
-                    # Process through PDF service
-                    self.pdf_service._build_masked_output(
-                        pdf_bytes,
-                        mapping,
-                        anonymized_text,
-                        out_path
-                    )
-                    
-                finally:
-                    # Clean up temp PDF
-                    if os.path.exists(temp_pdf_path):
-                        os.unlink(temp_pdf_path)
-            finally:
-                # Clean up temp DOC
-                if os.path.exists(temp_doc_path):
-                    os.unlink(temp_doc_path)
-                    
+            # The conversion made for extraction
+            pdf_bytes = self._converted(raw, '.doc', self.converter.convert_to_pdf)
+            self.pdf_service._build_masked_document(pdf_bytes, extracted, anon, out_path)
         except ConversionException as e:
             raise DocumentProcessingException(f"DOC to PDF conversion failed: {e}")
         except Exception as e:
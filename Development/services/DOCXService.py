@@ -1,37 +1,51 @@
 """
-DOCX Service – Handle .docx files by converting to PDF first.
+DOCX Service – mask PII in .docx files natively, keeping the DOCX format.
 
-This service converts .docx files to PDF using LibreOffice, then processes
-them through the PDFService for precise coordinate-based PII redaction.
-This ensures better formatting preservation and more accurate PII masking.
+Paragraphs are read straight from the OOXML package (see utility.docx_runs)
+and detected values are replaced in the affected runs only, so the output
+is the original document with its formatting, minus the PII.
+
+Documents the native path cannot mask safely (tracked deletions, imported
+altChunk content, damaged packages) fall back to converting to PDF with
+LibreOffice and redacting it through the PDFService; their output is a PDF.
+DOCX_NATIVE_MASKING=false sends every document down that path.
 """
 from fastapi import UploadFile
-import tempfile
+import logging
 import os
 
 from services.BaseService import BaseService
 from services.LibreOfficeConverter import LibreOfficeConverter, ConversionException
 from services.PDFService import PDFService
+from utility.DocumentModel import ExtractedDocument
+from utility.docx_runs import ParagraphLocation, UnsupportedDocument, extract_docx, mask_docx
 from utility.exceptions import FileValidationException, DocumentProcessingException
 
+logger = logging.getLogger(__name__)
+
+DOCX_NATIVE_MASKING = os.getenv("DOCX_NATIVE_MASKING", "true").lower() == "true"
+
 
 class DOCXService(BaseService):
     """
     Service for processing .docx files.
     
     Workflow:
-    1. Save uploaded .docx file to temp location
-    2. Convert .docx to PDF using LibreOffice
-    3. Process PDF through PDFService
-    4. Return anonymized PDF
+    1. Read paragraphs and runs from the .docx package
+    2. Detect PII in the paragraph text
+    3. Rewrite the runs holding PII in place
+    4. Return the anonymized DOCX
     
-    Note: Output will be PDF format, not DOCX. This is intentional
-    to ensure precise coordinate-based redaction and formatting preservation.
+    Fallback (unsupported documents): convert to PDF with LibreOffice,
+    redact it through PDFService and return the anonymized PDF.
     """
     
+    converted_suffix = '.pdf'
+
     def __init__(self, repository, presidio):
         super().__init__(repository, presidio)
-        self.converter = LibreOfficeConverter()
+        # Looked up on first fallback: the native path needs no LibreOffice
+        self.converter = None
         self.pdf_service = PDFService(repository, presidio)
 
     def _validate(self, document: UploadFile) -> None:
@@ -40,99 +54,65 @@ class DOCXService(BaseService):
         if not fn.endswith(".docx"):
             raise FileValidationException("File must be a .docx file")
 
-    def _extract_text(self, raw: bytes, filename: str) -> str:
+    def _extract_document(self, raw: bytes, filename: str) -> ExtractedDocument:
         """
-        Extract text from .docx file by converting to PDF first.
+        Extract paragraph text from the .docx package, or from its PDF conversion.
         
         Args:
             raw: Raw .docx file bytes
             filename: Original filename
             
         Returns:
-            Extracted text
+            Extracted text, located by paragraph (native) or in the converted PDF
         """
-        try:
-            # Save .docx to temp file
-            with tempfile.NamedTemporaryFile(
-                suffix='.docx',
-                delete=False
-            ) as temp_docx:
-                temp_docx.write(raw)
-                temp_docx_path = temp_docx.name
-            
+        if DOCX_NATIVE_MASKING:
             try:
-                # Convert to PDF
-                temp_pdf_path = self.converter.convert_to_pdf(temp_docx_path)
-                
-                try:
-                    # Extract text from PDF
-                    with open(temp_pdf_path, 'rb') as f:
-                        pdf_bytes = f.read()
-                    
-                    text = self.pdf_service._extract_text(pdf_bytes, filename)
-                    
-                    return text
-                    
-                finally:
-                    # Clean up temp PDF
-                    if os.path.exists(temp_pdf_path):
-                        os.unlink(temp_pdf_path)
-            finally:
-                # Clean up temp DOCX
-                if os.path.exists(temp_docx_path):
-                    os.unlink(temp_docx_path)
-                    
+                return extract_docx(raw)
+            except UnsupportedDocument as e:
+                logger.info(f"{filename}: {e}; converting with LibreOffice")
+            except Exception as e:
+                logger.warning(f"{filename}: native DOCX extraction failed ({e}); converting with LibreOffice")
+
+        try:
+            # Converted once per request; masking reuses the same file
+            pdf_bytes = self._converted(raw, '.docx', self._converter().convert_to_pdf)
+            return self.pdf_service._extract_document(pdf_bytes, filename)
         except ConversionException as e:
             raise DocumentProcessingException(f"DOCX to PDF conversion failed: {e}")
         except Exception as e:
             raise DocumentProcessingException(f"DOCX text extraction failed: {e}")
 
-    def _build_masked_output(self, raw, mapping, anonymized_text, out_path):
+    def _build_masked_document(self, raw, extracted, anon, out_path):
         """
-        Build masked output by converting to PDF and redacting.
+        Build masked output the way the document was extracted.
         
         Args:
             raw: Original .docx file bytes
-            mapping: PII mapping (not used directly)
-            anonymized_text: Text with PII replaced by tags
-            out_path: Output file path (will be PDF)
+            extracted: The document returned by _extract_document()
+            anon: anonymize_text() result; its spans locate the PII
+            out_path: Output file path (DOCX, or PDF for the fallback)
         """
-        try:
-            # Save .docx to temp file
-            with tempfile.NamedTemporaryFile(
-                suffix='.docx',
-                delete=False
-            ) as temp_docx:
-                temp_docx.write(raw)
-                temp_docx_path = temp_docx.name
-            
+        if not extracted.locations or isinstance(extracted.locations[0], ParagraphLocation):
             try:
-                # Convert to PDF
-                temp_pdf_path = self.converter.convert_to_pdf(temp_docx_path)
-                
-                try:
-                    # Read PDF bytes
-                    with open(temp_pdf_path, 'rb') as f:
-                        pdf_bytes = f.read()
-                    
-                    # Process through PDF service
-                    self.pdf_service._build_masked_output(
-                        pdf_bytes,
-                        mapping,
-                        anonymized_text,
-                        out_path
-                    )
-                    
-                finally:
-                    # Clean up temp PDF
-                    if os.path.exists(temp_pdf_path):
-                        os.unlink(temp_pdf_path)
-            finally:
-                # Clean up temp DOCX
-                if os.path.exists(temp_docx_path):
-                    os.unlink(temp_docx_path)
-                    
+                mask_docx(raw, extracted, anon["spans"], out_path)
+                return
+            except UnsupportedDocument as e:
+                if extracted.locations:
+                    raise DocumentProcessingException(f"DOCX masking failed: {e}")
+                # Nothing extracted by either path: build what the fallback would
+            except Exception as e:
+                raise DocumentProcessingException(f"DOCX masking failed: {e}")
+
+        try:
+            # The conversion made for extraction
+            pdf_bytes = self._converted(raw, '.docx', self._converter().convert_to_pdf)
+            self.pdf_service._build_masked_document(pdf_bytes, extracted, anon, out_path)
         except ConversionException as e:
             raise DocumentProcessingException(f"DOCX to PDF conversion failed: {e}")
         except Exception as e:
             raise DocumentProcessingException(f"DOCX masking failed: {e}")
+
+    def _converter(self) -> LibreOfficeConverter:
+        if self.converter is None:
+            self.converter = LibreOfficeConverter()
+        return self.converter
@@ -1,55 +1,164 @@
-"""JSON Service – mask PII in JSON files recursively."""
+"""
+JSON Service – mask PII in JSON files recursively.
+
+Documents below JSON_STREAMING_MIN_MB are parsed whole. Larger ones, and
+every NDJSON / JSON Lines file, are streamed (see utility.json_stream): the
+text is tokenized block by block, JSON_BATCH_LEAVES string leaves at a time
+are masked by a CellAnonymizer, each leaf analyzed on its own with the words
+of its key path as context, and the output is written as it goes, with the
+input's layout and only the masked strings re-encoded.
+"""
 from fastapi import UploadFile
-from typing import Dict, Any
+from typing import Any, Dict, Iterator, List, Tuple, Union
 import json
+import logging
+import os
 
-from services.BaseService import BaseService
+from services.BaseService import BaseService, remove_masked_outputs, streamed_text_path
+from utility.CellAnonymizer import CellAnonymizer
+from utility.DocumentIngestion import IngestedDocument
+from utility.DocumentModel import DocumentBuilder, ExtractedDocument, apply_spans
 from utility.exceptions import FileValidationException, DocumentProcessingException
+from utility.json_stream import Token, encode, iter_tokens, path_context
+
+logger = logging.getLogger(__name__)
+
+JSON_STREAMING_MIN_MB = float(os.getenv("JSON_STREAMING_MIN_MB", "10"))
+JSON_BATCH_LEAVES = int(os.getenv("JSON_BATCH_LEAVES", "1000"))
+
+# One JSON value per line: always streamed
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+_READ_CHARS = 1024 * 1024
+# Raw text held back while a batch fills; a full buffer flushes the batch early
+_MAX_PENDING_CHARS = 1024 * 1024
 
 
 class JSONService(BaseService):
 
     def _validate(self, document: UploadFile) -> None:
         fn = (document.filename or "").lower()
-        if not fn.endswith(".json"):
-            raise FileValidationException("File must be a .json file")
+        if not fn.endswith((".json",) + NDJSON_EXTENSIONS):
+            raise FileValidationException("File must be a .json, .ndjson or .jsonl file")
 
     def _extract_text(self, raw: bytes, filename: str) -> str:
+        return self._extract_document(raw, filename).text
+
+    def _extract_document(self, raw: bytes, filename: str) -> ExtractedDocument:
+        """String leaves joined by spaces; each leaf is a segment located by its JSON path."""
         try:
             data = json.loads(raw.decode("utf-8"))
-            return self._collect_strings(data)
         except Exception as e:
             raise DocumentProcessingException(f"JSON parse failed: {e}")
+        builder = DocumentBuilder(separator=" ")
+        for path, value in self._string_leaves(data, ()):
+            builder.add(value, path)
+        return builder.build()
 
-    def _collect_strings(self, obj: Any) -> str:
-        """Recursively collect all string values."""
+    def _string_leaves(self, obj: Any, path: Tuple) -> Iterator[Tuple[Tuple, str]]:
+        """Yield (path, value) for every string value, in document order."""
         if isinstance(obj, str):
-            return obj + " "
-        if isinstance(obj, dict):
-            return "".join(self._collect_strings(v) for v in obj.values())
-        if isinstance(obj, (list, tuple)):
-            return "".join(self._collect_strings(i) for i in obj)
-        return ""
-
-    def _build_masked_output(self, raw, mapping, anonymized_text, out_path):
-        """Replace PII strings inside the JSON structure."""
+            yield path, obj
+        elif isinstance(obj, dict):
+            for key, value in obj.items():
+                yield from self._string_leaves(value, path + (key,))
+        elif isinstance(obj, list):
+            for i, value in enumerate(obj):
+                yield from self._string_leaves(value, path + (i,))
+
+    def _build_masked_document(self, raw, extracted, anon, out_path):
+        """Replace only the string leaves that contain a detected span."""
         try:
             data = json.loads(raw.decode("utf-8"))
-            orig_text = self._collect_strings(data)
-            from services.CSVService import CSVService
-            replacements = CSVService._build_replacement_pairs(orig_text, anonymized_text)
-            masked = self._mask_json(data, replacements)
+            for index, spans in extracted.segment_spans(anon["spans"]):
+                path = extracted.locations[index]
+                masked = apply_spans(extracted.segment_text(index), spans)
+                if not path:
+                    data = masked  # the document is a single string
+                    continue
+                parent = data
+                for key in path[:-1]:
+                    parent = parent[key]
+                parent[path[-1]] = masked
             with open(out_path, "w", encoding="utf-8") as f:
-                json.dump(masked, f, indent=2, ensure_ascii=False)
+                json.dump(data, f, indent=2, ensure_ascii=False)
         except Exception as e:
             raise DocumentProcessingException(f"JSON masking failed: {e}")
 
-    def _mask_json(self, obj: Any, replacements: Dict[str, str]) -> Any:
-        from services.CSVService import CSVService
-        if isinstance(obj, str):
-            return CSVService._apply_replacements(obj, replacements)
-        if isinstance(obj, dict):
-            return {k: self._mask_json(v, replacements) for k, v in obj.items()}
-        if isinstance(obj, (list, tuple)):
-            return [self._mask_json(i, replacements) for i in obj]
-        return obj
+    # ------------------------------------------------------------------
+    # Streaming
+    # ------------------------------------------------------------------
+    def _use_streaming(self, source: IngestedDocument) -> bool:
+        if source.ext.lower() not in NDJSON_EXTENSIONS and source.size < JSON_STREAMING_MIN_MB * 1024 * 1024:
+            return False
+        source.materialize()  # the stream stage may run in a worker process
+        return True
+
+    def _mask_streaming(self, source: IngestedDocument, country: str, out_path: str) -> Dict:
+        """
+        Mask the document leaf batch by leaf batch with bounded memory.
+
+        Tokens are held back only while the batch holding the string leaves
+        among them fills; then the batch is masked and everything written.
+        """
+        try:
+            masker = CellAnonymizer(self.presidio, country)
+            with open(source.path, "r", encoding="utf-8-sig") as f, \
+                    open(out_path, "w", encoding="utf-8") as out, \
+                    open(streamed_text_path(out_path), "w", encoding="utf-8") as text_out:
+                writer = _LeafBatchWriter(masker, out, text_out)
+                for token in iter_tokens(f, _READ_CHARS):
+                    writer.add(token)
+                writer.flush()
+            logger.info(
+                f"Streamed JSON: {writer.leaves} string leaves, {masker.analyzed} distinct values analyzed, "
+                f"{masker.entities_count} entities"
+            )
+            return masker.result()
+        except Exception as e:
+            remove_masked_outputs(out_path)
+            raise DocumentProcessingException(f"JSON streaming failed: {e}")
+
+
+class _LeafBatchWriter:
+    """Write tokens in order, masking string leaves JSON_BATCH_LEAVES at a time."""
+
+    def __init__(self, masker: CellAnonymizer, out, text_out):
+        self.masker = masker
+        self.out = out
+        self.text_out = text_out
+        self.leaves = 0
+        self._pending: List[Union[str, Token]] = []
+        self._pending_chars = 0
+        self._batch: List[Token] = []
+        self._text_written = False
+
+    def add(self, token: Token) -> None:
+        if token.value is None and not self._batch:
+            self.out.write(token.raw)
+            return
+        self._pending.append(token if token.value is not None else token.raw)
+        self._pending_chars += len(token.raw)
+        if token.value is not None:
+            self._batch.append(token)
+        if len(self._batch) >= JSON_BATCH_LEAVES or self._pending_chars >= _MAX_PENDING_CHARS:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._batch:
+            masked = iter(self.masker.mask(
+                [token.value for token in self._batch],
+                [path_context(token.path) for token in self._batch],
+            ))
+            for piece in self._pending:
+                if isinstance(piece, str):
+                    self.out.write(piece)
+                    continue
+                value = next(masked)
+                self.out.write(piece.raw if value == piece.value else encode(value))
+                if value.strip():
+                    self.text_out.write((" " if self._text_written else "") + value)
+                    self._text_written = True
+            self.leaves += len(self._batch)
+        else:
+            self.out.write("".join(self._pending))
+        self._pending, self._pending_chars, self._batch = [], 0, []
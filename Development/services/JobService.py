@@ -0,0 +1,424 @@
+"""
+Job Service – run document pipelines in the background for /v1/jobs.
+
+A submitted upload is persisted under JOB_DATA_PATH and a job row is written
+to the configured repository (CSV or database) before the request returns.
+A bounded queue feeds JOB_WORKERS asyncio workers, each of which runs the
+same pipeline as /handle-pii and records the outcome on the job row. When
+the job has a callback_url the outcome is POSTed there (best effort, with
+retries). Callbacks only go to hosts in JOB_CALLBACK_ALLOWED_HOSTS, so a
+caller cannot make the service send requests into its own network.
+
+Several JobService instances (uvicorn workers, old and new processes of a
+rolling restart) can share one repository. Each job row is held by one
+instance (owner) under a lease it renews every JOB_LEASE_S / 3 seconds, and
+a job only runs after claim_job() took it in a single conditional update.
+On start-up an instance claims the queued and running jobs whose owner let
+the lease expire: they run again if their upload is still on disk, and fail
+otherwise. Jobs held by a live instance are left alone.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+import asyncio
+import os
+import shutil
+import socket
+import tempfile
+import time
+import uuid
+import logging
+
+import requests
+from fastapi import UploadFile
+
+from repository.CSVRepository import CSVRepository
+from repository.PIIRepository import PIIRepository
+from utility.storage_config import is_csv_mode
+from utility.ExecutionPool import get_execution_pool
+from utility.exceptions import (
+    InvalidInputTypeException,
+    JobNotFoundException,
+    PIIException,
+    ServiceUnavailableException,
+)
+from utility.helpers import generate_job_id
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_DATA_PATH = os.getenv("JOB_DATA_PATH", os.path.join(tempfile.gettempdir(), "pii_jobs"))
+JOB_WEBHOOK_TIMEOUT_S = float(os.getenv("JOB_WEBHOOK_TIMEOUT_S", "10"))
+JOB_WEBHOOK_RETRIES = int(os.getenv("JOB_WEBHOOK_RETRIES", "3"))
+# How long a job stays with an instance that stopped renewing it (crashed)
+JOB_LEASE_S = float(os.getenv("JOB_LEASE_S", "60"))
+# Comma-separated callback hosts; "*.example.com" allows its subdomains.
+# Empty: callback_url is rejected
+JOB_CALLBACK_ALLOWED_HOSTS = [
+    host.strip().lower() for host in os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if host.strip()
+]
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+# Statuses in which a job is held by its owner
+JOB_ACTIVE = [JOB_QUEUED, JOB_RUNNING]
+
+# (repository, job record, persisted upload) -> pipeline result
+JobRunner = Callable[[object, object, UploadFile], Awaitable[Dict]]
+
+
+@contextmanager
+def job_repository() -> Iterator:
+    """
+    Yield a repository for job bookkeeping.
+
+    Jobs outlive the request that submitted them, so in database mode each
+    use opens (and closes) its own session instead of borrowing the request's.
+    """
+    if is_csv_mode():
+        yield CSVRepository()
+        return
+    from utility import database  # resolved late: refresh_oauth_token() rebinds SessionLocal
+
+    session = database.SessionLocal()
+    try:
+        yield PIIRepository(session)
+    finally:
+        session.close()
+
+
+def job_to_dict(job) -> Dict:
+    """Public view of a job record."""
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "input_type": job.input_type,
+        "filename": job.filename,
+        "request_id": job.request_id,
+        "result": job.result,
+        "error": job.error,
+        "created_at": _isoformat(job.created_at),
+        "modified_at": _isoformat(job.modified_at),
+    }
+
+
+def validate_callback_url(url: str) -> None:
+    """
+    Reject a callback_url that is not http(s) or whose host is not allowed.
+
+    Raises:
+        InvalidInputTypeException: The URL cannot be used as a callback
+    """
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+    except ValueError:
+        raise InvalidInputTypeException("callback_url is not a valid URL")
+    if parts.scheme not in ("http", "https") or not host:
+        raise InvalidInputTypeException("callback_url must be an http(s) URL")
+    if parts.username or parts.password:
+        raise InvalidInputTypeException("callback_url must not carry credentials")
+    if not _host_allowed(host):
+        raise InvalidInputTypeException(f"callback_url host {host} is not allowed")
+
+
+def _host_allowed(host: str) -> bool:
+    for allowed in JOB_CALLBACK_ALLOWED_HOSTS:
+        if allowed.startswith("*."):
+            if host.endswith(allowed[1:]):
+                return True
+        elif host == allowed:
+            return True
+    return False
+
+
+def _isoformat(value) -> Optional[str]:
+    if isinstance(value, datetime):
+        return value.isoformat() + "Z"
+    return value or None
+
+
+class JobService:
+    """Bounded background execution of document pipelines."""
+
+    def __init__(
+        self,
+        runner: JobRunner,
+        workers: int = JOB_WORKERS,
+        queue_size: int = JOB_QUEUE_SIZE,
+        data_path: str = JOB_DATA_PATH,
+        lease_s: Optional[float] = None,
+    ):
+        """
+        Args:
+            runner: Coroutine running the pipeline for one job
+            workers: Number of jobs processed concurrently
+            queue_size: Queued jobs accepted before submit() answers 503
+            data_path: Directory holding persisted uploads
+            lease_s: Lease on the jobs this instance holds (default JOB_LEASE_S)
+        """
+        self.runner = runner
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.data_path = data_path
+        self.lease_s = JOB_LEASE_S if lease_s is None else lease_s
+        # Unique per instance: a restarted process must not pass for the old one
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._lease_task: Optional[asyncio.Task] = None
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    async def start(self) -> None:
+        """Start the workers and resume jobs interrupted by a restart."""
+        if self._tasks:
+            return
+        os.makedirs(self.data_path, exist_ok=True)
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [
+            asyncio.create_task(self._worker(n), name=f"pii-job-worker-{n}")
+            for n in range(self.workers)
+        ]
+        self._lease_task = asyncio.create_task(self._renew_leases(), name="pii-job-leases")
+        await self._resume_interrupted()
+        logger.info(f"Job service started with {self.workers} worker(s)")
+
+    async def stop(self) -> None:
+        tasks = self._tasks + ([self._lease_task] if self._lease_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._lease_task = None
+        self._queue = None
+
+    def health(self) -> Dict:
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "queue_size": self.queue_size,
+        }
+
+    async def _resume_interrupted(self) -> None:
+        executor = get_execution_pool()
+        jobs = await executor.run_blocking(self._load_jobs, JOB_ACTIVE)
+        for job in jobs:
+            # Only jobs whose owner let the lease expire; one instance wins each
+            job = await executor.run_blocking(self._claim_job, job.job_id, JOB_ACTIVE, JOB_QUEUED)
+            if job is None:
+                continue
+            if job.source_path and os.path.exists(job.source_path) and not self._queue.full():
+                self._queue.put_nowait(job.job_id)
+                logger.info(f"[{job.job_id}] Resumed after restart")
+                continue
+            await executor.run_blocking(
+                self._update_job, job.job_id,
+                status=JOB_FAILED, error="Job interrupted by a service restart",
+            )
+            self._remove_upload(job.job_id)
+
+    async def _renew_leases(self) -> None:
+        """Keep the jobs this instance holds (queued or running) from being claimed elsewhere."""
+        executor = get_execution_pool()
+        while True:
+            await asyncio.sleep(self.lease_s / 3)
+            try:
+                await executor.run_blocking(self._renew_job_leases)
+            except Exception as e:
+                logger.error(f"Job lease renewal failed: {e}")
+
+    # ------------------------------------------------------------------
+    # Submission and lookup
+    # ------------------------------------------------------------------
+    async def submit(
+        self,
+        document: UploadFile,
+        assessment_id: str,
+        prospect_id: str,
+        caller_name: str,
+        input_type: str,
+        company_name: Optional[str] = None,
+        company_website: Optional[str] = None,
+        callback_url: Optional[str] = None,
+        created_by: str = "system",
+    ):
+        """
+        Persist *document*, record a queued job and enqueue it.
+
+        Returns:
+            The saved job record
+
+        Raises:
+            ServiceUnavailableException: The queue is full or not running
+        """
+        if self._queue is None:
+            raise ServiceUnavailableException("Job workers are not running")
+        if self._queue.full():
+            raise ServiceUnavailableException(
+                f"Job queue is full ({self.queue_size} jobs waiting), retry later"
+            )
+
+        executor = get_execution_pool()
+        job_id = generate_job_id()
+        filename = document.filename or "document"
+        source_path = await executor.run_blocking(self._persist_upload, job_id, document)
+        try:
+            job = await executor.run_blocking(
+                self._save_job,
+                job_id=job_id,
+                assessment_id=assessment_id,
+                prospect_id=prospect_id,
+                caller_name=caller_name,
+                input_type=input_type,
+                filename=filename,
+                source_path=source_path,
+                company_name=company_name,
+                company_website=company_website,
+                callback_url=callback_url,
+                owner=self.owner,
+                lease_expires_at=self._lease_end(),
+                created_by=created_by,
+            )
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            await executor.run_blocking(
+                self._update_job, job_id, status=JOB_FAILED, error="Job queue is full"
+            )
+            self._remove_upload(job_id)
+            raise ServiceUnavailableException("Job queue is full, retry later")
+        except BaseException:
+            self._remove_upload(job_id)
+            raise
+
+        logger.info(f"[{job_id}] Queued {input_type} job for {filename}")
+        return job
+
+    def get_job(self, job_id: str):
+        """Return the job record or raise JobNotFoundException."""
+        with job_repository() as repo:
+            job = repo.get_job(job_id)
+        if not job:
+            raise JobNotFoundException(f"No job found with ID: {job_id}")
+        return job
+
+    # ------------------------------------------------------------------
+    # Execution
+    # ------------------------------------------------------------------
+    async def _worker(self, n: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # _run records failures itself; this only guards the worker loop
+                logger.error(f"[{job_id}] Job worker {n} error: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        executor = get_execution_pool()
+        job = await executor.run_blocking(self._claim_job, job_id, [JOB_QUEUED], JOB_RUNNING)
+        if job is None:
+            # Taken over by another instance after our lease lapsed
+            logger.warning(f"[{job_id}] Job is held by another instance, skipped")
+            return
+        start = datetime.now()
+        updates: Dict
+        try:
+            with open(job.source_path, "rb") as f, job_repository() as repo:
+                document = UploadFile(file=f, filename=job.filename)
+                result = await self.runner(repo, job, document)
+            result["processing_time_ms"] = int((datetime.now() - start).total_seconds() * 1000)
+            updates = dict(status=JOB_SUCCEEDED, request_id=result.get("request_id"), result=result)
+            logger.info(f"[{job_id}] Job succeeded in {result['processing_time_ms']}ms")
+        except PIIException as e:
+            updates = dict(status=JOB_FAILED, error=e.message)
+            logger.error(f"[{job_id}] Job failed: {e}")
+        except Exception as e:
+            updates = dict(status=JOB_FAILED, error=str(e))
+            logger.error(f"[{job_id}] Job failed unexpectedly: {e}", exc_info=True)
+        finally:
+            self._remove_upload(job_id)
+
+        job = await executor.run_blocking(self._update_job, job_id, **updates)
+        if job.callback_url:
+            await executor.run_blocking(self._notify, job)
+
+    # ------------------------------------------------------------------
+    # Blocking helpers (run off the event loop)
+    # ------------------------------------------------------------------
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.data_path, job_id)
+
+    def _persist_upload(self, job_id: str, document: UploadFile) -> str:
+        job_dir = self._job_dir(job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        ext = os.path.splitext(document.filename or "")[1]
+        path = os.path.join(job_dir, f"source{ext}")
+        document.file.seek(0)
+        with open(path, "wb") as out:
+            shutil.copyfileobj(document.file, out, 1024 * 1024)
+        return path
+
+    def _remove_upload(self, job_id: str) -> None:
+        shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+    @staticmethod
+    def _load_jobs(statuses: List[str]) -> List:
+        with job_repository() as repo:
+            return list(repo.get_jobs_by_status(statuses))
+
+    @staticmethod
+    def _save_job(**fields):
+        with job_repository() as repo:
+            return repo.save_job(**fields)
+
+    def _lease_end(self) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=self.lease_s)
+
+    def _claim_job(self, job_id: str, statuses: List[str], status: str):
+        with job_repository() as repo:
+            return repo.claim_job(job_id, self.owner, statuses, status, self._lease_end())
+
+    def _renew_job_leases(self) -> int:
+        with job_repository() as repo:
+            return repo.renew_job_leases(self.owner, JOB_ACTIVE, self._lease_end())
+
+    @staticmethod
+    def _update_job(job_id: str, **fields):
+        with job_repository() as repo:
+            return repo.update_job(job_id, "system", **fields)
+
+    @staticmethod
+    def _notify(job) -> None:
+        """POST the job outcome to its callback_url, retrying with backoff."""
+        try:
+            # Checked again: a resumed job may predate the current allow-list
+            validate_callback_url(job.callback_url)
+        except InvalidInputTypeException as e:
+            logger.warning(f"[{job.job_id}] Webhook not sent: {e.message}")
+            return
+        payload = job_to_dict(job)
+        for attempt in range(1, JOB_WEBHOOK_RETRIES + 1):
+            try:
+                # A redirect could point anywhere: it is not followed
+                response = requests.post(
+                    job.callback_url, json=payload, timeout=JOB_WEBHOOK_TIMEOUT_S, allow_redirects=False
+                )
+                if response.status_code < 500:
+                    logger.info(f"[{job.job_id}] Webhook answered {response.status_code}")
+                    return
+                logger.warning(f"[{job.job_id}] Webhook attempt {attempt} answered {response.status_code}")
+            except requests.RequestException as e:
+                logger.warning(f"[{job.job_id}] Webhook attempt {attempt} failed: {e}")
+            if attempt < JOB_WEBHOOK_RETRIES:
+                time.sleep(2 ** (attempt - 1))
+        logger.error(f"[{job.job_id}] Webhook gave up after {JOB_WEBHOOK_RETRIES} attempts")
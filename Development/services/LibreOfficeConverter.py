@@ -1,10 +1,15 @@
 """
 LibreOffice Converter Service
 Converts DOC/DOCX documents to PDF using LibreOffice headless mode.
+
+Conversions go through the LibreOfficePool of warm instances when it is
+available; otherwise each conversion starts its own soffice process, with a
+profile directory per thread so concurrent conversions never share one.
 """
 import subprocess
 import os
 import tempfile
+import threading
 from pathlib import Path
 from typing import Optional
 
@@ -143,57 +148,10 @@ class LibreOfficeConverter:
         # Ensure output directory exists
         os.makedirs(output_dir, exist_ok=True)
         
-        # Build LibreOffice command
-        cmd = [
-            self.libreoffice_path,
-            "--headless",              # No GUI
-            "--invisible",             # Don't show splash screen
-            "--nocrashreport",         # Don't show crash reports
-            "--nodefault",             # Don't start with default document
-            "--nofirststartwizard",    # Skip first start wizard
-            "--nolockcheck",           # Don't check for lock files
-            "--nologo",                # Don't show logo
-            "--norestore",             # Don't restore previous session
-            "--convert-to", "pdf",     # Output format
-            "--outdir", output_dir,    # Output directory
-            input_path                 # Input file
-        ]
-        
-        try:
-            # Run conversion
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=300  # 5 minute timeout
-            )
-            
-            if result.returncode != 0:
-                error_msg = result.stderr or result.stdout or "Unknown error"
-                raise ConversionException(
-                    f"LibreOffice conversion failed: {error_msg}"
-                )
-            
-            # Calculate output PDF path
-            input_name = Path(input_path).stem
-            output_pdf = os.path.join(output_dir, f"{input_name}.pdf")
-            
-            if not os.path.exists(output_pdf):
-                raise ConversionException(
-                    f"PDF not created at expected location: {output_pdf}"
-                )
-            
-            return output_pdf
-            
-        except subprocess.TimeoutExpired:
-            raise ConversionException(
-                "Conversion timeout (>5 minutes). "
-                "The document may be too large or complex."
-            )
-        except ConversionException:
-            raise
-        except Exception as e:
-            raise ConversionException(f"Conversion error: {e}")
+        input_name = Path(input_path).stem
+        output_pdf = os.path.join(output_dir, f"{input_name}.pdf")
+        self._convert(input_path, output_dir, output_pdf, "pdf", "LibreOffice conversion")
+        return output_pdf
     
     def convert_csv_to_xlsx(
         self,
@@ -233,6 +191,33 @@ class LibreOfficeConverter:
         # Ensure output directory exists
         os.makedirs(output_dir, exist_ok=True)
         
+        input_name = Path(input_path).stem
+        output_xlsx = os.path.join(output_dir, f"{input_name}.xlsx")
+        self._convert(input_path, output_dir, output_xlsx, "xlsx", "LibreOffice CSV to XLSX conversion")
+        return output_xlsx
+
+    def _convert(
+        self, input_path: str, output_dir: str, output_path: str, target: str, label: str
+    ) -> None:
+        """
+        Convert *input_path* to *output_path* (``<output_dir>/<stem>.<target>``).
+
+        Uses a warm pooled instance when possible, else a one-shot process.
+        """
+        from services.LibreOfficePool import get_libreoffice_pool
+
+        pool = get_libreoffice_pool()
+        if pool.available:
+            pool.convert(input_path, output_path, target)
+        else:
+            self._convert_one_shot(input_path, output_dir, target, label)
+
+        if not os.path.exists(output_path):
+            raise ConversionException(
+                f"{target.upper()} not created at expected location: {output_path}"
+            )
+
+    def _convert_one_shot(self, input_path: str, output_dir: str, target: str, label: str) -> None:
         # Build LibreOffice command
         cmd = [
             self.libreoffice_path,
@@ -244,7 +229,8 @@ class LibreOfficeConverter:
             "--nolockcheck",           # Don't check for lock files
             "--nologo",                # Don't show logo
             "--norestore",             # Don't restore previous session
-            "--convert-to", "xlsx",    # Output format
+            f"-env:UserInstallation={_thread_profile_uri()}",
+            "--convert-to", target,    # Output format
             "--outdir", output_dir,    # Output directory
             input_path                 # Input file
         ]
@@ -260,30 +246,17 @@ class LibreOfficeConverter:
             
             if result.returncode != 0:
                 error_msg = result.stderr or result.stdout or "Unknown error"
-                raise ConversionException(
-                    f"LibreOffice CSV to XLSX conversion failed: {error_msg}"
-                )
-            
-            # Calculate output XLSX path
-            input_name = Path(input_path).stem
-            output_xlsx = os.path.join(output_dir, f"{input_name}.xlsx")
-            
-            if not os.path.exists(output_xlsx):
-                raise ConversionException(
-                    f"XLSX not created at expected location: {output_xlsx}"
-                )
-            
-            return output_xlsx
+                raise ConversionException(f"{label} failed: {error_msg}")
             
         except subprocess.TimeoutExpired:
             raise ConversionException(
-                "CSV to XLSX conversion timeout (>5 minutes). "
-                "The file may be too large."
+                f"{label} timeout (>5 minutes). "
+                "The document may be too large or complex."
             )
         except ConversionException:
             raise
         except Exception as e:
-            raise ConversionException(f"CSV to XLSX conversion error: {e}")
+            raise ConversionException(f"{label} error: {e}")
     
     def convert_to_pdf_bytes(self, input_path: str) -> bytes:
         """
@@ -356,6 +329,14 @@ class LibreOfficeConverter:
         return results
 
 
+def _thread_profile_uri() -> str:
+    """A LibreOffice profile used only by the calling thread (reused across its calls)."""
+    profile = os.path.join(
+        tempfile.gettempdir(), "pii_libreoffice_oneshot", f"{os.getpid()}_{threading.get_ident()}"
+    )
+    return Path(profile).as_uri()
+
+
 # Convenience function for quick conversions
 def convert_doc_to_pdf(input_path: str, output_dir: Optional[str] = None) -> str:
     """
@@ -0,0 +1,446 @@
+"""
+Pool of long-lived headless LibreOffice instances.
+
+Starting ``soffice --headless --convert-to`` costs 2-5 seconds per file, and
+concurrent one-shot processes collide on the shared user profile. The pool
+keeps LIBREOFFICE_POOL_SIZE instances running, each with its own profile
+directory and listening on its own local UNO pipe, and hands one instance to
+each conversion:
+
+    * a conversion waits in a queue (up to LIBREOFFICE_QUEUE_TIMEOUT_S) for a
+      free instance, then loads and stores the document over UNO;
+    * a conversion running past LIBREOFFICE_CONVERSION_TIMEOUT_S has its
+      instance killed, which aborts the blocked UNO call;
+    * an instance that crashed, timed out or reached
+      LIBREOFFICE_MAX_CONVERSIONS is replaced by a fresh one;
+    * a background watcher probes idle instances and restarts dead ones.
+
+Driving LibreOffice needs its Python-UNO bridge (``import uno``, shipped with
+LibreOffice / python3-uno). Without it, or with a pool size of 0,
+LibreOfficeConverter falls back to one process per conversion.
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import logging
+
+from services.LibreOfficeConverter import ConversionException, LibreOfficeConverter
+from utility.exceptions import ServiceUnavailableException
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+
+logger = logging.getLogger(__name__)
+
+LIBREOFFICE_POOL_SIZE = int(os.getenv("LIBREOFFICE_POOL_SIZE", "2"))
+LIBREOFFICE_CONVERSION_TIMEOUT_S = float(os.getenv("LIBREOFFICE_CONVERSION_TIMEOUT_S", "120"))
+LIBREOFFICE_QUEUE_TIMEOUT_S = float(os.getenv("LIBREOFFICE_QUEUE_TIMEOUT_S", "60"))
+LIBREOFFICE_START_TIMEOUT_S = float(os.getenv("LIBREOFFICE_START_TIMEOUT_S", "30"))
+# Instances are recycled after this many conversions (LibreOffice leaks memory)
+LIBREOFFICE_MAX_CONVERSIONS = int(os.getenv("LIBREOFFICE_MAX_CONVERSIONS", "200"))
+LIBREOFFICE_WATCH_INTERVAL_S = float(os.getenv("LIBREOFFICE_WATCH_INTERVAL_S", "30"))
+LIBREOFFICE_PROFILE_DIR = os.getenv(
+    "LIBREOFFICE_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "pii_libreoffice_profiles")
+)
+
+# Target extension -> (import filter, import filter options, export filter).
+# The CSV options mean: comma separated, '"' quoted, UTF-8, from line 1.
+_FILTERS = {
+    "pdf": (None, None, "writer_pdf_Export"),
+    "xlsx": ("Text - txt - csv (StarCalc)", "44,34,76,1", "Calc MS Excel 2007 XML"),
+}
+
+
+class SofficeInstance:
+    """One headless soffice process with its own profile, driven over a UNO pipe."""
+
+    def __init__(self, soffice_path: str, name: str, profile_dir: str):
+        """
+        Args:
+            soffice_path: LibreOffice executable
+            name: UNO pipe name, unique on the host
+            profile_dir: User profile (UserInstallation) of this instance only
+        """
+        self.soffice_path = soffice_path
+        self.name = name
+        self.profile_dir = profile_dir
+        self.conversions = 0
+        # Set when a conversion failed on it: it is replaced, not reused
+        self.broken = False
+        self._process: Optional[subprocess.Popen] = None
+        self._desktop = None
+
+    def start(self, timeout_s: float = LIBREOFFICE_START_TIMEOUT_S) -> "SofficeInstance":
+        os.makedirs(self.profile_dir, exist_ok=True)
+        # A crashed predecessor leaves its profile lock behind
+        lock = os.path.join(self.profile_dir, ".lock")
+        if os.path.exists(lock):
+            os.remove(lock)
+        self._process = subprocess.Popen(
+            [
+                self.soffice_path,
+                "--headless",
+                "--invisible",
+                "--nocrashreport",
+                "--nodefault",
+                "--nofirststartwizard",
+                "--nolockcheck",
+                "--nologo",
+                "--norestore",
+                f"-env:UserInstallation={Path(self.profile_dir).as_uri()}",
+                f"--accept=pipe,name={self.name};urp;StarOffice.ComponentContext",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local
+        )
+        deadline = time.monotonic() + timeout_s
+        while True:
+            try:
+                context = resolver.resolve(
+                    f"uno:pipe,name={self.name};urp;StarOffice.ComponentContext"
+                )
+                break
+            except Exception:
+                if self._process.poll() is not None or time.monotonic() > deadline:
+                    self.kill()
+                    raise ConversionException(f"LibreOffice instance {self.name} did not start")
+                time.sleep(0.2)
+        self._desktop = context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.frame.Desktop", context
+        )
+        return self
+
+    def convert(self, input_path: str, output_path: str, target: str) -> None:
+        """Load *input_path* and store it as *target* ('pdf' or 'xlsx') at *output_path*."""
+        import_filter, import_options, export_filter = _FILTERS[target]
+        load_props = [_property("Hidden", True), _property("ReadOnly", True)]
+        if import_filter:
+            load_props.append(_property("FilterName", import_filter))
+            load_props.append(_property("FilterOptions", import_options))
+
+        document = self._desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(os.path.abspath(input_path)), "_blank", 0, tuple(load_props)
+        )
+        if document is None:
+            raise ConversionException(f"LibreOffice could not open {os.path.basename(input_path)}")
+        try:
+            document.storeToURL(
+                uno.systemPathToFileUrl(os.path.abspath(output_path)),
+                (_property("FilterName", export_filter),),
+            )
+        finally:
+            document.close(True)
+        self.conversions += 1
+
+    def is_alive(self) -> bool:
+        if self._process is None or self._process.poll() is not None:
+            return False
+        try:
+            self._desktop.getComponents()  # round trip over the bridge
+            return True
+        except Exception:
+            return False
+
+    def kill(self) -> None:
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                pass
+        self._desktop = None
+
+
+def _property(name: str, value) -> "PropertyValue":
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+class LibreOfficePool:
+    """
+    Fixed-size pool of warm LibreOffice instances.
+
+    Usage:
+        get_libreoffice_pool().convert("in.docx", "out.pdf", "pdf")
+    """
+
+    def __init__(
+        self,
+        size: int = LIBREOFFICE_POOL_SIZE,
+        factory: Optional[Callable[[int], SofficeInstance]] = None,
+        conversion_timeout_s: float = LIBREOFFICE_CONVERSION_TIMEOUT_S,
+        queue_timeout_s: float = LIBREOFFICE_QUEUE_TIMEOUT_S,
+        max_conversions: int = LIBREOFFICE_MAX_CONVERSIONS,
+        watch_interval_s: float = LIBREOFFICE_WATCH_INTERVAL_S,
+    ):
+        """
+        Args:
+            size: Number of instances kept running; 0 disables the pool
+            factory: Starts the instance for a slot (default: a SofficeInstance
+                     with a per-slot profile and pipe name)
+            conversion_timeout_s: Longest a single conversion may take
+            queue_timeout_s: Longest a conversion waits for a free instance
+            max_conversions: Conversions after which an instance is recycled
+            watch_interval_s: Seconds between health checks of idle instances
+        """
+        self.size = max(0, size)
+        self.factory = factory or self._start_soffice
+        self._needs_uno = factory is None
+        self.conversion_timeout_s = conversion_timeout_s
+        self.queue_timeout_s = queue_timeout_s
+        self.max_conversions = max(1, max_conversions)
+        self.watch_interval_s = watch_interval_s
+
+        # (slot, instance); a slot keeps its profile directory across restarts
+        self._idle: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._restarts = 0
+        self._timeouts = 0
+        self._last_health_check: Optional[float] = None
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._soffice_path: Optional[str] = None
+
+    @property
+    def available(self) -> bool:
+        """True if conversions can go through the pool."""
+        return self.size > 0 and (uno is not None or not self._needs_uno)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        """Start every instance (in parallel) and the background watcher."""
+        with self._lock:
+            if self._started or not self.available:
+                return
+            started = time.time()
+            results: List = [None] * self.size
+            threads = [
+                threading.Thread(target=self._start_slot, args=(slot, results))
+                for slot in range(self.size)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            running = 0
+            for slot, result in enumerate(results):
+                if isinstance(result, Exception):
+                    logger.error(f"LibreOffice slot {slot} failed to start: {result}")
+                    result = None  # started on checkout or by the watcher
+                else:
+                    running += 1
+                self._idle.put((slot, result))
+            self._started = True
+            logger.info(
+                f"LibreOffice pool warmed: {running}/{self.size} instance(s) in "
+                f"{time.time() - started:.1f}s"
+            )
+
+        if self.watch_interval_s > 0:
+            self._stop.clear()
+            self._watcher = threading.Thread(
+                target=self._watch, name="libreoffice-pool-watcher", daemon=True
+            )
+            self._watcher.start()
+
+    def stop(self) -> None:
+        """Stop the watcher and kill every idle instance."""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+        with self._lock:
+            while True:
+                try:
+                    _, instance = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if instance is not None:
+                    instance.kill()
+            self._started = False
+
+    def health(self) -> Dict:
+        """Snapshot of the pool state for the /health endpoint."""
+        return {
+            "available": self.available,
+            "started": self._started,
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "restarts": self._restarts,
+            "timeouts": self._timeouts,
+            "last_health_check": self._last_health_check,
+        }
+
+    # ------------------------------------------------------------------
+    # Conversion
+    # ------------------------------------------------------------------
+    def convert(self, input_path: str, output_path: str, target: str) -> None:
+        """
+        Convert *input_path* to *target* ('pdf' or 'xlsx') at *output_path*.
+
+        Raises:
+            ServiceUnavailableException: If no instance frees up in time
+            ConversionException: If the conversion fails or times out
+        """
+        with self._checkout() as (slot, instance):
+            timed_out = threading.Event()
+
+            def expire() -> None:
+                # Set first: the killed instance makes convert() fail right away
+                timed_out.set()
+                instance.kill()
+
+            timer = threading.Timer(self.conversion_timeout_s, expire)
+            timer.daemon = True
+            timer.start()
+            try:
+                instance.convert(input_path, output_path, target)
+            except Exception as e:
+                instance.broken = True
+                if timed_out.is_set():
+                    self._timeouts += 1
+                    raise ConversionException(
+                        f"Conversion timeout (>{self.conversion_timeout_s:.0f}s). "
+                        "The document may be too large or complex."
+                    )
+                if isinstance(e, ConversionException):
+                    raise
+                raise ConversionException(f"LibreOffice conversion failed: {e}")
+            finally:
+                timer.cancel()
+
+    @contextmanager
+    def _checkout(self) -> Iterator:
+        if not self._started:
+            self.start()
+        slot, instance = self._acquire()
+        try:
+            if instance is None or not instance.is_alive():
+                instance = self._restart(slot, instance)
+            yield slot, instance
+        finally:
+            self._release(slot, instance)
+
+    def _acquire(self):
+        try:
+            return self._idle.get(timeout=self.queue_timeout_s)
+        except queue.Empty:
+            raise ServiceUnavailableException(
+                f"No LibreOffice instance available within {self.queue_timeout_s:.0f}s"
+            )
+
+    def _release(self, slot: int, instance: Optional[SofficeInstance]) -> None:
+        if instance is not None and (instance.broken or instance.conversions >= self.max_conversions):
+            # Replaced off the request path; the slot stays usable meanwhile
+            instance.kill()
+            instance = None
+        if not self._started:
+            if instance is not None:
+                instance.kill()
+            return
+        self._idle.put((slot, instance))
+
+    def _restart(self, slot: int, instance: Optional[SofficeInstance]) -> SofficeInstance:
+        if instance is not None:
+            instance.kill()
+        self._restarts += 1
+        logger.warning(f"Restarting LibreOffice slot {slot}")
+        return self.factory(slot)
+
+    def _start_slot(self, slot: int, results: List) -> None:
+        try:
+            results[slot] = self.factory(slot)
+        except Exception as e:
+            results[slot] = e
+
+    def _start_soffice(self, slot: int) -> SofficeInstance:
+        if self._soffice_path is None:
+            self._soffice_path = LibreOfficeConverter().libreoffice_path
+        return SofficeInstance(
+            self._soffice_path,
+            name=f"pii_soffice_{os.getpid()}_{slot}",
+            profile_dir=os.path.join(LIBREOFFICE_PROFILE_DIR, f"{os.getpid()}_{slot}"),
+        ).start()
+
+    # ------------------------------------------------------------------
+    # Health
+    # ------------------------------------------------------------------
+    def check_health(self) -> int:
+        """
+        Probe idle instances and restart the dead ones (and empty slots).
+
+        Instances in use are left alone; they are probed on a later tick.
+        Returns the number of instances restarted.
+        """
+        restarted = 0
+        probed = []
+        for _ in range(self._idle.qsize()):
+            try:
+                slot, instance = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if instance is None or not instance.is_alive():
+                try:
+                    instance = self._restart(slot, instance)
+                    restarted += 1
+                except Exception as e:
+                    logger.error(f"LibreOffice slot {slot} restart failed: {e}")
+                    instance = None
+            probed.append((slot, instance))
+        for slot, instance in probed:
+            self._idle.put((slot, instance))
+        self._last_health_check = time.time()
+        return restarted
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.watch_interval_s):
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.error(f"LibreOffice pool watcher error: {e}", exc_info=True)
+
+
+# ============================================================
+# Process-wide instance
+# ============================================================
+_pool: Optional[LibreOfficePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_libreoffice_pool() -> LibreOfficePool:
+    """Return the process-wide LibreOffice pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = LibreOfficePool()
+    return _pool
+
+
+def remove_profiles() -> None:
+    """Delete this process's instance profiles (on shutdown)."""
+    prefix = f"{os.getpid()}_"
+    if os.path.isdir(LIBREOFFICE_PROFILE_DIR):
+        for entry in os.listdir(LIBREOFFICE_PROFILE_DIR):
+            if entry.startswith(prefix):
+                shutil.rmtree(os.path.join(LIBREOFFICE_PROFILE_DIR, entry), ignore_errors=True)
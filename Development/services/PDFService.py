@@ -1,15 +1,48 @@
-"""PDF Service – mask PII in PDF while preserving formatting using PyMuPDF."""
+"""
+PDF Service – mask PII in PDF while preserving formatting using PyMuPDF.
+
+Extraction reads every page once with get_text("rawdict") and keeps the
+bounding box of each character, so a detected span maps straight to a
+rectangle: redaction never searches the page for the value, and each page
+gets all of its redactions applied in one pass.
+
+Documents from PDF_PARALLEL_MIN_PAGES pages up are extracted and redacted
+page-range by page-range in the PDFPagePool worker processes, which all open
+the request's one materialized copy of the upload. From
+PDF_STREAMING_MIN_PAGES pages up the document is never held whole: each page
+is extracted, analyzed (see StreamingAnonymizer), redacted and its anonymized
+text written to disk before the next pages are read.
+"""
 from fastapi import UploadFile
 from typing import Dict, List
-import io
-
-from services.BaseService import BaseService
+import logging
+import os
+import tempfile
+
+from services.BaseService import BaseService, remove_masked_outputs, streamed_text_path
+from utility.DocumentIngestion import IngestedDocument
+from utility.DocumentModel import DocumentBuilder, ExtractedDocument
+from utility.PDFPagePool import get_pdf_page_pool
+from utility.StreamingAnonymizer import StreamingAnonymizer
 from utility.exceptions import FileValidationException, DocumentProcessingException
-
-try:
-    import fitz  # PyMuPDF
-except ImportError:
-    fitz = None
+from utility.pdf_pages import (
+    extract_page_lines,
+    extract_pages,
+    fitz,
+    merge_ranges,
+    plan_redactions,
+    redact_pages,
+    save_range,
+)
+
+logger = logging.getLogger(__name__)
+
+PDF_STREAMING_MIN_PAGES = int(os.getenv("PDF_STREAMING_MIN_PAGES", "1000"))
+# Redacted pages held by MuPDF before they are saved to a part file
+PDF_STREAMING_FLUSH_PAGES = int(os.getenv("PDF_STREAMING_FLUSH_PAGES", "100"))
+# Uploads up to this size have their pages counted from the bytes the
+# in-memory path reads anyway; only larger ones are written to disk for it
+_COUNT_IN_MEMORY_MAX_BYTES = 32 * 1024 * 1024
 
 
 class PDFService(BaseService):
@@ -24,166 +57,145 @@ class PDFService(BaseService):
                 "Install with: pip install PyMuPDF"
             )
 
+    def _ingest(self, document: UploadFile, request_id: str) -> IngestedDocument:
+        source = super()._ingest(document, request_id)
+        # Sharded stages hand a path to the page workers: write the file
+        # once, here, so extraction and redaction share it
+        try:
+            if get_pdf_page_pool().shards(self._page_count(source)):
+                source.materialize()
+        except Exception:
+            pass  # let extraction report the broken file
+        return source
+
     def _extract_text(self, raw: bytes, filename: str) -> str:
         """Extract text from PDF using PyMuPDF."""
+        return self._extract_document(raw, filename).text
+
+    def _extract_document(self, raw: bytes, filename: str) -> ExtractedDocument:
+        """
+        Text lines joined by newlines, page after page.
+
+        Each line is a segment located by ``(page number, character
+        bboxes)``: four floats per character of the line text.
+        """
         try:
-            doc = fitz.open(stream=raw, filetype="pdf")
-            text_parts = []
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                page_text = page.get_text()
-                if page_text:
-                    text_parts.append(page_text)
-            doc.close()
-            return "\n".join(text_parts).strip()
+            with fitz.open(stream=raw, filetype="pdf") as doc:
+                shards = get_pdf_page_pool().shards(len(doc))
+                if not shards:
+                    pages = extract_pages(doc, 0, len(doc))
+            if shards:
+                with self._input_path(raw, ".pdf") as path:
+                    pages = get_pdf_page_pool().extract(path, shards)
+
+            builder = DocumentBuilder(separator="\n")
+            for page_num, lines in pages:
+                for line_text, bboxes in lines:
+                    builder.add(line_text, (page_num, bboxes))
+            return builder.build()
         except Exception as e:
             raise DocumentProcessingException(f"PDF text extraction failed: {e}")
 
-    def _build_masked_output(self, raw, mapping, anonymized_text, out_path):
+    def _build_masked_document(self, raw, extracted, anon, out_path):
         """
         Redact PII in original PDF while preserving formatting.
-        Uses PyMuPDF to find and redact PII text in-place.
+
+        Every span becomes one redaction rectangle from the character boxes
+        captured at extraction; pages without spans are never touched.
 
         Args:
             raw: Original PDF bytes
-            mapping: Not used directly (we use anonymized_text to find replacements)
-            anonymized_text: Text with PII replaced by tags
+            extracted: The document returned by _extract_document()
+            anon: anonymize_text() result; its spans drive the redactions
             out_path: Output file path
         """
         try:
-            # Open the original PDF
-            doc = fitz.open(stream=raw, filetype="pdf")
-
-            # Extract original text to compare with anonymized text
-            original_text = self._extract_text(raw, "")
-
-            # Build replacement map by comparing original and anonymized text
-            replacements = self._build_replacement_map_from_diff(
-                original_text, anonymized_text
-            )
-
-            if not replacements:
-                # No PII found, just save the original
-                doc.save(out_path)
-                doc.close()
-                return
-
-            # Process each page
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-
-                # For each PII value, find and redact it
-                for original_value, tag in replacements.items():
-                    if not original_value or not original_value.strip():
-                        continue
-
-                    # Search for the text on the page
-                    text_instances = page.search_for(original_value)
-
-                    # Redact each instance
-                    for inst in text_instances:
-                        # Add redaction annotation with the tag as replacement text
-                        page.add_redact_annot(
-                            inst, 
-                            text=tag,
-                            fill=(1, 1, 1),  # White background
-                            text_color=(0, 0, 0)  # Black text
-                        )
-
-                # Apply all redactions on this page
-                page.apply_redactions()
-
-            # Save the anonymized PDF
-            doc.save(out_path)
-            doc.close()
+            plan = plan_redactions(extracted, anon["spans"])
+            with fitz.open(stream=raw, filetype="pdf") as doc:
+                shards = get_pdf_page_pool().shards(len(doc))
+                if not shards:
+                    redactions = redact_pages(doc, plan)
+                    # Save the anonymized PDF
+                    doc.save(out_path)
+            if shards:
+                with self._input_path(raw, ".pdf") as path:
+                    redactions = get_pdf_page_pool().redact(path, shards, plan, out_path)
+            logger.info(f"Applied {redactions} PDF redactions")
 
         except Exception as e:
             raise DocumentProcessingException(f"PDF redaction failed: {e}")
 
-    def _build_replacement_map_from_diff(
-        self, original_text: str, anonymized_text: str
-    ) -> Dict[str, str]:
+    # ------------------------------------------------------------------
+    # Streaming mode
+    # ------------------------------------------------------------------
+    def _use_streaming(self, source: IngestedDocument) -> bool:
+        try:
+            return self._page_count(source) >= PDF_STREAMING_MIN_PAGES
+        except Exception:
+            return False  # let extraction report the broken file
+
+    @staticmethod
+    def _page_count(source: IngestedDocument) -> int:
+        if source.size <= _COUNT_IN_MEMORY_MAX_BYTES:
+            with fitz.open(stream=source.read(), filetype="pdf") as doc:
+                return len(doc)
+        with fitz.open(source.path) as doc:
+            return len(doc)
+
+    def _mask_streaming(self, source: IngestedDocument, country: str, out_path: str) -> Dict:
         """
-        Compare original and anonymized text to extract {original_value: tag} pairs.
-
-        This method aligns the two texts and identifies where tags replaced original values.
-
-        Args:
-            original_text: Original text with PII
-            anonymized_text: Text with PII replaced by tags like <PERSON_1>
-
-        Returns:
-            Dictionary mapping original PII values to their replacement tags
+        Mask the PDF page by page with bounded memory.
+
+        Each page's lines are kept only until the StreamingAnonymizer has
+        finalized its spans (one page of lookahead); the page is then
+        redacted and its geometry dropped. Every PDF_STREAMING_FLUSH_PAGES
+        redacted pages are saved (compressed) to a part file and the source
+        is reopened, so MuPDF does not hold every rewritten page until the
+        end; the parts are merged into *out_path*.
         """
-        import re
-
-        replacements: Dict[str, str] = {}
-
-        # Find all tags in anonymized text
-        tag_pattern = re.compile(r"<[A-Z_]+_\d+>")
-        tags = list(tag_pattern.finditer(anonymized_text))
-
-        if not tags:
-            return replacements
-
-        # Walk through both texts to align and extract replacements
-        anon_pos = 0
-        orig_pos = 0
-
-        for match in tags:
-            tag_start = match.start()
-            tag_end = match.end()
-            tag = match.group()
-
-            # Characters before this tag should be the same in both texts
-            prefix_len = tag_start - anon_pos
-
-            # Skip matching prefix in original text
-            orig_pos += prefix_len
-
-            # Move anonymized position past the tag
-            anon_pos = tag_end
-
-            # Find the original value that was replaced by this tag
-            # Look ahead to find the next common text after the tag
-            if anon_pos < len(anonymized_text):
-                # Find next tag or end of text
-                next_tag = tag_pattern.search(anonymized_text, anon_pos)
-
-                if next_tag:
-                    # Text between current tag and next tag
-                    next_common = anonymized_text[anon_pos:next_tag.start()]
-                else:
-                    # Text from current tag to end
-                    next_common = anonymized_text[anon_pos:]
-
-                # Find where this common text appears in original
-                if next_common and orig_pos < len(original_text):
-                    # Look for the common text in original
-                    common_idx = original_text.find(next_common, orig_pos)
-
-                    if common_idx != -1:
-                        # Extract the original value between current position and common text
-                        orig_value = original_text[orig_pos:common_idx]
-
-                        if orig_value.strip():
-                            replacements[orig_value] = tag
-
-                        # Move original position past the common text
-                        orig_pos = common_idx
-                    else:
-                        # Common text not found, skip ahead
-                        orig_pos += len(tag)
-                else:
-                    # No more common text, skip
-                    orig_pos += len(tag)
-            else:
-                # Tag is at the end, remaining text is the original value
-                if orig_pos < len(original_text):
-                    orig_value = original_text[orig_pos:]
-                    if orig_value.strip():
-                        replacements[orig_value] = tag
-                orig_pos = len(original_text)
-
-        return replacements
- 
\ No newline at end of file
+        path = source.path
+        text_path = streamed_text_path(out_path)
+        try:
+            with tempfile.TemporaryDirectory() as part_dir, \
+                    open(text_path, "w", encoding="utf-8") as text_out:
+                streamer = StreamingAnonymizer(self.presidio, text_out.write, country, separator="\n")
+                pending: Dict[int, ExtractedDocument] = {}
+                parts: List[str] = []
+                doc = fitz.open(path)
+                page_count = len(doc)
+                first = 0      # first page not yet saved to a part
+                redacted = 0   # pages [0, redacted) are redacted
+                redactions = 0
+                try:
+                    def redact(done) -> None:
+                        nonlocal redacted, redactions
+                        for page_num, spans in done:
+                            page_doc = pending.pop(page_num)
+                            redactions += redact_pages(doc, plan_redactions(page_doc, spans))
+                            redacted = page_num + 1
+
+                    for page_num in range(page_count):
+                        builder = DocumentBuilder(separator="\n")
+                        for line_text, bboxes in extract_page_lines(doc[page_num]):
+                            builder.add(line_text, (page_num, bboxes))
+                        pending[page_num] = builder.build()
+                        redact(streamer.push(pending[page_num].text))
+
+                        if redacted - first >= PDF_STREAMING_FLUSH_PAGES:
+                            parts.append(os.path.join(part_dir, f"{len(parts)}.pdf"))
+                            save_range(doc, first, redacted, parts[-1])
+                            doc.close()
+                            doc = fitz.open(path)
+                            first = redacted
+                    redact(streamer.finish())
+                    parts.append(os.path.join(part_dir, f"{len(parts)}.pdf"))
+                    save_range(doc, first, page_count, parts[-1])
+                finally:
+                    doc.close()
+
+                merge_ranges(path, parts, out_path)
+            logger.info(f"Streamed {page_count} PDF pages: {redactions} redactions")
+            return streamer.result()
+        except Exception as e:
+            remove_masked_outputs(out_path)
+            raise DocumentProcessingException(f"PDF streaming failed: {e}")
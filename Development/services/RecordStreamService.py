@@ -0,0 +1,220 @@
+"""
+Record stream masking: NDJSON records in, masked NDJSON records out.
+
+Log lines and CRM records that never exist as files are masked as they
+arrive on one long request, without the per-document overhead of
+BaseService (temp files, masked output, one repository row per document).
+
+Records are collected into micro-batches of up to RECORD_STREAM_BATCH
+records, or whatever arrived within RECORD_STREAM_MAX_WAIT_MS of the
+batch's first record. The string leaves of a batch go through one
+detect_pii_batch() call (one nlp.pipe() pass, key paths as context words,
+as JSONService does for streamed documents) and every batch shares one
+CellAnonymizer, so a value gets the same tag for the whole stream. Masked
+records are written back one line per input line, in order; a line that
+is not JSON comes back as ``{"error": ...}``. The stream's mapping is saved
+as a single repository row once the input ends.
+
+The response is a RecordStreamResponse: a plain StreamingResponse listens
+for the client's disconnect on receive() while it streams, taking request
+chunks from under mask_stream().
+"""
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional, Tuple
+from functools import lru_cache
+import asyncio
+import json
+import os
+import time
+import logging
+
+from starlette.responses import StreamingResponse
+
+from utility.CellAnonymizer import CellAnonymizer
+from utility.ExecutionPool import ExecutionPool
+from utility.country_pii_config import DEFAULT_COUNTRY
+from utility.exceptions import PayloadTooLargeException
+from utility.helpers import generate_request_id
+from utility.json_stream import path_context
+
+logger = logging.getLogger(__name__)
+
+RECORD_STREAM_BATCH = int(os.getenv("RECORD_STREAM_BATCH", "500"))
+RECORD_STREAM_MAX_WAIT_MS = int(os.getenv("RECORD_STREAM_MAX_WAIT_MS", "50"))
+RECORD_STREAM_MAX_RECORD_KB = int(os.getenv("RECORD_STREAM_MAX_RECORD_KB", "1024"))
+# Whole request body, enforced by UploadSizeLimitMiddleware
+RECORD_STREAM_MAX_MB = int(os.getenv("RECORD_STREAM_MAX_MB", "10240"))
+
+# Leaf location: (container, key in it, key path)
+_Leaf = Tuple[Any, Any, Tuple]
+_END = object()
+# Records of one stream share a handful of key paths
+_path_context = lru_cache(maxsize=4096)(path_context)
+
+
+class RecordStreamService:
+    """Mask one stream of NDJSON records with a consistent tag mapping."""
+
+    def __init__(
+        self,
+        repository,
+        executor: ExecutionPool,
+        country: str = DEFAULT_COUNTRY,
+        language: str = "en",
+    ):
+        """
+        Args:
+            repository: PIIRepository or CSVRepository for the mapping row
+            executor: Runs detection (on the worker engines in process mode)
+            country: Country name for country-specific entities
+            language: Language code
+        """
+        self.repository = repository
+        self.executor = executor
+        self.request_id = generate_request_id()
+        # Detection runs through the executor: the masker only tags
+        self.masker = CellAnonymizer(None, country, language)
+        self.records = 0
+        self.errors = 0
+
+    async def mask_stream(self, chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+        """
+        Yield the masked records of *chunks* (a request body), batch by batch.
+
+        Raises:
+            PayloadTooLargeException: A record over RECORD_STREAM_MAX_RECORD_KB
+        """
+        # Reading runs ahead of detection, a few chunks' lines at a time
+        queue: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=8)
+        reader = asyncio.create_task(_read_lines(chunks, queue))
+        try:
+            batch: List[bytes] = []
+            deadline = 0.0
+            while True:
+                timeout = None if not batch else max(0.0, deadline - time.monotonic())
+                try:
+                    lines = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    lines = None
+                if isinstance(lines, Exception):
+                    raise lines
+                if isinstance(lines, list) and lines:
+                    if not batch:
+                        deadline = time.monotonic() + RECORD_STREAM_MAX_WAIT_MS / 1000
+                    batch.extend(lines)
+                while len(batch) >= RECORD_STREAM_BATCH:
+                    yield await self.mask_batch(batch[:RECORD_STREAM_BATCH])
+                    batch = batch[RECORD_STREAM_BATCH:]
+                    deadline = time.monotonic() + RECORD_STREAM_MAX_WAIT_MS / 1000
+                if batch and not isinstance(lines, list):
+                    # Waited long enough, or the input ended
+                    yield await self.mask_batch(batch)
+                    batch = []
+                if lines is _END:
+                    break
+        finally:
+            reader.cancel()
+
+    async def mask_batch(self, lines: List[bytes]) -> bytes:
+        """Mask one batch of NDJSON lines; returns the masked lines, newline-terminated."""
+        records: List[List[Any]] = []
+        leaves: List[_Leaf] = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                self.errors += 1
+                records.append([{"error": f"Invalid JSON: {e}"}])
+                continue
+            # Held in a list so a bare string record is a leaf like any other
+            holder = [record]
+            _collect_leaves(holder, 0, (), leaves)
+            records.append(holder)
+        self.records += len(lines)
+
+        if leaves:
+            batch = self.masker.prepare(
+                [container[key] for container, key, _ in leaves],
+                [_path_context(path) for _, _, path in leaves],
+            )
+            per_value = await self._detect(batch.texts, batch.contexts) if batch.texts else []
+            for (container, key, _), masked in zip(leaves, self.masker.finish(batch, per_value)):
+                container[key] = masked
+
+        out = [json.dumps(holder[0], ensure_ascii=False, separators=(",", ":")) for holder in records]
+        return ("\n".join(out) + "\n").encode("utf-8")
+
+    async def _detect(self, texts: List[str], contexts: Optional[List[List[str]]]) -> List:
+        masker = self.masker
+        return await self.executor.run_pooled_presidio_stage(
+            "detect", "detect_pii_batch", texts, masker.language, masker.country, contexts
+        )
+
+    def save(self, assessment_id: str, prospect_id: str, caller_name: str, created_by: str = "system") -> Dict:
+        """Persist the stream's mapping as one repository row; returns the masker's result()."""
+        result = self.masker.result()
+        self.repository.save_pii_details(
+            request_id=self.request_id,
+            assessment_id=assessment_id,
+            prospect_id=prospect_id,
+            input_type="ndjson",
+            caller_name=caller_name,
+            country=self.masker.country,
+            # Masked records went back to the caller; nothing is stored
+            processed_document="",
+            output_text="",
+            anonymizing_mapping=result["mapping"],
+            encrypted_key=result["encryption_key"],
+            created_by=created_by,
+        )
+        logger.info(
+            f"[{self.request_id}] Stream of {self.records} records saved "
+            f"({self.masker.entities_count} entities, {self.errors} invalid lines)"
+        )
+        return result
+
+
+class RecordStreamResponse(StreamingResponse):
+    """
+    NDJSON StreamingResponse whose body reads the request body as it goes.
+
+    The request stream is the only reader of receive(); a client that goes
+    away ends it with ClientDisconnect instead of a parallel listener.
+    """
+
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def _read_lines(chunks: AsyncIterable[bytes], queue: asyncio.Queue) -> None:
+    """Put the non-blank lines of each chunk on *queue* as a list, then _END (or the error raised)."""
+    limit = RECORD_STREAM_MAX_RECORD_KB * 1024
+    rest = b""
+    try:
+        async for chunk in chunks:
+            lines = (rest + chunk).split(b"\n")
+            rest = lines.pop()
+            if len(rest) > limit or any(len(line) > limit for line in lines):
+                raise PayloadTooLargeException(f"Record exceeds {RECORD_STREAM_MAX_RECORD_KB}KB")
+            await queue.put([line for line in lines if line.strip()])
+        if rest.strip():
+            await queue.put([rest])
+        await queue.put(_END)
+    except Exception as e:
+        await queue.put(e)
+
+
+def _collect_leaves(container: Any, key: Any, path: Tuple, leaves: List[_Leaf]) -> None:
+    """Append the string leaves under ``container[key]``, depth first."""
+    value = container[key]
+    if isinstance(value, str):
+        leaves.append((container, key, path))
+    elif isinstance(value, dict):
+        for k in value:
+            _collect_leaves(value, k, path + (k,), leaves)
+    elif isinstance(value, list):
+        for i in range(len(value)):
+            _collect_leaves(value, i, path + (i,), leaves)
@@ -20,7 +20,6 @@ class UnmaskService:
         self.repository = repository
 
     def process_document(self, request_id: str, document: UploadFile, input_type: str) -> Dict:
-        temp_path = None
         out_path = None
         try:
             record = self.repository.get_pii_details(request_id)
@@ -35,10 +34,6 @@ class UnmaskService:
             
             # Use system temp directory
             temp_dir = tempfile.gettempdir()
-            temp_path = os.path.join(temp_dir, f"{request_id}_masked.{input_type}")
-            
-            with open(temp_path, "wb") as f:
-                f.write(raw)
 
             text = self._extract(raw, input_type)
             restored = deanonymize_text(text, mapping, key)
@@ -46,18 +41,14 @@ class UnmaskService:
             out_path = os.path.join(temp_dir, f"{request_id}_unmasked.{input_type}")
             self._write_output(restored, out_path, input_type, raw)
 
-            if temp_path and os.path.exists(temp_path):
-                os.remove(temp_path)
-
             return {
                 "request_id": request_id,
                 "unmasked_document": out_path,
                 "tags_replaced": len(mapping),
             }
         except Exception as e:
-            for p in (temp_path, out_path):
-                if p and os.path.exists(p):
-                    os.remove(p)
+            if out_path and os.path.exists(out_path):
+                os.remove(out_path)
             if isinstance(e, (DocumentProcessingException, DatabaseException)):
                 raise
             raise DocumentProcessingException(f"De-anonymization failed: {e}")
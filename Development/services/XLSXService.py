@@ -1,13 +1,33 @@
-"""XLSX Service – mask PII in Excel workbooks cell-by-cell."""
+"""
+XLSX Service – mask PII in Excel workbooks cell-by-cell.
+
+Workbooks below XLSX_STREAMING_MIN_MB are masked in place: the original
+workbook is loaded once for writing, so styles, merged cells and formulas
+without PII are kept. Larger workbooks are streamed: rows are read with a
+read-only workbook, XLSX_BATCH_CELLS cell values at a time are masked by a
+CellAnonymizer (each distinct value detected once, per cell) and written to
+a write-only workbook, so memory stays flat however many cells there are.
+Streamed output keeps sheets, values and their types but not formatting,
+and formulas are replaced by their computed values.
+"""
 from fastapi import UploadFile
-from typing import Dict
+from typing import Dict, Iterable, Iterator, List, Tuple
 import openpyxl
 import io
-import re
+import logging
+import os
 
-from services.BaseService import BaseService
+from services.BaseService import BaseService, remove_masked_outputs, streamed_text_path
+from utility.CellAnonymizer import CellAnonymizer
+from utility.DocumentIngestion import IngestedDocument
+from utility.DocumentModel import DocumentBuilder, ExtractedDocument, apply_spans
 from utility.exceptions import FileValidationException, DocumentProcessingException
 
+logger = logging.getLogger(__name__)
+
+XLSX_STREAMING_MIN_MB = float(os.getenv("XLSX_STREAMING_MIN_MB", "5"))
+XLSX_BATCH_CELLS = int(os.getenv("XLSX_BATCH_CELLS", "20000"))
+
 
 class XLSXService(BaseService):
 
@@ -17,97 +37,99 @@ class XLSXService(BaseService):
             raise FileValidationException("File must be an .xlsx file")
 
     def _extract_text(self, raw: bytes, filename: str) -> str:
+        return self._extract_document(raw, filename).text
+
+    def _extract_document(self, raw: bytes, filename: str) -> ExtractedDocument:
+        """Cell values joined by spaces; each cell is a segment located by (sheet, coordinate)."""
         try:
-            wb = openpyxl.load_workbook(io.BytesIO(raw), data_only=True)
-            parts = []
-            for ws in wb.worksheets:
-                for row in ws.iter_rows():
-                    parts.extend(
-                        str(cell.value) for cell in row if cell.value is not None
-                    )
-            return " ".join(parts)
+            # Read-only: cells are parsed as rows are iterated, without the object model
+            wb = openpyxl.load_workbook(io.BytesIO(raw), read_only=True, data_only=True)
+            try:
+                builder = DocumentBuilder(separator=" ")
+                for ws in wb.worksheets:
+                    for row in ws.iter_rows():
+                        for cell in row:
+                            if cell.value is not None:
+                                builder.add(str(cell.value), (ws.title, cell.coordinate))
+                return builder.build()
+            finally:
+                wb.close()
         except Exception as e:
             raise DocumentProcessingException(f"XLSX parse failed: {e}")
 
-    def _build_masked_output(self, raw, mapping, anonymized_text, out_path):
-        """Replace PII in each cell of the workbook."""
+    def _build_masked_document(self, raw, extracted, anon, out_path):
+        """Rewrite only the cells that contain a detected span."""
         try:
             wb = openpyxl.load_workbook(io.BytesIO(raw))
-            # Build original->tag from diff approach
-            orig_text = self._extract_text(raw, "")
-            replacements = self._build_replacement_pairs(orig_text, anonymized_text)
-
-            for ws in wb.worksheets:
-                for row in ws.iter_rows():
-                    for cell in row:
-                        if cell.value is not None:
-                            val = str(cell.value)
-                            masked = self._apply_replacements(val, replacements)
-                            if masked != val:
-                                cell.value = masked
+            for index, spans in extracted.segment_spans(anon["spans"]):
+                sheet, coordinate = extracted.locations[index]
+                # Masked from the extracted (computed) value, which also
+                # replaces a formula whose result contained PII
+                wb[sheet][coordinate].value = apply_spans(extracted.segment_text(index), spans)
             wb.save(out_path)
         except Exception as e:
             raise DocumentProcessingException(f"XLSX masking failed: {e}")
 
-    @staticmethod
-    def _build_replacement_pairs(original: str, anonymized: str) -> Dict[str, str]:
-        """
-        Compare original and anonymized text to extract {original_value: tag} pairs.
-        Uses a simple diff approach: find tags in anonymized text and map them
-        back to the corresponding spans in the original.
-        """
-        pairs: Dict[str, str] = {}
-        tag_pattern = re.compile(r"<[A-Z_]+_\d+>")
-        tags = list(tag_pattern.finditer(anonymized))
-        if not tags:
-            return pairs
-
-        # Walk through both texts to align
-        anon_pos = 0
-        orig_pos = 0
-        for match in tags:
-            tag_start = match.start()
-            tag_end = match.end()
-            tag = match.group()
-
-            # Characters before this tag should be the same in both
-            prefix_len = tag_start - anon_pos
-            orig_pos += prefix_len
-            anon_pos = tag_end
+    # ------------------------------------------------------------------
+    # Streaming
+    # ------------------------------------------------------------------
+    def _use_streaming(self, source: IngestedDocument) -> bool:
+        if source.size < XLSX_STREAMING_MIN_MB * 1024 * 1024:
+            return False
+        source.materialize()  # the stream stage may run in a worker process
+        return True
 
-            # Find the original value: it's the text in original at orig_pos
-            # that was replaced by the tag. We need to figure out its length.
-            # Look ahead to the next common text after the tag.
-            if anon_pos < len(anonymized):
-                # Find next non-tag text
-                next_tag = tag_pattern.search(anonymized, anon_pos)
-                if next_tag:
-                    next_common = anonymized[anon_pos:next_tag.start()]
-                else:
-                    next_common = anonymized[anon_pos:]
-
-                if next_common and next_common in original[orig_pos:]:
-                    end_idx = original.index(next_common, orig_pos)
-                    orig_value = original[orig_pos:end_idx]
-                    if orig_value.strip():
-                        pairs[orig_value] = tag
-                    orig_pos = end_idx
-                else:
-                    # Fallback: skip ahead
-                    orig_pos += len(tag)
-            else:
-                # Tag is at the end
-                orig_value = original[orig_pos:]
-                if orig_value.strip():
-                    pairs[orig_value] = tag
-                orig_pos = len(original)
+    def _mask_streaming(self, source: IngestedDocument, country: str, out_path: str) -> Dict:
+        """
+        Mask the workbook sheet by sheet, XLSX_BATCH_CELLS cells at a time.
 
-        return pairs
+        Cells without PII keep their value and type; masked cells become text.
+        """
+        try:
+            wb = openpyxl.load_workbook(source.path, read_only=True, data_only=True)
+            out = openpyxl.Workbook(write_only=True)
+            masker = CellAnonymizer(self.presidio, country)
+            cells = 0
+            try:
+                with open(streamed_text_path(out_path), "w", encoding="utf-8") as text_out:
+                    for ws in wb.worksheets:
+                        out_ws = out.create_sheet(ws.title)
+                        for batch in _batches(ws.iter_rows(values_only=True), XLSX_BATCH_CELLS):
+                            values = [str(v) for row in batch for v in row if v is not None]
+                            masked = iter(masker.mask(values))
+                            for row in batch:
+                                masked_row = []
+                                for value in row:
+                                    if value is not None:
+                                        text = next(masked)
+                                        if text.strip():
+                                            text_out.write((" " if cells else "") + text)
+                                            cells += 1
+                                        if text != str(value):
+                                            value = text
+                                    masked_row.append(value)
+                                out_ws.append(masked_row)
+            finally:
+                wb.close()
+            out.save(out_path)
+            logger.info(
+                f"Streamed XLSX: {cells} cells, {masker.analyzed} distinct values analyzed, "
+                f"{masker.entities_count} entities"
+            )
+            return masker.result()
+        except Exception as e:
+            remove_masked_outputs(out_path)
+            raise DocumentProcessingException(f"XLSX streaming failed: {e}")
 
-    @staticmethod
-    def _apply_replacements(text: str, replacements: Dict[str, str]) -> str:
-        """Apply all replacement pairs to text, longest match first."""
-        for orig in sorted(replacements, key=len, reverse=True):
-            text = text.replace(orig, replacements[orig])
-        return text
 
+def _batches(rows: Iterable[Tuple], cells: int) -> Iterator[List[Tuple]]:
+    """Group *rows* into batches of about *cells* cells (whole rows)."""
+    batch, size = [], 0
+    for row in rows:
+        batch.append(row)
+        size += len(row)
+        if size >= cells:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
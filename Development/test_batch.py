@@ -0,0 +1,289 @@
+"""
+Test batch masking: zip expansion, the per-document manifest and the batch save
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import zipfile
+from contextlib import asynccontextmanager, contextmanager
+from io import BytesIO
+
+# CSV mode with a throwaway data directory
+os.environ['STORAGE_MODE'] = 'csv'
+os.environ.setdefault('CSV_DATA_PATH', tempfile.mkdtemp(prefix="pii_batch_test_"))
+
+import pytest
+from fastapi import UploadFile
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import services.BaseService as base_service
+import utility.ExecutionPool as execution_pool
+from repository.CSVRepository import CSVRepository
+from repository.PIIRepository import PIIRepository
+from services.BaseService import streamed_text_path
+from services.BatchService import BatchService
+from services.TXTService import TXTService
+from test_streaming_pdf import RegexPresidio, _tags
+from utility.DocumentIngestion import expand_batch_uploads
+from utility.ExecutionPool import ExecutionPool
+from utility.ORM import Base, PIIDetailsRecord
+from utility.ResultCache import ResultCache
+from utility.exceptions import (
+    DatabaseException,
+    FileValidationException,
+    InvalidInputTypeException,
+    PayloadTooLargeException,
+)
+
+ASSESSMENT_ID = "a3097aef-06db-4568-a619-194e5b8c7d21"
+PROSPECT_ID = "b4097aef-06db-4568-a619-194e5b8c7d22"
+TEXT = b"Contact John Smith at john.smith@acme.com."
+
+
+def _upload(name: str, data: bytes) -> UploadFile:
+    return UploadFile(file=BytesIO(data), filename=name)
+
+
+def _zip(members, compression=zipfile.ZIP_DEFLATED) -> bytes:
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+class _Pool:
+    """Engine pool lending one RegexPresidio."""
+
+    def __init__(self):
+        self.presidio = RegexPresidio()
+
+    @asynccontextmanager
+    async def checkout_async(self, timeout=None):
+        yield self.presidio
+
+
+@contextmanager
+def _engine_pool():
+    pool = _Pool()
+    previous = execution_pool.get_engine_pool
+    execution_pool.get_engine_pool = lambda: pool
+    try:
+        yield pool
+    finally:
+        execution_pool.get_engine_pool = previous
+
+
+def _route(input_type, repo, presidio):
+    if input_type != "txt":
+        raise InvalidInputTypeException(f"Unsupported input type: {input_type}")
+    return TXTService(repo, presidio)
+
+
+def _validate(document, input_type):
+    if input_type == "exe":
+        raise InvalidInputTypeException(f"Unsupported type: {input_type}")
+
+
+def _run_batch(documents, repo=None):
+    service = BatchService(repo, ExecutionPool(workers=0), _route, "batch_test", _validate, concurrency=2)
+    # Whatever RESULT_CACHE_ENABLED was when the cache module was first imported
+    previous = base_service.get_result_cache
+    base_service.get_result_cache = lambda: ResultCache(enabled=False)
+    try:
+        with _engine_pool():
+            manifest, results = asyncio.run(service.run(documents, "United States"))
+    finally:
+        base_service.get_result_cache = previous
+    return service, manifest, results
+
+
+def _record(request_id: str, **overrides) -> dict:
+    record = dict(
+        request_id=request_id,
+        assessment_id=ASSESSMENT_ID,
+        prospect_id=PROSPECT_ID,
+        input_type="txt",
+        caller_name="test_script",
+        country="United States",
+        processed_document=f"/tmp/{request_id}_masked.txt",
+        output_text="Contact <PERSON_0>",
+        anonymizing_mapping={"<PERSON_0>": {"encrypted_value": "x", "entity_type": "PERSON", "score": 0.9}},
+        encrypted_key="key",
+    )
+    record.update(overrides)
+    return record
+
+
+# ============================================================
+# Zip expansion
+# ============================================================
+def test_zips_are_expanded_into_their_documents():
+    archive = _zip({
+        "reports/a.txt": b"first",
+        "reports/b.txt": b"second",
+        "reports/": b"",
+        ".hidden.txt": b"skip",
+        "__MACOSX/reports/._a.txt": b"skip",
+        "nested.zip": _zip({"c.txt": b"third"}),
+    })
+    plain = _upload("notes.txt", b"plain")
+    files = expand_batch_uploads([plain, _upload("bundle.ZIP", archive)])
+    assert [f.filename for f in files] == ["notes.txt", "a.txt", "b.txt", "nested.zip"]
+    assert files[0] is plain
+    assert files[1].file.read() == b"first" and files[2].file.read() == b"second"
+
+
+def test_batch_limits():
+    with pytest.raises(FileValidationException):
+        expand_batch_uploads([_upload(f"{n}.txt", b"x") for n in range(3)], max_files=2)
+    with pytest.raises(FileValidationException):
+        expand_batch_uploads([_upload("many.zip", _zip({f"{n}.txt": b"x" for n in range(3)}))], max_files=2)
+    with pytest.raises(FileValidationException):
+        expand_batch_uploads([_upload("broken.zip", b"not a zip")])
+    with pytest.raises(FileValidationException):
+        expand_batch_uploads([_upload("empty.zip", _zip({"folder/": b""}))])
+
+
+def test_plain_uploads_count_toward_the_batch_size():
+    half = b"x" * (512 * 1024)
+    files = expand_batch_uploads([_upload("a.txt", half), _upload("b.txt", half)], max_total_mb=1)
+    assert [f.file.read() for f in files] == [half, half]
+    with pytest.raises(PayloadTooLargeException):
+        expand_batch_uploads([_upload(f"{n}.txt", half) for n in range(3)], max_total_mb=1)
+    # Mixed with a zip: the plain upload's bytes are already counted
+    with pytest.raises(PayloadTooLargeException):
+        expand_batch_uploads([_upload("a.txt", half + half), _upload("c.zip", _zip({"c.txt": b"x"}))], max_total_mb=1)
+
+
+def test_zip_bomb_stops_at_the_decompressed_limit():
+    # 8MB of zeros compresses to a few KB
+    bomb = _zip({"zeros.txt": b"\0" * (8 * 1024 * 1024), "more.txt": b"x"})
+    assert len(bomb) < 64 * 1024
+    opened = []
+    original = tempfile.SpooledTemporaryFile
+
+    def spool(*args, **kwargs):
+        opened.append(original(*args, **kwargs))
+        return opened[-1]
+
+    tempfile.SpooledTemporaryFile = spool
+    try:
+        with pytest.raises(PayloadTooLargeException):
+            expand_batch_uploads([_upload("bomb.zip", bomb)], max_total_mb=1)
+    finally:
+        tempfile.SpooledTemporaryFile = original
+    # Decompression stopped at the limit and the member spool was closed
+    assert len(opened) == 1 and opened[0].closed
+
+
+# ============================================================
+# Manifest
+# ============================================================
+def test_failed_documents_are_reported_without_stopping_the_batch():
+    documents = [
+        _upload("a.txt", TEXT),
+        _upload("tool.exe", b"MZ"),
+        _upload("b.txt", b"John Smith again."),
+        _upload("sheet.xlsx", b"PK"),
+    ]
+    _, manifest, results = _run_batch(documents)
+    try:
+        assert [entry["filename"] for entry in manifest] == ["a.txt", "tool.exe", "b.txt", "sheet.xlsx"]
+        assert [entry["status"] for entry in manifest] == ["succeeded", "failed", "succeeded", "failed"]
+        assert "exe" in manifest[1]["error"] and "xlsx" in manifest[3]["error"]
+        assert manifest[0]["entities_detected"] == 2 and manifest[0]["cache_hit"] is False
+        assert [r["request_id"] for r in results] == [manifest[0]["request_id"], manifest[2]["request_id"]]
+        with open(results[0]["processed_document"], encoding="utf-8") as f:
+            assert _tags(f.read(), "PERSON")
+    finally:
+        for r in results:
+            os.remove(r["processed_document"])
+
+
+# ============================================================
+# Batch save
+# ============================================================
+def test_batch_is_saved_in_one_csv_write():
+    repo = CSVRepository()
+    service, manifest, results = _run_batch([_upload("a.txt", TEXT), _upload("b.txt", TEXT)], repo)
+    try:
+        service.save(results, ASSESSMENT_ID, PROSPECT_ID, "test_script")
+        for entry in manifest:
+            saved = repo.get_pii_details(entry["request_id"])
+            assert saved.processed_document == entry["processed_document"]
+            assert saved.country == "United States" and saved.caller_name == "test_script"
+    finally:
+        for r in results:
+            os.remove(r["processed_document"])
+
+
+def test_save_pii_details_batch_csv():
+    repo = CSVRepository()
+    saved = repo.save_pii_details_batch([_record("req_batch_csv_1"), _record("req_batch_csv_2")])
+    assert [r.request_id for r in saved] == ["req_batch_csv_1", "req_batch_csv_2"]
+    assert repo.get_pii_details("req_batch_csv_2").anonymizing_mapping["<PERSON_0>"]["entity_type"] == "PERSON"
+
+    # A bad record fails the whole write
+    bad = _record("req_batch_csv_4")
+    del bad["caller_name"]
+    with pytest.raises(DatabaseException):
+        repo.save_pii_details_batch([_record("req_batch_csv_3"), bad])
+    assert repo.get_pii_details("req_batch_csv_3") is None
+
+
+def test_save_pii_details_batch_database():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    repo = PIIRepository(session)
+    try:
+        saved = repo.save_pii_details_batch([_record("req_batch_db_1"), _record("req_batch_db_2", created_by="tests")])
+        assert [r.request_id for r in saved] == ["req_batch_db_1", "req_batch_db_2"]
+        assert saved[1].modified_by == "tests" and saved[1].is_active
+        assert repo.get_pii_details("req_batch_db_1").encrypted_key == "key"
+
+        # All or nothing: a duplicate key rolls back the other record too
+        session.expunge_all()
+        with pytest.raises(DatabaseException):
+            repo.save_pii_details_batch([_record("req_batch_db_3"), _record("req_batch_db_1")])
+        assert session.query(PIIDetailsRecord).count() == 2
+    finally:
+        session.close()
+
+
+def test_masked_outputs_are_removed_when_the_save_fails():
+    class FailingRepository:
+        def save_pii_details_batch(self, records):
+            raise DatabaseException("Failed to save PII details: down")
+
+    service, _, results = _run_batch([_upload("a.txt", TEXT), _upload("b.txt", TEXT)], FailingRepository())
+    outputs = [r["processed_document"] for r in results]
+    # A streamed document leaves its text beside the masked file
+    with open(streamed_text_path(outputs[0]), "w", encoding="utf-8") as f:
+        f.write("<PERSON_0>")
+    assert all(os.path.exists(path) for path in outputs)
+
+    with pytest.raises(DatabaseException):
+        service.save(results, ASSESSMENT_ID, PROSPECT_ID, "test_script")
+    assert not any(os.path.exists(path) for path in outputs)
+    assert not os.path.exists(streamed_text_path(outputs[0]))
+
+
+if __name__ == "__main__":
+    try:
+        test_zips_are_expanded_into_their_documents()
+        test_batch_limits()
+        test_plain_uploads_count_toward_the_batch_size()
+        test_zip_bomb_stops_at_the_decompressed_limit()
+        test_failed_documents_are_reported_without_stopping_the_batch()
+        test_batch_is_saved_in_one_csv_write()
+        test_save_pii_details_batch_csv()
+        test_save_pii_details_batch_database()
+        test_masked_outputs_are_removed_when_the_save_fails()
+        print("All batch tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
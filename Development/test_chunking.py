@@ -0,0 +1,62 @@
+"""
+Test boundary-aware chunking and exact chunk merging
+"""
+import random
+import sys
+from types import SimpleNamespace
+
+from utility.span_helpers import create_chunks, merge_duplicate_spans, owns_entity
+
+
+def _sample_text(n_words: int = 20000) -> str:
+    rng = random.Random(7)
+    words = ["alpha", "beta.", "gamma\n\n", "delta!", "epsilon", "John", "Smith,"]
+    return " ".join(rng.choice(words) for _ in range(n_words))
+
+
+def test_chunks_tile_text_on_boundaries():
+    text = _sample_text()
+    chunks = create_chunks(text, chunk_size=5000, chunk_overlap=300)
+
+    assert len(chunks) > 1
+    assert chunks[0]["core_start"] == 0
+    assert chunks[-1]["core_end"] == len(text)
+    for prev, nxt in zip(chunks, chunks[1:]):
+        assert prev["core_end"] == nxt["core_start"]
+        # Boundaries never cut through a word
+        assert text[prev["core_end"] - 1].isspace()
+    for chunk in chunks:
+        assert chunk["length"] <= 5000
+        assert chunk["start_offset"] <= chunk["core_start"] < chunk["core_end"] <= chunk["end_offset"]
+        assert text[chunk["start_offset"]:chunk["end_offset"]] == chunk["text"]
+
+
+def test_each_position_owned_by_exactly_one_chunk():
+    text = _sample_text(3000)
+    chunks = create_chunks(text, chunk_size=1200, chunk_overlap=100)
+    for pos in range(0, len(text), 37):
+        assert sum(owns_entity(c, pos) for c in chunks) == 1
+
+
+def test_merge_duplicate_spans_is_exact():
+    ents = [
+        SimpleNamespace(entity_type="PERSON", start=10, end=20, score=0.6),
+        SimpleNamespace(entity_type="PERSON", start=10, end=20, score=0.9),
+        SimpleNamespace(entity_type="PERSON", start=11, end=20, score=0.7),
+        SimpleNamespace(entity_type="LOCATION", start=10, end=20, score=0.5),
+    ]
+    merged = merge_duplicate_spans(ents)
+    assert [(e.entity_type, e.start, e.score) for e in merged] == [
+        ("LOCATION", 10, 0.5), ("PERSON", 10, 0.9), ("PERSON", 11, 0.7),
+    ]
+
+
+if __name__ == "__main__":
+    try:
+        test_chunks_tile_text_on_boundaries()
+        test_each_position_owned_by_exactly_one_chunk()
+        test_merge_duplicate_spans_is_exact()
+        print("All chunking tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
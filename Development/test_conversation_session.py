@@ -0,0 +1,100 @@
+"""
+Test conversation sessions: one mapping across messages and the sliding context window
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from services.ConversationService import ConversationService, _tail
+from test_record_stream import _Repository, _engine_pool
+from test_streaming_pdf import RegexPresidio, _tags
+from utility.ExecutionPool import ExecutionPool
+
+ASSESSMENT_ID = "a3097aef-06db-4568-a619-194e5b8c7d21"
+PROSPECT_ID = "b4097aef-06db-4568-a619-194e5b8c7d22"
+
+
+class WindowPresidio(RegexPresidio):
+    """RegexPresidio that records the windows it analyzed."""
+
+    def __init__(self):
+        super().__init__()
+        self.windows = []
+
+    def detect_pii(self, text, language="en", country=None):
+        self.windows.append(text)
+        return super().detect_pii(text, language, country)
+
+
+def _converse(messages, presidio=None, context_chars=300):
+    session = ConversationService(_Repository(), ExecutionPool(workers=0), context_chars=context_chars)
+
+    async def run():
+        return [await session.mask(message) for message in messages]
+
+    with _engine_pool(presidio):
+        return session, asyncio.run(run())
+
+
+def test_tags_are_consistent_across_messages():
+    session, replies = _converse([
+        "Hi, I'm John Smith",
+        "Hello John Smith, can you confirm your email?",
+        "Sure, john.smith@acme.com",
+        "",
+    ])
+    assert [reply["message_id"] for reply in replies] == [0, 1, 2, 3]
+    person = replies[0]["text"][len("Hi, I'm "):]
+    assert _tags(person, "PERSON") and replies[1]["text"] == f"Hello {person}, can you confirm your email?"
+    assert _tags(replies[2]["text"], "EMAIL_ADDRESS")
+    assert replies[3] == {"message_id": 3, "text": "", "entities_detected": 0}
+    # Entities in the context window are not counted again
+    assert [reply["entities_detected"] for reply in replies] == [1, 1, 1, 0]
+
+    result = session.save(ASSESSMENT_ID, PROSPECT_ID, "tests")
+    rows = session.repository.rows
+    assert len(rows) == 1 and rows[0]["request_id"] == session.request_id
+    assert len(result["mapping"]) == 2 and session.entities_count == 3
+
+
+def test_messages_are_analyzed_with_a_bounded_context():
+    presidio = WindowPresidio()
+    messages = [f"message number {n} from the customer" for n in range(20)]
+    _converse(messages, presidio, context_chars=80)
+    assert presidio.windows[0] == messages[0]
+    assert presidio.windows[1] == f"{messages[0]}\n{messages[1]}"
+    assert all(window.endswith(message) for window, message in zip(presidio.windows, messages))
+    assert max(len(window) for window in presidio.windows) <= 80 + 1 + len(messages[-1])
+    assert _tail("alpha beta gamma", 8) == "gamma" and _tail("alpha beta gamma", 6) == "gamma"
+
+
+def test_benchmark_per_message_latency():
+    messages = [f"Agent: hi John Smith, your ticket {n} is updated. Reply to user{n % 20}@acme.com" for n in range(500)]
+    session = ConversationService(_Repository(), ExecutionPool(workers=0))
+
+    async def run():
+        timings = []
+        for message in messages:
+            start = time.perf_counter()
+            await session.mask(message)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    with _engine_pool():
+        timings = asyncio.run(run())
+    median = statistics.median(timings)
+    # Session overhead only: detection here is a regex, not spaCy
+    print(f"\n500 messages: median {median:.2f}ms, p99 {sorted(timings)[494]:.2f}ms per message")
+    assert median < 5
+
+
+if __name__ == "__main__":
+    try:
+        test_tags_are_consistent_across_messages()
+        test_messages_are_analyzed_with_a_bounded_context()
+        test_benchmark_per_message_latency()
+        print("All conversation session tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,164 @@
+"""
+Test convert-once artifacts and the cross-request conversion cache
+"""
+import os
+import pickle
+import sys
+import tempfile
+from io import BytesIO
+
+import fitz
+from fastapi import UploadFile
+
+import utility.ConversionCache as conversion_cache
+from services.DOCXService import DOCXService
+from utility.ConversionCache import ConversionCache
+
+# Not a DOCX package, so DOCXService takes its LibreOffice fallback path
+DOCX = b"PK fake docx: contact John Smith at john.smith@acme.com"
+
+
+class FakeConverter:
+    """Writes a one-page PDF holding the input's text instead of running LibreOffice."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def convert_to_pdf(self, input_path, output_dir=None):
+        self.calls += 1
+        with open(input_path, "rb") as f:
+            text = f.read().decode("utf-8")
+        doc = fitz.open()
+        doc.new_page().insert_text((72, 72), text, fontsize=9)
+        out = os.path.join(output_dir or tempfile.gettempdir(), f"{os.path.splitext(os.path.basename(input_path))[0]}.pdf")
+        doc.save(out)
+        doc.close()
+        return out
+
+
+def _service(converter):
+    service = DOCXService(None, None)
+    service.converter = converter
+    return service
+
+
+def _ingest(service, raw=DOCX, request_id="req1"):
+    return service._ingest(UploadFile(filename="letter.docx", file=BytesIO(raw)), request_id)
+
+
+def _with_cache(cache, fn):
+    previous = conversion_cache._cache
+    conversion_cache._cache = cache
+    try:
+        return fn()
+    finally:
+        conversion_cache._cache = previous
+
+
+def test_extract_and_build_convert_once():
+    converter = FakeConverter()
+    service = _service(converter)
+
+    def run():
+        source = _ingest(service)
+        try:
+            extracted = service._extract_document(source.read(), "letter.docx")
+            out_path = os.path.join(tempfile.mkdtemp(), "letter_masked.pdf")
+            start = extracted.text.index("john.smith@acme.com")
+            anon = {"spans": [(start, start + len("john.smith@acme.com"), "<EMAIL_ADDRESS_0>")]}
+            service._build_masked_document(source.read(), extracted, anon, out_path)
+            artifact = source.artifact_path(".pdf")
+            assert os.path.exists(artifact)
+        finally:
+            service._release_source()
+        assert not os.path.exists(artifact)
+        with fitz.open(out_path) as masked:
+            assert "john.smith@acme.com" not in masked[0].get_text()
+            assert "John Smith" in masked[0].get_text()
+
+    _with_cache(ConversionCache(enabled=False), run)
+    assert converter.calls == 1
+
+
+def test_worker_copy_shares_the_artifact_without_deleting_it():
+    service = _service(FakeConverter())
+    source = _ingest(service)
+    try:
+        copy = pickle.loads(pickle.dumps(source))
+        assert copy.artifact_path(".pdf") == source.artifact_path(".pdf")
+        with open(copy.artifact_path(".pdf"), "wb") as f:
+            f.write(b"%PDF")
+        copy.cleanup()
+        assert os.path.exists(source.artifact_path(".pdf"))
+    finally:
+        artifact = source.artifact_path(".pdf")
+        source.cleanup()
+    assert not os.path.exists(artifact)
+
+
+def test_cache_reuses_conversion_across_requests():
+    converter = FakeConverter()
+    service = _service(converter)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ConversionCache(path=tmp, max_bytes=10 ** 7, ttl_s=60, enabled=True)
+
+        def extract(raw, request_id):
+            source = _ingest(service, raw, request_id)
+            try:
+                return service._extract_document(source.read(), "letter.docx").text
+            finally:
+                service._release_source()
+
+        first = _with_cache(cache, lambda: extract(DOCX, "req1"))
+        second = _with_cache(cache, lambda: extract(DOCX, "req2"))
+        assert first == second
+        assert converter.calls == 1
+        assert cache.hits == 1
+
+        _with_cache(cache, lambda: extract(DOCX + b" (v2)", "req3"))
+        assert converter.calls == 2
+
+        # Entries are encrypted: the converted text is not on disk
+        for name in os.listdir(tmp):
+            with open(os.path.join(tmp, name), "rb") as f:
+                assert b"%PDF" not in f.read()
+
+
+def test_entry_needs_the_original_bytes():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ConversionCache(path=tmp, max_bytes=10 ** 7, ttl_s=60, enabled=True)
+        key = cache.make_key(DOCX, ".pdf")
+        cache.put(key, DOCX, b"%PDF converted")
+        assert cache.get(key, DOCX) == b"%PDF converted"
+        # Same key with other bytes fails to decrypt and drops the entry
+        assert cache.get(key, b"other") is None
+        assert cache.get(key, DOCX) is None
+
+
+def test_least_recently_used_entries_are_evicted():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ConversionCache(path=tmp, max_bytes=2500, ttl_s=10 ** 10, enabled=True)
+        keys = []
+        for n in range(3):
+            raw = f"document {n}".encode()
+            keys.append((cache.make_key(raw, ".pdf"), raw))
+            cache.put(keys[-1][0], raw, os.urandom(1000))
+            # Distinct mtimes so the LRU order is deterministic
+            os.utime(os.path.join(tmp, keys[-1][0] + ".bin"), (n + 1, n + 1))
+        cache._evict()
+        assert cache.get(*keys[0]) is None
+        assert cache.get(*keys[1]) is not None
+        assert cache.get(*keys[2]) is not None
+
+
+if __name__ == "__main__":
+    try:
+        test_extract_and_build_convert_once()
+        test_worker_copy_shares_the_artifact_without_deleting_it()
+        test_cache_reuses_conversion_across_requests()
+        test_entry_needs_the_original_bytes()
+        test_least_recently_used_entries_are_evicted()
+        print("All conversion cache tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,168 @@
+"""
+Test the Tavily country cache: tiers, TTLs, negative caching, single-flight
+
+The end-to-end test points TavilyCountrySearch at a local HTTP stub, so no
+real Tavily calls are made.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utility.CountryCache import (
+    CountryCache,
+    cache_key,
+    normalize_company_name,
+    normalize_website,
+    STATUS_ERROR,
+    STATUS_FOUND,
+    STATUS_NOT_FOUND,
+)
+
+
+class TavilyStub:
+    """Minimal stand-in for POST /search; answers are looked up by company name."""
+
+    def __init__(self, answers, delay_s: float = 0.0, status: int = 200):
+        self.answers = answers
+        self.delay_s = delay_s
+        self.status = status
+        self.calls = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                stub.calls += 1
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(stub.delay_s)
+                answer = next((a for name, a in stub.answers.items() if name in body["query"]), None)
+                payload = json.dumps({"query": body["query"], "answer": answer, "results": []}).encode()
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/search"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+def test_normalization():
+    assert normalize_company_name("  ACME Holdings, Inc. ") == "acme"
+    assert normalize_company_name("Acme Corp") == normalize_company_name("acme")
+    assert normalize_website("https://www.Acme.co.uk:443/about?x=1") == "acme.co.uk"
+    assert cache_key("Acme Inc", "acme.com") == cache_key("ACME", "http://www.acme.com/")
+
+
+def test_memory_disk_and_negative_tiers():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "cc.sqlite3")
+        cache = CountryCache(db_path=db, memory_size=2)
+        calls = []
+
+        def lookup():
+            calls.append(1)
+            return "Canada", STATUS_FOUND
+
+        assert cache.resolve("acme|", lookup).source == "lookup"
+        assert cache.resolve("acme|", lookup).source == "memory"
+        assert len(calls) == 1
+
+        # A new process (fresh memory tier) reads the SQLite tier
+        reopened = CountryCache(db_path=db)
+        hit = reopened.resolve("acme|", lookup)
+        assert (hit.country, hit.source) == ("Canada", "disk")
+        assert len(calls) == 1
+
+        assert cache.resolve("nobody|", lambda: (None, STATUS_NOT_FOUND)).status == STATUS_NOT_FOUND
+        assert cache.resolve("nobody|", lookup).status == STATUS_NOT_FOUND
+
+        def failing():
+            raise RuntimeError("tavily down")
+
+        assert cache.resolve("broken|", failing).status == STATUS_ERROR
+        assert cache.resolve("broken|", lookup).source == "memory"
+
+
+def test_expired_entries_are_looked_up_again():
+    cache = CountryCache(db_path=None, ttls={STATUS_FOUND: 0.05})
+    cache.resolve("acme|", lambda: ("Canada", STATUS_FOUND))
+    time.sleep(0.1)
+    assert cache.resolve("acme|", lambda: ("Mexico", STATUS_FOUND)).country == "Mexico"
+
+
+def test_single_flight():
+    cache = CountryCache(db_path=None)
+    calls = []
+
+    def slow_lookup():
+        calls.append(1)
+        time.sleep(0.2)
+        return "Japan", STATUS_FOUND
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.resolve("toyota|", slow_lookup)))
+               for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert {r.country for r in results} == {"Japan"}
+
+
+def test_against_tavily_stub():
+    stub = TavilyStub({"Acme": "Acme is headquartered in Toronto, Canada.", "Nowhere": "Unknown."},
+                      delay_s=0.1)
+    os.environ["TAVILY_API_KEY"] = "test-key"
+    try:
+        from utility.TavilyCountrySearch import TavilyCountrySearch
+
+        tavily = TavilyCountrySearch()
+        tavily.api_url = stub.url
+        cache = CountryCache(db_path=None)
+
+        def resolve(name):
+            def lookup():
+                result = tavily.lookup_country(name)
+                return (result.country, STATUS_FOUND) if result.matched_from_list else (None, STATUS_NOT_FOUND)
+            return cache.resolve(cache_key(name, None), lookup)
+
+        threads = [threading.Thread(target=resolve, args=("Acme",)) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert stub.calls == 1
+        assert resolve("Acme").country == "Canada"
+        assert resolve("Nowhere").status == STATUS_NOT_FOUND
+        assert resolve("Nowhere").source == "memory"
+        assert stub.calls == 2
+
+        stub.status = 500
+        assert resolve("Broken Co").status == STATUS_ERROR
+    finally:
+        stub.close()
+
+
+if __name__ == "__main__":
+    try:
+        test_normalization()
+        test_memory_disk_and_negative_tiers()
+        test_expired_entries_are_looked_up_again()
+        test_single_flight()
+        test_against_tavily_stub()
+        print("All country cache tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
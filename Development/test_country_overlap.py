@@ -0,0 +1,151 @@
+"""
+Test that country detection overlaps text extraction in the async pipeline
+
+Uses a stand-in executor and Presidio so only the pipeline's scheduling is
+measured: extraction and country detection each take ~0.3s, so run serially
+they would take ~0.6s.
+"""
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+os.environ["RESULT_CACHE_ENABLED"] = "false"
+
+from fastapi import UploadFile
+from io import BytesIO
+
+from services.BaseService import BaseService
+
+STAGE_S = 0.3
+
+
+class FakeExecutor:
+    is_process_mode = False
+
+    def __init__(self):
+        self.events = []
+
+    @asynccontextmanager
+    async def engine(self):
+        presidio = FakePresidio()
+        presidio.events = self.events
+        self.events.append("checkout")
+        try:
+            yield presidio
+        finally:
+            self.events.append("release")
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    async def run_service_stage(self, stage, service, method, *args):
+        return await asyncio.to_thread(getattr(service, method), *args)
+
+    async def run_presidio_stage(self, stage, presidio, method, *args):
+        return getattr(presidio, method)(*args)
+
+    async def detect_pii(self, presidio, text, language, country):
+        presidio.detected_with = country
+        presidio.events.append("detect")
+        return []
+
+
+class FakePresidio:
+    detected_with = None
+
+    def __init__(self):
+        self.events = []
+
+    def profile_version(self, country):
+        return "test"
+
+    def anonymize_text(self, text, entities):
+        self.events.append("anonymize")
+        return {"anonymized_text": text, "mapping": {}, "encryption_key": "", "entities_count": 0}
+
+
+class SlowTextService(BaseService):
+    def _extract_text(self, raw, filename):
+        time.sleep(STAGE_S)
+        return raw.decode("utf-8")
+
+    def _build_masked_output(self, raw, mapping, anonymized_text, out_path):
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(anonymized_text)
+
+
+async def _slow_country():
+    await asyncio.sleep(STAGE_S)
+    return "Canada"
+
+
+def _run(country_factory):
+    async def run():
+        presidio = FakePresidio()
+        service = SlowTextService(None, presidio)
+        document = UploadFile(file=BytesIO(b"hello"), filename="note.txt")
+        start = time.perf_counter()
+        result = await service.run_pipeline_async(FakeExecutor(), document, await country_factory())
+        elapsed = time.perf_counter() - start
+        os.remove(result["processed_document"])
+        return result, elapsed, presidio
+
+    return asyncio.run(run())
+
+
+def test_country_overlaps_extraction():
+    async def pending_country():
+        return asyncio.ensure_future(_slow_country())
+
+    result, elapsed, presidio = _run(pending_country)
+    assert result["country"] == "Canada"
+    assert presidio.detected_with == "Canada"
+    assert elapsed < 2 * STAGE_S * 0.9, f"stages did not overlap ({elapsed:.2f}s)"
+    assert result["country_wait_ms"] < STAGE_S * 1000 / 2
+
+
+def test_resolved_country_passes_through():
+    async def known_country():
+        return "Japan"
+
+    result, _, presidio = _run(known_country)
+    assert result["country"] == "Japan"
+    assert presidio.detected_with == "Japan"
+    assert result["country_wait_ms"] < 50
+
+
+def test_pooled_engine_is_held_for_the_presidio_stages_only():
+    executor = FakeExecutor()
+
+    class RecordingService(SlowTextService):
+        def _extract_text(self, raw, filename):
+            executor.events.append("extract")
+            return raw.decode("utf-8")
+
+        def _build_masked_output(self, raw, mapping, anonymized_text, out_path):
+            executor.events.append("build")
+            super()._build_masked_output(raw, mapping, anonymized_text, out_path)
+
+    async def run():
+        service = RecordingService(None, None)
+        document = UploadFile(file=BytesIO(b"hello"), filename="note.txt")
+        result = await service.run_pipeline_async(executor, document, "Canada")
+        os.remove(result["processed_document"])
+        return service
+
+    service = asyncio.run(run())
+    assert executor.events == ["extract", "checkout", "detect", "anonymize", "release", "build"]
+    assert service.presidio is None
+
+
+if __name__ == "__main__":
+    try:
+        test_country_overlaps_extraction()
+        test_resolved_country_passes_through()
+        test_pooled_engine_is_held_for_the_presidio_stages_only()
+        print("All country overlap tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,77 @@
+"""
+Test country profiles against the pinned Presidio: building, analysis and score thresholds
+"""
+import sys
+import tempfile
+
+import spacy
+from presidio_analyzer import AnalyzerEngine, RecognizerResult
+from presidio_analyzer.nlp_engine import SpacyNlpEngine
+
+import utility.country_pii_config as country_config
+from utility.CountryProfile import build_country_profile
+from utility.country_pii_config import DEFAULT_SCORE_THRESHOLD, get_score_thresholds
+from utility.custom_recognizers import get_custom_recognizers
+
+TEXT = "Write to john.smith@acme.com about SSN 078-05-1120"
+
+
+def _base_analyzer() -> AnalyzerEngine:
+    """Default registry over a blank English pipeline (no model download needed)."""
+    path = tempfile.mkdtemp(prefix="blank_en_")
+    spacy.blank("en").to_disk(path)
+    analyzer = AnalyzerEngine(nlp_engine=SpacyNlpEngine(models={"en": path}), supported_languages=["en"])
+    for recognizer in get_custom_recognizers():
+        analyzer.registry.add_recognizer(recognizer)
+    return analyzer
+
+
+BASE = _base_analyzer()
+
+
+def test_profile_builds_and_analyzes():
+    profile = build_country_profile(BASE, "United States")
+    assert profile.recognizers and "EMAIL_ADDRESS" in profile.entities
+    found = {(r.entity_type, TEXT[r.start:r.end]) for r in profile.analyze(TEXT)}
+    assert ("EMAIL_ADDRESS", "john.smith@acme.com") in found
+    # Only the country's entities come back
+    assert all(r.entity_type in profile.entities for r in profile.analyze(TEXT))
+
+
+def test_profile_batch_matches_single_analysis():
+    profile = build_country_profile(BASE, "Canada")
+    texts = [TEXT, "nothing here", "mail jane@roe.org"]
+    single = [sorted((r.entity_type, r.start, r.end) for r in profile.analyze(t)) for t in texts]
+    for contexts in (None, [["email"], [], ["contact", "email"]]):
+        batch = profile.analyze_batch(texts, contexts)
+        assert [sorted((r.entity_type, r.start, r.end) for r in rs) for rs in batch] == single
+
+
+def test_score_thresholds():
+    entities = ("EMAIL_ADDRESS", "PERSON")
+    assert get_score_thresholds("Canada", entities) == {e: DEFAULT_SCORE_THRESHOLD for e in entities}
+
+    country_config._COUNTRY_SCORE_THRESHOLDS["Canada"] = {"PERSON": 0.85}
+    try:
+        assert get_score_thresholds("Canada", entities) == {"EMAIL_ADDRESS": DEFAULT_SCORE_THRESHOLD, "PERSON": 0.85}
+        assert get_score_thresholds("Mexico", entities)["PERSON"] == DEFAULT_SCORE_THRESHOLD
+        strict = build_country_profile(BASE, "Canada")
+    finally:
+        del country_config._COUNTRY_SCORE_THRESHOLDS["Canada"]
+
+    default = build_country_profile(BASE, "Canada")
+    person = RecognizerResult("PERSON", 0, 4, 0.6)
+    assert default.accepts(person) and not strict.accepts(person)
+    assert strict.version != default.version
+    assert not default.accepts(RecognizerResult("NOT_AN_ENTITY", 0, 4, 1.0))
+
+
+if __name__ == "__main__":
+    try:
+        test_profile_builds_and_analyzes()
+        test_profile_batch_matches_single_analysis()
+        test_score_thresholds()
+        print("All country profile tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
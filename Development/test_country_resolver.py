@@ -0,0 +1,151 @@
+"""
+Test offline country resolution, the circuit breaker and the async Tavily path
+
+The async client is exercised against the local stub server from
+test_country_cache, so no real Tavily calls are made.
+"""
+import asyncio
+import os
+import sys
+import time
+
+from utility.CircuitBreaker import CircuitBreaker, STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN
+from utility.CountryCache import CountryCache, STATUS_ERROR, STATUS_FOUND, STATUS_NOT_FOUND
+from utility.OfflineCountryResolver import OfflineCountryResolver
+from utility.exceptions import ServiceUnavailableException
+from test_country_cache import TavilyStub
+
+
+def test_offline_resolver():
+    resolver = OfflineCountryResolver()
+    assert resolver.resolve("Royal Bank of Canada", None).country == "Canada"
+    assert resolver.resolve("Shopify Inc.", None) == ("Canada", "gazetteer_company")
+    assert resolver.resolve("Unknown Startup", "https://careers.rbc.com/jobs") == ("Canada", "gazetteer_domain")
+    assert resolver.resolve("Unknown Startup", "www.example.co.uk") == ("United Kingdom", "cctld")
+    assert resolver.resolve("Unknown Startup", "example.com.au").country == "Australia"
+    # Generic TLDs and unsupported ccTLDs need Tavily
+    assert resolver.resolve("Unknown Startup", "https://example.com") is None
+    assert resolver.resolve("Unknown Startup", "example.br") is None
+    # The gazetteer domain wins over the ccTLD
+    assert resolver.resolve(None, "commbank.com.au").source == "gazetteer_domain"
+
+
+def test_offline_resolver_without_gazetteer():
+    resolver = OfflineCountryResolver(gazetteer_path=None)
+    assert resolver.resolve("Shopify", None) is None
+    assert resolver.resolve("Shopify", "shopify.ca").country == "Canada"
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout_s=0.1)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == STATE_CLOSED
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+
+    try:
+        breaker.before_call()
+        assert False, "open breaker should fail fast"
+    except ServiceUnavailableException:
+        pass
+
+    time.sleep(0.15)
+    assert breaker.state == STATE_HALF_OPEN
+    breaker.before_call()  # the one trial call
+    try:
+        breaker.before_call()
+        assert False, "only one trial call while half-open"
+    except ServiceUnavailableException:
+        pass
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+
+    time.sleep(0.15)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.health()["consecutive_failures"] == 0
+
+
+def test_resolve_async_single_flight():
+    cache = CountryCache(db_path=None)
+    calls = []
+
+    async def slow_lookup():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "Japan", STATUS_FOUND
+
+    async def run():
+        return await asyncio.gather(*(cache.resolve_async("toyota|", slow_lookup) for _ in range(10)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert {r.country for r in results} == {"Japan"}
+    assert sorted(r.source for r in results).count("lookup") == 1
+
+    async def failing():
+        raise RuntimeError("down")
+
+    assert asyncio.run(cache.resolve_async("broken|", failing)).status == STATUS_ERROR
+    assert asyncio.run(cache.resolve_async("broken|", slow_lookup)).source == "memory"
+
+
+def test_async_client_against_stub():
+    stub = TavilyStub({"Acme": "Acme is based in Osaka, Japan."}, delay_s=0.05)
+    os.environ["TAVILY_API_KEY"] = "test-key"
+    try:
+        from utility.TavilyCountrySearch import TavilyCountrySearch
+
+        tavily = TavilyCountrySearch()
+        tavily.api_url = stub.url
+        tavily.breaker.failure_threshold = 2
+        cache = CountryCache(db_path=None)
+
+        async def resolve(name):
+            async def lookup():
+                result = await tavily.lookup_country_async(name)
+                return (result.country, STATUS_FOUND) if result.matched_from_list else (None, STATUS_NOT_FOUND)
+            return await cache.resolve_async(name, lookup)
+
+        async def run():
+            try:
+                found = await asyncio.gather(*(resolve("Acme") for _ in range(5)))
+                assert stub.calls == 1
+                assert {r.country for r in found} == {"Japan"}
+
+                # A slow upstream is cut off at the latency budget
+                stub.delay_s = 1.0
+                tavily.timeout_s = 0.2
+                tavily._async_client = None
+                started = time.monotonic()
+                assert (await resolve("Slow Co")).status == STATUS_ERROR
+                assert time.monotonic() - started < 0.9
+
+                # A second failure opens the breaker: no more upstream calls
+                assert (await resolve("Slow Co 2")).status == STATUS_ERROR
+                calls = stub.calls
+                assert (await resolve("Other Co")).status == STATUS_ERROR
+                assert stub.calls == calls
+            finally:
+                await tavily.aclose()
+
+        asyncio.run(run())
+    finally:
+        stub.close()
+
+
+if __name__ == "__main__":
+    try:
+        test_offline_resolver()
+        test_offline_resolver_without_gazetteer()
+        test_circuit_breaker()
+        test_resolve_async_single_flight()
+        test_async_client_against_stub()
+        print("All country resolver tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,170 @@
+"""
+Test native CSV masking: csv-module parsing, batched streaming and the cell memo
+"""
+import csv
+import io
+import os
+import re
+import sys
+import tempfile
+from io import BytesIO
+
+import openpyxl
+from fastapi import UploadFile
+
+import services.CSVService as csv_service
+from services.BaseService import streamed_text_path
+from services.CSVService import CSVService
+from test_streaming_pdf import RegexPresidio, _tags
+from utility.CellAnonymizer import CellAnonymizer
+from utility.DocumentIngestion import IngestedDocument
+
+EMAIL = "john.smith@acme.com"
+PERSON = "John Smith"
+
+ROWS = [
+    ["id", "name", "email", "country"],
+    ["0012", PERSON, EMAIL, "Canada"],
+    ["0013", "Jane Roe", "", "Canada"],
+    ["0014", "Contact: John Smith", "jane@roe.com", "Canada"],
+]
+
+
+def _csv(rows, delimiter=",", encoding="utf-8") -> bytes:
+    buffer = io.StringIO(newline="")
+    csv.writer(buffer, delimiter=delimiter).writerows(rows)
+    return buffer.getvalue().encode(encoding)
+
+
+def _mask(raw: bytes, filename="export.csv"):
+    presidio = RegexPresidio()
+    service = CSVService(None, presidio)
+    extracted = service._extract_document(raw, filename)
+    anon = presidio.anonymize_text(extracted.text, presidio.detect_pii(extracted.text))
+    out_path = os.path.join(tempfile.mkdtemp(), "export_masked.csv")
+    service._build_masked_document(raw, extracted, anon, out_path)
+    return out_path
+
+
+def _read(path: str, encoding="utf-8", delimiter=","):
+    with open(path, encoding=encoding, newline="") as f:
+        return list(csv.reader(f, delimiter=delimiter))
+
+
+def _stream(raw: bytes, batch_rows: int, masked_name="export_masked.csv"):
+    service = CSVService(None, RegexPresidio())
+    source = IngestedDocument(UploadFile(filename="export.csv", file=BytesIO(raw)), "req1")
+    previous = csv_service.CSV_STREAMING_MIN_MB, csv_service.CSV_BATCH_ROWS
+    csv_service.CSV_STREAMING_MIN_MB, csv_service.CSV_BATCH_ROWS = 0, batch_rows
+    try:
+        assert service._use_streaming(source)
+        out_path = os.path.join(tempfile.mkdtemp(), masked_name)
+        result = service._mask_streaming(source, "United States", out_path)
+    finally:
+        csv_service.CSV_STREAMING_MIN_MB, csv_service.CSV_BATCH_ROWS = previous
+        source.cleanup()
+    return out_path, result
+
+
+def test_cells_are_masked_in_place():
+    masked = _read(_mask(_csv(ROWS)))
+    assert masked[0] == ROWS[0]
+    assert [row[0] for row in masked] == ["id", "0012", "0013", "0014"]
+    assert masked[1][1] == masked[3][1].replace("Contact: ", "")
+    assert _tags(masked[1][1], "PERSON") and _tags(masked[1][2], "EMAIL_ADDRESS")
+    assert masked[2][2] == ""
+    assert all(row[3] in ("country", "Canada") for row in masked)
+    assert not any(EMAIL in cell or "Smith" in cell for row in masked for cell in row)
+
+
+def test_encoding_and_delimiter_are_kept():
+    rows = [["name", "city"], [PERSON, "Montréal"]]
+    raw = _csv(rows, delimiter=";", encoding="cp1252")
+    out_path = _mask(raw)
+    with open(out_path, "rb") as f:
+        data = f.read()
+    # Written back in cp1252 with semicolons
+    assert "Montréal".encode("cp1252") in data
+    masked = _read(out_path, encoding="cp1252", delimiter=";")
+    assert masked[1][1] == "Montréal" and _tags(masked[1][0], "PERSON")
+
+    # Excel's UTF-8 export starts with a BOM; plain UTF-8 gets none added
+    with open(_mask(_csv(rows, encoding="utf-8-sig")), "rb") as f:
+        assert f.read().startswith(b"\xef\xbb\xbfname,city")
+    with open(_mask(_csv(rows)), "rb") as f:
+        assert f.read().startswith(b"name,city")
+
+
+def test_streaming_matches_in_memory_masking():
+    rows = [ROWS[0]] + [[f"{n:04d}", PERSON, EMAIL, "Canada"] for n in range(250)]
+    raw = _csv(rows)
+    whole = _read(_mask(raw))
+    out_path, result = _stream(raw, batch_rows=40)
+    streamed = _read(out_path)
+
+    assert len(streamed) == len(rows)
+    assert [row[0] for row in streamed] == [row[0] for row in rows]
+    # One tag per value across every batch (numbered in the order tags were made)
+    for column in (1, 2):
+        tags = {row[column] for row in streamed[1:]}
+        assert len(tags) == 1
+        assert re.sub(r"\d+", "", tags.pop()) == re.sub(r"\d+", "", whole[1][column])
+    assert result["entities_count"] == 500
+
+    with open(streamed_text_path(out_path), encoding="utf-8") as f:
+        text = f.read()
+    lines = text.split("\n")
+    assert lines[0] == "id name email country"
+    assert len(lines) == len(rows) and EMAIL not in text
+
+
+def test_repeated_values_are_analyzed_once():
+    presidio = RegexPresidio()
+    masker = CellAnonymizer(presidio)
+    values = [PERSON, "Canada", EMAIL, "Canada", "", PERSON]
+    masked = masker.mask(values) + masker.mask([EMAIL, "Canada", "Jane Roe"])
+    assert masker.analyzed == 4
+    assert len(presidio.calls) == 2
+    assert masked[0] == masked[5] and masked[2] == masked[6]
+    assert masked[4] == "" and masked[3] == masked[7] == "Canada"
+    assert masker.entities_count == 5
+
+
+def test_memo_is_bounded():
+    masker = CellAnonymizer(RegexPresidio(), cache_size=3)
+    masker.mask([f"user{n}@acme.com" for n in range(10)])
+    assert len(masker._memo) == 3
+    # Evicted values are analyzed again and keep their tag
+    first = masker.mask(["user0@acme.com"])
+    assert masker.analyzed == 11
+    assert first == masker.mask(["user0@acme.com"])
+    assert masker.analyzed == 11
+
+
+def test_xlsx_output_keeps_values_as_text():
+    previous = csv_service.CSV_OUTPUT_FORMAT
+    csv_service.CSV_OUTPUT_FORMAT = "xlsx"
+    try:
+        assert CSVService._masked_filename("export.csv") == "export_masked.xlsx"
+        out_path, _ = _stream(_csv(ROWS), batch_rows=2, masked_name="export_masked.xlsx")
+    finally:
+        csv_service.CSV_OUTPUT_FORMAT = previous
+    ws = openpyxl.load_workbook(out_path).active
+    values = [[cell.value for cell in row] for row in ws.iter_rows()]
+    assert values[1][0] == "0012"
+    assert _tags(values[1][2], "EMAIL_ADDRESS")
+    assert values[0] == ROWS[0]
+
+
+if __name__ == "__main__":
+    try:
+        test_cells_are_masked_in_place()
+        test_encoding_and_delimiter_are_kept()
+        test_streaming_matches_in_memory_masking()
+        test_repeated_values_are_analyzed_once()
+        test_memo_is_bounded()
+        test_xlsx_output_keeps_values_as_text()
+        print("All native CSV tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,81 @@
+"""
+Test the span-preserving document model and span recovery
+"""
+import sys
+
+from utility.DocumentModel import DocumentBuilder, ExtractedDocument, apply_spans
+from utility.span_helpers import original_spans
+
+
+def _workbook_like():
+    builder = DocumentBuilder(separator=" ")
+    builder.add("Name", ("Sheet1", "A1"))
+    builder.add("John", ("Sheet1", "A2"))
+    builder.add("Smith", ("Sheet1", "B2"))
+    builder.add("john@acme.com", ("Sheet1", "C2"))
+    builder.add("John", ("Sheet2", "A1"))
+    return builder.build()
+
+
+def test_builder_and_locate():
+    doc = _workbook_like()
+    assert doc.text == "Name John Smith john@acme.com John"
+    assert doc.segment_text(2) == "Smith"
+    assert doc.locations[doc.locate(doc.text.index("acme"))] == ("Sheet1", "C2")
+    assert doc.locate(4) is None  # separator
+    assert ExtractedDocument.from_text("abc").locate(2) == 0
+
+
+def test_segment_spans_by_location():
+    doc = _workbook_like()
+    email = doc.text.index("john@")
+    spans = [(email, email + len("john@acme.com"), "<EMAIL_ADDRESS_0>")]
+    groups = list(doc.segment_spans(spans))
+    assert groups == [(3, [(0, 13, "<EMAIL_ADDRESS_0>")])]
+
+    # Only the detected occurrence is masked, not every "John" in the workbook
+    groups = dict(doc.segment_spans([(5, 9, "<PERSON_0>")]))
+    assert set(groups) == {1}
+
+
+def test_span_across_segments_masks_every_piece():
+    doc = _workbook_like()
+    spans = [(5, 15, "<PERSON_0>")]  # "John Smith" seen across A2 and B2
+    groups = dict(doc.segment_spans(spans))
+    assert groups == {1: [(0, 4, "<PERSON_0>")], 2: [(0, 5, "<PERSON_0>")]}
+    assert apply_spans(doc.segment_text(1), groups[1]) == "<PERSON_0>"
+    assert apply_spans(doc.segment_text(2), groups[2]) == "<PERSON_0>"
+
+
+def test_several_spans_in_one_segment():
+    builder = DocumentBuilder(separator="\n")
+    builder.add("Call Ann on 555-1234 or Bob.", 0)
+    builder.add("No PII here.", 1)
+    doc = builder.build()
+    spans = [(5, 8, "<PERSON_0>"), (12, 20, "<PHONE_NUMBER_0>"), (24, 27, "<PERSON_1>")]
+    [(index, local)] = list(doc.segment_spans(spans))
+    assert index == 0
+    assert apply_spans(doc.segment_text(0), local) == "Call <PERSON_0> on <PHONE_NUMBER_0> or <PERSON_1>."
+
+
+def test_original_spans_from_replacements():
+    text = "Bob met Alice and Bob."
+    anonymized = "<PERSON_0> met <PERSON_1> and <PERSON_0>."
+    tag_to_value = {"<PERSON_0>": "Bob", "<PERSON_1>": "Alice"}
+    replacements = [(0, 10, "<PERSON_0>"), (15, 25, "<PERSON_1>"), (30, 40, "<PERSON_0>")]
+    spans = original_spans(replacements, tag_to_value)
+    assert spans == [(0, 3, "<PERSON_0>"), (8, 13, "<PERSON_1>"), (18, 21, "<PERSON_0>")]
+    assert apply_spans(text, spans) == anonymized
+
+
+if __name__ == "__main__":
+    try:
+        test_builder_and_locate()
+        test_segment_spans_by_location()
+        test_span_across_segments_masks_every_piece()
+        test_several_spans_in_one_segment()
+        test_original_spans_from_replacements()
+        print("All document model tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,266 @@
+"""
+Test native DOCX masking on generated documents
+"""
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+import docx
+import pytest
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+
+from services.DOCXService import DOCXService
+from services.LibreOfficeConverter import LibreOfficeConverter
+from services.PDFService import PDFService
+from utility.docx_runs import UnsupportedDocument, extract_docx, mask_docx
+
+EMAIL = "john.smith@acme.com"
+PERSON = "John Smith"
+
+
+def _spans(text: str, values) -> list:
+    spans = []
+    for value, tag in values.items():
+        spans += [(m.start(), m.end(), tag) for m in re.finditer(re.escape(value), text)]
+    return sorted(spans)
+
+
+def _mask(raw: bytes, values) -> docx.Document:
+    extracted = extract_docx(raw)
+    out_path = os.path.join(tempfile.mkdtemp(), "masked.docx")
+    mask_docx(raw, extracted, _spans(extracted.text, values), out_path)
+    return docx.Document(out_path)
+
+
+def _save(document: docx.Document) -> bytes:
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def _insert_in_body(raw: bytes, xml: str) -> bytes:
+    """*raw* with *xml* added at the end of the body."""
+    with zipfile.ZipFile(io.BytesIO(raw)) as archive:
+        members = {n: archive.read(n) for n in archive.namelist()}
+    body = members["word/document.xml"].decode("utf-8")
+    members["word/document.xml"] = body.replace("<w:sectPr", xml + "<w:sectPr", 1).encode("utf-8")
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as out:
+        for name, data in members.items():
+            out.writestr(name, data)
+    return buffer.getvalue()
+
+
+def _add_hyperlink(paragraph, text: str, url: str) -> None:
+    r_id = paragraph.part.relate_to(url, docx.opc.constants.RELATIONSHIP_TYPE.HYPERLINK, is_external=True)
+    link = OxmlElement("w:hyperlink")
+    link.set(qn("r:id"), r_id)
+    run = OxmlElement("w:r")
+    t = OxmlElement("w:t")
+    t.text = text
+    run.append(t)
+    link.append(run)
+    paragraph._p.append(link)
+
+
+def _sample() -> bytes:
+    document = docx.Document()
+    section = document.sections[0]
+    section.header.paragraphs[0].text = f"Prepared for {PERSON}"
+    section.footer.paragraphs[0].text = f"Contact {EMAIL}"
+
+    # The name is split across runs with different formatting
+    paragraph = document.add_paragraph("Dear ")
+    paragraph.add_run("John").bold = True
+    paragraph.add_run(" Smith,")
+    document.add_paragraph("This paragraph has no PII.")
+
+    table = document.add_table(rows=2, cols=2)
+    table.cell(0, 0).text = "Email"
+    table.cell(0, 1).text = EMAIL
+    table.cell(1, 0).text = "Name"
+    table.cell(1, 1).text = PERSON
+
+    _add_hyperlink(document.add_paragraph("Write to "), EMAIL, f"mailto:{EMAIL}")
+    return _save(document)
+
+
+def test_extraction_covers_body_tables_headers_and_footers():
+    extracted = extract_docx(_sample())
+    text = extracted.text
+    assert "Dear John Smith," in text
+    assert f"Contact {EMAIL}" in text
+    assert f"Prepared for {PERSON}" in text
+    assert text.count(EMAIL) == 3
+    # The main document comes first
+    assert text.index("Dear") < text.index("Prepared for")
+
+
+def test_masking_rewrites_only_affected_runs():
+    masked = _mask(_sample(), {PERSON: "<PERSON_0>", EMAIL: "<EMAIL_ADDRESS_0>"})
+    body = masked.paragraphs[0]
+    assert body.text == "Dear <PERSON_0>,"
+    # The tag took the first run's place and formatting; the rest was cut
+    assert [run.text for run in body.runs] == ["Dear ", "<PERSON_0>", ","]
+    assert body.runs[1].bold
+    assert masked.paragraphs[1].text == "This paragraph has no PII."
+
+    cells = [cell.text for row in masked.tables[0].rows for cell in row.cells]
+    assert cells == ["Email", "<EMAIL_ADDRESS_0>", "Name", "<PERSON_0>"]
+    assert masked.sections[0].header.paragraphs[0].text == "Prepared for <PERSON_0>"
+    assert masked.sections[0].footer.paragraphs[0].text == "Contact <EMAIL_ADDRESS_0>"
+
+
+def test_nothing_of_the_values_is_left_in_the_package():
+    extracted = extract_docx(_sample())
+    out_path = os.path.join(tempfile.mkdtemp(), "masked.docx")
+    mask_docx(_sample(), extracted, _spans(extracted.text, {PERSON: "<P>", EMAIL: "<E>"}), out_path)
+    with zipfile.ZipFile(out_path) as archive:
+        for name in archive.namelist():
+            data = archive.read(name)
+            # Including the hyperlink's mailto: target
+            assert EMAIL.encode() not in data, name
+            assert b"Smith" not in data, name
+
+
+def test_untouched_parts_are_copied_verbatim():
+    raw = _sample()
+    extracted = extract_docx(raw)
+    out_path = os.path.join(tempfile.mkdtemp(), "masked.docx")
+    # Only the body's first paragraph holds a span
+    start = extracted.text.index("John")
+    mask_docx(raw, extracted, [(start, start + len(PERSON), "<PERSON_0>")], out_path)
+    with zipfile.ZipFile(io.BytesIO(raw)) as original, zipfile.ZipFile(out_path) as masked:
+        changed = [n for n in masked.namelist() if original.read(n) != masked.read(n)]
+        dropped = set(original.namelist()) - set(masked.namelist())
+    # Besides the document: the blanked properties and the thumbnail's relationship
+    assert changed == ["_rels/.rels", "docProps/core.xml", "word/document.xml"]
+    assert dropped == {"docProps/thumbnail.jpeg"}
+
+
+def test_authors_alt_text_and_properties_are_blanked():
+    document = docx.Document(io.BytesIO(_sample()))
+    document.core_properties.author = PERSON
+    document.core_properties.last_modified_by = PERSON
+    document.core_properties.title = f"Offer for {PERSON}"
+    raw = _insert_in_body(_save(document), (
+        f'<w:p><w:ins w:id="7" w:author="{PERSON}" w:initials="JS"><w:r><w:t>Added</w:t></w:r></w:ins>'
+        '<w:r><w:drawing><wp:inline xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing">'
+        f'<wp:docPr id="1" name="Picture 1" descr="Photo of {PERSON}"/></wp:inline></w:drawing></w:r></w:p>'
+    ))
+    extracted = extract_docx(raw)
+    # Whether or not the part also holds a span
+    for values in ({}, {PERSON: "<PERSON_0>"}):
+        out_path = os.path.join(tempfile.mkdtemp(), "masked.docx")
+        mask_docx(raw, extracted, _spans(extracted.text, values), out_path)
+        with zipfile.ZipFile(out_path) as archive:
+            body = archive.read("word/document.xml")
+            for name in ("docProps/core.xml", "docProps/app.xml", "_rels/.rels"):
+                assert b"Smith" not in archive.read(name), name
+            assert "docProps/thumbnail.jpeg" not in archive.namelist()
+        assert b'w:author=""' in body and b'w:initials=""' in body and b'descr=""' in body
+        assert b"Photo of" not in body and b"<w:t>Added</w:t>" in body
+        masked = docx.Document(out_path)
+        assert masked.core_properties.author == "" and masked.core_properties.title == ""
+
+
+def test_text_box_text_is_read_once_per_copy():
+    # A text box inside a body paragraph: its paragraph is a segment of its own
+    raw = _insert_in_body(_sample(), (
+        '<w:p><w:r><w:t>Box: </w:t></w:r><w:r><w:pict><v:shape xmlns:v="urn:schemas-microsoft-com:vml">'
+        '<v:textbox><w:txbxContent><w:p><w:r><w:t>Signed John Smith</w:t></w:r></w:p>'
+        '</w:txbxContent></v:textbox></v:shape></w:pict></w:r></w:p>'
+    ))
+
+    extracted = extract_docx(raw)
+    assert extracted.text.count("Signed John Smith") == 1
+    assert "\nBox: " in extracted.text
+    out_path = os.path.join(tempfile.mkdtemp(), "masked.docx")
+    mask_docx(raw, extracted, _spans(extracted.text, {PERSON: "<PERSON_0>"}), out_path)
+    with zipfile.ZipFile(out_path) as archive:
+        xml = archive.read("word/document.xml")
+    assert b"Signed &lt;PERSON_0&gt;" in xml
+    assert b"Smith" not in xml
+
+
+def test_tracked_deletions_fall_back_to_conversion():
+    raw = _insert_in_body(
+        _sample(),
+        f'<w:p><w:del w:id="1" w:author="x"><w:r><w:delText>{PERSON}</w:delText></w:r></w:del></w:p>',
+    )
+    with pytest.raises(UnsupportedDocument):
+        extract_docx(raw)
+
+
+def test_service_masks_natively_without_libreoffice():
+    service = DOCXService(None, None)
+    raw = _sample()
+    extracted = service._extract_document(raw, "letter.docx")
+    out_path = os.path.join(tempfile.mkdtemp(), "letter_masked.docx")
+    spans = _spans(extracted.text, {EMAIL: "<EMAIL_ADDRESS_0>"})
+    service._build_masked_document(raw, extracted, {"spans": spans}, out_path)
+    assert service.converter is None
+    masked = docx.Document(out_path)
+    assert masked.tables[0].cell(0, 1).text == "<EMAIL_ADDRESS_0>"
+
+
+def _large_docx(paragraphs: int) -> bytes:
+    document = docx.Document()
+    for n in range(paragraphs):
+        paragraph = document.add_paragraph(f"Paragraph {n}: please contact ")
+        paragraph.add_run(PERSON).italic = True
+        paragraph.add_run(f" at {EMAIL} about case {n}.")
+    return _save(document)
+
+
+def test_native_latency_against_conversion_path():
+    raw = _large_docx(2000)
+    start = time.perf_counter()
+    extracted = extract_docx(raw)
+    spans = _spans(extracted.text, {PERSON: "<PERSON_0>", EMAIL: "<EMAIL_ADDRESS_0>"})
+    out_path = os.path.join(tempfile.mkdtemp(), "large_masked.docx")
+    mask_docx(raw, extracted, spans, out_path)
+    native = time.perf_counter() - start
+    print(f"\nNative: 2000 paragraphs, {len(spans)} spans in {native:.2f}s")
+
+    if shutil.which("soffice") or shutil.which("libreoffice"):
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "large.docx")
+            with open(path, "wb") as f:
+                f.write(raw)
+            pdf_path = LibreOfficeConverter().convert_to_pdf(path, tmp)
+            with open(pdf_path, "rb") as f:
+                pdf = f.read()
+        pdf_service = PDFService(None, None)
+        pdf_extracted = pdf_service._extract_document(pdf, "large.pdf")
+        pdf_spans = _spans(pdf_extracted.text, {EMAIL: "<EMAIL_ADDRESS_0>"})
+        pdf_service._build_masked_document(pdf, pdf_extracted, {"spans": pdf_spans}, out_path + ".pdf")
+        converted = time.perf_counter() - start
+        print(f"LibreOffice conversion path: {converted:.2f}s")
+    else:
+        print("LibreOffice conversion path: not measured (LibreOffice not installed)")
+    assert native < 30
+
+
+if __name__ == "__main__":
+    try:
+        test_extraction_covers_body_tables_headers_and_footers()
+        test_masking_rewrites_only_affected_runs()
+        test_nothing_of_the_values_is_left_in_the_package()
+        test_untouched_parts_are_copied_verbatim()
+        test_authors_alt_text_and_properties_are_blanked()
+        test_text_box_text_is_read_once_per_copy()
+        test_tracked_deletions_fall_back_to_conversion()
+        test_service_masks_natively_without_libreoffice()
+        test_native_latency_against_conversion_path()
+        print("All native DOCX tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
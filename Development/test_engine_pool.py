@@ -0,0 +1,234 @@
+"""
+Test the Presidio engine pool: checkout, rebuilds, health checks and generations
+"""
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import utility.ExecutionPool as execution_pool
+from utility.ExecutionPool import ExecutionPool
+from utility.PresidioEnginePool import PresidioEnginePool
+from utility.exceptions import GatewayTimeoutException, ServiceUnavailableException
+
+
+class FakeEngine:
+    """Stands in for a PresidioUtility; fails its probe when told to."""
+
+    def __init__(self, config):
+        self.config = dict(config)
+        self.error = None
+
+    def detect_pii(self, text, language="en", country=None):
+        if self.error is not None:
+            raise self.error
+        return []
+
+    def block(self, event):
+        event.wait(5)
+        return "done"
+
+
+class _Abort(BaseException):
+    """A probe failure that is not an Exception (as KeyboardInterrupt)."""
+
+
+def _pool(size=2, config=None, factory=FakeEngine):
+    config = config if config is not None else {"chunk_size": 100}
+    pool = PresidioEnginePool(size=size, config_provider=lambda: config, factory=factory, watch_interval_s=0)
+    pool.start()
+    return pool, config
+
+
+def _idle(pool):
+    engines = []
+    while not pool._idle.empty():
+        engines.append(pool._idle.get_nowait())
+    for engine in engines:
+        pool._idle.put(engine)
+    return [engine.presidio for engine in engines]
+
+
+def test_checkout_and_release():
+    pool, _ = _pool()
+    with pool.checkout() as first, pool.checkout() as second:
+        assert first is not second and pool.health()["idle"] == 0
+        with pytest.raises(ServiceUnavailableException):
+            with pool.checkout(timeout=0.05):
+                pass
+    assert pool.health()["idle"] == 2
+
+    async def borrow():
+        async with pool.checkout_async() as presidio:
+            return presidio
+
+    assert asyncio.run(borrow()) in _idle(pool)
+    pool.stop()
+    health = pool.health()
+    assert not health["started"] and health["idle"] == 0
+
+
+def test_rebuild_on_config_change_drops_the_old_generation():
+    pool, config = _pool()
+    assert not pool.reload_if_changed()
+    with pool.checkout() as old:
+        config["chunk_size"] = 200
+        assert pool.reload_if_changed()
+        assert pool.health()["generation"] == 1
+        fresh = _idle(pool)
+        assert len(fresh) == 2 and all(engine.config["chunk_size"] == 200 for engine in fresh)
+    # The engine borrowed before the rebuild is not returned to the pool
+    assert old not in _idle(pool) and len(_idle(pool)) == 2
+
+
+def test_stale_generation_is_skipped_on_checkout():
+    pool, _ = _pool(size=1)
+    stale = pool._idle.get_nowait()
+    pool.rebuild()
+    pool._idle.put(stale)  # a stale engine that slipped back in
+    with pool.checkout() as presidio:
+        assert presidio is not stale.presidio
+    assert len(_idle(pool)) == 1
+
+
+def test_failed_health_check_replaces_the_engine():
+    pool, _ = _pool()
+    sick = _idle(pool)[0]
+    sick.error = ValueError("spaCy crashed")  # any Exception counts as a failure
+    assert pool.check_health() == 1
+    engines = _idle(pool)
+    assert len(engines) == 2 and sick not in engines
+    assert pool.health()["unhealthy_replaced"] == 1
+
+
+def test_failed_rebuild_keeps_the_pool_size():
+    built = []
+
+    def factory(config):
+        if built:
+            raise RuntimeError("model missing")
+        built.append(FakeEngine(config))
+        return built[-1]
+
+    pool, _ = _pool(size=1, factory=factory)
+    built[0].error = ValueError("broken")
+    assert pool.check_health() == 0
+    # The sick engine stays until a later check can replace it
+    assert _idle(pool) == [built[0]]
+
+
+def test_engines_survive_a_probe_that_aborts():
+    pool, _ = _pool(size=3)
+    engines = _idle(pool)
+    engines[1].error = _Abort()
+    with pytest.raises(_Abort):
+        pool.check_health()
+    assert sorted(map(id, _idle(pool))) == sorted(map(id, engines))
+
+
+def test_waiting_requests_do_not_take_executor_threads():
+    pool, _ = _pool()
+
+    async def request():
+        async with pool.checkout_async(timeout=5) as presidio:
+            # A stage on the default executor, as ExecutionPool runs them
+            await asyncio.get_running_loop().run_in_executor(None, time.sleep, 0.2)
+            return presidio
+
+    async def run():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=4))
+        start = time.perf_counter()
+        engines = await asyncio.gather(*(request() for _ in range(8)))
+        return engines, time.perf_counter() - start
+
+    engines, elapsed = asyncio.run(run())
+    # Two engines, eight requests: four rounds of 0.2s, none starved of a thread
+    assert len(set(map(id, engines))) == 2
+    assert elapsed < 1.5, f"8 requests took {elapsed:.1f}s"
+    assert pool.health()["idle"] == 2
+
+
+def test_cancelled_waiters_leave_the_engines_in_the_pool():
+    pool, _ = _pool(size=1)
+
+    async def waiter():
+        async with pool.checkout_async(timeout=5) as presidio:
+            return presidio
+
+    async def run():
+        held = pool.checkout()
+        held.__enter__()
+        early = asyncio.create_task(waiter())
+        woken = asyncio.create_task(waiter())
+        served = asyncio.create_task(waiter())
+        await asyncio.sleep(0.05)
+        early.cancel()
+        await asyncio.sleep(0)
+        # The release wakes *woken*, which is cancelled before it runs: the
+        # engine passes on to *served*
+        held.__exit__(None, None, None)
+        woken.cancel()
+        presidio = await asyncio.wait_for(served, 1)
+        await asyncio.gather(early, woken, return_exceptions=True)
+        assert early.cancelled() and woken.cancelled()
+        return presidio
+
+    assert asyncio.run(run()) is _idle(pool)[0]
+    assert pool.health()["idle"] == 1 and not pool._waiters
+
+    # A timed-out waiter is not left registered either
+    async def timed_out():
+        async with pool.checkout_async():
+            with pytest.raises(ServiceUnavailableException):
+                async with pool.checkout_async(timeout=0.05):
+                    pass
+
+    asyncio.run(timed_out())
+    assert pool.health()["idle"] == 1 and not pool._waiters
+
+
+def test_timed_out_stage_keeps_its_engine_until_it_ends():
+    pool, _ = _pool(size=1)
+    executor = ExecutionPool(workers=0, stage_timeouts={"detect": 0.05})
+    previous = execution_pool.get_engine_pool
+    execution_pool.get_engine_pool = lambda: pool
+    release = threading.Event()
+
+    async def scenario():
+        with pytest.raises(GatewayTimeoutException):
+            await executor.run_pooled_presidio_stage("detect", "block", release)
+        # The stage is still running on its thread: the engine is not lent again
+        assert pool.health()["idle"] == 0
+        with pytest.raises(ServiceUnavailableException):
+            async with pool.checkout_async(timeout=0.05):
+                pass
+        release.set()
+        async with pool.checkout_async(timeout=1) as presidio:
+            assert isinstance(presidio, FakeEngine)
+
+    try:
+        asyncio.run(scenario())
+        assert pool.health()["idle"] == 1 and not pool._held
+    finally:
+        release.set()
+        execution_pool.get_engine_pool = previous
+
+
+if __name__ == "__main__":
+    try:
+        test_checkout_and_release()
+        test_rebuild_on_config_change_drops_the_old_generation()
+        test_stale_generation_is_skipped_on_checkout()
+        test_failed_health_check_replaces_the_engine()
+        test_failed_rebuild_keeps_the_pool_size()
+        test_engines_survive_a_probe_that_aborts()
+        test_waiting_requests_do_not_take_executor_threads()
+        test_cancelled_waiters_leave_the_engines_in_the_pool()
+        test_timed_out_stage_keeps_its_engine_until_it_ends()
+        print("All engine pool tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,128 @@
+"""
+Test the execution pool in thread and process mode: stages, pickling, timeouts, crashes
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from services.BaseService import BaseService
+from utility.ExecutionPool import ExecutionPool
+from utility.exceptions import GatewayTimeoutException, ServiceUnavailableException
+
+
+class StubEngine:
+    """Stands in for a PresidioUtility in the workers."""
+
+    def __init__(self, config):
+        self.config = config
+
+    def detect_pii(self, text, language="en", country=None):
+        return [("PID", os.getpid()), ("TEXT", text)]
+
+
+def stub_factory(config):
+    return StubEngine(config)
+
+
+class StubService(BaseService):
+    def describe(self, tag):
+        return {
+            "pid": os.getpid(),
+            "repository": self.repository,
+            "engine": type(self.presidio).__name__,
+            "tag": tag,
+        }
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+        return seconds
+
+    def crash(self):
+        os._exit(1)
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_thread_mode_runs_stages_in_process():
+    pool = ExecutionPool(workers=0, stage_timeouts={"build": 0.1})
+    assert not pool.is_process_mode and pool.process_executor is None
+    service = StubService("repo", StubEngine({}))
+
+    result = _run(pool.run_service_stage("extract", service, "describe", "x"))
+    assert result == {"pid": os.getpid(), "repository": "repo", "engine": "StubEngine", "tag": "x"}
+    entities = _run(pool.run_presidio_stage("detect", StubEngine({}), "detect_pii", "hello"))
+    assert entities == [("PID", os.getpid()), ("TEXT", "hello")]
+
+    with pytest.raises(GatewayTimeoutException):
+        _run(pool.run_service_stage("build", service, "sleep", 1))
+    assert pool.health() == {"mode": "thread", "workers": 0, "running": False}
+
+
+def test_services_pickle_without_repository_and_engine():
+    state = StubService("db-session", StubEngine({})).__getstate__()
+    assert state["repository"] is None and state["presidio"] is None
+
+
+@pytest.fixture(scope="module")
+def process_pool():
+    pool = ExecutionPool(workers=1, start_method="spawn", factory=stub_factory, stage_timeouts={"build": 1})
+    pool.start()
+    yield pool
+    pool.stop()
+
+
+def test_process_mode_runs_stages_on_the_worker_engine(process_pool):
+    assert process_pool.health()["running"]
+    service = StubService("db-session", StubEngine({"local": True}))
+    result = _run(process_pool.run_service_stage("extract", service, "describe", "y"))
+    # Pickled without the repository; the worker attached its own engine
+    assert result["pid"] != os.getpid() and result["repository"] is None
+    assert result["engine"] == "StubEngine" and result["tag"] == "y"
+    # The parent's service is untouched
+    assert service.repository == "db-session"
+
+    entities = _run(process_pool.run_presidio_stage("detect", None, "detect_pii", "hi"))
+    assert entities == [("PID", result["pid"]), ("TEXT", "hi")]
+
+
+def test_process_mode_stage_timeout(process_pool):
+    service = StubService(None, None)
+    with pytest.raises(GatewayTimeoutException):
+        _run(process_pool.run_service_stage("build", service, "sleep", 3))
+    # The pool keeps working once the slow stage finishes in the background
+    result = _run(process_pool.run_service_stage("extract", service, "describe", "after"))
+    assert result["tag"] == "after"
+
+
+def test_broken_pool_is_restarted(process_pool):
+    service = StubService(None, None)
+    before = _run(process_pool.run_service_stage("extract", service, "describe", "a"))["pid"]
+    with pytest.raises(ServiceUnavailableException):
+        _run(process_pool.run_service_stage("extract", service, "crash"))
+    assert not process_pool.health()["running"]
+    # The next stage starts a fresh pool on demand
+    after = _run(process_pool.run_service_stage("extract", service, "describe", "b"))
+    assert after["pid"] != before and process_pool.health()["running"]
+
+
+if __name__ == "__main__":
+    try:
+        test_thread_mode_runs_stages_in_process()
+        test_services_pickle_without_repository_and_engine()
+        pool = ExecutionPool(workers=1, start_method="spawn", factory=stub_factory, stage_timeouts={"build": 1})
+        pool.start()
+        try:
+            test_process_mode_runs_stages_on_the_worker_engine(pool)
+            test_process_mode_stage_timeout(pool)
+            test_broken_pool_is_restarted(pool)
+        finally:
+            pool.stop()
+        print("All execution pool tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
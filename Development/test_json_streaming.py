@@ -0,0 +1,159 @@
+"""
+Test streaming JSON / NDJSON masking: the incremental tokenizer and per-leaf batches
+"""
+import io
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from io import BytesIO
+
+import pytest
+from fastapi import UploadFile
+
+import services.JSONService as json_service
+from services.BaseService import streamed_text_path
+from services.JSONService import JSONService
+from test_streaming_pdf import RegexPresidio, _tags
+from utility.DocumentIngestion import IngestedDocument
+from utility.json_stream import JSONStreamError, iter_tokens, path_context
+
+EMAIL = "john.smith@acme.com"
+PERSON = "John Smith"
+
+DOCUMENT = """{
+  "customer": {"name": "John Smith", "contact": {"email": "john.smith@acme.com"}},
+  "tags": ["vip", "Jane Roe", 3, true, null],
+  "quote": "She said \\"hi\\" \\u00e9",
+  "empty": "",
+  "amount": -12.5e3
+}"""
+
+
+class ContextPresidio(RegexPresidio):
+    """RegexPresidio that records the context words it was given."""
+
+    def __init__(self):
+        super().__init__()
+        self.contexts = []
+
+    def detect_pii_batch(self, texts, language="en", country=None, contexts=None):
+        self.contexts.extend(contexts or [])
+        return super().detect_pii_batch(texts, language, country, contexts)
+
+
+def _stream(raw: bytes, filename="dump.json", presidio=None, batch_leaves=2, measure=False):
+    service = JSONService(None, presidio or RegexPresidio())
+    source = IngestedDocument(UploadFile(filename=filename, file=BytesIO(raw)), "req1")
+    previous = json_service.JSON_STREAMING_MIN_MB, json_service.JSON_BATCH_LEAVES
+    json_service.JSON_STREAMING_MIN_MB, json_service.JSON_BATCH_LEAVES = 0, batch_leaves
+    try:
+        assert service._use_streaming(source)
+        out_path = os.path.join(tempfile.mkdtemp(), "dump_masked" + os.path.splitext(filename)[1])
+        if measure:
+            tracemalloc.start()
+        result = service._mask_streaming(source, "United States", out_path)
+        peak = tracemalloc.get_traced_memory()[1] if measure else 0
+    finally:
+        if measure:
+            tracemalloc.stop()
+        json_service.JSON_STREAMING_MIN_MB, json_service.JSON_BATCH_LEAVES = previous
+        source.cleanup()
+    with open(out_path, encoding="utf-8") as f:
+        return f.read(), result, out_path, peak
+
+
+def test_tokens_reproduce_the_input_and_locate_leaves():
+    tokens = list(iter_tokens(io.StringIO(DOCUMENT)))
+    assert "".join(token.raw for token in tokens) == DOCUMENT
+    leaves = [(token.path, token.value) for token in tokens if token.value is not None]
+    assert leaves == [
+        (("customer", "name"), PERSON),
+        (("customer", "contact", "email"), EMAIL),
+        (("tags", 0), "vip"),
+        (("tags", 1), "Jane Roe"),
+        (("quote",), 'She said "hi" é'),
+        (("empty",), ""),
+    ]
+    # Tokens split across tiny blocks come out the same
+    assert list(iter_tokens(io.StringIO(DOCUMENT), block_chars=3)) == tokens
+
+
+@pytest.mark.parametrize("text", ['{"a": 1', '{"a": 1]}', '{"a": nope}', '["x" , ]]', '{"a": "b\\x"}'])
+def test_malformed_json_is_rejected(text):
+    with pytest.raises(JSONStreamError):
+        list(iter_tokens(io.StringIO(text)))
+
+
+def test_path_context_words():
+    assert path_context(("billing", 0, "emailAddress")) == ["billing", "email", "address"]
+    assert path_context(("a", "b", "home_phone")) == ["b", "home", "phone"]
+    assert path_context((0, 1)) == []
+
+
+def test_streamed_json_keeps_layout_and_masks_leaves():
+    presidio = ContextPresidio()
+    masked, result, out_path, _ = _stream(DOCUMENT.encode("utf-8"), presidio=presidio)
+    data = json.loads(masked)
+    assert _tags(data["customer"]["name"], "PERSON")
+    assert _tags(data["customer"]["contact"]["email"], "EMAIL_ADDRESS")
+    assert _tags(data["tags"][1], "PERSON")
+    assert data["tags"][2:] == [3, True, None] and data["amount"] == -12.5e3
+    # Unchanged strings keep their original escapes; the layout is the input's
+    assert '"She said \\"hi\\" \\u00e9"' in masked
+    assert masked.count("\n") == DOCUMENT.count("\n")
+    assert result["entities_count"] == 3
+    assert ["contact", "email"] in presidio.contexts
+
+    with open(streamed_text_path(out_path), encoding="utf-8") as f:
+        text = f.read()
+    assert text.startswith("<PERSON_") and EMAIL not in text
+
+
+def test_ndjson_is_streamed_record_by_record():
+    records = [{"id": n, "user": {"name": PERSON, "email": f"user{n % 3}@acme.com"}} for n in range(10)]
+    raw = "\n".join(json.dumps(record) for record in records).encode("utf-8")
+    assert JSONService(None, None)._use_streaming(
+        IngestedDocument(UploadFile(filename="small.ndjson", file=BytesIO(raw)), "req2")
+    )
+    masked, result, _, _ = _stream(raw, filename="dump.ndjson", batch_leaves=3)
+    lines = [json.loads(line) for line in masked.split("\n")]
+    assert [line["id"] for line in lines] == list(range(10))
+    assert len({line["user"]["name"] for line in lines}) == 1
+    assert len({line["user"]["email"] for line in lines}) == 3
+    assert result["entities_count"] == 20
+
+
+def test_memory_stays_flat_as_the_dump_grows():
+    def dump(records):
+        return "\n".join(
+            json.dumps({"id": n, "name": PERSON, "email": f"user{n % 50}@acme.com", "note": "x" * 40})
+            for n in range(records)
+        ).encode("utf-8")
+
+    # A read block smaller than either dump, so the peak is the batch and not the block
+    previous = json_service._READ_CHARS
+    json_service._READ_CHARS = 16 * 1024
+    try:
+        *_, small = _stream(dump(1000), filename="dump.ndjson", batch_leaves=500, measure=True)
+        *_, large = _stream(dump(8000), filename="dump.ndjson", batch_leaves=500, measure=True)
+    finally:
+        json_service._READ_CHARS = previous
+    print(f"\nPeak traced memory: {small / 1e6:.2f} MB for 1k records, {large / 1e6:.2f} MB for 8k records")
+    assert large < small * 1.5
+
+
+if __name__ == "__main__":
+    try:
+        test_tokens_reproduce_the_input_and_locate_leaves()
+        for text in ['{"a": 1', '{"a": 1]}', '{"a": nope}', '["x" , ]]', '{"a": "b\\x"}']:
+            test_malformed_json_is_rejected(text)
+        test_path_context_words()
+        test_streamed_json_keeps_layout_and_masks_leaves()
+        test_ndjson_is_streamed_record_by_record()
+        test_memory_stays_flat_as_the_dump_grows()
+        print("All JSON streaming tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,194 @@
+"""
+Test the LibreOffice instance pool with fake instances (no LibreOffice needed)
+"""
+import sys
+import threading
+import time
+
+import pytest
+
+from services.LibreOfficeConverter import ConversionException
+from services.LibreOfficePool import LibreOfficePool
+from utility.exceptions import ServiceUnavailableException
+
+
+class FakeInstance:
+    """Stands in for SofficeInstance: 'converts' by sleeping or raising."""
+
+    def __init__(self, slot, delay=0.0, fail=False, kill_s=0.0):
+        self.slot = slot
+        self.delay = delay
+        self.fail = fail
+        self.kill_s = kill_s
+        self.conversions = 0
+        self.broken = False
+        self.alive = True
+        self._killed = threading.Event()
+
+    def convert(self, input_path, output_path, target):
+        if self.fail:
+            raise RuntimeError("crashed")
+        if self._killed.wait(self.delay):
+            raise RuntimeError("bridge disposed")
+        self.conversions += 1
+
+    def is_alive(self):
+        return self.alive and not self._killed.is_set()
+
+    def kill(self):
+        self._killed.set()
+        # As terminate() then wait(): the bridge is gone before kill() returns
+        time.sleep(self.kill_s)
+
+
+class Factory:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.started = []
+
+    def __call__(self, slot):
+        instance = FakeInstance(slot, **self.kwargs)
+        self.started.append(instance)
+        return instance
+
+
+def _pool(factory, **kwargs):
+    kwargs.setdefault("watch_interval_s", 0)
+    pool = LibreOfficePool(factory=factory, **kwargs)
+    pool.start()
+    return pool
+
+
+def test_instances_are_reused():
+    factory = Factory()
+    pool = _pool(factory, size=2)
+    try:
+        for _ in range(5):
+            pool.convert("in.docx", "out.pdf", "pdf")
+        assert len(factory.started) == 2
+        assert sum(i.conversions for i in factory.started) == 5
+        assert pool.health()["idle"] == 2
+    finally:
+        pool.stop()
+    assert all(i._killed.is_set() for i in factory.started)
+
+
+def test_waiting_past_queue_timeout_is_unavailable():
+    factory = Factory(delay=1.0)
+    pool = _pool(factory, size=1, queue_timeout_s=0.1)
+    try:
+        busy = threading.Thread(target=pool.convert, args=("a.docx", "a.pdf", "pdf"))
+        busy.start()
+        time.sleep(0.05)
+        with pytest.raises(ServiceUnavailableException):
+            pool.convert("b.docx", "b.pdf", "pdf")
+        busy.join()
+    finally:
+        pool.stop()
+
+
+def test_timeout_kills_instance_and_slot_is_replaced():
+    factory = Factory(delay=5.0)
+    pool = _pool(factory, size=1, conversion_timeout_s=0.1)
+    try:
+        start = time.perf_counter()
+        with pytest.raises(ConversionException, match="timeout"):
+            pool.convert("big.docx", "big.pdf", "pdf")
+        assert time.perf_counter() - start < 2
+        assert factory.started[0]._killed.is_set()
+        assert pool.health()["timeouts"] == 1
+
+        factory.kwargs["delay"] = 0.0
+        pool.convert("small.docx", "small.pdf", "pdf")
+        assert len(factory.started) == 2
+        assert factory.started[1].conversions == 1
+    finally:
+        pool.stop()
+
+
+def test_timeout_is_reported_while_the_kill_is_still_running():
+    factory = Factory(delay=5.0, kill_s=0.5)
+    pool = _pool(factory, size=1, conversion_timeout_s=0.1)
+    try:
+        with pytest.raises(ConversionException, match="timeout"):
+            pool.convert("big.docx", "big.pdf", "pdf")
+        assert pool.health()["timeouts"] == 1
+    finally:
+        pool.stop()
+
+
+def test_crashed_instance_is_restarted():
+    factory = Factory(fail=True)
+    pool = _pool(factory, size=1)
+    try:
+        with pytest.raises(ConversionException, match="crashed"):
+            pool.convert("a.docx", "a.pdf", "pdf")
+        factory.kwargs["fail"] = False
+        pool.convert("a.docx", "a.pdf", "pdf")
+        assert len(factory.started) == 2
+        assert pool.health()["restarts"] == 1
+    finally:
+        pool.stop()
+
+
+def test_instances_are_recycled_after_max_conversions():
+    factory = Factory()
+    pool = _pool(factory, size=1, max_conversions=3)
+    try:
+        for _ in range(7):
+            pool.convert("a.docx", "a.pdf", "pdf")
+        assert [i.conversions for i in factory.started] == [3, 3, 1]
+    finally:
+        pool.stop()
+
+
+def test_health_check_restarts_dead_instances():
+    factory = Factory()
+    pool = _pool(factory, size=2)
+    try:
+        factory.started[0].alive = False
+        assert pool.check_health() == 1
+        assert pool.check_health() == 0
+        assert len(factory.started) == 3
+        assert pool.health()["last_health_check"] is not None
+    finally:
+        pool.stop()
+
+
+def test_failed_start_is_retried_on_checkout():
+    attempts = []
+
+    def flaky(slot):
+        attempts.append(slot)
+        if len(attempts) == 1:
+            raise ConversionException("did not start")
+        return FakeInstance(slot)
+
+    pool = _pool(flaky, size=1)
+    try:
+        assert pool.health()["started"]
+        pool.convert("a.docx", "a.pdf", "pdf")
+        assert len(attempts) == 2
+    finally:
+        pool.stop()
+
+
+def test_size_zero_disables_pool():
+    assert not LibreOfficePool(size=0, factory=Factory()).available
+
+
+if __name__ == "__main__":
+    try:
+        test_instances_are_reused()
+        test_waiting_past_queue_timeout_is_unavailable()
+        test_timeout_kills_instance_and_slot_is_replaced()
+        test_timeout_is_reported_while_the_kill_is_still_running()
+        test_crashed_instance_is_restarted()
+        test_instances_are_recycled_after_max_conversions()
+        test_health_check_restarts_dead_instances()
+        test_failed_start_is_retried_on_checkout()
+        test_size_zero_disables_pool()
+        print("All LibreOffice pool tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,103 @@
+"""
+Test the sweep-line overlap resolver against the previous quadratic one
+
+Run directly for a benchmark on 100k synthetic spans:
+    python test_overlap_resolution.py
+"""
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from utility.span_helpers import resolve_overlaps
+
+ENTITY_TYPES = ["PHONE_NUMBER", "ZIP_CODE", "DATE_TIME", "PERSON", "US_SSN"]
+
+
+def _reference_resolve(entities):
+    """The previous PresidioUtility._resolve_overlapping_entities, kept verbatim as the oracle."""
+    if not entities:
+        return []
+    sorted_ents = sorted(entities, key=lambda x: (x.start, x.end, -x.score))
+    resolved = []
+    for ent in sorted_ents:
+        overlaps = [r for r in resolved if ent.start < r.end and ent.end > r.start]
+        if not overlaps:
+            resolved.append(ent)
+        else:
+            for overlap in overlaps:
+                if ent.score > overlap.score:
+                    resolved.remove(overlap)
+                    resolved.append(ent)
+                    break
+    return sorted(resolved, key=lambda x: x.start)
+
+
+def _random_spans(rng: random.Random, n: int, text_len: int, max_len: int = 20):
+    spans = []
+    for _ in range(n):
+        start = rng.randrange(text_len)
+        spans.append(SimpleNamespace(
+            entity_type=rng.choice(ENTITY_TYPES),
+            start=start,
+            end=start + rng.randint(0, max_len),
+            # Coarse scores so that ties are common
+            score=rng.choice([0.4, 0.5, 0.6, 0.75, 0.85, 1.0]),
+        ))
+    return spans
+
+
+def test_matches_reference_on_random_inputs():
+    rng = random.Random(1234)
+    for trial in range(500):
+        n = rng.randint(0, 60)
+        text_len = rng.randint(1, 200)
+        spans = _random_spans(rng, n, text_len)
+        expected = _reference_resolve(spans)
+        actual = resolve_overlaps(spans)
+        assert [id(e) for e in actual] == [id(e) for e in expected], f"trial {trial}"
+
+
+def test_result_is_non_overlapping_and_sorted():
+    rng = random.Random(99)
+    for _ in range(200):
+        resolved = resolve_overlaps(_random_spans(rng, 80, 300))
+        for prev, nxt in zip(resolved, resolved[1:]):
+            assert prev.start <= nxt.start
+            assert not (nxt.start < prev.end and nxt.end > prev.start)
+
+
+def test_highest_score_wins():
+    low = SimpleNamespace(entity_type="ZIP_CODE", start=10, end=15, score=0.5)
+    high = SimpleNamespace(entity_type="PHONE_NUMBER", start=8, end=20, score=0.9)
+    assert resolve_overlaps([low, high]) == [high]
+
+
+def benchmark(n: int = 100_000) -> None:
+    rng = random.Random(42)
+    spans = _random_spans(rng, n, text_len=n * 12)
+
+    started = time.perf_counter()
+    resolved = resolve_overlaps(spans)
+    sweep_s = time.perf_counter() - started
+    print(f"sweep-line: {n:,} spans -> {len(resolved):,} kept in {sweep_s * 1000:.0f} ms")
+
+    # The quadratic version is only timed on a slice; it takes minutes at 100k
+    sample = spans[: n // 10]
+    started = time.perf_counter()
+    _reference_resolve(sample)
+    ref_s = time.perf_counter() - started
+    print(f"reference : {len(sample):,} spans in {ref_s * 1000:.0f} ms "
+          f"(~{ref_s * 100:.0f} s extrapolated to {n:,})")
+
+
+if __name__ == "__main__":
+    try:
+        test_matches_reference_on_random_inputs()
+        test_result_is_non_overlapping_and_sorted()
+        test_highest_score_wins()
+        print("All overlap resolution tests passed!")
+        benchmark()
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
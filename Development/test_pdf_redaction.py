@@ -0,0 +1,218 @@
+"""
+Test span-driven PDF redaction on a generated PDF
+"""
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import fitz
+from fastapi import UploadFile
+
+import utility.DocumentIngestion as ingestion
+import utility.PDFPagePool as page_pool
+from services.PDFService import PDFService
+from utility.PDFPagePool import PDFPagePool
+
+
+def _make_pdf(pages: int = 3) -> bytes:
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {n + 1} contact: John Smith", fontsize=11)
+        page.insert_text((72, 96), "Email john.smith@acme.com for details.", fontsize=11)
+        page.insert_text((72, 120), "John Smith is also the name of a song.", fontsize=11)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _spans_for(text: str, value: str, tag: str, occurrences=None):
+    spans, start = [], 0
+    while True:
+        i = text.find(value, start)
+        if i < 0:
+            return spans if occurrences is None else [spans[k] for k in occurrences]
+        spans.append((i, i + len(value), tag))
+        start = i + len(value)
+
+
+def _redact_to_file(raw: bytes, spans) -> str:
+    service = PDFService(None, None)
+    extracted = service._extract_document(raw, "doc.pdf")
+    out_path = os.path.join(tempfile.mkdtemp(), "masked.pdf")
+    service._build_masked_document(raw, extracted, {"spans": spans}, out_path)
+    return out_path
+
+
+def _redact(raw: bytes, spans):
+    with fitz.open(_redact_to_file(raw, spans)) as doc:
+        return [page.get_text() for page in doc]
+
+
+def _with_pool(pool: PDFPagePool, fn):
+    previous = page_pool._pool
+    page_pool._pool = pool
+    try:
+        return fn()
+    finally:
+        page_pool._pool = previous
+        pool.stop()
+
+
+def _sequential(fn):
+    return _with_pool(PDFPagePool(workers=0), fn)
+
+
+def _parallel(fn):
+    return _with_pool(PDFPagePool(workers=3, min_pages=6, min_pages_per_shard=2), fn)
+
+
+def test_extraction_keeps_line_geometry():
+    raw = _make_pdf(pages=2)
+    extracted = PDFService(None, None)._extract_document(raw, "doc.pdf")
+    assert "john.smith@acme.com" in extracted.text
+    index = extracted.locate(extracted.text.index("john.smith@"))
+    page_num, bboxes = extracted.locations[index]
+    assert page_num == 0
+    assert len(bboxes) == 4 * len(extracted.segment_text(index))
+
+
+def test_only_detected_spans_are_redacted():
+    raw = _make_pdf(pages=2)
+    text = PDFService(None, None)._extract_document(raw, "doc.pdf").text
+    email = _spans_for(text, "john.smith@acme.com", "<EMAIL_ADDRESS_0>")
+    # Only the first "John Smith" on each page is a detected person
+    person = _spans_for(text, "John Smith", "<PERSON_0>", occurrences=[0, 2])
+    pages = _redact(raw, sorted(email + person))
+
+    for page_text in pages:
+        assert "john.smith@acme.com" not in page_text
+        assert "contact: John Smith" not in page_text
+        # The undetected occurrence stays as it was
+        assert "John Smith is also the name of a song." in page_text
+
+
+def test_no_spans_leaves_document_intact():
+    raw = _make_pdf(pages=1)
+    pages = _redact(raw, [])
+    assert "john.smith@acme.com" in pages[0]
+
+
+def test_redaction_time_large_document():
+    raw = _make_pdf(pages=300)
+    text = PDFService(None, None)._extract_document(raw, "doc.pdf").text
+    spans = sorted(
+        _spans_for(text, "john.smith@acme.com", "<EMAIL_ADDRESS_0>")
+        + _spans_for(text, "John Smith", "<PERSON_0>")
+    )
+    start = time.perf_counter()
+    pages = _redact(raw, spans)
+    elapsed = time.perf_counter() - start
+    print(f"\n300 pages, {len(spans)} spans redacted in {elapsed:.2f}s")
+    assert all("John Smith" not in page for page in pages)
+
+
+def test_parallel_extraction_matches_sequential():
+    raw = _make_pdf(pages=10)
+    sequential = _sequential(lambda: PDFService(None, None)._extract_document(raw, "doc.pdf"))
+    parallel = _parallel(lambda: PDFService(None, None)._extract_document(raw, "doc.pdf"))
+    assert parallel.text == sequential.text
+    assert parallel.starts == sequential.starts
+    assert [page for page, _ in parallel.locations] == [page for page, _ in sequential.locations]
+
+
+def test_parallel_redaction_matches_sequential_and_is_stable():
+    raw = _make_pdf(pages=10)
+    text = PDFService(None, None)._extract_document(raw, "doc.pdf").text
+    spans = _spans_for(text, "john.smith@acme.com", "<EMAIL_ADDRESS_0>")
+
+    sequential = _sequential(lambda: _redact(raw, spans))
+    paths = _parallel(lambda: [_redact_to_file(raw, spans) for _ in range(2)])
+    with fitz.open(paths[0]) as doc:
+        parallel = [page.get_text() for page in doc]
+    assert parallel == sequential
+    assert all("john.smith@acme.com" not in page for page in parallel)
+
+    # Same input, same bytes
+    with open(paths[0], "rb") as a, open(paths[1], "rb") as b:
+        assert a.read() == b.read()
+
+
+def test_sharded_stages_share_one_copy_of_the_upload():
+    raw = _make_pdf(pages=10)
+    copies = []
+    original = ingestion.tempfile.NamedTemporaryFile
+
+    def temp_copy(*args, **kwargs):
+        copies.append(kwargs.get("suffix"))
+        return original(*args, **kwargs)
+
+    def run():
+        service = PDFService(None, None)
+        source = service._ingest(UploadFile(file=BytesIO(raw), filename="doc.pdf"), "req_pdf_shared")
+        assert source.has_path
+        pool = page_pool.get_pdf_page_pool()
+        opened = []
+        extract, redact = pool.extract, pool.redact
+        pool.extract = lambda path, *args: opened.append(path) or extract(path, *args)
+        pool.redact = lambda path, *args: opened.append(path) or redact(path, *args)
+        out_path = os.path.join(tempfile.mkdtemp(), "masked.pdf")
+        try:
+            extracted = service._extract_document(raw, "doc.pdf")
+            service._build_masked_document(raw, extracted, {"spans": []}, out_path)
+            assert opened == [source.path, source.path]
+        finally:
+            service._release_source()
+        assert not os.path.exists(opened[0])
+
+    ingestion.tempfile.NamedTemporaryFile = temp_copy
+    try:
+        _parallel(run)
+    finally:
+        ingestion.tempfile.NamedTemporaryFile = original
+    assert copies == []
+
+
+def test_small_documents_stay_sequential():
+    pool = PDFPagePool(workers=4, min_pages=200, min_pages_per_shard=50)
+    assert pool.shards(199) == []
+    assert pool.shards(200) == [(0, 50), (50, 100), (100, 150), (150, 200)]
+    # Never more shards than min_pages_per_shard allows
+    assert pool.shards(250) == [(0, 63), (63, 126), (126, 188), (188, 250)]
+    assert PDFPagePool(workers=8, min_pages=10, min_pages_per_shard=50).shards(120) == [(0, 60), (60, 120)]
+
+
+def test_page_workers_are_a_node_wide_budget():
+    # Thread mode: the API process is the only one running PDF stages
+    assert page_pool.pdf_workers_per_process(8, 0) == 8
+    # Process mode: execution workers split the budget, 1 or less means sequential
+    assert page_pool.pdf_workers_per_process(8, 4) == 2
+    assert page_pool.pdf_workers_per_process(4, 4) == 1
+    assert page_pool.pdf_workers_per_process(4, 8) == 0
+    previous = page_pool.EXECUTION_POOL_WORKERS, page_pool.PDF_PARALLEL_WORKERS
+    page_pool.EXECUTION_POOL_WORKERS, page_pool.PDF_PARALLEL_WORKERS = 3, 9
+    try:
+        pool = PDFPagePool(min_pages=10, min_pages_per_shard=5)
+        assert pool.workers * page_pool.EXECUTION_POOL_WORKERS <= page_pool.PDF_PARALLEL_WORKERS
+        assert pool.workers == 3 and len(pool.shards(100)) == 3
+    finally:
+        page_pool.EXECUTION_POOL_WORKERS, page_pool.PDF_PARALLEL_WORKERS = previous
+
+
+if __name__ == "__main__":
+    try:
+        test_extraction_keeps_line_geometry()
+        test_only_detected_spans_are_redacted()
+        test_no_spans_leaves_document_intact()
+        test_redaction_time_large_document()
+        test_parallel_extraction_matches_sequential()
+        test_parallel_redaction_matches_sequential_and_is_stable()
+        test_sharded_stages_share_one_copy_of_the_upload()
+        test_small_documents_stay_sequential()
+        test_page_workers_are_a_node_wide_budget()
+        print("All PDF redaction tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,77 @@
+"""
+Test the content-addressed result cache
+"""
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+from utility.PresidioUtility import ConsistentAnonymizer, decrypt_value
+from utility.ResultCache import ResultCache
+
+
+def _result(raw_value: str):
+    key = os.urandom(16).hex()
+    mapper = ConsistentAnonymizer(crypto_key=key)
+    tag = mapper.operator_logic(raw_value, "PERSON")
+    mapping = mapper.get_mapping_with_metadata(
+        [SimpleNamespace(entity_type="PERSON", start=0, end=len(raw_value), score=0.85)]
+    )
+    return f"Hello {tag}", mapping, key
+
+
+def test_hit_returns_same_output_with_fresh_key():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResultCache(path=os.path.join(tmp, "cache"), max_bytes=10 ** 7, ttl_s=60, enabled=True)
+        raw = b"Hello John Smith"
+        artifact = os.path.join(tmp, "out.txt")
+        text, mapping, key = _result("John Smith")
+        with open(artifact, "w") as f:
+            f.write(text)
+
+        cache_key = cache.make_key(raw, "TXTService:.txt", "United States", "v1")
+        spans = [SimpleNamespace(entity_type="PERSON", start=6, end=16, score=0.85)]
+        cache.put(cache_key, raw, artifact, text, mapping, key, spans)
+
+        copy_path = os.path.join(tmp, "copy.txt")
+        hit = cache.get(cache_key, raw, copy_path)
+        assert hit is not None
+        assert hit["anonymized_text"] == text
+        assert hit["entities_count"] == 1
+        assert hit["encryption_key"] != key
+        (tag, meta), = hit["mapping"].items()
+        assert decrypt_value(meta["encrypted_value"], hit["encryption_key"]) == "John Smith"
+        with open(copy_path) as f:
+            assert f.read() == text
+
+
+def test_key_depends_on_country_and_profile():
+    raw = b"same bytes"
+    base = ResultCache.make_key(raw, "TXTService:.txt", "United States", "v1")
+    assert base != ResultCache.make_key(raw, "TXTService:.txt", "Mexico", "v1")
+    assert base != ResultCache.make_key(raw, "TXTService:.txt", "United States", "v2")
+    assert base != ResultCache.make_key(raw + b"!", "TXTService:.txt", "United States", "v1")
+
+
+def test_miss_and_eviction():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResultCache(path=os.path.join(tmp, "cache"), max_bytes=0, ttl_s=60, enabled=True)
+        artifact = os.path.join(tmp, "out.txt")
+        with open(artifact, "w") as f:
+            f.write("no pii")
+        cache_key = cache.make_key(b"no pii", "TXTService:.txt", "United States", "v1")
+        assert cache.get(cache_key, b"no pii", os.path.join(tmp, "x.txt")) is None
+        # max_bytes=0 evicts the entry straight after it is stored
+        cache.put(cache_key, b"no pii", artifact, "no pii", {}, "", [])
+        assert cache.get(cache_key, b"no pii", os.path.join(tmp, "x.txt")) is None
+
+
+if __name__ == "__main__":
+    try:
+        test_hit_returns_same_output_with_fresh_key()
+        test_key_depends_on_country_and_profile()
+        test_miss_and_eviction()
+        print("All result cache tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,186 @@
+"""
+Test bounded-memory streaming: windowed anonymization and page-by-page PDF masking
+
+Detection is a few regexes instead of spaCy; anonymization is the real
+Presidio AnonymizerEngine behind PresidioUtility.anonymize_segment().
+"""
+import os
+import re
+import sys
+import tempfile
+
+import fitz
+from fastapi import UploadFile
+from io import BytesIO
+from presidio_analyzer import RecognizerResult
+from presidio_anonymizer import AnonymizerEngine
+
+import services.PDFService as pdf_service
+from services.BaseService import streamed_output_text, streamed_text_path
+from services.PDFService import PDFService
+from utility.DocumentIngestion import IngestedDocument
+from utility.PresidioUtility import PresidioUtility, deanonymize_text
+from utility.StreamingAnonymizer import StreamingAnonymizer
+
+PATTERNS = {
+    "EMAIL_ADDRESS": re.compile(r"[\w.]+@[\w.]+\.com"),
+    "PERSON": re.compile(r"John Smith|Jane\sRoe"),
+}
+
+
+class RegexPresidio(PresidioUtility):
+    """PresidioUtility with regex detection, so no spaCy model is needed."""
+
+    def __init__(self, overlap: int = 20):
+        self.anonymizer = AnonymizerEngine()
+        self.chunk_overlap = overlap
+        self.calls = []
+
+    def detect_pii(self, text, language="en", country=None):
+        self.calls.append(len(text))
+        return _detect(text)
+
+    def detect_pii_batch(self, texts, language="en", country=None, contexts=None):
+        self.calls.append(sum(map(len, texts)))
+        return [_detect(text) for text in texts]
+
+
+def _detect(text):
+    return [
+        RecognizerResult(entity_type, m.start(), m.end(), 0.9)
+        for entity_type, pattern in PATTERNS.items()
+        for m in pattern.finditer(text)
+    ]
+
+
+def _tags(text, entity_type):
+    return re.findall(rf"<{entity_type}_\d+>", text)
+
+
+def _stream(pages, overlap=20):
+    written = []
+    streamer = StreamingAnonymizer(RegexPresidio(overlap), written.append, separator="\n")
+    done = []
+    for page in pages:
+        done.extend(streamer.push(page))
+    done.extend(streamer.finish())
+    return streamer, "".join(written), dict(done)
+
+
+def test_streamed_text_matches_whole_document():
+    pages = [f"Page {n}: mail john.smith@acme.com or John Smith." for n in range(6)]
+    streamer, text, spans = _stream(pages)
+    result = streamer.result()
+
+    # One tag per value, on every page
+    for entity_type in PATTERNS:
+        tags = _tags(text, entity_type)
+        assert len(tags) == 6 and len(set(tags)) == 1
+    assert "john.smith@acme.com" not in text
+    assert result["entities_count"] == 12
+    assert deanonymize_text(text, result["mapping"], result["encryption_key"]) == "\n".join(pages)
+    # Spans are relative to each page
+    for n, page in enumerate(pages):
+        assert sorted(page[s:e] for s, e, _ in spans[n]) == ["John Smith", "john.smith@acme.com"]
+
+
+def test_entity_crossing_pages_masks_both_pieces():
+    pages = ["Signed by Jane", "Roe on Monday", "nothing here"]
+    _, text, spans = _stream(pages)
+    assert re.fullmatch(r"Signed by <PERSON_\d+> on Monday\nnothing here", text)
+    assert [pages[0][s:e] for s, e, _ in spans[0]] == ["Jane"]
+    assert [pages[1][s:e] for s, e, _ in spans[1]] == ["Roe"]
+    assert spans[2] == []
+
+
+def test_empty_pages_and_no_entities():
+    streamer, text, spans = _stream(["", "plain text", "", "more"])
+    assert text == "plain text\nmore"
+    assert spans == {0: [], 1: [], 2: [], 3: []}
+    assert streamer.result() == {"mapping": {}, "encryption_key": "", "entities_count": 0}
+
+
+def test_memory_is_bounded_by_the_window():
+    page = "x" * 1000 + " john.smith@acme.com"
+    streamer = StreamingAnonymizer(RegexPresidio(overlap=50), lambda _: None)
+    for _ in range(200):
+        streamer.push(page)
+        # At most the pending page, the one before it and the overlap
+        assert len(streamer._buffer) <= 2 * (len(page) + 1) + 50
+    streamer.finish()
+    # Every window is one page plus context, never the document
+    assert max(streamer.presidio.calls) <= len(page) + 2 * 51
+
+
+def test_pdf_is_masked_page_by_page():
+    doc = fitz.open()
+    for n in range(5):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {n + 1} contact: John Smith", fontsize=11)
+        page.insert_text((72, 96), "Email john.smith@acme.com for details.", fontsize=11)
+    raw = doc.tobytes()
+    doc.close()
+
+    service = PDFService(None, RegexPresidio())
+    source = IngestedDocument(UploadFile(filename="big.pdf", file=BytesIO(raw)), "req1")
+    previous = pdf_service.PDF_STREAMING_MIN_PAGES, pdf_service.PDF_STREAMING_FLUSH_PAGES
+    # Flushing every 2 pages exercises the part files and their merge
+    pdf_service.PDF_STREAMING_MIN_PAGES, pdf_service.PDF_STREAMING_FLUSH_PAGES = 5, 2
+    try:
+        assert service._use_streaming(source)
+        out_path = os.path.join(tempfile.mkdtemp(), "big_masked.pdf")
+        result = service._mask_streaming(source, "United States", out_path)
+    finally:
+        pdf_service.PDF_STREAMING_MIN_PAGES, pdf_service.PDF_STREAMING_FLUSH_PAGES = previous
+        source.cleanup()
+
+    with fitz.open(out_path) as masked:
+        assert [page.get_text().split("contact")[0] for page in masked] == [f"Page {n + 1} " for n in range(5)]
+        for page in masked:
+            assert "john.smith@acme.com" not in page.get_text()
+            assert "John Smith" not in page.get_text()
+    with open(streamed_text_path(out_path), encoding="utf-8") as f:
+        text = f.read()
+    for entity_type in PATTERNS:
+        tags = _tags(text, entity_type)
+        assert len(tags) == 5 and len(set(tags)) == 1
+    assert result["entities_count"] == 10
+    assert streamed_output_text(out_path) == "file://" + streamed_text_path(out_path)
+
+
+def test_page_count_does_not_copy_small_uploads():
+    doc = fitz.open()
+    for _ in range(3):
+        doc.new_page()
+    raw = doc.tobytes()
+    doc.close()
+
+    service = PDFService(None, RegexPresidio())
+    source = IngestedDocument(UploadFile(filename="small.pdf", file=BytesIO(raw)), "req2")
+    try:
+        assert not service._use_streaming(source)
+        # Counted from the in-memory bytes: no temp file was written
+        assert source._path is None
+        previous = pdf_service._COUNT_IN_MEMORY_MAX_BYTES
+        pdf_service._COUNT_IN_MEMORY_MAX_BYTES = 0
+        try:
+            assert not service._use_streaming(source)
+        finally:
+            pdf_service._COUNT_IN_MEMORY_MAX_BYTES = previous
+        assert source._path is not None
+    finally:
+        source.cleanup()
+
+
+if __name__ == "__main__":
+    try:
+        test_streamed_text_matches_whole_document()
+        test_entity_crossing_pages_masks_both_pieces()
+        test_empty_pages_and_no_entities()
+        test_memory_is_bounded_by_the_window()
+        test_pdf_is_masked_page_by_page()
+        test_page_count_does_not_copy_small_uploads()
+        print("All streaming tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,136 @@
+"""
+Test UploadSizeLimitMiddleware: declared and streamed bodies, per-path limits
+"""
+import json
+import sys
+
+from fastapi import FastAPI, File, Request, UploadFile
+from fastapi.testclient import TestClient
+
+from services.RecordStreamService import RecordStreamResponse
+from utility.DocumentIngestion import MULTIPART_OVERHEAD_BYTES, UploadSizeLimitMiddleware, max_request_bytes
+from utility.exceptions import PIIException
+
+KB = 1024
+# Small limits so the tests move kilobytes, configured like main.py
+LIMIT = max_request_bytes(0.125)
+BATCH_LIMIT = max_request_bytes(0.5)
+STREAM_LIMIT = max_request_bytes(1)
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(
+        UploadSizeLimitMiddleware,
+        max_bytes=LIMIT,
+        path_limits={"/v1/handle-pii/batch": BATCH_LIMIT, "/v1/records:stream": STREAM_LIMIT},
+    )
+
+    @app.post("/v1/handle-pii")
+    async def handle_pii(document: UploadFile = File(...)):
+        return {"size": len(await document.read())}
+
+    @app.post("/v1/handle-pii/batch")
+    async def handle_pii_batch(documents: list[UploadFile] = File(...)):
+        return {"size": sum([len(await d.read()) for d in documents])}
+
+    @app.post("/v1/records:stream")
+    async def stream_records(request: Request):
+        # As the controller does: headers are sent, errors go out as the last line
+        async def body():
+            size = 0
+            try:
+                async for chunk in request.stream():
+                    size += len(chunk)
+                yield json.dumps({"size": size}).encode("utf-8")
+            except PIIException as e:
+                yield json.dumps({"status": "error", "code": e.code, "message": e.message}).encode("utf-8")
+
+        return RecordStreamResponse(body())
+
+    return app
+
+
+def _chunks(size: int, chunk: int = KB):
+    for start in range(0, size, chunk):
+        yield b"x" * min(chunk, size - start)
+
+
+def _multipart(size: int, field: str = "document") -> bytes:
+    boundary = "limitboundary"
+    return (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"a.txt\"\r\n"
+        f"Content-Type: text/plain\r\n\r\n"
+    ).encode() + b"x" * size + f"\r\n--{boundary}--\r\n".encode()
+
+
+def _post_streamed(client: TestClient, path: str, body: bytes):
+    """POST a multipart *body* chunked, without a Content-Length."""
+    return client.post(
+        path,
+        content=(body[i:i + KB] for i in range(0, len(body), KB)),
+        headers={"Content-Type": "multipart/form-data; boundary=limitboundary"},
+    )
+
+
+def _assert_envelope(response):
+    assert response.status_code == 413
+    data = response.json()
+    assert data["status"] == "error" and data["code"] == 413
+    assert "exceeds limit" in data["message"] and "timestamp" in data
+    assert "detail" not in data
+
+
+def test_declared_content_length_over_the_limit():
+    client = TestClient(_app())
+    ok = client.post("/v1/handle-pii", files={"document": ("a.txt", b"x" * (LIMIT // 2))})
+    assert ok.status_code == 200 and ok.json() == {"size": LIMIT // 2}
+    _assert_envelope(client.post("/v1/handle-pii", files={"document": ("a.txt", b"x" * (2 * LIMIT))}))
+
+
+def test_streamed_body_over_the_limit_gets_the_same_envelope():
+    client = TestClient(_app())
+    ok = _post_streamed(client, "/v1/handle-pii", _multipart(LIMIT // 2))
+    assert ok.status_code == 200 and ok.json() == {"size": LIMIT // 2}
+    response = _post_streamed(client, "/v1/handle-pii", _multipart(2 * LIMIT))
+    _assert_envelope(response)
+    assert "content-length" not in {k.lower() for k in response.request.headers}
+
+
+def test_per_path_limits():
+    middleware = UploadSizeLimitMiddleware(None, max_bytes=LIMIT, path_limits={
+        "/v1/handle-pii/batch": BATCH_LIMIT, "/v1/records:stream": STREAM_LIMIT,
+    })
+    assert middleware._limit_for("/v1/handle-pii") == LIMIT
+    assert middleware._limit_for("/v1/handle-pii/batch") == BATCH_LIMIT
+    assert middleware._limit_for("/v1/records:stream") == STREAM_LIMIT
+    assert STREAM_LIMIT == 1024 * 1024 + MULTIPART_OVERHEAD_BYTES
+
+    client = TestClient(_app())
+    # Over the default limit, within the batch limit
+    batch = client.post("/v1/handle-pii/batch", files=[
+        ("documents", ("a.txt", b"x" * LIMIT)), ("documents", ("b.txt", b"x" * (LIMIT // 2))),
+    ])
+    assert batch.status_code == 200 and batch.json() == {"size": LIMIT + LIMIT // 2}
+    _assert_envelope(_post_streamed(client, "/v1/handle-pii/batch", _multipart(2 * BATCH_LIMIT, "documents")))
+
+    # Over the batch limit, within the stream limit
+    stream = client.post("/v1/records:stream", content=_chunks(BATCH_LIMIT + KB))
+    assert stream.status_code == 200 and stream.json() == {"size": BATCH_LIMIT + KB}
+    # Declared too large: rejected before the endpoint runs
+    _assert_envelope(client.post("/v1/records:stream", content=b"x" * (2 * STREAM_LIMIT)))
+    # Streamed too large: headers are out, the endpoint's last line carries the 413
+    late = client.post("/v1/records:stream", content=_chunks(2 * STREAM_LIMIT))
+    assert late.status_code == 200
+    assert late.json()["code"] == 413 and "exceeds limit" in late.json()["message"]
+
+
+if __name__ == "__main__":
+    try:
+        test_declared_content_length_over_the_limit()
+        test_streamed_body_over_the_limit_gets_the_same_envelope()
+        test_per_path_limits()
+        print("All upload limit tests passed!")
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        sys.exit(1)
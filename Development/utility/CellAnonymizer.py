@@ -0,0 +1,156 @@
+"""
+Batched detection and anonymization of independent cell values.
+
+Tabular documents too large to hold as one text (CSV exports with hundreds
+of thousands of rows, large workbooks) are masked batch by batch. A batch's
+distinct values that have not been seen yet are analyzed in one
+detect_pii_batch() call, each value on its own (no entity spans two cells)
+but through a single nlp.pipe() pass; each value's masked form is then
+remembered, so values repeated across rows (countries, departments, the
+same customer) are analyzed once. The memo is an LRU of
+CELL_ANONYMIZER_CACHE_SIZE values, and every batch shares one
+ConsistentAnonymizer, so a value gets the same tag in every row.
+
+Memory is bounded by the batch, the memo and the mapping of distinct PII
+values, not by the number of rows.
+"""
+from collections import OrderedDict
+from typing import Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple
+import os
+
+from presidio_analyzer import RecognizerResult
+
+from utility.DocumentModel import apply_spans
+from utility.PresidioUtility import ConsistentAnonymizer, PresidioUtility
+from utility.country_pii_config import DEFAULT_COUNTRY
+
+CELL_ANONYMIZER_CACHE_SIZE = int(os.getenv("CELL_ANONYMIZER_CACHE_SIZE", "100000"))
+
+
+class CellAnonymizer:
+    """Anonymize cell values batch by batch with a consistent tag mapping."""
+
+    def __init__(
+        self,
+        presidio: PresidioUtility,
+        country: str = DEFAULT_COUNTRY,
+        language: str = "en",
+        cache_size: int = CELL_ANONYMIZER_CACHE_SIZE,
+    ):
+        """
+        Args:
+            presidio: Engine used for detection and anonymization
+            country: Country name for country-specific entities
+            language: Language code
+            cache_size: Distinct values whose masked form is remembered
+        """
+        self.presidio = presidio
+        self.country = country
+        self.language = language
+        self.cache_size = cache_size
+
+        self.encryption_key = os.urandom(16).hex()
+        self.mapper = ConsistentAnonymizer(crypto_key=self.encryption_key)
+        self.entities_count = 0
+        self.analyzed = 0  # distinct values sent to detection
+        # Highest-scoring entity per type: all the mapping metadata needs
+        self._best: Dict[str, RecognizerResult] = {}
+        # value, or (value, context), -> (masked value, entities in it)
+        self._memo: "OrderedDict[Hashable, Tuple[str, int]]" = OrderedDict()
+
+    def mask(self, values: Sequence[str], contexts: Optional[Sequence[Sequence[str]]] = None) -> List[str]:
+        """
+        Return *values* with their PII replaced by tags, in order.
+
+        Blank values are returned as they are. With *contexts* (context words
+        per value, such as a JSON leaf's key path) a value is analyzed, and
+        remembered, once per distinct context.
+        """
+        batch = self.prepare(values, contexts)
+        per_value = []
+        if batch.texts:
+            per_value = self.presidio.detect_pii_batch(batch.texts, self.language, self.country, batch.contexts)
+        return self.finish(batch, per_value)
+
+    def prepare(self, values: Sequence[str], contexts: Optional[Sequence[Sequence[str]]] = None) -> "CellBatch":
+        """
+        First half of mask(): the batch's distinct, unseen values to detect.
+
+        For callers running detection elsewhere (a worker process): pass
+        ``batch.texts`` and ``batch.contexts`` to detect_pii_batch() and its
+        result to finish().
+        """
+        keys = list(values) if contexts is None else list(zip(values, map(tuple, contexts)))
+        pending = [k for k in dict.fromkeys(keys) if _value(k).strip() and k not in self._memo]
+        return CellBatch(
+            keys=keys,
+            pending=pending,
+            texts=[_value(k) for k in pending],
+            contexts=None if contexts is None else [list(k[1]) for k in pending],
+        )
+
+    def finish(self, batch: "CellBatch", per_value: Sequence[List[RecognizerResult]]) -> List[str]:
+        """Second half of mask(): tag the detected entities and return the masked values."""
+        fresh = self._tag(batch.pending, batch.texts, per_value)
+        masked = []
+        for key in batch.keys:
+            value = _value(key)
+            if not value.strip():
+                masked.append(value)
+                continue
+            result = fresh.get(key)
+            if result is None:
+                result = self._memo[key]
+                self._memo.move_to_end(key)
+            masked.append(result[0])
+            self.entities_count += result[1]
+        while len(self._memo) > self.cache_size:
+            self._memo.popitem(last=False)
+        return masked
+
+    def result(self) -> Dict:
+        """Mapping, encryption key and entity count, as anonymize_text() returns them."""
+        if not self.mapper.tag_to_encrypted:
+            return {"mapping": {}, "encryption_key": "", "entities_count": 0}
+        return {
+            "mapping": self.mapper.get_mapping_with_metadata(list(self._best.values())),
+            "encryption_key": self.encryption_key,
+            "entities_count": self.entities_count,
+        }
+
+    def _tag(
+        self,
+        keys: List[Hashable],
+        values: List[str],
+        per_value: Sequence[List[RecognizerResult]],
+    ) -> Dict[Hashable, Tuple[str, int]]:
+        """Anonymize freshly detected values and remember them."""
+        self.analyzed += len(keys)
+        fresh = {}
+        for key, value, entities in zip(keys, values, per_value):
+            # Entities of one value do not overlap: tag them directly, without
+            # the anonymizer's pairwise conflict check over the whole batch
+            spans = []
+            for entity in sorted(entities, key=lambda e: e.start):
+                best = self._best.get(entity.entity_type)
+                if best is None or entity.score > best.score:
+                    self._best[entity.entity_type] = entity
+                tag = self.mapper.operator_logic(value[entity.start:entity.end], entity.entity_type)
+                spans.append((entity.start, entity.end, tag))
+            fresh[key] = (apply_spans(value, spans), len(spans))
+            self._memo[key] = fresh[key]
+        return fresh
+
+
+class CellBatch(NamedTuple):
+    """A batch between CellAnonymizer.prepare() and finish()."""
+    keys: List[Hashable]
+    pending: List[Hashable]
+    # Values to detect, and their context words (None without contexts)
+    texts: List[str]
+    contexts: Optional[List[List[str]]]
+
+
+def _value(key: Hashable) -> str:
+    """The value of a memo key: the value itself, or (value, context)."""
+    return key if isinstance(key, str) else key[0]
@@ -0,0 +1,89 @@
+"""
+Circuit breaker for outbound calls.
+
+After ``failure_threshold`` consecutive failures the breaker opens and calls
+fail fast with ServiceUnavailableException instead of waiting on a dependency
+that is known to be down. Once ``reset_timeout_s`` has passed one trial call
+is let through (half-open): success closes the breaker, failure re-opens it.
+"""
+from typing import Dict
+import threading
+import time
+import logging
+
+from utility.exceptions import ServiceUnavailableException
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker, safe to share across threads and tasks."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout_s: float = 30.0):
+        """
+        Args:
+            name: Dependency name used in logs and errors
+            failure_threshold: Consecutive failures that open the breaker
+            reset_timeout_s: Seconds the breaker stays open before a trial call
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_s = reset_timeout_s
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.reset_timeout_s:
+            return STATE_HALF_OPEN
+        return self._state
+
+    def before_call(self) -> None:
+        """
+        Raise ServiceUnavailableException unless a call may go through now.
+
+        Every permitted call must be followed by record_success() or
+        record_failure().
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == STATE_CLOSED:
+                return
+            if state == STATE_HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+        raise ServiceUnavailableException(f"{self.name} circuit is open, failing fast")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != STATE_CLOSED:
+                logger.info(f"{self.name} circuit closed")
+            self._state = STATE_CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            reopen = self._trial_in_flight or self._state == STATE_OPEN
+            self._trial_in_flight = False
+            if reopen or self._failures >= self.failure_threshold:
+                if self._state != STATE_OPEN or reopen:
+                    logger.warning(f"{self.name} circuit opened after {self._failures} consecutive failure(s)")
+                self._state = STATE_OPEN
+                self._opened_at = time.monotonic()
+
+    def health(self) -> Dict:
+        with self._lock:
+            return {"state": self._current_state(), "consecutive_failures": self._failures}
@@ -0,0 +1,186 @@
+"""
+Content-addressed cache of LibreOffice conversions.
+
+DOC/DOCX uploads that are not masked natively are converted to PDF before
+extraction. Within a request the converted file is shared by extraction and
+masking (IngestedDocument.artifact_path()); across requests this cache keeps
+the converted bytes, so re-submitting a document for another country or
+after a detection-profile change skips LibreOffice altogether:
+
+    <CONVERSION_CACHE_PATH>/<entry key>.bin
+
+A converted document still holds the original's PII, so entries are
+AES-GCM encrypted under a key derived from the upload bytes: only a request
+with the same upload can read them, as with ResultCache's wrapped keys.
+
+Entries unused for CONVERSION_CACHE_TTL_S expire, and the least recently
+used ones are evicted once the cache exceeds CONVERSION_CACHE_MAX_MB.
+"""
+from typing import Dict, Optional
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import uuid
+import logging
+
+from Crypto.Cipher import AES
+
+logger = logging.getLogger(__name__)
+
+CONVERSION_CACHE_ENABLED = os.getenv("CONVERSION_CACHE_ENABLED", "true").lower() == "true"
+CONVERSION_CACHE_PATH = os.getenv(
+    "CONVERSION_CACHE_PATH", os.path.join(tempfile.gettempdir(), "pii_conversion_cache")
+)
+CONVERSION_CACHE_MAX_MB = float(os.getenv("CONVERSION_CACHE_MAX_MB", "512"))
+CONVERSION_CACHE_TTL_S = float(os.getenv("CONVERSION_CACHE_TTL_S", str(24 * 3600)))
+
+# Bump when the converter's output for the same input changes
+CONVERSION_FORMAT_VERSION = "1"
+
+_ENTRY_SUFFIX = ".bin"
+_NONCE_BYTES = 12
+_TAG_BYTES = 16
+
+
+def _content_key(raw: bytes) -> bytes:
+    """AES key for an entry; needs the original bytes."""
+    return hashlib.sha256(b"pii-conversion-cache-key:" + raw).digest()
+
+
+class ConversionCache:
+    """Disk-backed LRU/TTL cache of encrypted converted documents."""
+
+    def __init__(
+        self,
+        path: str = CONVERSION_CACHE_PATH,
+        max_bytes: int = int(CONVERSION_CACHE_MAX_MB * 1024 * 1024),
+        ttl_s: float = CONVERSION_CACHE_TTL_S,
+        enabled: bool = CONVERSION_CACHE_ENABLED,
+    ):
+        """
+        Args:
+            path: Cache directory
+            max_bytes: Total size above which LRU entries are evicted
+            ttl_s: Seconds an unused entry is kept
+            enabled: When False every lookup misses and nothing is stored
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if enabled:
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def make_key(raw: bytes, target: str) -> str:
+        """Entry key: SHA-256 of the bytes, the target format and the format version."""
+        digest = hashlib.sha256(raw).hexdigest()
+        parts = [digest, target.lower(), CONVERSION_FORMAT_VERSION]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+    def health(self) -> Dict:
+        return {"enabled": self.enabled, "hits": self.hits, "misses": self.misses}
+
+    def get(self, key: str, raw: bytes) -> Optional[bytes]:
+        """Return the converted bytes stored for *raw* under *key*, or None on a miss."""
+        if not self.enabled:
+            return None
+        entry = os.path.join(self.path, key + _ENTRY_SUFFIX)
+        try:
+            if time.time() - os.stat(entry).st_mtime > self.ttl_s:
+                self._remove(entry)
+                self.misses += 1
+                return None
+            with open(entry, "rb") as f:
+                blob = f.read()
+            nonce = blob[:_NONCE_BYTES]
+            tag = blob[_NONCE_BYTES:_NONCE_BYTES + _TAG_BYTES]
+            cipher = AES.new(_content_key(raw), AES.MODE_GCM, nonce=nonce)
+            data = cipher.decrypt_and_verify(blob[_NONCE_BYTES + _TAG_BYTES:], tag)
+            os.utime(entry)  # LRU: mark as recently used
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            # A corrupt or unreadable entry is dropped and treated as a miss
+            logger.warning(f"Conversion cache entry {key[:12]} unusable, evicting: {e}")
+            self._remove(entry)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        logger.info(f"Conversion cache hit {key[:12]} ({len(data)} bytes)")
+        return data
+
+    def put(self, key: str, raw: bytes, data: bytes) -> None:
+        """Store the converted bytes of *raw*; failures are logged and ignored."""
+        if not self.enabled:
+            return
+        entry = os.path.join(self.path, key + _ENTRY_SUFFIX)
+        staging = os.path.join(self.path, f".staging-{uuid.uuid4().hex}")
+        try:
+            cipher = AES.new(_content_key(raw), AES.MODE_GCM, nonce=os.urandom(_NONCE_BYTES))
+            ciphertext, tag = cipher.encrypt_and_digest(data)
+            with open(staging, "wb") as f:
+                f.write(cipher.nonce + tag + ciphertext)
+            os.replace(staging, entry)
+        except Exception as e:
+            self._remove(staging)
+            logger.warning(f"Conversion cache store failed for {key[:12]}: {e}")
+            return
+        self._evict()
+
+    def _evict(self) -> None:
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        with self._lock:
+            now = time.time()
+            entries = []
+            total = 0
+            for entry in os.scandir(self.path):
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.ttl_s:
+                    self._remove(entry.path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# ============================================================
+# Process-wide instance
+# ============================================================
+_cache: Optional[ConversionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_conversion_cache() -> ConversionCache:
+    """Return the process-wide conversion cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ConversionCache()
+    return _cache
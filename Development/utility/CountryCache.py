@@ -0,0 +1,329 @@
+"""
+Country resolution cache for Tavily lookups.
+
+Lookups are keyed by the normalized company name and website and stored in
+two tiers: an in-process LRU and a SQLite file shared across restarts (and
+across workers on one host). Every outcome is cached, with its own TTL:
+
+    found       the country resolved from Tavily       COUNTRY_CACHE_TTL_S
+    not_found   Tavily answered, no supported country  COUNTRY_CACHE_NEGATIVE_TTL_S
+    error       the lookup itself failed               COUNTRY_CACHE_ERROR_TTL_S
+
+Concurrent misses for the same key are collapsed into one lookup; the other
+callers wait for its result instead of stampeding Tavily. resolve() does this
+across threads, resolve_async() across tasks on the event loop.
+"""
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+import logging
+
+from utility.storage_config import get_csv_data_path
+
+logger = logging.getLogger(__name__)
+
+COUNTRY_CACHE_MEMORY_SIZE = int(os.getenv("COUNTRY_CACHE_MEMORY_SIZE", "1024"))
+COUNTRY_CACHE_DB_PATH = os.getenv(
+    "COUNTRY_CACHE_DB_PATH", os.path.join(get_csv_data_path(), "country_cache.sqlite3")
+)
+COUNTRY_CACHE_TTL_S = float(os.getenv("COUNTRY_CACHE_TTL_S", str(30 * 24 * 3600)))
+COUNTRY_CACHE_NEGATIVE_TTL_S = float(os.getenv("COUNTRY_CACHE_NEGATIVE_TTL_S", str(24 * 3600)))
+COUNTRY_CACHE_ERROR_TTL_S = float(os.getenv("COUNTRY_CACHE_ERROR_TTL_S", "300"))
+
+STATUS_FOUND = "found"
+STATUS_NOT_FOUND = "not_found"
+STATUS_ERROR = "error"
+
+# Legal-form suffixes dropped from company names ("Acme Corp." == "ACME")
+_LEGAL_SUFFIXES = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "ltd",
+    "limited", "llc", "llp", "lp", "plc", "gmbh", "ag", "sa", "sas", "bv",
+    "nv", "pty", "pte", "kk", "sdn", "bhd", "group", "holdings",
+}
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def normalize_company_name(name: Optional[str]) -> str:
+    """'  ACME Holdings, Inc. ' -> 'acme'"""
+    words = _NON_WORD.sub(" ", (name or "").lower()).split()
+    while len(words) > 1 and words[-1] in _LEGAL_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+
+def normalize_website(website: Optional[str]) -> str:
+    """'https://www.Acme.co.uk:443/about' -> 'acme.co.uk'"""
+    host = (website or "").strip().lower()
+    host = re.sub(r"^[a-z][a-z0-9+.-]*://", "", host)
+    host = re.split(r"[/?#]", host, maxsplit=1)[0]
+    host = host.rsplit("@", 1)[-1].split(":", 1)[0].strip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    return host
+
+
+def cache_key(company_name: Optional[str], company_website: Optional[str]) -> str:
+    return f"{normalize_company_name(company_name)}|{normalize_website(company_website)}"
+
+
+class CountryLookup:
+    """One cached outcome."""
+
+    __slots__ = ("country", "status", "expires_at", "source")
+
+    def __init__(self, country: Optional[str], status: str, expires_at: float, source: str = ""):
+        self.country = country
+        self.status = status
+        self.expires_at = expires_at
+        self.source = source
+
+    @property
+    def expired(self) -> bool:
+        return time.time() >= self.expires_at
+
+
+class _Flight:
+    """A lookup in progress that other callers can wait on."""
+
+    __slots__ = ("done", "result")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[CountryLookup] = None
+
+
+class CountryCache:
+    """Two-tier (memory LRU + SQLite) TTL cache with single-flight lookups."""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = COUNTRY_CACHE_DB_PATH,
+        memory_size: int = COUNTRY_CACHE_MEMORY_SIZE,
+        ttls: Optional[Dict[str, float]] = None,
+    ):
+        """
+        Args:
+            db_path: SQLite file for the persistent tier (None keeps memory only)
+            memory_size: Entries kept in the in-process LRU
+            ttls: Per-status TTL overrides in seconds
+        """
+        self.memory_size = memory_size
+        self.ttls = {
+            STATUS_FOUND: COUNTRY_CACHE_TTL_S,
+            STATUS_NOT_FOUND: COUNTRY_CACHE_NEGATIVE_TTL_S,
+            STATUS_ERROR: COUNTRY_CACHE_ERROR_TTL_S,
+        }
+        if ttls:
+            self.ttls.update(ttls)
+        self._memory: "OrderedDict[str, CountryLookup]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._async_flights: Dict[str, asyncio.Future] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS country_cache ("
+                " key TEXT PRIMARY KEY, country TEXT, status TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            # The memory tier still works; persistence is an optimization
+            logger.error(f"Country cache database unavailable ({db_path}): {e}")
+            self._db = None
+
+    # ------------------------------------------------------------------
+    # Tiers
+    # ------------------------------------------------------------------
+    def get(self, key: str) -> Optional[CountryLookup]:
+        """Return a live cached lookup for *key* from memory, then disk."""
+        return self._get_from_memory(key) or self._get_from_disk(key)
+
+    def _get_from_memory(self, key: str) -> Optional[CountryLookup]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not entry.expired:
+                    self._memory.move_to_end(key)
+                    return CountryLookup(entry.country, entry.status, entry.expires_at, "memory")
+                del self._memory[key]
+        return None
+
+    def _get_from_disk(self, key: str) -> Optional[CountryLookup]:
+        entry = self._get_from_db(key)
+        if entry is not None:
+            self._remember(key, entry)
+            return CountryLookup(entry.country, entry.status, entry.expires_at, "disk")
+        return None
+
+    def put(self, key: str, country: Optional[str], status: str) -> CountryLookup:
+        """Cache an outcome in both tiers with the TTL for its status."""
+        entry = CountryLookup(country, status, time.time() + self.ttls[status])
+        self._remember(key, entry)
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO country_cache VALUES (?, ?, ?, ?, ?)",
+                        (key, country, status, entry.expires_at, time.time()),
+                    )
+                    self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Country cache write failed: {e}")
+        return entry
+
+    def _remember(self, key: str, entry: CountryLookup) -> None:
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _get_from_db(self, key: str) -> Optional[CountryLookup]:
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT country, status, expires_at FROM country_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[2] <= time.time():
+                    self._db.execute("DELETE FROM country_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    return None
+        except sqlite3.Error as e:
+            logger.warning(f"Country cache read failed: {e}")
+            return None
+        return CountryLookup(row[0], row[1], row[2]) if row else None
+
+    # ------------------------------------------------------------------
+    # Single-flight resolution
+    # ------------------------------------------------------------------
+    def resolve(
+        self,
+        key: str,
+        lookup: Callable[[], Tuple[Optional[str], str]],
+        wait_timeout_s: float = 60.0,
+    ) -> CountryLookup:
+        """
+        Return the cached outcome for *key*, running *lookup* on a miss.
+
+        *lookup* returns ``(country, status)``; an exception counts as
+        STATUS_ERROR. Concurrent callers with the same key share one call.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if flight.done.wait(wait_timeout_s) and flight.result is not None:
+                return CountryLookup(flight.result.country, flight.result.status,
+                                     flight.result.expires_at, "shared")
+            return CountryLookup(None, STATUS_ERROR, time.time(), "timeout")
+
+        try:
+            try:
+                country, status = lookup()
+            except Exception as e:
+                logger.error(f"Country lookup failed for '{key}': {e}")
+                country, status = None, STATUS_ERROR
+            flight.result = self.put(key, country, status)
+            flight.result.source = "lookup"
+            return flight.result
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    async def resolve_async(
+        self,
+        key: str,
+        lookup: Callable[[], Awaitable[Tuple[Optional[str], str]]],
+        wait_timeout_s: float = 60.0,
+    ) -> CountryLookup:
+        """
+        Event-loop version of resolve(): *lookup* is a coroutine function.
+
+        Memory hits return without leaving the loop; the SQLite tier is read
+        and written on a worker thread. Concurrent tasks with the same key
+        share one lookup.
+        """
+        cached = self._get_from_memory(key)
+        if cached is None and self._db is not None:
+            cached = await asyncio.to_thread(self._get_from_disk, key)
+        if cached is not None:
+            return cached
+
+        flight = self._async_flights.get(key)
+        if flight is not None:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(flight), wait_timeout_s)
+            except asyncio.TimeoutError:
+                result = None
+            if result is not None:
+                return CountryLookup(result.country, result.status, result.expires_at, "shared")
+            return CountryLookup(None, STATUS_ERROR, time.time(), "timeout")
+
+        flight = self._async_flights[key] = asyncio.get_running_loop().create_future()
+        try:
+            try:
+                country, status = await lookup()
+            except Exception as e:
+                logger.error(f"Country lookup failed for '{key}': {e}")
+                country, status = None, STATUS_ERROR
+            if self._db is not None:
+                result = await asyncio.to_thread(self.put, key, country, status)
+            else:
+                result = self.put(key, country, status)
+            result.source = "lookup"
+            flight.set_result(result)
+            return result
+        finally:
+            self._async_flights.pop(key, None)
+            if not flight.done():
+                # The leader was cancelled; waiters fall back to an error outcome
+                flight.set_result(None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM country_cache")
+                self._db.commit()
+
+
+# ============================================================
+# Process-wide instance
+# ============================================================
+_cache: Optional[CountryCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_country_cache() -> CountryCache:
+    """Return the process-wide country cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CountryCache()
+    return _cache
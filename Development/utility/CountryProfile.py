@@ -0,0 +1,196 @@
+"""
+Per-country detection profiles.
+
+A CountryProfile freezes everything detection needs for one country: the
+entity set, the recognizers that can produce those entities (resolved from
+the registry once, regex patterns precompiled) and the score thresholds.
+Profiles are built once per PresidioUtility and reused by every request, so
+AnalyzerEngine no longer walks the full registry per entity on each call.
+"""
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import re
+import logging
+
+from presidio_analyzer import (
+    AnalyzerEngine,
+    BatchAnalyzerEngine,
+    EntityRecognizer,
+    PatternRecognizer,
+    RecognizerResult,
+)
+from presidio_analyzer.recognizer_registry import RecognizerRegistry
+
+from utility.country_pii_config import (
+    get_entities_for_country,
+    get_score_thresholds,
+    DEFAULT_SCORE_THRESHOLD,
+)
+
+logger = logging.getLogger(__name__)
+
+# PatternRecognizer's flags when it has none of its own
+_DEFAULT_REGEX_FLAGS = re.DOTALL | re.MULTILINE
+
+
+class _ResolvedRecognizerRegistry(RecognizerRegistry):
+    """Registry holding an already-filtered recognizer list; lookups skip filtering."""
+
+    def get_recognizers(
+        self,
+        language: str,
+        entities: Optional[List[str]] = None,
+        all_fields: bool = False,
+        ad_hoc_recognizers: Optional[List[EntityRecognizer]] = None,
+    ) -> List[EntityRecognizer]:
+        if ad_hoc_recognizers:
+            return list(self.recognizers) + list(ad_hoc_recognizers)
+        return self.recognizers
+
+
+class CountryProfile:
+    """Frozen detection settings for one country."""
+
+    __slots__ = ("country", "language", "entity_list", "entities",
+                 "recognizers", "analyzer", "thresholds", "min_threshold", "version")
+
+    def __init__(
+        self,
+        country: str,
+        language: str,
+        entity_list: Tuple[str, ...],
+        recognizers: List[EntityRecognizer],
+        analyzer: AnalyzerEngine,
+        thresholds: Dict[str, float],
+    ):
+        self.country = country
+        self.language = language
+        self.entity_list = entity_list
+        self.entities: FrozenSet[str] = frozenset(entity_list)
+        self.recognizers = recognizers
+        self.analyzer = analyzer
+        self.thresholds = thresholds
+        self.min_threshold = min(thresholds.values(), default=DEFAULT_SCORE_THRESHOLD)
+        self.version = self._compute_version()
+
+    def _compute_version(self) -> str:
+        """Stable hash of what this profile detects; changes when config changes."""
+        payload = {
+            "country": self.country,
+            "language": self.language,
+            "entities": list(self.entity_list),
+            "thresholds": self.thresholds,
+            "recognizers": sorted(r.name for r in self.recognizers),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def accepts(self, result: RecognizerResult) -> bool:
+        """True if *result* is a profile entity at or above its threshold."""
+        return (
+            result.entity_type in self.entities
+            and result.score >= self.thresholds.get(result.entity_type, DEFAULT_SCORE_THRESHOLD)
+        )
+
+    def analyze(self, text: str) -> List[RecognizerResult]:
+        """Run the profile's recognizers on *text* and apply its thresholds."""
+        results = self.analyzer.analyze(
+            text=text,
+            language=self.language,
+            entities=list(self.entity_list),
+            score_threshold=self.min_threshold,
+        )
+        return [r for r in results if self.accepts(r)]
+
+    def analyze_batch(
+        self,
+        texts: Sequence[str],
+        contexts: Optional[Sequence[List[str]]] = None,
+    ) -> List[List[RecognizerResult]]:
+        """
+        analyze() for many short texts: the NLP model runs over them with
+        nlp.pipe() instead of once per text.
+
+        *contexts* gives each text its own context words (the key path of a
+        JSON leaf, as BatchAnalyzerEngine.analyze_dict() uses the key), which
+        recognizers use to raise the score of what they find.
+        """
+        if contexts is None:
+            batch = BatchAnalyzerEngine(analyzer_engine=self.analyzer).analyze_iterator(
+                texts,
+                language=self.language,
+                entities=list(self.entity_list),
+                score_threshold=self.min_threshold,
+            )
+        else:
+            artifacts = self.analyzer.nlp_engine.process_batch(texts, self.language)
+            batch = [
+                self.analyzer.analyze(
+                    text=text,
+                    language=self.language,
+                    entities=list(self.entity_list),
+                    score_threshold=self.min_threshold,
+                    context=context,
+                    nlp_artifacts=nlp_artifacts,
+                )
+                for (text, nlp_artifacts), context in zip(artifacts, contexts)
+            ]
+        return [[r for r in results if self.accepts(r)] for results in batch]
+
+
+def build_country_profile(
+    base_analyzer: AnalyzerEngine,
+    country: str,
+    language: str = "en",
+) -> CountryProfile:
+    """
+    Resolve the recognizers for *country* from *base_analyzer*'s registry once.
+
+    The profile's AnalyzerEngine shares the base engine's NLP engine (the
+    spaCy model is not loaded again) and context enhancer.
+    """
+    entity_list = tuple(get_entities_for_country(country))
+    recognizers = base_analyzer.registry.get_recognizers(
+        language=language, entities=list(entity_list)
+    )
+    recognizers = sorted(recognizers, key=lambda r: r.name)
+
+    for recognizer in recognizers:
+        if not recognizer.is_loaded:
+            recognizer.load()
+            recognizer.is_loaded = True
+        if isinstance(recognizer, PatternRecognizer):
+            _precompile(recognizer)
+
+    registry = _ResolvedRecognizerRegistry(recognizers=recognizers)
+    # Newer Presidio releases check the registry's languages against the engine's
+    registry.supported_languages = [language]
+    analyzer = AnalyzerEngine(
+        registry=registry,
+        nlp_engine=base_analyzer.nlp_engine,
+        supported_languages=[language],
+        context_aware_enhancer=base_analyzer.context_aware_enhancer,
+    )
+
+    thresholds = get_score_thresholds(country, entity_list)
+    logger.debug(f"Built profile for {country}: {len(entity_list)} entities, "
+                 f"{len(recognizers)} recognizers")
+    return CountryProfile(country, language, entity_list, recognizers, analyzer, thresholds)
+
+
+def _precompile(recognizer: PatternRecognizer) -> None:
+    """
+    Compile *recognizer*'s patterns ahead of the first request.
+
+    Presidio releases that cache a compiled regex on each Pattern get it
+    stored there; older ones (2.2.33, pinned) match with re.finditer() on
+    the pattern string, so compiling warms re's own cache instead.
+    """
+    flags = getattr(recognizer, "global_regex_flags", None)
+    if flags is None:
+        flags = _DEFAULT_REGEX_FLAGS
+    for pattern in recognizer.patterns:
+        compiled = re.compile(pattern.regex, flags=flags)
+        if hasattr(pattern, "compiled_regex") and getattr(pattern, "compiled_with_flags", None) != flags:
+            pattern.compiled_regex = compiled
+            pattern.compiled_with_flags = flags
@@ -0,0 +1,380 @@
+"""
+Upload ingestion.
+
+UploadSizeLimitMiddleware enforces MAX_FILE_SIZE_MB while the request body
+is still streaming: a declared Content-Length over the limit is rejected
+before a byte is read, and a body without one is cut off as soon as the
+received bytes pass the limit, with the same 413 response. What is accepted
+is spooled once by Starlette (memory, then disk), and IngestedDocument hands
+that one buffer to every consumer: the bytes are read once, and consumers
+that need a path (LibreOffice) share a single temp file that is removed with
+the request.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+import logging
+
+from fastapi import UploadFile
+from starlette.responses import JSONResponse
+
+from utility.exceptions import FileValidationException, PayloadTooLargeException
+
+logger = logging.getLogger(__name__)
+
+MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "50"))
+MAX_BATCH_SIZE_MB = int(os.getenv("MAX_BATCH_SIZE_MB", "200"))
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "50"))
+# Allowance on top of the file limit for multipart boundaries and form fields
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+_COPY_BUFFER_BYTES = 1024 * 1024
+# Zip members are spooled in memory up to this size, then on disk
+_SPOOL_MAX_BYTES = 1024 * 1024
+_BODY_METHODS = ("POST", "PUT", "PATCH")
+
+
+def max_request_bytes(max_file_size_mb: float = MAX_FILE_SIZE_MB) -> int:
+    """Largest request body accepted for a *max_file_size_mb* upload."""
+    return int(max_file_size_mb * 1024 * 1024) + MULTIPART_OVERHEAD_BYTES
+
+
+# ============================================================
+# Early size rejection
+# ============================================================
+class UploadSizeLimitMiddleware:
+    """ASGI middleware rejecting request bodies over a size limit with 413."""
+
+    def __init__(
+        self,
+        app,
+        max_bytes: Optional[int] = None,
+        path_limits: Optional[Dict[str, int]] = None,
+    ):
+        """
+        Args:
+            app: The wrapped ASGI application
+            max_bytes: Body limit for every path (default from MAX_FILE_SIZE_MB)
+            path_limits: Per-path-prefix overrides, longest prefix wins
+        """
+        self.app = app
+        self.max_bytes = max_bytes if max_bytes is not None else max_request_bytes()
+        self.path_limits = dict(path_limits or {})
+
+    def _limit_for(self, path: str) -> int:
+        matches = [p for p in self.path_limits if path.startswith(p)]
+        if not matches:
+            return self.max_bytes
+        return self.path_limits[max(matches, key=len)]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") not in _BODY_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        limit = self._limit_for(scope.get("path", ""))
+        declared = _content_length(scope)
+        if declared is not None and declared > limit:
+            logger.warning(f"Rejected {scope.get('path')}: Content-Length {declared} > {limit}")
+            await _too_large_response(declared, limit)(scope, receive, send)
+            return
+
+        received = 0
+        too_large: Optional[int] = None  # bytes received when the limit was passed
+        started = replaced = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    too_large = received
+                    # Raised inside body parsing: FastAPI answers a form it
+                    # cannot read with a 400, replaced below; a streaming
+                    # endpoint reports it in its own error line
+                    raise PayloadTooLargeException(_too_large_message(received, limit))
+            return message
+
+        async def limited_send(message):
+            nonlocal started, replaced
+            if message["type"] == "http.response.start" and not started:
+                if too_large is not None:
+                    # Same 413 envelope as a Content-Length over the limit
+                    logger.warning(f"Rejected {scope.get('path')}: body passed {limit} bytes")
+                    replaced = True
+                    await _too_large_response(too_large, limit)(scope, receive, send)
+                    return
+                started = True
+            if not replaced:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except Exception:
+            if too_large is None or started:
+                raise
+            if not replaced:
+                await limited_send({"type": "http.response.start", "status": 413, "headers": []})
+
+
+def _content_length(scope) -> Optional[int]:
+    for name, value in scope.get("headers", []):
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+def _too_large_message(size: int, limit: int) -> str:
+    limit_mb = (limit - MULTIPART_OVERHEAD_BYTES) / (1024 * 1024)
+    return f"Request body of {size / (1024 * 1024):.1f}MB exceeds limit of {limit_mb:.0f}MB"
+
+
+def _too_large_response(size: int, limit: int) -> JSONResponse:
+    return JSONResponse(
+        status_code=413,
+        content={
+            "status": "error",
+            "code": 413,
+            "message": _too_large_message(size, limit),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+        },
+    )
+
+
+# ============================================================
+# Single-buffer document access
+# ============================================================
+class IngestedDocument:
+    """
+    One uploaded document, shared by every stage of a request.
+
+    ``read()`` returns the same bytes object on every call and ``path``
+    materializes the spooled upload to disk at most once. Files derived from
+    the document (its LibreOffice conversion) live at ``artifact_path()`` and
+    are removed with it. Pickled copies (sent to worker processes) keep only
+    the paths and never delete them.
+    """
+
+    def __init__(self, upload: UploadFile, request_id: str, temp_dir: Optional[str] = None):
+        self.filename = upload.filename or "document"
+        self.ext = os.path.splitext(self.filename)[1]
+        self.request_id = request_id
+        self.temp_dir = temp_dir or tempfile.gettempdir()
+        self._file: Optional[BinaryIO] = upload.file
+        self._raw: Optional[bytes] = None
+        self._path: Optional[str] = None
+        self._owns_path = False
+        # suffix -> path of a derived file; registered before stages run so
+        # that worker copies see the same paths
+        self._artifacts: Dict[str, str] = {}
+        self._owns_artifacts = True
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """Size of the upload in bytes."""
+        if self._raw is not None:
+            return len(self._raw)
+        if self._file is not None:
+            self._file.seek(0, os.SEEK_END)
+            size = self._file.tell()
+            self._file.seek(0)
+            return size
+        return os.path.getsize(self._path) if self._path else 0
+
+    def read(self) -> bytes:
+        """Return the document bytes, reading the spooled upload only once."""
+        with self._lock:
+            if self._raw is None:
+                if self._file is not None:
+                    self._file.seek(0)
+                    self._raw = self._file.read()
+                    self._file.seek(0)
+                elif self._path:
+                    with open(self._path, "rb") as f:
+                        self._raw = f.read()
+                else:
+                    self._raw = b""
+            return self._raw
+
+    @property
+    def path(self) -> str:
+        """Filesystem path holding the document, written on first access."""
+        return self.materialize()
+
+    def materialize(self) -> str:
+        """Write the upload to its shared temp file (once) and return the path."""
+        with self._lock:
+            if self._path is None:
+                self._path = os.path.join(self.temp_dir, f"{self.request_id}_source{self.ext}")
+                with open(self._path, "wb") as out:
+                    if self._raw is not None:
+                        out.write(self._raw)
+                    elif self._file is not None:
+                        # Stream from the spool; the bytes are not held twice
+                        self._file.seek(0)
+                        shutil.copyfileobj(self._file, out, _COPY_BUFFER_BYTES)
+                        self._file.seek(0)
+                self._owns_path = True
+            return self._path
+
+    @property
+    def has_path(self) -> bool:
+        return self._path is not None
+
+    def artifact_path(self, suffix: str) -> str:
+        """Path for a file derived from this document with *suffix*; it may not exist yet."""
+        with self._lock:
+            path = self._artifacts.get(suffix)
+            if path is None:
+                path = os.path.join(self.temp_dir, f"{self.request_id}_converted{suffix}")
+                self._artifacts[suffix] = path
+            return path
+
+    def cleanup(self) -> None:
+        """Remove the materialized and derived files (only in the owning process)."""
+        with self._lock:
+            if self._owns_path and self._path and os.path.exists(self._path):
+                os.remove(self._path)
+            if self._owns_artifacts:
+                for path in self._artifacts.values():
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._artifacts = {}
+            self._path = None
+            self._owns_path = False
+            self._raw = None
+
+    def __enter__(self) -> "IngestedDocument":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cleanup()
+
+    def __getstate__(self) -> Dict:
+        # Workers re-read from the shared path instead of receiving the bytes
+        state = self.__dict__.copy()
+        state["_file"] = None
+        state["_raw"] = None
+        state["_owns_path"] = False
+        state["_owns_artifacts"] = False
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+@contextmanager
+def materialized_path(
+    raw: bytes, suffix: str, source: Optional[IngestedDocument] = None
+) -> Iterator[str]:
+    """
+    Yield a filesystem path holding *raw*.
+
+    Reuses *source*'s shared file when it holds the same document type, so a
+    tool that needs a path never causes a second copy of the upload;
+    otherwise *raw* is written to a temp file removed on exit.
+    """
+    if source is not None and source.has_path and source.ext.lower() == suffix.lower():
+        yield source.path
+        return
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        tmp.write(raw)
+    try:
+        yield tmp.name
+    finally:
+        if os.path.exists(tmp.name):
+            os.unlink(tmp.name)
+
+
+# ============================================================
+# Batch uploads
+# ============================================================
+def expand_batch_uploads(
+    uploads: List[UploadFile],
+    max_files: int = MAX_BATCH_FILES,
+    max_total_mb: float = MAX_BATCH_SIZE_MB,
+) -> List[UploadFile]:
+    """
+    Flatten a batch upload: ``.zip`` files are replaced by their members.
+
+    Members are decompressed into spooled files while counting the bytes
+    actually produced, so a zip bomb fails at the limit instead of filling
+    memory or disk. Directories, hidden files and macOS resource forks are
+    skipped; zips inside zips are not expanded. Uploads that are not zips
+    count toward the same limit.
+
+    Raises:
+        FileValidationException: Too many files or an unreadable zip
+        PayloadTooLargeException: The documents, decompressed, exceed *max_total_mb*
+    """
+    max_total = int(max_total_mb * 1024 * 1024)
+    total = 0
+    files: List[UploadFile] = []
+    try:
+        for upload in uploads:
+            if not (upload.filename or "").lower().endswith(".zip"):
+                upload.file.seek(0, os.SEEK_END)
+                total += upload.file.tell()
+                upload.file.seek(0)
+                if total > max_total:
+                    raise PayloadTooLargeException(_batch_too_large_message(max_total))
+                files.append(upload)
+            else:
+                total = _expand_zip(upload, files, total, max_total, max_files)
+            if len(files) > max_files:
+                raise FileValidationException(f"Batch has more than {max_files} files")
+    except BaseException:
+        for f in files:
+            if f not in uploads:
+                f.file.close()
+        raise
+    if not files:
+        raise FileValidationException("Batch contains no documents")
+    return files
+
+
+def _expand_zip(
+    upload: UploadFile, files: List[UploadFile], total: int, max_total: int, max_files: int
+) -> int:
+    upload.file.seek(0)
+    try:
+        archive = zipfile.ZipFile(upload.file)
+    except zipfile.BadZipFile:
+        raise FileValidationException(f"{upload.filename} is not a valid zip archive")
+
+    with archive:
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name or name.startswith(".") or "__MACOSX" in info.filename:
+                continue
+            if len(files) >= max_files:
+                raise FileValidationException(f"Batch has more than {max_files} files")
+
+            spool = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_BYTES)
+            files.append(UploadFile(file=spool, filename=name))
+            with archive.open(info) as member:
+                while True:
+                    block = member.read(_COPY_BUFFER_BYTES)
+                    if not block:
+                        break
+                    total += len(block)
+                    if total > max_total:
+                        raise PayloadTooLargeException(_batch_too_large_message(max_total))
+                    spool.write(block)
+            spool.seek(0)
+    return total
+
+
+def _batch_too_large_message(max_total: int) -> str:
+    return f"Batch exceeds {max_total / (1024 * 1024):.0f}MB (zip members counted decompressed)"
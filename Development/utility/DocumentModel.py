@@ -0,0 +1,141 @@
+"""
+Span-preserving document model.
+
+Extraction produces an ExtractedDocument: the text handed to NER plus a
+compact offset -> location index. Each segment of the text remembers where it
+came from (a PDF page, an (sheet, cell) pair, a JSON path ...), so the spans
+returned by PresidioUtility.anonymize_text() can be applied back to the
+source by location, in one linear pass, instead of recovering
+{original: tag} pairs by diffing and re-searching the whole document.
+"""
+from bisect import bisect_right
+from typing import Any, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+# (start, end, tag) in text offsets
+Span = Tuple[int, int, str]
+
+
+class ExtractedDocument:
+    """
+    Extracted text plus the location of every segment.
+
+    Segment *i* covers ``text[starts[i]:ends[i]]`` and came from
+    ``locations[i]``. Segments are in text order and never overlap;
+    separators inserted between them belong to no segment.
+    """
+
+    __slots__ = ("text", "starts", "ends", "locations")
+
+    def __init__(
+        self,
+        text: str,
+        starts: Optional[List[int]] = None,
+        ends: Optional[List[int]] = None,
+        locations: Optional[List[Hashable]] = None,
+    ):
+        self.text = text
+        self.starts = starts if starts is not None else [0]
+        self.ends = ends if ends is not None else [len(text)]
+        self.locations = locations if locations is not None else [None]
+
+    @classmethod
+    def from_text(cls, text: str) -> "ExtractedDocument":
+        """A document with a single segment covering all of *text*."""
+        return cls(text)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getstate__(self):
+        return (self.text, self.starts, self.ends, self.locations)
+
+    def __setstate__(self, state) -> None:
+        self.text, self.starts, self.ends, self.locations = state
+
+    def segment_text(self, index: int) -> str:
+        return self.text[self.starts[index]:self.ends[index]]
+
+    def locate(self, offset: int) -> Optional[int]:
+        """Index of the segment containing *offset*, or None for a separator."""
+        i = bisect_right(self.starts, offset) - 1
+        if i >= 0 and offset < self.ends[i]:
+            return i
+        return None
+
+    def segment_spans(self, spans: Sequence[Span]) -> Iterator[Tuple[int, List[Span]]]:
+        """
+        Group *spans* by segment, with offsets relative to the segment.
+
+        Yields ``(segment index, [(local_start, local_end, tag), ...])`` for
+        every segment touched by a span, in text order. A span crossing a
+        segment boundary (an entity NER saw across two cells or lines) is
+        cut at the boundary and every piece carries the tag, so no part of
+        the value is left unmasked. Both inputs are sorted, so this is a
+        single merge pass: O(segments + spans).
+        """
+        ordered = sorted(spans)
+        n = len(self.starts)
+        seg = 0
+        current: Optional[int] = None
+        pieces: List[Span] = []
+        for start, end, tag in ordered:
+            # Skip segments ending before this span
+            while seg < n and self.ends[seg] <= start:
+                seg += 1
+            i = seg
+            while i < n and self.starts[i] < end:
+                seg_start = self.starts[i]
+                lo = max(start, seg_start) - seg_start
+                hi = min(end, self.ends[i]) - seg_start
+                if hi > lo:
+                    if current != i:
+                        if pieces:
+                            yield current, pieces
+                        current, pieces = i, []
+                    pieces.append((lo, hi, tag))
+                i += 1
+        if pieces:
+            yield current, pieces
+
+
+class DocumentBuilder:
+    """Assemble an ExtractedDocument segment by segment."""
+
+    def __init__(self, separator: str = " "):
+        """
+        Args:
+            separator: Text inserted between segments (kept out of segments)
+        """
+        self.separator = separator
+        self._parts: List[str] = []
+        self._length = 0
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        self._locations: List[Any] = []
+
+    def add(self, text: str, location: Hashable, separator: Optional[str] = None) -> None:
+        """Append a segment; *separator* overrides the default one before it."""
+        separator = self.separator if separator is None else separator
+        if self._parts and separator:
+            self._parts.append(separator)
+            self._length += len(separator)
+        self._parts.append(text)
+        self._starts.append(self._length)
+        self._length += len(text)
+        self._ends.append(self._length)
+        self._locations.append(location)
+
+    def build(self) -> ExtractedDocument:
+        return ExtractedDocument("".join(self._parts), self._starts, self._ends, self._locations)
+
+
+def apply_spans(text: str, spans: Sequence[Span]) -> str:
+    """Replace each sorted, non-overlapping ``(start, end, tag)`` in *text* (linear)."""
+    out: List[str] = []
+    pos = 0
+    for start, end, tag in spans:
+        out.append(text[pos:start])
+        out.append(tag)
+        pos = end
+    out.append(text[pos:])
+    return "".join(out)
@@ -0,0 +1,297 @@
+"""
+Execution layer for the CPU-bound pipeline stages.
+
+Text extraction, PII detection, anonymization and masked-output building are
+CPU-bound and hold the GIL. With EXECUTION_POOL_WORKERS > 0 they run in a
+pre-warmed ProcessPoolExecutor whose workers build their own PresidioUtility
+once at start-up, so throughput scales with cores. With 0 workers the stages
+run on the default thread pool using an engine borrowed from the
+PresidioEnginePool.
+
+Every stage is awaited with its own timeout, after which the caller gets
+GatewayTimeoutException. A running stage cannot be cancelled: it runs to the
+end in its thread or worker process and its result is discarded. In thread
+mode the engine it runs on is kept out of the PresidioEnginePool until then,
+so no other request uses it concurrently.
+
+Large PDFs are split across a PDFPagePool by whichever process runs their
+stages; in process mode the workers share PDF_PARALLEL_WORKERS between them
+(see utility.PDFPagePool) rather than each starting a full pool.
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+import asyncio
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import logging
+
+from utility.PresidioEnginePool import engine_config, get_engine_pool
+from utility.span_helpers import create_chunks
+from utility.exceptions import GatewayTimeoutException, ServiceUnavailableException
+
+logger = logging.getLogger(__name__)
+
+EXECUTION_POOL_WORKERS = int(os.getenv("EXECUTION_POOL_WORKERS", "0"))
+EXECUTION_POOL_START_METHOD = os.getenv(
+    "EXECUTION_POOL_START_METHOD",
+    "spawn" if sys.platform == "win32" else "forkserver",
+)
+
+# Per-stage timeouts in seconds
+STAGE_TIMEOUTS: Dict[str, float] = {
+    "extract": float(os.getenv("STAGE_TIMEOUT_EXTRACT_S", "300")),
+    "detect": float(os.getenv("STAGE_TIMEOUT_DETECT_S", "300")),
+    "anonymize": float(os.getenv("STAGE_TIMEOUT_ANONYMIZE_S", "120")),
+    "build": float(os.getenv("STAGE_TIMEOUT_BUILD_S", "300")),
+    # Whole page-by-page pipeline of a streamed document
+    "stream": float(os.getenv("STAGE_TIMEOUT_STREAM_S", "1800")),
+}
+DEFAULT_STAGE_TIMEOUT_S = 300.0
+
+
+# ============================================================
+# Worker-side state and task functions (must be module-level to pickle)
+# ============================================================
+_worker_presidio = None
+
+
+def _init_worker(config: Dict, factory: Optional[Callable[[Dict], Any]] = None) -> None:
+    """ProcessPoolExecutor initializer: load spaCy + recognizers once per worker."""
+    global _worker_presidio
+    if factory is None:
+        from utility.PresidioUtility import PresidioUtility
+
+        _worker_presidio = PresidioUtility(**config)
+    else:
+        _worker_presidio = factory(config)
+    logger.info(f"Execution worker {os.getpid()} ready")
+
+
+def get_worker_presidio():
+    """Return the PresidioUtility owned by the current worker process."""
+    return _worker_presidio
+
+
+def _warm_up() -> int:
+    return os.getpid()
+
+
+def _run_service_stage(service, method: str, args: tuple) -> Any:
+    """Run ``service.<method>(*args)`` on an unpickled copy of the service."""
+    service.presidio = _worker_presidio
+    return getattr(service, method)(*args)
+
+
+def _run_presidio_stage(method: str, args: tuple) -> Any:
+    """Run ``PresidioUtility.<method>(*args)`` on the worker's engine."""
+    return getattr(_worker_presidio, method)(*args)
+
+
+class ExecutionPool:
+    """Runs pipeline stages in worker processes (or threads) with timeouts."""
+
+    def __init__(
+        self,
+        workers: int = EXECUTION_POOL_WORKERS,
+        start_method: str = EXECUTION_POOL_START_METHOD,
+        stage_timeouts: Optional[Dict[str, float]] = None,
+        factory: Optional[Callable[[Dict], Any]] = None,
+    ):
+        """
+        Args:
+            workers: Number of worker processes; 0 runs stages on threads
+            start_method: multiprocessing start method for the workers
+            stage_timeouts: Per-stage timeout overrides in seconds
+            factory: Builds each worker's engine from the engine configuration
+                     (default: PresidioUtility(**config)); must be picklable
+        """
+        self.workers = max(0, workers)
+        self.start_method = start_method
+        self.factory = factory
+        self.stage_timeouts = dict(STAGE_TIMEOUTS)
+        if stage_timeouts:
+            self.stage_timeouts.update(stage_timeouts)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_process_mode(self) -> bool:
+        return self.workers > 0
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        """Spawn and warm every worker process (no-op in thread mode)."""
+        if not self.is_process_mode:
+            return
+        with self._lock:
+            if self._executor is not None:
+                return
+            started = time.time()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=_init_worker,
+                initargs=(engine_config(), self.factory),
+            )
+            # Force every worker to spawn and run its initializer now
+            pids = {f.result() for f in [self._executor.submit(_warm_up) for _ in range(self.workers)]}
+            logger.info(
+                f"Execution pool warmed: {len(pids)} worker process(es) in "
+                f"{time.time() - started:.1f}s"
+            )
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def health(self) -> Dict:
+        return {
+            "mode": "process" if self.is_process_mode else "thread",
+            "workers": self.workers,
+            "running": self._executor is not None,
+        }
+
+    @property
+    def process_executor(self) -> Optional[ProcessPoolExecutor]:
+        """The underlying ProcessPoolExecutor, started on demand (None in thread mode)."""
+        if self.is_process_mode and self._executor is None:
+            self.start()
+        return self._executor
+
+    # ------------------------------------------------------------------
+    # Stage execution
+    # ------------------------------------------------------------------
+    async def run_service_stage(self, stage: str, service, method: str, *args) -> Any:
+        """
+        Await ``service.<method>(*args)``.
+
+        In process mode the service is pickled (without its repository and
+        engine, see BaseService.__getstate__) and runs against the worker's
+        own PresidioUtility.
+        """
+        if self.is_process_mode:
+            return await self._submit(stage, _run_service_stage, service, method, args)
+        return await self._submit(stage, getattr(service, method), *args, engine=service.presidio)
+
+    async def run_presidio_stage(self, stage: str, presidio, method: str, *args) -> Any:
+        """Await ``presidio.<method>(*args)`` (the worker's engine in process mode)."""
+        if self.is_process_mode:
+            return await self._submit(stage, _run_presidio_stage, method, args)
+        return await self._submit(stage, getattr(presidio, method), *args, engine=presidio)
+
+    async def run_pooled_presidio_stage(self, stage: str, method: str, *args) -> Any:
+        """
+        Await ``PresidioUtility.<method>(*args)`` on an engine held for this
+        call only: the worker's in process mode, otherwise a warm one
+        borrowed from the PresidioEnginePool. For long-lived streams and
+        sessions, which must not keep an engine between calls.
+        """
+        if self.is_process_mode:
+            return await self._submit(stage, _run_presidio_stage, method, args)
+        async with self.engine() as presidio:
+            return await self._submit(stage, getattr(presidio, method), *args, engine=presidio)
+
+    @asynccontextmanager
+    async def engine(self) -> AsyncIterator[Optional[Any]]:
+        """
+        Engine for the stages run inside the block: a warm one borrowed from
+        the PresidioEnginePool and returned on exit, or None in process mode,
+        where every worker has its own.
+        """
+        if self.is_process_mode:
+            yield None
+            return
+        async with get_engine_pool().checkout_async() as presidio:
+            yield presidio
+
+    async def detect_pii(self, presidio, text: str, language: str, country: str) -> List:
+        """
+        Await PII detection for *text*.
+
+        In process mode, texts above the configured chunk size are split in
+        this process and the chunks are analyzed concurrently on all workers,
+        then merged exactly (see PresidioUtility.merge_chunk_entities).
+        """
+        if self.is_process_mode:
+            config = engine_config()
+            if len(text) > config["chunk_size"]:
+                from utility.PresidioUtility import PresidioUtility
+
+                chunks = create_chunks(text, config["chunk_size"], config["chunk_overlap"])
+                logger.info(f"Analyzing {len(chunks)} chunks across {self.workers} workers")
+                per_chunk = await asyncio.gather(*(
+                    self._submit("detect", _run_presidio_stage, "analyze_chunk", (chunk, language, country))
+                    for chunk in chunks
+                ))
+                return PresidioUtility.merge_chunk_entities(
+                    [entity for chunk_entities in per_chunk for entity in chunk_entities]
+                )
+        return await self.run_presidio_stage("detect", presidio, "detect_pii", text, language, country)
+
+    async def run_blocking(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run blocking I/O (database, network) on the default thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(fn, *args, **kwargs))
+
+    async def _submit(self, stage: str, fn: Callable, *args, engine: Any = None) -> Any:
+        """
+        Await ``fn(*args)`` with the stage's timeout.
+
+        *engine* is the pooled engine a thread-mode stage runs on; if the
+        stage times out it stays out of the pool until the thread is done.
+        """
+        loop = asyncio.get_running_loop()
+        timeout = self.stage_timeouts.get(stage, DEFAULT_STAGE_TIMEOUT_S)
+        finished: Optional[Future] = None
+        if self.is_process_mode:
+            future = loop.run_in_executor(self.process_executor, fn, *args)
+        else:
+            finished = Future()
+            future = loop.run_in_executor(None, _signalling, fn, args, finished)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            # The stage keeps running (it cannot be interrupted): only the
+            # wait ends. Its result is discarded when it finishes.
+            if engine is not None and finished is not None:
+                get_engine_pool().hold_until(engine, finished)
+            raise GatewayTimeoutException(f"{stage} stage exceeded {timeout:.0f}s")
+        except BrokenProcessPool:
+            logger.error(f"Execution pool broke during {stage} stage, restarting")
+            self.stop()
+            raise ServiceUnavailableException(f"{stage} stage worker crashed")
+
+
+def _signalling(fn: Callable, args: tuple, finished: Future) -> Any:
+    """Run ``fn(*args)`` on a thread, completing *finished* when it returns or raises."""
+    try:
+        return fn(*args)
+    finally:
+        finished.set_result(None)
+
+
+# ============================================================
+# Process-wide instance
+# ============================================================
+_pool: Optional[ExecutionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_execution_pool() -> ExecutionPool:
+    """Return the process-wide execution pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ExecutionPool()
+    return _pool
@@ -0,0 +1,108 @@
+"""
+Replace many literal strings in one pass over a text.
+
+A ``{literal: replacement}`` map (PII values to tags, or tags to decrypted
+values) is compiled once into an Aho-Corasick automaton; each text is then
+scanned once, whatever the number of literals, instead of once per literal
+with str.replace(). Matches are chosen leftmost-longest: of overlapping
+literals the one starting first wins, and of those starting at the same
+place the longest ("John Smith" before "John"). Replacements are never
+rescanned, so a replacement containing another literal is left as it is.
+
+While the automaton is at its root, the scan jumps with a regex to the next
+character that can start a literal, so sparse matches (tags in a document)
+cost little more than a str.find().
+"""
+from typing import Dict, Iterator, List, Mapping, Tuple
+import re
+
+from utility.DocumentModel import Span, apply_spans
+
+
+class LiteralReplacer:
+    """Leftmost-longest multi-literal matcher and replacer."""
+
+    __slots__ = ("replacements", "_goto", "_fail", "_length", "_output", "_first")
+
+    def __init__(self, replacements: Mapping[str, str]):
+        """
+        Args:
+            replacements: Literal -> replacement; empty literals are ignored
+        """
+        self.replacements: Dict[str, str] = {k: v for k, v in replacements.items() if k}
+        # Trie: transitions per state; _length is the length of the literal
+        # ending at a state (0: none)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._length: List[int] = [0]
+        for literal in self.replacements:
+            state = 0
+            for ch in literal:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append({})
+                    self._length.append(0)
+                state = next_state
+            self._length[state] = len(literal)
+
+        # Failure links (longest proper suffix that is a trie state) and
+        # output links (nearest state on the failure chain ending a literal),
+        # breadth first so a state's links are known before its children's
+        self._fail: List[int] = [0] * len(self._goto)
+        self._output: List[int] = [0] * len(self._goto)
+        queue = list(self._goto[0].values())
+        for state in queue:
+            fail = self._fail[state]
+            self._output[state] = fail if self._length[fail] else self._output[fail]
+            for ch, child in self._goto[state].items():
+                queue.append(child)
+                fallback = fail
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(ch, 0)
+
+        first = "".join(sorted(self._goto[0]))
+        self._first = re.compile(f"[{re.escape(first)}]") if first else None
+
+    def __len__(self) -> int:
+        return len(self.replacements)
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Every occurrence ``(start, end)`` of every literal, ordered by end."""
+        if self._first is None:
+            return
+        goto, fail, length, output = self._goto, self._fail, self._length, self._output
+        search = self._first.search
+        state = 0
+        i = 0
+        n = len(text)
+        while i < n:
+            if not state:
+                m = search(text, i)
+                if m is None:
+                    return
+                i = m.start()
+            ch = text[i]
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            i += 1
+            match = state if length[state] else output[state]
+            while match:
+                yield i - length[match], i
+                match = output[match]
+
+    def spans(self, text: str) -> List[Span]:
+        """Leftmost-longest, non-overlapping ``(start, end, replacement)``, ordered by start."""
+        chosen: List[Span] = []
+        pos = 0
+        for start, end in sorted(self.finditer(text), key=lambda m: (m[0], -m[1])):
+            if start >= pos:
+                chosen.append((start, end, self.replacements[text[start:end]]))
+                pos = end
+        return chosen
+
+    def replace(self, text: str) -> str:
+        """*text* with every literal replaced."""
+        return apply_spans(text, self.spans(text))
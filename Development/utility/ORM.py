@@ -60,3 +60,30 @@ class PIIDetailsRecord(Base):
     modified_at = Column(TIMESTAMP, nullable=False, server_default=func.now(), onupdate=func.now())
     modified_by = Column(String, nullable=True)
     is_active = Column(Boolean, nullable=False, default=True)
+
+
+class PIIJobRecord(Base):
+    """Asynchronous PII processing jobs submitted via /v1/jobs"""
+    __tablename__ = "pii_jobs"
+
+    job_id = Column(String, primary_key=True, nullable=False)
+    status = Column(String(20), nullable=False)  # queued, running, succeeded, failed
+    assessment_id = Column(String, nullable=False)
+    prospect_id = Column(String, nullable=False)
+    caller_name = Column(String(255), nullable=False)
+    input_type = Column(String(50), nullable=False)
+    filename = Column(String(500), nullable=False)
+    source_path = Column(Text, nullable=False)  # Persisted upload, removed when the job ends
+    company_name = Column(String(255), nullable=True)
+    company_website = Column(String(2083), nullable=True)
+    callback_url = Column(String(2083), nullable=True)
+    request_id = Column(String, nullable=True)  # pii_details row written by the job
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    owner = Column(String(255), nullable=True)  # JobService instance that holds the job
+    lease_expires_at = Column(TIMESTAMP, nullable=True)  # UTC; once past, another instance may claim the job
+    created_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
+    created_by = Column(String, nullable=True)
+    modified_at = Column(TIMESTAMP, nullable=False, server_default=func.now(), onupdate=func.now())
+    modified_by = Column(String, nullable=True)
+    is_active = Column(Boolean, nullable=False, default=True)
@@ -0,0 +1,129 @@
+"""
+Offline country resolution – answers country detection without Tavily.
+
+Checked in order, all in memory:
+
+    1. the bundled gazetteer's domain table (company_website host)
+    2. the bundled gazetteer's company table (normalized company_name)
+    3. the website's country-code TLD (".co.uk" -> United Kingdom)
+
+Generic TLDs (.com, .io, ...) say nothing about the country, so they fall
+through to the Tavily lookup. Only countries in SUPPORTED_COUNTRIES are
+ever returned.
+"""
+from typing import Dict, NamedTuple, Optional
+import json
+import os
+import threading
+import logging
+
+from utility.country_pii_config import SUPPORTED_COUNTRIES
+from utility.CountryCache import normalize_company_name, normalize_website
+
+logger = logging.getLogger(__name__)
+
+COMPANY_GAZETTEER_PATH = os.getenv(
+    "COMPANY_GAZETTEER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "company_gazetteer.json"),
+)
+OFFLINE_COUNTRY_RESOLVER_ENABLED = os.getenv("OFFLINE_COUNTRY_RESOLVER_ENABLED", "true").lower() == "true"
+
+# Country-code TLDs of the supported countries (".us" is rare but unambiguous)
+CCTLD_COUNTRIES: Dict[str, str] = {
+    "ca": "Canada",
+    "mx": "Mexico",
+    "us": "United States",
+    "uk": "United Kingdom",
+    "de": "Germany",
+    "fr": "France",
+    "ae": "UAE",
+    "sa": "Saudi Arabia",
+    "za": "South Africa",
+    "jp": "Japan",
+    "in": "India",
+    "au": "Australia",
+    "sg": "Singapore",
+    "my": "Malaysia",
+}
+
+
+class OfflineMatch(NamedTuple):
+    country: str
+    source: str  # "gazetteer_domain", "gazetteer_company" or "cctld"
+
+
+class OfflineCountryResolver:
+    """Gazetteer and ccTLD lookups for company -> country."""
+
+    def __init__(self, gazetteer_path: Optional[str] = COMPANY_GAZETTEER_PATH):
+        """
+        Args:
+            gazetteer_path: JSON file with "companies" and "domains" tables
+                (None resolves from ccTLDs only)
+        """
+        self.companies: Dict[str, str] = {}
+        self.domains: Dict[str, str] = {}
+        if gazetteer_path:
+            self._load(gazetteer_path)
+
+    def _load(self, path: str) -> None:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Company gazetteer not loaded ({path}): {e}")
+            return
+
+        for name, country in data.get("companies", {}).items():
+            if country in SUPPORTED_COUNTRIES:
+                self.companies[normalize_company_name(name)] = country
+        for domain, country in data.get("domains", {}).items():
+            if country in SUPPORTED_COUNTRIES:
+                self.domains[normalize_website(domain)] = country
+        logger.info(
+            f"Company gazetteer loaded: {len(self.companies)} companies, {len(self.domains)} domains"
+        )
+
+    def resolve(self, company_name: Optional[str], company_website: Optional[str]) -> Optional[OfflineMatch]:
+        """Return the offline answer for a company, or None when Tavily is needed."""
+        host = normalize_website(company_website)
+        if host:
+            country = self._match_domain(host)
+            if country:
+                return OfflineMatch(country, "gazetteer_domain")
+
+        name = normalize_company_name(company_name)
+        if name and name in self.companies:
+            return OfflineMatch(self.companies[name], "gazetteer_company")
+
+        if host:
+            country = CCTLD_COUNTRIES.get(host.rsplit(".", 1)[-1])
+            if country:
+                return OfflineMatch(country, "cctld")
+        return None
+
+    def _match_domain(self, host: str) -> Optional[str]:
+        # "careers.rbc.com" matches the "rbc.com" entry
+        labels = host.split(".")
+        for i in range(len(labels) - 1):
+            country = self.domains.get(".".join(labels[i:]))
+            if country:
+                return country
+        return None
+
+
+# ============================================================
+# Process-wide instance
+# ============================================================
+_resolver: Optional[OfflineCountryResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def get_offline_country_resolver() -> OfflineCountryResolver:
+    """Return the process-wide resolver, loading the gazetteer on first use."""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = OfflineCountryResolver()
+    return _resolver
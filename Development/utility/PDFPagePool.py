@@ -0,0 +1,208 @@
+"""
+Page-parallel extraction and redaction for large PDFs.
+
+A PDF with PDF_PARALLEL_MIN_PAGES pages or more is split into contiguous page
+ranges, one per worker process. Every worker opens the same file on disk
+(MuPDF reads it lazily, so the OS page cache is shared instead of the bytes
+being pickled to each worker) and handles only its range:
+
+    extraction  ->  lines + character geometry of its pages
+    redaction   ->  its pages redacted, returned as a standalone PDF
+
+The parent reassembles extraction results in page order and merges the
+redacted shards with insert_pdf(), so the extracted text is identical to a
+sequential run and the merged output is byte-for-byte stable across runs.
+
+The pool is separate from the ExecutionPool (whose workers may be the ones
+calling it) and is started lazily in whichever process needs it.
+PDF_PARALLEL_WORKERS is a budget for the whole node: in process mode every
+ExecutionPool worker runs the PDF stages and starts its own pool, so each
+gets an equal share of the budget (see pdf_workers_per_process()) and a
+node never runs more than PDF_PARALLEL_WORKERS PDF processes on top of the
+EXECUTION_POOL_WORKERS NLP workers. A share of one process or less keeps
+PDFs sequential in that worker: the execution pool already uses the cores.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import logging
+
+from utility.pdf_pages import (
+    PageLines,
+    RedactionPlan,
+    extract_pages,
+    fitz,
+    merge_ranges,
+    redact_pages,
+    save_range,
+    shard_ranges,
+)
+
+logger = logging.getLogger(__name__)
+
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "200"))
+# For the whole node, shared by the processes running the PDF stages
+PDF_PARALLEL_WORKERS = int(os.getenv("PDF_PARALLEL_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Never hand a worker fewer pages than this
+PDF_MIN_PAGES_PER_SHARD = int(os.getenv("PDF_MIN_PAGES_PER_SHARD", "50"))
+# Same settings as the ExecutionPool, read here so workers never import the NLP stack
+EXECUTION_POOL_WORKERS = int(os.getenv("EXECUTION_POOL_WORKERS", "0"))
+PDF_PARALLEL_START_METHOD = os.getenv(
+    "EXECUTION_POOL_START_METHOD",
+    "spawn" if sys.platform == "win32" else "forkserver",
+)
+
+
+def pdf_workers_per_process(budget: Optional[int] = None, execution_workers: Optional[int] = None) -> int:
+    """
+    Page-pool workers for one process running the PDF stages.
+
+    In thread mode only this process runs them and gets the whole *budget*
+    (default PDF_PARALLEL_WORKERS); in process mode each of the
+    *execution_workers* (default EXECUTION_POOL_WORKERS) gets an equal share.
+    """
+    budget = PDF_PARALLEL_WORKERS if budget is None else budget
+    execution_workers = EXECUTION_POOL_WORKERS if execution_workers is None else execution_workers
+    if execution_workers <= 0:
+        return max(0, budget)
+    return max(0, budget) // execution_workers
+
+
+# ============================================================
+# Worker-side task functions (must be module-level to pickle)
+# ============================================================
+def _extract_range(path: str, first: int, stop: int) -> PageLines:
+    with fitz.open(path) as doc:
+        return extract_pages(doc, first, stop)
+
+
+def _redact_range(path: str, first: int, stop: int, plan: RedactionPlan) -> Tuple[bytes, int]:
+    """Redact pages ``[first, stop)`` and return them as a standalone PDF."""
+    with fitz.open(path) as doc:
+        redactions = redact_pages(doc, plan)
+        return save_range(doc, first, stop), redactions
+
+
+class PDFPagePool:
+    """Splits large PDFs into page ranges processed by worker processes."""
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        min_pages: int = PDF_PARALLEL_MIN_PAGES,
+        min_pages_per_shard: int = PDF_MIN_PAGES_PER_SHARD,
+        start_method: str = PDF_PARALLEL_START_METHOD,
+    ):
+        """
+        Args:
+            workers: Number of worker processes; 1 or less disables the pool
+                     (default: this process's share, pdf_workers_per_process())
+            min_pages: Page count from which a document is processed in parallel
+            min_pages_per_shard: Smallest page range handed to one worker
+            start_method: multiprocessing start method for the workers
+        """
+        self.workers = max(0, pdf_workers_per_process() if workers is None else workers)
+        self.min_pages = max(1, min_pages)
+        self.min_pages_per_shard = max(1, min_pages_per_shard)
+        self.start_method = start_method
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context(self.start_method),
+                    )
+        return self._executor
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def health(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "min_pages": self.min_pages,
+            "running": self._executor is not None,
+        }
+
+    # ------------------------------------------------------------------
+    # Sharding
+    # ------------------------------------------------------------------
+    def shards(self, page_count: int) -> List[Tuple[int, int]]:
+        """Page ranges for a document, or [] when it should stay sequential."""
+        if self.workers <= 1 or page_count < self.min_pages:
+            return []
+        count = min(self.workers, page_count // self.min_pages_per_shard)
+        if count <= 1:
+            return []
+        return shard_ranges(page_count, count)
+
+    def extract(self, path: str, ranges: List[Tuple[int, int]]) -> PageLines:
+        """Lines and geometry of every page of *path*, in page order."""
+        started = time.time()
+        parts = self._map(_extract_range, [(path, first, stop) for first, stop in ranges])
+        logger.info(f"Extracted {ranges[-1][1]} PDF pages in {len(ranges)} shards in {time.time() - started:.2f}s")
+        return [page for part in parts for page in part]
+
+    def redact(self, path: str, ranges: List[Tuple[int, int]], plan: RedactionPlan, out_path: str) -> int:
+        """
+        Redact *path* shard by shard and write the merged document to *out_path*.
+
+        Returns:
+            Number of redactions applied
+        """
+        started = time.time()
+        tasks = []
+        for first, stop in ranges:
+            shard_plan = {page_num: rects for page_num, rects in plan.items() if first <= page_num < stop}
+            tasks.append((path, first, stop, shard_plan))
+        parts = self._map(_redact_range, tasks)
+        merge_ranges(path, (shard_bytes for shard_bytes, _ in parts), out_path)
+
+        redactions = sum(count for _, count in parts)
+        logger.info(f"Redacted {len(ranges)} PDF shards in {time.time() - started:.2f}s")
+        return redactions
+
+    def _map(self, fn, tasks: List[tuple]) -> list:
+        executor = self._get_executor()
+        futures = [executor.submit(fn, *task) for task in tasks]
+        try:
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            logger.error("PDF page pool broke, restarting")
+            self.stop()
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+# ============================================================
+# Process-wide instance
+# ============================================================
+_pool: Optional[PDFPagePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pdf_page_pool() -> PDFPagePool:
+    """Return the process-wide PDF page pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PDFPagePool()
+    return _pool
@@ -0,0 +1,409 @@
+"""
+Process-wide pool of warm PresidioUtility engines.
+
+Constructing a PresidioUtility loads the spaCy model, builds a new
+AnonymizerEngine and registers every custom recognizer, which costs seconds
+per call. The pool builds its engines once at startup, checks one out per
+request, health-checks idle engines in the background and rebuilds the whole
+pool (off the request path) when the engine configuration changes.
+
+checkout_async() waits for an engine on the event loop, not on a thread:
+the default thread pool runs the stages of the requests holding engines,
+and requests queued for one must not take its threads.
+"""
+from collections import deque
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Iterator, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import weakref
+import logging
+
+from utility.PresidioUtility import PresidioUtility
+from utility.exceptions import ServiceUnavailableException
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv("PRESIDIO_POOL_SIZE", "2"))
+CHECKOUT_TIMEOUT_S = float(os.getenv("PRESIDIO_POOL_CHECKOUT_TIMEOUT_S", "30"))
+WATCH_INTERVAL_S = float(os.getenv("PRESIDIO_POOL_WATCH_INTERVAL_S", "60"))
+
+# Small probe run against idle engines; it only has to complete without error.
+_HEALTH_PROBE_TEXT = "Contact John Smith at john.smith@example.com or 212-555-0100."
+
+
+def engine_config() -> Dict:
+    """
+    Read the engine configuration from the environment.
+
+    Re-read on every watcher tick so that a changed value triggers a rebuild.
+    """
+    return {
+        "chunk_size": int(os.getenv("PRESIDIO_CHUNK_SIZE", "900000")),
+        "chunk_overlap": int(os.getenv("PRESIDIO_CHUNK_OVERLAP", "500")),
+    }
+
+
+def _fingerprint(config: Dict) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class _PooledEngine:
+    """A PresidioUtility plus the pool generation it was built for."""
+
+    __slots__ = ("presidio", "generation", "created_at")
+
+    def __init__(self, presidio: PresidioUtility, generation: int):
+        self.presidio = presidio
+        self.generation = generation
+        self.created_at = time.time()
+
+
+class PresidioEnginePool:
+    """
+    Fixed-size pool of pre-built PresidioUtility instances.
+
+    Usage:
+        with get_engine_pool().checkout() as presidio:
+            entities = presidio.detect_pii(text, country=country)
+    """
+
+    def __init__(
+        self,
+        size: int = POOL_SIZE,
+        config_provider: Callable[[], Dict] = engine_config,
+        factory: Optional[Callable[[Dict], PresidioUtility]] = None,
+        watch_interval_s: float = WATCH_INTERVAL_S,
+    ):
+        """
+        Args:
+            size: Number of engines kept warm
+            config_provider: Returns the current engine configuration
+            factory: Builds one engine from a configuration dict
+                     (default: PresidioUtility(**config))
+            watch_interval_s: Seconds between health checks / config checks
+        """
+        self.size = max(1, size)
+        self.config_provider = config_provider
+        self.factory = factory or (lambda config: PresidioUtility(**config))
+        self.watch_interval_s = watch_interval_s
+
+        self._idle: "queue.LifoQueue[_PooledEngine]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        # checkout_async() callers waiting for a release, oldest first
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._waiters_lock = threading.Lock()
+        # Engines still running a stage their borrower stopped waiting for
+        self._held: "weakref.WeakKeyDictionary[PresidioUtility, Future]" = weakref.WeakKeyDictionary()
+        self._generation = 0
+        self._fingerprint: Optional[str] = None
+        self._started = False
+        self._rebuilding = False
+        self._last_health_check: Optional[float] = None
+        self._unhealthy_replaced = 0
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        """Build every engine synchronously and start the background watcher."""
+        with self._lock:
+            if self._started:
+                return
+            config = self.config_provider()
+            started = time.time()
+            for _ in range(self.size):
+                self._idle.put(_PooledEngine(self.factory(config), self._generation))
+            self._fingerprint = _fingerprint(config)
+            self._started = True
+            logger.info(
+                f"Presidio engine pool warmed: {self.size} engine(s) in "
+                f"{time.time() - started:.1f}s"
+            )
+
+        if self.watch_interval_s > 0:
+            self._stop.clear()
+            self._watcher = threading.Thread(
+                target=self._watch, name="presidio-pool-watcher", daemon=True
+            )
+            self._watcher.start()
+
+    def stop(self) -> None:
+        """Stop the watcher and drop all idle engines."""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+        with self._lock:
+            self._drain(lambda engine: True)
+            self._started = False
+
+    # ------------------------------------------------------------------
+    # Checkout
+    # ------------------------------------------------------------------
+    @contextmanager
+    def checkout(self, timeout: Optional[float] = None) -> Iterator[PresidioUtility]:
+        """
+        Borrow an engine for the duration of the ``with`` block.
+
+        Raises:
+            ServiceUnavailableException: If no engine frees up within *timeout*
+        """
+        if not self._started:
+            self.start()
+
+        engine = self._acquire(CHECKOUT_TIMEOUT_S if timeout is None else timeout)
+        try:
+            yield engine.presidio
+        finally:
+            self._release(engine)
+
+    @asynccontextmanager
+    async def checkout_async(self, timeout: Optional[float] = None) -> AsyncIterator[PresidioUtility]:
+        """
+        Async variant of checkout(): waits on the event loop, without a thread.
+
+        A task cancelled while waiting takes no engine; one cancelled while
+        holding it returns it like any other exit from the block.
+        """
+        if not self._started:
+            await asyncio.get_running_loop().run_in_executor(None, self.start)
+
+        engine = await self._acquire_async(CHECKOUT_TIMEOUT_S if timeout is None else timeout)
+        try:
+            yield engine.presidio
+        finally:
+            self._release(engine)
+
+    def _acquire(self, timeout: float) -> _PooledEngine:
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                engine = self._idle.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                raise ServiceUnavailableException(
+                    f"No Presidio engine available within {timeout:.0f}s"
+                )
+            # Engines from a superseded generation are dropped on sight
+            if engine.generation == self._generation:
+                return engine
+
+    def _try_acquire(self) -> Optional[_PooledEngine]:
+        while True:
+            try:
+                engine = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            if engine.generation == self._generation:
+                return engine
+
+    async def _acquire_async(self, timeout: float) -> _PooledEngine:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            engine = self._try_acquire()
+            if engine is not None:
+                return engine
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise ServiceUnavailableException(
+                    f"No Presidio engine available within {timeout:.0f}s"
+                )
+            waiter = loop.create_future()
+            with self._waiters_lock:
+                self._waiters.append((loop, waiter))
+            try:
+                # An engine released before the waiter was registered woke nobody
+                engine = self._try_acquire()
+                if engine is not None:
+                    return engine
+                await asyncio.wait((waiter,), timeout=remaining)
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    # Woken, but cancelled before taking the engine: pass it on
+                    self._wake_one()
+                raise
+            finally:
+                with self._waiters_lock:
+                    try:
+                        self._waiters.remove((loop, waiter))
+                    except ValueError:
+                        pass
+                # A wake still on its way goes to the next waiter (see _notify)
+                waiter.cancel()
+
+    def _wake_one(self) -> None:
+        """Wake the longest-waiting checkout_async() caller, if any."""
+        while True:
+            with self._waiters_lock:
+                if not self._waiters:
+                    return
+                loop, waiter = self._waiters.popleft()
+            try:
+                loop.call_soon_threadsafe(self._notify, waiter)
+                return
+            except RuntimeError:
+                continue  # its loop is closed
+
+    def _notify(self, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            # Gave up in the meantime: the release goes to the next waiter
+            self._wake_one()
+        else:
+            waiter.set_result(None)
+
+    def hold_until(self, presidio: PresidioUtility, finished: Future) -> None:
+        """
+        Keep *presidio* out of the pool until *finished* is done.
+
+        For a stage that timed out while still running on a thread: the
+        engine must not be lent to the next request until that stage ends.
+        """
+        with self._waiters_lock:
+            self._held[presidio] = finished
+
+    def _release(self, engine: _PooledEngine) -> None:
+        with self._waiters_lock:
+            finished = self._held.pop(engine.presidio, None)
+        if finished is not None and not finished.done():
+            logger.warning("Presidio engine still running a timed-out stage, returned when it ends")
+            finished.add_done_callback(lambda _: self._release(engine))
+            return
+        if engine.generation == self._generation and self._started:
+            self._idle.put(engine)
+            self._wake_one()
+
+    # ------------------------------------------------------------------
+    # Health & reconfiguration
+    # ------------------------------------------------------------------
+    def health(self) -> Dict:
+        """Snapshot of the pool state for the /health endpoint."""
+        return {
+            "started": self._started,
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "generation": self._generation,
+            "rebuilding": self._rebuilding,
+            "last_health_check": self._last_health_check,
+            "unhealthy_replaced": self._unhealthy_replaced,
+        }
+
+    def check_health(self) -> int:
+        """
+        Probe idle engines and replace the ones that fail.
+
+        Engines that are checked out are left alone; they are probed on a
+        later tick. Every engine taken off the queue goes back, whatever the
+        probe or the rebuild raises; an engine that could not be rebuilt is
+        kept and probed again next tick. Returns the number of engines replaced.
+        """
+        replaced = 0
+        probed = []
+        try:
+            for _ in range(self._idle.qsize()):
+                try:
+                    engine = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if engine.generation != self._generation:
+                    continue
+                probed.append(engine)
+                try:
+                    engine.presidio.detect_pii(_HEALTH_PROBE_TEXT)
+                except Exception as e:
+                    logger.warning(f"Presidio engine failed health check, rebuilding: {e}")
+                    try:
+                        probed[-1] = _PooledEngine(self.factory(self.config_provider()), self._generation)
+                        replaced += 1
+                    except Exception as build_error:
+                        logger.error(f"Presidio engine rebuild failed, retrying next check: {build_error}")
+        finally:
+            for engine in probed:
+                self._release(engine)
+            self._last_health_check = time.time()
+            self._unhealthy_replaced += replaced
+        return replaced
+
+    def reload_if_changed(self) -> bool:
+        """Rebuild the pool if the engine configuration changed. Returns True if rebuilt."""
+        config = self.config_provider()
+        if _fingerprint(config) == self._fingerprint:
+            return False
+        self.rebuild(config)
+        return True
+
+    def rebuild(self, config: Optional[Dict] = None) -> None:
+        """
+        Build a fresh generation of engines and swap it in.
+
+        Requests keep using the current generation while the new engines are
+        built; engines of the old generation are discarded once returned.
+        """
+        config = config or self.config_provider()
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        try:
+            logger.info(f"Rebuilding Presidio engine pool with config {config}")
+            next_generation = self._generation + 1
+            fresh = [
+                _PooledEngine(self.factory(config), next_generation)
+                for _ in range(self.size)
+            ]
+            with self._lock:
+                self._generation = next_generation
+                self._fingerprint = _fingerprint(config)
+                self._drain(lambda engine: engine.generation != next_generation)
+                for engine in fresh:
+                    self._idle.put(engine)
+                    self._wake_one()
+            logger.info(f"Presidio engine pool now at generation {next_generation}")
+        finally:
+            self._rebuilding = False
+
+    def _drain(self, should_drop: Callable[[_PooledEngine], bool]) -> None:
+        keep = []
+        while True:
+            try:
+                engine = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if not should_drop(engine):
+                keep.append(engine)
+        for engine in keep:
+            self._idle.put(engine)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.watch_interval_s):
+            try:
+                if not self.reload_if_changed():
+                    self.check_health()
+            except Exception as e:
+                logger.error(f"Presidio engine pool watcher error: {e}", exc_info=True)
+
+
+# ============================================================
+# Process-wide instance
+# ============================================================
+_pool: Optional[PresidioEnginePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_engine_pool() -> PresidioEnginePool:
+    """Return the process-wide engine pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PresidioEnginePool()
+    return _pool
@@ -6,17 +6,26 @@ plus programmatically registered custom recognizers for entities not in Presidio
 from presidio_analyzer import AnalyzerEngine, RecognizerResult
 from presidio_anonymizer import AnonymizerEngine
 from presidio_anonymizer.entities import OperatorConfig
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Sequence, Tuple
 import base64
 import os
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
 from utility.exceptions import PresidioException
 from utility.country_pii_config import (
-    get_entities_for_country,
     DEFAULT_COUNTRY,
+    SUPPORTED_COUNTRIES,
 )
+from utility.CountryProfile import CountryProfile, build_country_profile
 from utility.custom_recognizers import get_custom_recognizers
+from utility.LiteralReplacer import LiteralReplacer
+from utility.span_helpers import (
+    create_chunks,
+    merge_duplicate_spans,
+    original_spans,
+    owns_entity,
+    resolve_overlaps,
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -109,6 +118,11 @@ class PresidioUtility:
             # Chunking configuration
             self.chunk_size = chunk_size
             self.chunk_overlap = chunk_overlap
+
+            # Pre-resolve a detection profile for every supported country
+            self._profiles: Dict[Tuple[str, str], CountryProfile] = {}
+            for country in SUPPORTED_COUNTRIES:
+                self.get_country_profile(country)
             
             logger.info("Presidio engines initialised")
             logger.info(f"Loaded {len(self.analyzer.registry.recognizers)} recognizers "
@@ -117,6 +131,31 @@ class PresidioUtility:
         except Exception as e:
             raise PresidioException(f"Failed to initialise Presidio: {e}")
 
+    # ------------------------------------------------------------------
+    # Country profiles
+    # ------------------------------------------------------------------
+    def get_country_profile(self, country: str, language: str = "en") -> CountryProfile:
+        """
+        Return the cached detection profile for *country*, building it on first use.
+        
+        Args:
+            country: Country name
+            language: Language code
+            
+        Returns:
+            CountryProfile with frozen entities, resolved recognizers and thresholds
+        """
+        key = (country, language)
+        profile = self._profiles.get(key)
+        if profile is None:
+            profile = build_country_profile(self.analyzer, country, language)
+            self._profiles[key] = profile
+        return profile
+
+    def profile_version(self, country: str, language: str = "en") -> str:
+        """Version hash of *country*'s profile; changes when its detection config changes."""
+        return self.get_country_profile(country, language).version
+
     # ------------------------------------------------------------------
     # Chunking Methods
     # ------------------------------------------------------------------
@@ -134,40 +173,54 @@ class PresidioUtility:
     
     def create_chunks(self, text: str) -> List[Dict]:
         """
-        Split text into overlapping chunks.
+        Split text into overlapping chunks on paragraph/sentence boundaries.
         
         Args:
             text: Text to split into chunks
             
         Returns:
-            List of chunk dictionaries with text and offset information
+            List of chunk dictionaries with text, offset and core-region
+            information (see utility.span_helpers.create_chunks)
+        """
+        chunks = create_chunks(text, self.chunk_size, self.chunk_overlap)
+        logger.info(f"Created {len(chunks)} chunks from {len(text):,} characters")
+        return chunks
+
+    def analyze_chunk(
+        self,
+        chunk_info: Dict,
+        language: str = "en",
+        country: str = DEFAULT_COUNTRY,
+    ) -> List[RecognizerResult]:
         """
-        chunks = []
-        text_length = len(text)
-        start = 0
-        chunk_num = 0
+        Analyze one chunk and return the entities it owns.
         
-        while start < text_length:
-            chunk_num += 1
-            end = min(start + self.chunk_size, text_length)
-            
-            chunk_info = {
-                'chunk_number': chunk_num,
-                'text': text[start:end],
-                'start_offset': start,
-                'end_offset': end,
-                'length': end - start
-            }
-            
-            chunks.append(chunk_info)
-            
-            # Move to next chunk with overlap
-            if end >= text_length:
-                break
-            start = end - self.chunk_overlap
+        Entity positions are adjusted to the original text. Entities that
+        start outside the chunk's core region are dropped; the neighbouring
+        chunk reports them.
         
-        logger.info(f"Created {len(chunks)} chunks from {text_length:,} characters")
-        return chunks
+        Args:
+            chunk_info: Chunk dictionary from create_chunks()
+            language: Language code
+            country: Country name for country-specific entities
+            
+        Returns:
+            List of owned entities with positions in the original text
+        """
+        profile = self.get_country_profile(country, language)
+        start_offset = chunk_info['start_offset']
+
+        owned = []
+        for entity in profile.analyze(chunk_info['text']):
+            entity.start += start_offset
+            entity.end += start_offset
+            if owns_entity(chunk_info, entity.start):
+                owned.append(entity)
+
+        logger.debug(f"Chunk {chunk_info['chunk_number']} "
+                     f"({chunk_info['core_start']:,}-{chunk_info['core_end']:,}): "
+                     f"{len(owned)} entities")
+        return owned
     
     def process_chunks(
         self,
@@ -176,7 +229,10 @@ class PresidioUtility:
         country: str = DEFAULT_COUNTRY
     ) -> List[RecognizerResult]:
         """
-        Process each chunk with Presidio and adjust entity positions.
+        Analyze every chunk and adjust entity positions.
+
+        Process mode spreads the chunks over the workers itself, see
+        ExecutionPool.detect_pii().
         
         Args:
             chunks: List of chunk dictionaries from create_chunks()
@@ -186,38 +242,9 @@ class PresidioUtility:
         Returns:
             List of all entities with positions adjusted to original text
         """
-        all_entities = []
-        entities_by_chunk = []
-        
-        for chunk_info in chunks:
-            chunk_num = chunk_info['chunk_number']
-            chunk_text = chunk_info['text']
-            start_offset = chunk_info['start_offset']
-            
-            # Get entity list for this country
-            entities = get_entities_for_country(country)
-            
-            # Detect PII in this chunk
-            chunk_entities = self.analyzer.analyze(
-                text=chunk_text,
-                language=language,
-                entities=entities,
-            )
-            
-            # Filter by score
-            chunk_entities = [e for e in chunk_entities if e.score >= 0.4 and e.entity_type in entities]
-            
-            # Adjust entity positions to match original text
-            for entity in chunk_entities:
-                entity.start += start_offset
-                entity.end += start_offset
-            
-            all_entities.extend(chunk_entities)
-            entities_by_chunk.append(len(chunk_entities))
-            
-            logger.debug(f"Chunk {chunk_num} ({start_offset:,}-{chunk_info['end_offset']:,}): "
-                        f"{len(chunk_entities)} entities")
-        
+        per_chunk = [self.analyze_chunk(chunk, language, country) for chunk in chunks]
+
+        all_entities = [entity for chunk_entities in per_chunk for entity in chunk_entities]
         logger.info(f"Processed {len(chunks)} chunks, found {len(all_entities)} entities total")
         return all_entities
     
@@ -228,9 +255,8 @@ class PresidioUtility:
         """
         Remove duplicate entities from overlapping regions.
         
-        Two entities are duplicates if they have:
-        - Same entity type
-        - Similar positions (within 5 characters)
+        Two entities are duplicates if they have the same entity type and
+        exactly the same span; the highest score is kept.
         
         Args:
             entities: List of entities (possibly with duplicates)
@@ -238,36 +264,29 @@ class PresidioUtility:
         Returns:
             Deduplicated list of entities
         """
-        if not entities:
-            return []
-        
-        # Sort by position and score (keep highest score for duplicates)
-        sorted_entities = sorted(
-            entities,
-            key=lambda x: (x.start, x.end, -x.score)
-        )
-        
-        deduplicated = []
-        seen_positions = set()
-        
-        for entity in sorted_entities:
-            # Create position key with tolerance (group nearby positions)
-            position_key = (
-                entity.entity_type,
-                entity.start // 5,  # Group positions within 5 chars
-                entity.end // 5
-            )
-            
-            if position_key not in seen_positions:
-                deduplicated.append(entity)
-                seen_positions.add(position_key)
-        
+        deduplicated = merge_duplicate_spans(entities)
+
         duplicates_removed = len(entities) - len(deduplicated)
         if duplicates_removed > 0:
             logger.info(f"Removed {duplicates_removed} duplicate entities from overlapping regions")
         
         return deduplicated
 
+    @staticmethod
+    def merge_chunk_entities(
+        entities: List[RecognizerResult],
+    ) -> List[RecognizerResult]:
+        """
+        Merge per-chunk results: drop exact duplicates, then resolve overlaps.
+        
+        Static so the API process can merge chunks analyzed by workers.
+        """
+        deduplicated = merge_duplicate_spans(entities)
+        duplicates_removed = len(entities) - len(deduplicated)
+        if duplicates_removed > 0:
+            logger.info(f"Removed {duplicates_removed} duplicate entities from overlapping regions")
+        return PresidioUtility._resolve_overlapping_entities(deduplicated)
+
     # ------------------------------------------------------------------
     # Detection
     # ------------------------------------------------------------------
@@ -282,10 +301,11 @@ class PresidioUtility:
         
         Automatically uses chunking for large documents to handle spaCy's
         max_length limit. Documents larger than chunk_size are split into
-        overlapping chunks, processed separately, and deduplicated.
+        overlapping chunks on sentence/paragraph boundaries, processed one
+        after the other and merged exactly.
         
-        Presidio automatically uses its built-in and custom recognizers based on
-        the entity list provided. No manual recognizer registration needed.
+        Detection runs through the country's cached CountryProfile, which holds
+        the pre-resolved recognizers and per-entity score thresholds.
         
         Args:
             text: Text to analyze
@@ -293,7 +313,7 @@ class PresidioUtility:
             country: Country name for country-specific entities
             
         Returns:
-            List of detected PII entities with scores >= 0.4
+            List of detected PII entities at or above the profile thresholds
         """
         try:
             if not text or not text.strip():
@@ -309,11 +329,8 @@ class PresidioUtility:
                 # Process chunks
                 all_entities = self.process_chunks(chunks, language, country)
                 
-                # Deduplicate entities from overlapping regions
-                results = self.deduplicate_entities(all_entities)
-                
-                # Resolve overlapping entities
-                resolved = self._resolve_overlapping_entities(results)
+                # Deduplicate exact repeats, then resolve overlapping entities
+                resolved = self.merge_chunk_entities(all_entities)
                 
                 logger.info(f"Detected {len(resolved)} PII entities for country={country} (chunked)")
                 return resolved
@@ -321,18 +338,9 @@ class PresidioUtility:
                 # Text is small enough, process normally
                 logger.debug(f"Text length ({len(text):,} chars) within chunk size, processing normally")
                 
-                # Get entity list for this country (9 common + 5 country-specific)
-                entities = get_entities_for_country(country)
-
-                # Presidio automatically uses the appropriate recognizers
-                results = self.analyzer.analyze(
-                    text=text,
-                    language=language,
-                    entities=entities,
-                )
-
-                # Filter by score and requested entities only
-                filtered = [e for e in results if e.score >= 0.4 and e.entity_type in entities]
+                # Cached profile: country entities, resolved recognizers, thresholds
+                profile = self.get_country_profile(country, language)
+                filtered = profile.analyze(text)
                 resolved = self._resolve_overlapping_entities(filtered)
                 logger.info(f"Detected {len(resolved)} PII entities for country={country}")
                 return resolved
@@ -340,6 +348,49 @@ class PresidioUtility:
         except Exception as e:
             raise PresidioException(f"PII detection failed: {e}")
 
+    def detect_pii_batch(
+        self,
+        texts: Sequence[str],
+        language: str = "en",
+        country: str = DEFAULT_COUNTRY,
+        contexts: Optional[Sequence[List[str]]] = None,
+    ) -> List[List[RecognizerResult]]:
+        """
+        Detect PII in each of *texts* separately (cell values, record fields).
+        
+        Every text is analyzed on its own, so no entity spans two of them,
+        but the NLP model processes them as one nlp.pipe() batch. Texts
+        longer than chunk_size go through detect_pii() (without context).
+        
+        Args:
+            texts: Texts to analyze
+            language: Language code
+            country: Country name for country-specific entities
+            contexts: Optional context words per text (e.g. its JSON key path)
+            
+        Returns:
+            One list of entities per text, with positions in that text
+        """
+        try:
+            results: List[List[RecognizerResult]] = [[] for _ in texts]
+            short = [i for i, text in enumerate(texts) if text.strip() and not self.should_chunk(text)]
+            if short:
+                profile = self.get_country_profile(country, language)
+                short_contexts = [contexts[i] for i in short] if contexts is not None else None
+                batch = profile.analyze_batch([texts[i] for i in short], short_contexts)
+                for i, entities in zip(short, batch):
+                    results[i] = self._resolve_overlapping_entities(entities)
+            for i, text in enumerate(texts):
+                if text.strip() and self.should_chunk(text):
+                    results[i] = self.detect_pii(text, language, country)
+            logger.info(f"Detected {sum(map(len, results))} PII entities in {len(texts)} texts "
+                        f"for country={country}")
+            return results
+        except PresidioException:
+            raise
+        except Exception as e:
+            raise PresidioException(f"PII detection failed: {e}")
+
     # ------------------------------------------------------------------
     # Anonymization
     # ------------------------------------------------------------------
@@ -348,7 +399,14 @@ class PresidioUtility:
         text: str,
         entities: List[RecognizerResult],
     ) -> Dict:
-        """Anonymize detected PII with consistent mapping + AES encryption."""
+        """
+        Anonymize detected PII with consistent mapping + AES encryption.
+
+        Returns:
+            Dict with anonymized_text, mapping, encryption_key, entities_count
+            and spans: the exact ``(start, end, tag)`` replacements in *text*
+            offsets, ordered by start, for builders that mask by location
+        """
         try:
             if not entities:
                 return {
@@ -356,38 +414,70 @@ class PresidioUtility:
                     "mapping": {},
                     "encryption_key": "",
                     "entities_count": 0,
+                    "spans": [],
                 }
 
             encryption_key = os.urandom(16).hex()
             mapper = ConsistentAnonymizer(crypto_key=encryption_key)
-
-            entity_types = {e.entity_type for e in entities}
-            operators = {
-                et: OperatorConfig(
-                    "custom",
-                    {"lambda": lambda val, _et=et: mapper.operator_logic(val, _et)},
-                )
-                for et in entity_types
-            }
-
-            result = self.anonymizer.anonymize(
-                text=text,
-                analyzer_results=entities,
-                operators=operators,
-            )
+            anonymized_text, spans = self.anonymize_segment(mapper, text, entities)
 
             mapping = mapper.get_mapping_with_metadata(entities)
             logger.info(f"Anonymised {len(mapping)} unique PII values")
 
             return {
-                "anonymized_text": result.text,
+                "anonymized_text": anonymized_text,
                 "mapping": mapping,
                 "encryption_key": encryption_key,
                 "entities_count": len(entities),
+                "spans": spans,
             }
         except Exception as e:
             raise PresidioException(f"Anonymization failed: {e}")
 
+    def anonymize_segment(
+        self,
+        mapper: ConsistentAnonymizer,
+        text: str,
+        entities: List[RecognizerResult],
+    ) -> Tuple[str, List[Tuple[int, int, str]]]:
+        """
+        Anonymize *text* with tags from *mapper*.
+
+        Sharing one mapper across calls keeps tags consistent across the
+        segments of a document processed piece by piece.
+
+        Returns:
+            The anonymized text and the ``(start, end, tag)`` replacements in
+            *text* offsets, ordered by start
+        """
+        if not entities:
+            return text, []
+
+        entity_types = {e.entity_type for e in entities}
+        operators = {
+            et: OperatorConfig(
+                "custom",
+                {"lambda": lambda val, _et=et: mapper.operator_logic(val, _et)},
+            )
+            for et in entity_types
+        }
+
+        result = self.anonymizer.anonymize(
+            text=text,
+            analyzer_results=entities,
+            operators=operators,
+        )
+
+        tag_to_value = {tag: value for value, tag in mapper.value_to_tag.items()}
+        spans = original_spans(
+            [(item.start, item.end, item.text) for item in result.items], tag_to_value
+        )
+        # Fail closed: a span that does not cover its value would leave PII in place
+        for start, end, tag in spans:
+            if text[start:end] != tag_to_value[tag]:
+                raise PresidioException(f"Replacement for {tag} could not be located at {start}")
+        return result.text, spans
+
     # ------------------------------------------------------------------
     # Helpers
     # ------------------------------------------------------------------
@@ -395,31 +485,8 @@ class PresidioUtility:
     def _resolve_overlapping_entities(
         entities: List[RecognizerResult],
     ) -> List[RecognizerResult]:
-        """Resolve overlapping entities by prioritizing highest score."""
-        if not entities:
-            return []
-        
-        # Sort by position first, then by score (highest first)
-        sorted_ents = sorted(entities, key=lambda x: (x.start, x.end, -x.score))
-        
-        resolved: List[RecognizerResult] = []
-        for ent in sorted_ents:
-            # Check if this entity overlaps with any already resolved entity
-            overlaps = [r for r in resolved if ent.start < r.end and ent.end > r.start]
-            
-            if not overlaps:
-                # No overlap, add it
-                resolved.append(ent)
-            else:
-                # There's overlap - keep the one with higher score
-                for overlap in overlaps:
-                    if ent.score > overlap.score:
-                        # Replace lower score with higher score
-                        resolved.remove(overlap)
-                        resolved.append(ent)
-                        break
-        
-        return sorted(resolved, key=lambda x: x.start)
+        """Resolve overlapping entities by prioritizing highest score (O(n log n))."""
+        return resolve_overlaps(entities)
 
 
 # ============================================================
@@ -442,12 +509,12 @@ def decrypt_value(encrypted_blob: str, crypto_key: str) -> str:
 def deanonymize_text(
     anonymized_text: str, mapping: Dict, encryption_key: str
 ) -> str:
-    """Replace tags with decrypted original values."""
+    """Replace tags with decrypted original values (one pass, see LiteralReplacer)."""
     try:
-        result = anonymized_text
-        for tag, meta in mapping.items():
-            decrypted = decrypt_value(meta["encrypted_value"], encryption_key)
-            result = result.replace(tag, decrypted)
-        return result
+        values = {
+            tag: decrypt_value(meta["encrypted_value"], encryption_key)
+            for tag, meta in mapping.items()
+        }
+        return LiteralReplacer(values).replace(anonymized_text)
     except Exception as e:
         raise PresidioException(f"De-anonymization failed: {e}")
@@ -0,0 +1,252 @@
+"""
+Content-addressed cache of pipeline results.
+
+Identical uploads (same bytes, document type, country and detection-profile
+version) produce identical masked output, so the result of the heavy stages
+is kept on local disk and reused:
+
+    <RESULT_CACHE_PATH>/<entry key>/artifact<ext>   masked document
+    <RESULT_CACHE_PATH>/<entry key>/meta.json       output text, mapping, spans
+
+No plaintext PII is written. The mapping keeps its AES-encrypted values, and
+the key they were encrypted with is itself stored wrapped under a key derived
+from the document bytes, which only a caller holding the same upload can
+recompute. A hit re-encrypts every value under a fresh key, so each request
+still gets its own request_id, encryption key and repository row.
+
+Entries unused for RESULT_CACHE_TTL_S expire, and the least recently used
+ones are evicted once the cache exceeds RESULT_CACHE_MAX_MB.
+"""
+from typing import Dict, List, Optional
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import logging
+
+from utility.PresidioUtility import ConsistentAnonymizer, decrypt_value
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_PATH = os.getenv(
+    "RESULT_CACHE_PATH", os.path.join(tempfile.gettempdir(), "pii_result_cache")
+)
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", "1024"))
+RESULT_CACHE_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", str(7 * 24 * 3600)))
+
+# Bump when the masked output for the same input changes (builder changes)
+CACHE_FORMAT_VERSION = "5"
+
+_META = "meta.json"
+_ARTIFACT = "artifact"
+
+
+def content_digest(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _wrap_key(raw: bytes) -> str:
+    """Key protecting a cached entry's encryption key; needs the original bytes."""
+    return hashlib.sha256(b"pii-result-cache-wrap:" + raw).hexdigest()
+
+
+class ResultCache:
+    """Disk-backed LRU/TTL cache of masked artifacts and encrypted mappings."""
+
+    def __init__(
+        self,
+        path: str = RESULT_CACHE_PATH,
+        max_bytes: int = int(RESULT_CACHE_MAX_MB * 1024 * 1024),
+        ttl_s: float = RESULT_CACHE_TTL_S,
+        enabled: bool = RESULT_CACHE_ENABLED,
+    ):
+        """
+        Args:
+            path: Cache directory
+            max_bytes: Total size above which LRU entries are evicted
+            ttl_s: Seconds an unused entry is kept
+            enabled: When False every lookup misses and nothing is stored
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if enabled:
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def make_key(raw: bytes, input_type: str, country: str, profile_version: str) -> str:
+        """Entry key: SHA-256 of the bytes plus everything the output depends on."""
+        parts = [content_digest(raw), input_type.lower(), country, profile_version, CACHE_FORMAT_VERSION]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+    def health(self) -> Dict:
+        return {"enabled": self.enabled, "hits": self.hits, "misses": self.misses}
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+    def get(self, key: str, raw: bytes, out_path: str) -> Optional[Dict]:
+        """
+        Copy a cached artifact to *out_path* and return its result re-keyed.
+
+        Returns:
+            Dict shaped like PresidioUtility.anonymize_text() output
+            (anonymized_text, mapping, encryption_key, entities_count) with a
+            fresh key, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        entry_dir = os.path.join(self.path, key)
+        meta_path = os.path.join(entry_dir, _META)
+        try:
+            if time.time() - os.stat(meta_path).st_mtime > self.ttl_s:
+                self._remove(entry_dir)
+                self.misses += 1
+                return None
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+            mapping, encryption_key = self._rekey(meta, raw)
+            shutil.copyfile(os.path.join(entry_dir, meta["artifact"]), out_path)
+            os.utime(meta_path)  # LRU: mark as recently used
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            # A corrupt or unreadable entry is dropped and treated as a miss
+            logger.warning(f"Result cache entry {key[:12]} unusable, evicting: {e}")
+            self._remove(entry_dir)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        logger.info(f"Result cache hit {key[:12]} ({len(mapping)} mapped values)")
+        return {
+            "anonymized_text": meta["output_text"],
+            "mapping": mapping,
+            "encryption_key": encryption_key,
+            "entities_count": meta["entities_count"],
+        }
+
+    @staticmethod
+    def _rekey(meta: Dict, raw: bytes):
+        """Decrypt the cached mapping values and re-encrypt them under a new key."""
+        if not meta["mapping"]:
+            return {}, ""
+        old_key = decrypt_value(meta["wrapped_key"], _wrap_key(raw))
+        new_key = os.urandom(16).hex()
+        mapper = ConsistentAnonymizer(crypto_key=new_key)
+        mapping = {}
+        for tag, entry in meta["mapping"].items():
+            value = decrypt_value(entry["encrypted_value"], old_key)
+            mapping[tag] = dict(entry, encrypted_value=mapper.encrypt_value(value))
+        return mapping, new_key
+
+    # ------------------------------------------------------------------
+    # Store
+    # ------------------------------------------------------------------
+    def put(
+        self,
+        key: str,
+        raw: bytes,
+        artifact_path: str,
+        output_text: str,
+        mapping: Dict,
+        encryption_key: str,
+        entities: List,
+    ) -> None:
+        """Store a finished result; failures are logged and ignored."""
+        if not self.enabled:
+            return
+        entry_dir = os.path.join(self.path, key)
+        staging = os.path.join(self.path, f".staging-{uuid.uuid4().hex}")
+        try:
+            os.makedirs(staging)
+            artifact = _ARTIFACT + os.path.splitext(artifact_path)[1]
+            shutil.copyfile(artifact_path, os.path.join(staging, artifact))
+            meta = {
+                "created_at": time.time(),
+                "artifact": artifact,
+                "output_text": output_text,
+                "mapping": mapping,
+                "wrapped_key": (
+                    ConsistentAnonymizer(crypto_key=_wrap_key(raw)).encrypt_value(encryption_key)
+                    if encryption_key else ""
+                ),
+                "entities_count": len(entities),
+                "spans": [[e.entity_type, e.start, e.end, e.score] for e in entities],
+            }
+            with open(os.path.join(staging, _META), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            try:
+                os.rename(staging, entry_dir)
+            except OSError:
+                # Another request stored the same entry first
+                shutil.rmtree(staging, ignore_errors=True)
+                return
+        except Exception as e:
+            shutil.rmtree(staging, ignore_errors=True)
+            logger.warning(f"Result cache store failed for {key[:12]}: {e}")
+            return
+        self._evict()
+
+    # ------------------------------------------------------------------
+    # Eviction
+    # ------------------------------------------------------------------
+    def _evict(self) -> None:
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        with self._lock:
+            now = time.time()
+            entries = []
+            total = 0
+            for name in os.listdir(self.path):
+                if name.startswith("."):
+                    continue
+                entry_dir = os.path.join(self.path, name)
+                try:
+                    meta_stat = os.stat(os.path.join(entry_dir, _META))
+                    size = sum(e.stat().st_size for e in os.scandir(entry_dir))
+                except OSError:
+                    continue
+                if now - meta_stat.st_mtime > self.ttl_s:
+                    self._remove(entry_dir)
+                    continue
+                entries.append((meta_stat.st_mtime, size, entry_dir))
+                total += size
+
+            entries.sort()
+            for _, size, entry_dir in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(entry_dir)
+                total -= size
+
+    @staticmethod
+    def _remove(entry_dir: str) -> None:
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+
+# ============================================================
+# Process-wide instance
+# ============================================================
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Return the process-wide result cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
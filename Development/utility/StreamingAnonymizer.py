@@ -0,0 +1,181 @@
+"""
+Windowed, unit-by-unit PII detection and anonymization.
+
+For documents too large to hold as one text (2,000-page PDFs), the text is
+pushed one unit (a page) at a time. Unit *i* is analyzed once unit *i+1* has
+arrived, over a window reaching ``overlap`` characters into both neighbours,
+and owns the entities starting inside it, exactly like the chunk cores of
+PresidioUtility.create_chunks(). Every unit shares one ConsistentAnonymizer,
+so a value gets the same tag on every page.
+
+Only the current unit, its successor and ``overlap`` characters of the
+predecessor are held; the anonymized text goes to a writer as it is
+produced, so memory is bounded by the window, not the document.
+"""
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+import os
+
+from presidio_analyzer import RecognizerResult
+
+from utility.DocumentModel import Span
+from utility.PresidioUtility import ConsistentAnonymizer, PresidioUtility
+from utility.country_pii_config import DEFAULT_COUNTRY
+
+
+class StreamingAnonymizer:
+    """Anonymize a document pushed unit by unit with a consistent tag mapping."""
+
+    def __init__(
+        self,
+        presidio: PresidioUtility,
+        write: Callable[[str], object],
+        country: str = DEFAULT_COUNTRY,
+        language: str = "en",
+        separator: str = "\n",
+        overlap: Optional[int] = None,
+    ):
+        """
+        Args:
+            presidio: Engine used for detection and anonymization
+            write: Receives the anonymized text, in order, piece by piece
+            country: Country name for country-specific entities
+            language: Language code
+            separator: Text between two non-empty units (as DocumentBuilder)
+            overlap: Context characters taken from each neighbouring unit
+                (default: the engine's chunk overlap)
+        """
+        self.presidio = presidio
+        self.write = write
+        self.country = country
+        self.language = language
+        self.separator = separator
+        self.overlap = presidio.chunk_overlap if overlap is None else overlap
+
+        self.encryption_key = os.urandom(16).hex()
+        self.mapper = ConsistentAnonymizer(crypto_key=self.encryption_key)
+        self.entities_count = 0
+        # Highest-scoring entity per type: all the mapping metadata needs
+        self._best: Dict[str, RecognizerResult] = {}
+
+        self._buffer = ""        # document text from _buffer_start on
+        self._buffer_start = 0
+        self._length = 0         # document text length pushed so far
+        self._emitted = 0        # text up to here is anonymized and written
+        # (index, start, end) of units not yet analyzed: at most two
+        self._units: Deque[Tuple[int, int, int]] = deque()
+        self._unit_spans: Dict[int, List[Span]] = {}
+        self._next_index = 0
+
+    # ------------------------------------------------------------------
+    # Feeding
+    # ------------------------------------------------------------------
+    def push(self, text: str) -> List[Tuple[int, List[Span]]]:
+        """
+        Add the next unit.
+
+        Returns:
+            ``(unit index, spans)`` for every unit whose spans are now final;
+            spans are ``(start, end, tag)`` relative to that unit's text
+        """
+        if text:
+            if self._length and self.separator:
+                self._append(self.separator)
+            start = self._length
+            self._append(text)
+        else:
+            start = self._length
+        self._units.append((self._next_index, start, self._length))
+        self._next_index += 1
+
+        done = []
+        while len(self._units) >= 2:
+            done.append(self._step(own_end=self._units[1][1]))
+        self._trim()
+        return done
+
+    def finish(self) -> List[Tuple[int, List[Span]]]:
+        """Analyze the last unit and write the rest of the text."""
+        done = []
+        while self._units:
+            done.append(self._step(own_end=self._length if len(self._units) == 1 else self._units[1][1]))
+        if self._emitted < self._length:
+            self.write(self._text(self._emitted, self._length))
+            self._emitted = self._length
+        self._buffer = ""
+        self._buffer_start = self._length
+        return done
+
+    def result(self) -> Dict:
+        """Mapping, encryption key and entity count, as anonymize_text() returns them."""
+        if not self.mapper.tag_to_encrypted:
+            return {"mapping": {}, "encryption_key": "", "entities_count": 0}
+        return {
+            "mapping": self.mapper.get_mapping_with_metadata(list(self._best.values())),
+            "encryption_key": self.encryption_key,
+            "entities_count": self.entities_count,
+        }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    def _append(self, text: str) -> None:
+        self._buffer += text
+        self._length += len(text)
+
+    def _text(self, start: int, end: int) -> str:
+        return self._buffer[start - self._buffer_start:end - self._buffer_start]
+
+    def _step(self, own_end: int) -> Tuple[int, List[Span]]:
+        """Analyze the front unit, which owns entities starting in ``[start, own_end)``."""
+        index, start, end = self._units.popleft()
+
+        window_start = max(self._buffer_start, start - self.overlap)
+        window_end = min(self._length, own_end + self.overlap)
+        owned = []
+        if start < own_end:
+            window = self._text(window_start, window_end)
+            for entity in self.presidio.detect_pii(window, self.language, self.country):
+                entity.start += window_start
+                entity.end += window_start
+                # Text before _emitted was already written with an entity
+                # that a previous unit owned
+                if max(start, self._emitted) <= entity.start < own_end:
+                    owned.append(entity)
+
+        # Emit through the end of this unit's last entity, which may reach
+        # into the next unit; the next step then starts after it
+        emit_start = self._emitted
+        emit_end = max(emit_start, own_end, max((e.end for e in owned), default=0))
+        for entity in owned:
+            entity.start -= emit_start
+            entity.end -= emit_start
+            best = self._best.get(entity.entity_type)
+            if best is None or entity.score > best.score:
+                self._best[entity.entity_type] = entity
+        anonymized, spans = self.presidio.anonymize_segment(
+            self.mapper, self._text(emit_start, emit_end), owned
+        )
+        self.write(anonymized)
+        self._emitted = emit_end
+        self.entities_count += len(owned)
+
+        # Hand each span to the unit(s) it covers, in unit-relative offsets
+        units = [(index, start, end)] + list(self._units)
+        for span_start, span_end, tag in spans:
+            span_start += emit_start
+            span_end += emit_start
+            for unit_index, unit_start, unit_end in units:
+                lo, hi = max(span_start, unit_start), min(span_end, unit_end)
+                if hi > lo:
+                    self._unit_spans.setdefault(unit_index, []).append(
+                        (lo - unit_start, hi - unit_start, tag)
+                    )
+        return index, self._unit_spans.pop(index, [])
+
+    def _trim(self) -> None:
+        """Drop text no window will read again."""
+        keep_from = self._units[0][1] - self.overlap if self._units else self._length - self.overlap
+        keep_from = max(self._buffer_start, keep_from)
+        self._buffer = self._buffer[keep_from - self._buffer_start:]
+        self._buffer_start = keep_from
@@ -3,10 +3,13 @@ Tavily Country Search Utility
 Uses Tavily API to detect prospect's country from available information
 """
 from typing import Optional, List
+import httpx
 import requests
 import os
+import threading
 import logging
 from utility.exceptions import PIIException
+from utility.CircuitBreaker import CircuitBreaker
 from utility.models import (
     TavilySearchRequest,
     TavilySearchResponse,
@@ -15,6 +18,15 @@ from utility.models import (
 
 logger = logging.getLogger(__name__)
 
+TAVILY_API_URL = os.getenv("TAVILY_API_URL", "https://api.tavily.com/search")
+# Latency budget per search; past it the caller falls back to DEFAULT_COUNTRY
+TAVILY_TIMEOUT_S = float(os.getenv("TAVILY_TIMEOUT_S", "5"))
+TAVILY_CONNECT_TIMEOUT_S = float(os.getenv("TAVILY_CONNECT_TIMEOUT_S", "2"))
+TAVILY_MAX_CONNECTIONS = int(os.getenv("TAVILY_MAX_CONNECTIONS", "10"))
+# Consecutive failures before searches fail fast, and for how long
+TAVILY_BREAKER_FAILURES = int(os.getenv("TAVILY_BREAKER_FAILURES", "5"))
+TAVILY_BREAKER_RESET_S = float(os.getenv("TAVILY_BREAKER_RESET_S", "30"))
+
 # Supported countries list
 SUPPORTED_COUNTRIES = [
     "Canada",
@@ -43,8 +55,16 @@ class TavilyCountrySearch:
         if not self.api_key:
             raise PIIException("TAVILY_API_KEY not found in environment variables", code=500)
         
-        self.api_url = "https://api.tavily.com/search"
+        self.api_url = TAVILY_API_URL
         self.supported_countries = SUPPORTED_COUNTRIES
+        self.timeout_s = TAVILY_TIMEOUT_S
+        self.breaker = CircuitBreaker(
+            "Tavily",
+            failure_threshold=TAVILY_BREAKER_FAILURES,
+            reset_timeout_s=TAVILY_BREAKER_RESET_S,
+        )
+        self._session: Optional[requests.Session] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
     
     def search_prospect_country(
         self,
@@ -62,34 +82,7 @@ class TavilyCountrySearch:
             CountryDetectionResult with detected country and confidence
         """
         try:
-            # Build search query
-            query = self._build_search_query(prospect_name, additional_context)
-            
-            logger.info(f"Searching country for prospect: {prospect_name}")
-            
-            # Create search request
-            search_request = TavilySearchRequest(
-                query=query,
-                search_depth="basic",
-                max_results=5
-            )
-            
-            # Execute Tavily search
-            search_response = self._execute_tavily_search(search_request)
-            
-            # Extract country from results
-            country_result = self._extract_country_from_results(
-                search_response,
-                prospect_name
-            )
-            
-            logger.info(
-                f"Country detection result for {prospect_name}: "
-                f"{country_result.country} (confidence: {country_result.confidence})"
-            )
-            
-            return country_result
-            
+            return self.lookup_country(prospect_name, additional_context)
         except Exception as e:
             logger.error(f"Error in country search: {str(e)}", exc_info=True)
             # Return result with no country found
@@ -100,6 +93,89 @@ class TavilyCountrySearch:
                 matched_from_list=False
             )
     
+    def lookup_country(
+        self,
+        prospect_name: str,
+        additional_context: Optional[str] = None
+    ) -> CountryDetectionResult:
+        """
+        Same as search_prospect_country() but raises when the search fails,
+        so callers can tell "no country found" from "lookup failed"
+        
+        Args:
+            prospect_name: Name of the prospect/company
+            additional_context: Additional context for better search results
+            
+        Returns:
+            CountryDetectionResult with detected country and confidence
+        """
+        # Build search query
+        query = self._build_search_query(prospect_name, additional_context)
+        
+        logger.info(f"Searching country for prospect: {prospect_name}")
+        
+        # Create search request
+        search_request = TavilySearchRequest(
+            query=query,
+            search_depth="basic",
+            max_results=5
+        )
+        
+        # Execute Tavily search
+        search_response = self._execute_tavily_search(search_request)
+        
+        # Extract country from results
+        country_result = self._extract_country_from_results(
+            search_response,
+            prospect_name
+        )
+        
+        logger.info(
+            f"Country detection result for {prospect_name}: "
+            f"{country_result.country} (confidence: {country_result.confidence})"
+        )
+        
+        return country_result
+    
+    async def lookup_country_async(
+        self,
+        prospect_name: str,
+        additional_context: Optional[str] = None
+    ) -> CountryDetectionResult:
+        """
+        Non-blocking lookup_country() on the pooled async client
+        
+        Args:
+            prospect_name: Name of the prospect/company
+            additional_context: Additional context for better search results
+            
+        Returns:
+            CountryDetectionResult with detected country and confidence
+        """
+        query = self._build_search_query(prospect_name, additional_context)
+        
+        logger.info(f"Searching country for prospect: {prospect_name}")
+        
+        search_request = TavilySearchRequest(
+            query=query,
+            search_depth="basic",
+            max_results=5
+        )
+        
+        search_response = await self._execute_tavily_search_async(search_request)
+        
+        country_result = self._extract_country_from_results(
+            search_response,
+            prospect_name
+        )
+        
+        logger.info(
+            f"Country detection result for {prospect_name}: "
+            f"{country_result.country} (confidence: {country_result.confidence})"
+        )
+        
+        return country_result
+    
     def _build_search_query(
         self,
         prospect_name: str,
@@ -139,7 +215,7 @@ class TavilyCountrySearch:
         search_request: TavilySearchRequest
     ) -> TavilySearchResponse:
         """
-        Execute Tavily API search
+        Execute Tavily API search (blocking, on the shared requests session)
         
         Args:
             search_request: Validated search request
@@ -147,70 +223,146 @@ class TavilyCountrySearch:
         Returns:
             TavilySearchResponse with search results
         """
+        self.breaker.before_call()
         try:
-            logger.info(f"=== TAVILY API REQUEST ===")
-            logger.info(f"Query: {search_request.query}")
-            logger.info(f"Search Depth: {search_request.search_depth}")
-            logger.info(f"Max Results: {search_request.max_results}")
-            
-            headers = {
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "api_key": self.api_key,
-                "query": search_request.query,
-                "search_depth": search_request.search_depth,
-                "max_results": search_request.max_results,
-                "include_answer": True
-            }
-            
-            if search_request.include_domains:
-                payload["include_domains"] = search_request.include_domains
-            
-            if search_request.exclude_domains:
-                payload["exclude_domains"] = search_request.exclude_domains
-            
-            response = requests.post(
+            self._log_request(search_request)
+            response = self._get_session().post(
                 self.api_url,
-                json=payload,
-                headers=headers,
-                timeout=30
+                json=self._build_payload(search_request),
+                headers={"Content-Type": "application/json"},
+                timeout=(TAVILY_CONNECT_TIMEOUT_S, self.timeout_s)
             )
-            
             response.raise_for_status()
-            
-            data = response.json()
-            
-            logger.info(f"=== TAVILY API RESPONSE ===")
-            logger.info(f"Response Status: {response.status_code}")
-            logger.info(f"Answer Provided: {'Yes' if data.get('answer') else 'No'}")
-            if data.get('answer'):
-                logger.info(f"Answer: {data.get('answer')}")
-            logger.info(f"Number of Results: {len(data.get('results', []))}")
-            
-            # Log first few results for debugging
-            for idx, result in enumerate(data.get('results', [])[:3]):
-                logger.info(f"Result {idx+1}:")
-                logger.info(f"  Title: {result.get('title', 'N/A')}")
-                logger.info(f"  URL: {result.get('url', 'N/A')}")
-                logger.info(f"  Content Preview: {result.get('content', 'N/A')[:150]}...")
-            
-            # Validate response with Pydantic
-            return TavilySearchResponse(
-                query=data.get("query", search_request.query),
-                results=data.get("results", []),
-                answer=data.get("answer"),
-                images=data.get("images"),
-                response_time=data.get("response_time")
-            )
-            
+            search_response = self._parse_response(response.json(), response.status_code, search_request)
         except requests.exceptions.RequestException as e:
+            self.breaker.record_failure()
             logger.error(f"Tavily API request failed: {str(e)}")
             raise PIIException(f"Tavily search failed: {str(e)}", code=503)
         except Exception as e:
+            self.breaker.record_failure()
             logger.error(f"Error executing Tavily search: {str(e)}")
             raise PIIException(f"Tavily search error: {str(e)}", code=500)
+        self.breaker.record_success()
+        return search_response
+    
+    async def _execute_tavily_search_async(
+        self,
+        search_request: TavilySearchRequest
+    ) -> TavilySearchResponse:
+        """
+        Execute Tavily API search on the pooled async client
+        
+        Args:
+            search_request: Validated search request
+            
+        Returns:
+            TavilySearchResponse with search results
+        """
+        self.breaker.before_call()
+        try:
+            self._log_request(search_request)
+            response = await self._get_async_client().post(
+                self.api_url,
+                json=self._build_payload(search_request),
+            )
+            response.raise_for_status()
+            search_response = self._parse_response(response.json(), response.status_code, search_request)
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            logger.error(f"Tavily API request failed: {type(e).__name__}: {str(e)}")
+            raise PIIException(f"Tavily search failed: {str(e)}", code=503)
+        except Exception as e:
+            self.breaker.record_failure()
+            logger.error(f"Error executing Tavily search: {str(e)}")
+            raise PIIException(f"Tavily search error: {str(e)}", code=500)
+        self.breaker.record_success()
+        return search_response
+    
+    def _build_payload(self, search_request: TavilySearchRequest) -> dict:
+        """Request body for the Tavily search endpoint"""
+        payload = {
+            "api_key": self.api_key,
+            "query": search_request.query,
+            "search_depth": search_request.search_depth,
+            "max_results": search_request.max_results,
+            "include_answer": True
+        }
+        
+        if search_request.include_domains:
+            payload["include_domains"] = search_request.include_domains
+        
+        if search_request.exclude_domains:
+            payload["exclude_domains"] = search_request.exclude_domains
+        
+        return payload
+    
+    @staticmethod
+    def _log_request(search_request: TavilySearchRequest) -> None:
+        logger.info(f"=== TAVILY API REQUEST ===")
+        logger.info(f"Query: {search_request.query}")
+        logger.info(f"Search Depth: {search_request.search_depth}")
+        logger.info(f"Max Results: {search_request.max_results}")
+    
+    @staticmethod
+    def _parse_response(
+        data: dict,
+        status_code: int,
+        search_request: TavilySearchRequest
+    ) -> TavilySearchResponse:
+        """Log and validate a Tavily response body"""
+        logger.info(f"=== TAVILY API RESPONSE ===")
+        logger.info(f"Response Status: {status_code}")
+        logger.info(f"Answer Provided: {'Yes' if data.get('answer') else 'No'}")
+        if data.get('answer'):
+            logger.info(f"Answer: {data.get('answer')}")
+        logger.info(f"Number of Results: {len(data.get('results', []))}")
+        
+        # Log first few results for debugging
+        for idx, result in enumerate(data.get('results', [])[:3]):
+            logger.info(f"Result {idx+1}:")
+            logger.info(f"  Title: {result.get('title', 'N/A')}")
+            logger.info(f"  URL: {result.get('url', 'N/A')}")
+            logger.info(f"  Content Preview: {result.get('content', 'N/A')[:150]}...")
+        
+        # Validate response with Pydantic
+        return TavilySearchResponse(
+            query=data.get("query", search_request.query),
+            results=data.get("results", []),
+            answer=data.get("answer"),
+            images=data.get("images"),
+            response_time=data.get("response_time")
+        )
+    
+    # ------------------------------------------------------------------
+    # Connection pools
+    # ------------------------------------------------------------------
+    def _get_session(self) -> requests.Session:
+        if self._session is None:
+            self._session = requests.Session()
+        return self._session
+    
+    def _get_async_client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout_s, connect=TAVILY_CONNECT_TIMEOUT_S),
+                limits=httpx.Limits(
+                    max_connections=TAVILY_MAX_CONNECTIONS,
+                    max_keepalive_connections=TAVILY_MAX_CONNECTIONS,
+                    keepalive_expiry=60,
+                ),
+                headers={"Content-Type": "application/json"},
+            )
+        return self._async_client
+    
+    async def aclose(self) -> None:
+        """Close pooled connections (call on application shutdown)"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
     
     def _extract_country_from_results(
         self,
@@ -351,6 +503,29 @@ class TavilyCountrySearch:
         return self.supported_countries.copy()
 
 
+# ============================================================
+# Process-wide instance (shares the connection pools and breaker)
+# ============================================================
+_instance: Optional[TavilyCountrySearch] = None
+_instance_lock = threading.Lock()
+
+
+def get_tavily_country_search() -> TavilyCountrySearch:
+    """Return the process-wide TavilyCountrySearch, creating it on first use."""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = TavilyCountrySearch()
+    return _instance
+
+
+async def close_tavily_country_search() -> None:
+    """Close the process-wide instance's connections, if it was created."""
+    if _instance is not None:
+        await _instance.aclose()
+
+
 # Convenience function for quick country detection
 def detect_prospect_country(
     prospect_name: str,
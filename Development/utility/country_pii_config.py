@@ -10,7 +10,7 @@ Country-Specific: Varies by country (e.g., US_SSN, ZIP_CODE, CA_SIN, etc.)
 Note: Regex patterns and recognition logic are defined in Presidio recognizer classes,
 not in this config file. This file only defines which entities to look for per country.
 """
-from typing import Dict, List
+from typing import Dict, Iterable, List
 
 SUPPORTED_COUNTRIES = [
     "Canada", "Mexico", "United States", "United Kingdom",
@@ -21,6 +21,9 @@ SUPPORTED_COUNTRIES = [
 
 DEFAULT_COUNTRY = "United States"
 
+# Minimum Presidio score for a detection to be kept
+DEFAULT_SCORE_THRESHOLD = 0.4
+
 # ============================================================
 # ENTITY LISTS PER COUNTRY
 # ============================================================
@@ -102,6 +105,15 @@ _COUNTRY_SPECIFIC: Dict[str, List[str]] = {
 }
 
 
+# ============================================================
+# SCORE THRESHOLDS PER COUNTRY
+# ============================================================
+# Per-entity overrides of DEFAULT_SCORE_THRESHOLD, e.g.
+#   "Germany": {"DE_POSTAL_CODE": 0.6}
+# Entities without an override use DEFAULT_SCORE_THRESHOLD.
+_COUNTRY_SCORE_THRESHOLDS: Dict[str, Dict[str, float]] = {}
+
+
 def get_entities_for_country(country: str) -> List[str]:
     """
     Return the full entity list (common + USA + country-specific) for a country.
@@ -137,3 +149,18 @@ def get_entities_for_country(country: str) -> List[str]:
     # Use dict.fromkeys to deduplicate while preserving order
     all_entities = _COMMON_ENTITIES + usa_entities + country_entities
     return list(dict.fromkeys(all_entities))
+
+
+def get_score_thresholds(country: str, entities: Iterable[str]) -> Dict[str, float]:
+    """
+    Return {entity: minimum score} for *entities* in *country*.
+    
+    Args:
+        country: Country name
+        entities: Entities the thresholds are needed for
+        
+    Returns:
+        Threshold per entity (override or DEFAULT_SCORE_THRESHOLD)
+    """
+    overrides = _COUNTRY_SCORE_THRESHOLDS.get(country, {})
+    return {e: overrides.get(e, DEFAULT_SCORE_THRESHOLD) for e in entities}
@@ -7,7 +7,7 @@ import json
 import os
 import sys
 import time
-from typing import List, Dict, Optional, Any
+from typing import Callable, List, Dict, Optional, Any
 from datetime import datetime
 from contextlib import contextmanager
 import logging
@@ -164,6 +164,31 @@ def write_csv_record(csv_path: str, record: Dict[str, Any], headers: List[str])
         return False
 
 
+def write_csv_records(csv_path: str, records: List[Dict[str, Any]], headers: List[str]) -> bool:
+    """
+    Append several records to CSV file in one locked write
+    
+    Args:
+        csv_path: Path to CSV file
+        records: Dictionaries representing the records
+        headers: List of column headers
+        
+    Returns:
+        True if successful, False otherwise
+    """
+    try:
+        ensure_csv_file_exists(csv_path, headers)
+        
+        with open(csv_path, 'a', newline='', encoding='utf-8') as f:
+            with file_lock(f):
+                writer = csv.DictWriter(f, fieldnames=headers, quoting=csv.QUOTE_ALL)
+                writer.writerows(records)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to write CSV records: {e}")
+        return False
+
+
 def find_csv_record(csv_path: str, field: str, value: Any) -> Optional[Dict[str, Any]]:
     """
     Find a record in CSV by field value
@@ -240,6 +265,49 @@ def update_csv_record(csv_path: str, field: str, value: Any, updates: Dict[str,
         return False
 
 
+def modify_csv_records(
+    csv_path: str,
+    modify: Callable[[Dict[str, Any]], bool],
+    headers: List[str]
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Update records in place, read and rewrite under one file lock
+    
+    Unlike update_csv_record, no other writer (thread or process) can get
+    between the read and the rewrite, so *modify* can make a conditional
+    update atomic.
+    
+    Args:
+        csv_path: Path to CSV file
+        modify: Updates a record and returns True, or returns False to leave it
+        headers: List of column headers
+        
+    Returns:
+        The modified records, or None if the file could not be updated
+    """
+    try:
+        ensure_csv_file_exists(csv_path, headers)
+        
+        with open(csv_path, 'r+', newline='', encoding='utf-8') as f:
+            with file_lock(f):
+                records = list(csv.DictReader(f))
+                modified = []
+                for record in records:
+                    if modify(record):
+                        record['modified_at'] = datetime.utcnow().isoformat() + "Z"
+                        modified.append(record)
+                if modified:
+                    f.seek(0)
+                    f.truncate()
+                    writer = csv.DictWriter(f, fieldnames=headers, quoting=csv.QUOTE_ALL)
+                    writer.writeheader()
+                    writer.writerows(records)
+        return modified
+    except Exception as e:
+        logger.error(f"Failed to modify CSV records: {e}")
+        return None
+
+
 def delete_csv_record(csv_path: str, field: str, value: Any, headers: List[str]) -> bool:
     """
     Soft delete a record by setting is_active to False
@@ -0,0 +1,387 @@
+"""
+Native DOCX extraction and masking on the OOXML package.
+
+Every paragraph (body, tables, text boxes, headers, footers, footnotes,
+endnotes and comments) becomes one segment of an ExtractedDocument, located
+by ``(part name, paragraph index)``. Its text is the concatenation of its
+runs' ``w:t`` nodes, with ``w:tab`` as a tab and ``w:br``/``w:cr`` as a
+newline. Masking rebuilds that run-level offset index for the paragraphs
+that hold a span and rewrites only the affected ``w:t`` nodes, so run
+formatting is kept. Names and free text kept outside the paragraphs are
+blanked in every case (see scrub_metadata()): revision and comment authors,
+image alt text, the document properties and the page thumbnail. Other
+package members (styles, media) are copied byte for byte.
+
+Paragraphs are numbered in the order iterparse() ends them, which both
+extraction (streaming, clearing what it has read) and masking use.
+
+Documents whose text is not all in ``w:t`` nodes raise UnsupportedDocument
+so the caller can fall back to the LibreOffice conversion path.
+"""
+from bisect import bisect_right
+from collections import defaultdict
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Sequence, Set, Tuple, Union
+import io
+import posixpath
+import shutil
+import zipfile
+
+from lxml import etree
+
+from utility.DocumentModel import DocumentBuilder, ExtractedDocument, Span, apply_spans
+from utility.LiteralReplacer import LiteralReplacer
+
+_W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+_R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PKG_RELS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+_P = f"{{{_W}}}p"
+_T = f"{{{_W}}}t"
+_TAB = f"{{{_W}}}tab"
+_BR = f"{{{_W}}}br"
+_CR = f"{{{_W}}}cr"
+_HYPERLINK = f"{{{_W}}}hyperlink"
+_INSTR_TEXT = f"{{{_W}}}instrText"
+_FLD_SIMPLE = f"{{{_W}}}fldSimple"
+_INSTR = f"{{{_W}}}instr"
+_R_ID = f"{{{_R}}}id"
+_RELATIONSHIP = f"{{{_PKG_RELS}}}Relationship"
+_CONTENT_TYPES = "[Content_Types].xml"
+_OVERRIDE = "{http://schemas.openxmlformats.org/package/2006/content-types}Override"
+
+_NODE_TEXT = {_TAB: "\t", _BR: "\n", _CR: "\n"}
+# Text a w:t-only reader would miss: tracked deletions and imported content
+_UNSUPPORTED = {f"{{{_W}}}delText": "tracked deletions", f"{{{_W}}}altChunk": "imported content (altChunk)"}
+# Relationship types (suffix) of the main part whose targets hold paragraphs
+_TEXT_PART_TYPES = ("/header", "/footer", "/footnotes", "/endnotes", "/comments")
+
+# Elements and attributes outside the paragraphs that name people or describe
+# the content: document properties (core and app), revision and comment
+# authors (w:ins, w:del, w:comment, ...), the people part, and the alt text
+# of drawings (wp:docPr, pic:cNvPr) and VML shapes
+_DC = "http://purl.org/dc/elements/1.1/"
+_CP = "http://schemas.openxmlformats.org/package/2006/metadata/core-properties"
+_EP = "http://schemas.openxmlformats.org/officeDocument/2006/extended-properties"
+_W15 = "http://schemas.microsoft.com/office/word/2012/wordml"
+_O = "urn:schemas-microsoft-com:office:office"
+_METADATA_TEXT = {
+    f"{{{_DC}}}title", f"{{{_DC}}}subject", f"{{{_DC}}}creator", f"{{{_DC}}}description",
+    f"{{{_CP}}}keywords", f"{{{_CP}}}lastModifiedBy", f"{{{_EP}}}Manager", f"{{{_EP}}}Company",
+}
+_METADATA_ATTRIBUTES = {
+    f"{{{_W}}}author", f"{{{_W}}}initials", f"{{{_W15}}}author", f"{{{_W15}}}userId",
+    "descr", "title", "alt", f"{{{_O}}}title",
+}
+# Package relationship types (suffix) of the property parts, and of the thumbnail
+_PROPERTY_PART_TYPES = ("/core-properties", "/extended-properties")
+_THUMBNAIL_TYPE = "/metadata/thumbnail"
+
+
+class UnsupportedDocument(Exception):
+    """The DOCX cannot be masked natively; convert it instead."""
+
+
+class ParagraphLocation(NamedTuple):
+    part: str
+    paragraph: int
+
+
+# ============================================================
+# Package structure
+# ============================================================
+def text_parts(archive: zipfile.ZipFile) -> List[str]:
+    """Names of the parts holding paragraphs: the main document first, then the rest sorted."""
+    try:
+        main = _relationship_targets(archive, "_rels/.rels", "", ("/officeDocument",))[0]
+        archive.getinfo(main)
+    except (KeyError, IndexError):
+        raise UnsupportedDocument("No main document part")
+    folder, name = posixpath.split(main)
+    rels = posixpath.join(folder, "_rels", f"{name}.rels")
+    others = _relationship_targets(archive, rels, folder, _TEXT_PART_TYPES) if rels in archive.namelist() else []
+    return [main] + sorted(p for p in set(others) if p in archive.namelist())
+
+
+def _relationship_targets(archive: zipfile.ZipFile, rels: str, folder: str, types: Sequence[str]) -> List[str]:
+    root = etree.fromstring(archive.read(rels))
+    targets = []
+    for rel in root.iter(_RELATIONSHIP):
+        if rel.get("TargetMode") == "External" or not rel.get("Type", "").endswith(types):
+            continue
+        target = rel.get("Target", "")
+        path = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(folder, target))
+        targets.append(path)
+    return targets
+
+
+def _part_rels(part: str) -> str:
+    folder, name = posixpath.split(part)
+    return posixpath.join(folder, "_rels", f"{name}.rels")
+
+
+# ============================================================
+# Paragraphs
+# ============================================================
+def iter_paragraphs(source: BinaryIO, stream: bool = True) -> Iterator[Tuple[int, etree._Element]]:
+    """
+    Yield ``(index, w:p element)`` for every paragraph of a part, innermost first.
+
+    With *stream* the tree is discarded as it is read (extraction); without
+    it the elements stay attached, so they can be modified and the whole
+    part serialized from ``element.getroottree()`` afterwards.
+    """
+    index = 0
+    for event, element in etree.iterparse(source, events=("end",)):
+        if element.tag in _UNSUPPORTED:
+            raise UnsupportedDocument(f"Document contains {_UNSUPPORTED[element.tag]}")
+        if element.tag != _P:
+            continue
+        yield index, element
+        index += 1
+        if stream:
+            # Text of this paragraph is read: keep only the (empty) element,
+            # so an enclosing paragraph does not see a text box's text again
+            element.clear(keep_tail=True)
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+
+def text_nodes(paragraph: etree._Element) -> Iterator[etree._Element]:
+    """The w:t/w:tab/w:br/w:cr nodes of *paragraph*, skipping nested paragraphs (text boxes)."""
+    for child in paragraph:
+        tag = child.tag
+        if tag == _T or tag in _NODE_TEXT:
+            yield child
+        elif tag != _P and len(child):
+            yield from text_nodes(child)
+
+
+def node_text(node: etree._Element) -> str:
+    return (node.text or "") if node.tag == _T else _NODE_TEXT[node.tag]
+
+
+def paragraph_text(paragraph: etree._Element) -> str:
+    return "".join(node_text(node) for node in text_nodes(paragraph))
+
+
+# ============================================================
+# Extraction
+# ============================================================
+def extract_docx(data: Union[bytes, str]) -> ExtractedDocument:
+    """
+    One segment per non-blank paragraph, joined by newlines.
+
+    Raises:
+        UnsupportedDocument: Not a DOCX package, or text outside w:t nodes
+    """
+    builder = DocumentBuilder(separator="\n")
+    with _open(data) as archive:
+        for part in text_parts(archive):
+            with archive.open(part) as stream:
+                for index, paragraph in _paragraphs(stream, keep=False):
+                    text = paragraph_text(paragraph)
+                    if text.strip():
+                        builder.add(text, ParagraphLocation(part, index))
+    return builder.build()
+
+
+# ============================================================
+# Masking
+# ============================================================
+def mask_docx(data: Union[bytes, str], extracted: ExtractedDocument, spans: Sequence[Span], out_path: str) -> int:
+    """
+    Write *data* to *out_path* with every span replaced by its tag.
+
+    Returns:
+        Number of paragraphs rewritten
+    """
+    by_part: Dict[str, Dict[int, Tuple[str, List[Span]]]] = defaultdict(dict)
+    for index, paragraph_spans in extracted.segment_spans(spans):
+        location = extracted.locations[index]
+        by_part[location.part][location.paragraph] = (extracted.segment_text(index), paragraph_spans)
+
+    rewritten: Dict[str, bytes] = {}
+    unlinked: Dict[str, Set[str]] = {}
+    count = 0
+    with _open(data) as archive:
+        for part, paragraphs in by_part.items():
+            root = None
+            removed_ids: Set[str] = set()
+            with archive.open(part) as stream:
+                for index, paragraph in _paragraphs(stream, keep=True):
+                    root = paragraph
+                    if index in paragraphs:
+                        text, paragraph_spans = paragraphs[index]
+                        removed_ids |= mask_paragraph(paragraph, text, paragraph_spans)
+                        count += 1
+            if root is not None:
+                scrub_metadata(root)
+                rewritten[part] = etree.tostring(
+                    root.getroottree(), xml_declaration=True, encoding="UTF-8", standalone=True
+                )
+            if removed_ids:
+                unlinked[_part_rels(part)] = removed_ids
+
+        for rels, ids in unlinked.items():
+            if rels in archive.namelist():
+                root = etree.fromstring(archive.read(rels))
+                for rel in list(root.iter(_RELATIONSHIP)):
+                    if rel.get("Id") in ids:
+                        root.remove(rel)
+                rewritten[rels] = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+        dropped = _scrub_package(archive, rewritten)
+        with zipfile.ZipFile(out_path, "w", zipfile.ZIP_DEFLATED) as out:
+            for info in archive.infolist():
+                if info.filename in dropped:
+                    continue
+                if info.filename in rewritten:
+                    out.writestr(info, rewritten[info.filename])
+                else:
+                    with archive.open(info) as src, out.open(info, "w") as dst:
+                        shutil.copyfileobj(src, dst, 1024 * 1024)
+    return count
+
+
+def mask_paragraph(paragraph: etree._Element, text: str, spans: Sequence[Span]) -> Set[str]:
+    """
+    Replace *spans* (offsets into the paragraph's text) in its runs.
+
+    The tag goes into the first ``w:t`` the span touches and the rest of
+    the value is cut from the following ones; tabs and breaks inside a
+    value are dropped. Hyperlinks around masked text lose their target and
+    field instructions have the values replaced, since both usually repeat
+    the value (``mailto:``).
+
+    Returns:
+        Relationship ids of the hyperlinks unlinked, to drop from the part's rels
+    """
+    nodes = list(text_nodes(paragraph))
+    starts = []
+    position = 0
+    for node in nodes:
+        starts.append(position)
+        position += len(node_text(node))
+
+    edits: Dict[int, List[Span]] = defaultdict(list)
+    for start, end, tag in spans:
+        placed = False
+        i = max(0, bisect_right(starts, start) - 1)
+        while i < len(nodes) and starts[i] < end:
+            node_start = starts[i]
+            lo = max(start, node_start) - node_start
+            hi = min(end, node_start + len(node_text(nodes[i]))) - node_start
+            if hi > lo:
+                if nodes[i].tag == _T:
+                    edits[i].append((lo, hi, "" if placed else tag))
+                    placed = True
+                else:
+                    edits[i].append((0, hi, ""))
+            i += 1
+
+    removed_ids: Set[str] = set()
+    for i, node_edits in edits.items():
+        node = nodes[i]
+        if node.tag != _T:
+            node.getparent().remove(node)
+            continue
+        node.text = apply_spans(node.text or "", node_edits)
+        node.set(_XML_SPACE, "preserve")
+        for ancestor in node.iterancestors(_HYPERLINK, _P):
+            if ancestor.tag == _P:
+                break
+            if ancestor.get(_R_ID):
+                removed_ids.add(ancestor.attrib.pop(_R_ID))
+
+    instrs = list(paragraph.iter(_INSTR_TEXT))
+    fields = [field for field in paragraph.iter(_FLD_SIMPLE) if field.get(_INSTR)]
+    if instrs or fields:
+        values = LiteralReplacer({text[start:end]: tag for start, end, tag in spans if text[start:end].strip()})
+        for instr in instrs:
+            instr.text = values.replace(instr.text or "")
+        for field in fields:
+            field.set(_INSTR, values.replace(field.get(_INSTR)))
+    return removed_ids
+
+
+# ============================================================
+# Metadata
+# ============================================================
+def scrub_metadata(root: etree._Element) -> bool:
+    """
+    Blank the names and free text of a part that are not paragraph text.
+
+    Returns:
+        True if anything was blanked
+    """
+    changed = False
+    for element in root.iter(etree.Element):
+        if element.tag in _METADATA_TEXT and element.text:
+            element.text = None
+            changed = True
+        for name in _METADATA_ATTRIBUTES.intersection(element.attrib):
+            if element.get(name):
+                element.set(name, "")
+                changed = True
+    return changed
+
+
+def _scrub_package(archive: zipfile.ZipFile, rewritten: Dict[str, bytes]) -> Set[str]:
+    """
+    Scrub the parts mask_docx() has not rewritten into *rewritten*.
+
+    Returns:
+        Parts to leave out of the masked package: the thumbnail, an image
+        of the first page, along with its relationship and content type
+    """
+    names = set(archive.namelist())
+    parts = text_parts(archive) + _relationship_targets(archive, "_rels/.rels", "", _PROPERTY_PART_TYPES)
+    main_rels = _part_rels(parts[0])
+    if main_rels in names:
+        parts += _relationship_targets(archive, main_rels, posixpath.dirname(parts[0]), ("/people",))
+    for part in parts:
+        if part in rewritten or part not in names:
+            continue
+        root = _parse(archive, part)
+        if scrub_metadata(root):
+            rewritten[part] = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+    thumbnails = {p for p in _relationship_targets(archive, "_rels/.rels", "", (_THUMBNAIL_TYPE,)) if p in names}
+    if thumbnails:
+        for member, tag, key, matches in (
+            ("_rels/.rels", _RELATIONSHIP, "Type", lambda value: value.endswith(_THUMBNAIL_TYPE)),
+            (_CONTENT_TYPES, _OVERRIDE, "PartName", lambda value: value.lstrip("/") in thumbnails),
+        ):
+            root = _parse(archive, member)
+            for element in list(root.iter(tag)):
+                if matches(element.get(key, "")):
+                    root.remove(element)
+            rewritten[member] = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+    return thumbnails
+
+
+# ============================================================
+# Helpers
+# ============================================================
+def _open(data: Union[bytes, str]) -> zipfile.ZipFile:
+    try:
+        return zipfile.ZipFile(io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data)
+    except zipfile.BadZipFile:
+        raise UnsupportedDocument("Not a DOCX (zip) package")
+
+
+def _parse(archive: zipfile.ZipFile, part: str) -> etree._Element:
+    try:
+        return etree.fromstring(archive.read(part))
+    except etree.XMLSyntaxError as e:
+        raise UnsupportedDocument(f"Malformed part: {e}")
+
+
+def _paragraphs(source: BinaryIO, keep: bool) -> Iterator[Tuple[int, etree._Element]]:
+    try:
+        yield from iter_paragraphs(source, stream=not keep)
+    except etree.XMLSyntaxError as e:
+        raise UnsupportedDocument(f"Malformed part: {e}")
@@ -62,3 +62,9 @@ class PayloadTooLargeException(PIIException):
     """Exception when file size exceeds limit"""
     def __init__(self, message: str = "File size exceeds maximum allowed limit"):
         super().__init__(message, code=413)
+
+
+class JobNotFoundException(PIIException):
+    """Exception when a job id is unknown"""
+    def __init__(self, message: str = "Job not found"):
+        super().__init__(message, code=404)
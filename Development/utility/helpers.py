@@ -5,3 +5,13 @@ import uuid
 def generate_request_id() -> str:
     """Generate a unique request ID."""
     return f"req_{uuid.uuid4().hex[:24]}"
+
+
+def generate_job_id() -> str:
+    """Generate a unique job ID."""
+    return f"job_{uuid.uuid4().hex[:24]}"
+
+
+def generate_batch_id() -> str:
+    """Generate a unique batch ID."""
+    return f"batch_{uuid.uuid4().hex[:24]}"
@@ -0,0 +1,133 @@
+"""
+Incremental JSON / NDJSON tokenizer for masking documents too large to load.
+
+iter_tokens() reads a text stream block by block and yields the document
+back as a sequence of tokens: string values (decoded, with their key path)
+and everything else as raw text. Concatenating the raw text of every token,
+with each string value's original ``raw`` in its place, reproduces the input
+exactly, so a masker only re-encodes the strings it changes and the output
+keeps the input's layout. Any number of top-level values may follow each
+other (NDJSON / JSON Lines, or concatenated JSON).
+
+Memory is bounded by the block size, the longest single token and the
+nesting depth, not by the document size.
+"""
+from typing import Iterator, List, NamedTuple, Optional, TextIO, Tuple, Union
+import json
+import re
+
+PathKey = Union[str, int]
+
+# One token at a time; strings in the unrolled-loop form
+_TOKEN = re.compile(
+    r'(?P<ws>[ \t\r\n]+)'
+    r'|(?P<string>"[^"\\]*(?:\\.[^"\\]*)*")'
+    r'|(?P<punct>[{}\[\]:,])'
+    r'|(?P<literal>[^ \t\r\n{}\[\]:,"]+)'
+)
+_LITERAL = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null')
+_BLOCK_CHARS = 1024 * 1024
+
+
+class JSONStreamError(ValueError):
+    """The stream is not valid JSON (or NDJSON)."""
+
+
+class Token(NamedTuple):
+    raw: str
+    # Decoded value of a string leaf; None for everything else (keys included)
+    value: Optional[str] = None
+    path: Tuple[PathKey, ...] = ()
+
+
+class _Frame:
+    __slots__ = ("is_object", "key", "expects_key")
+
+    def __init__(self, is_object: bool):
+        self.is_object = is_object
+        self.key: PathKey = None if is_object else 0
+        self.expects_key = is_object
+
+
+def iter_tokens(stream: TextIO, block_chars: int = _BLOCK_CHARS) -> Iterator[Token]:
+    """
+    Yield the tokens of the JSON values in *stream*, in order.
+
+    Raises:
+        JSONStreamError: Malformed JSON
+    """
+    stack: List[_Frame] = []
+    buffer = ""
+    pos = 0
+    eof = False
+    while True:
+        match = _TOKEN.match(buffer, pos)
+        # A token touching the end of the buffer may continue in the next block
+        if (match is None or match.end() == len(buffer)) and not eof:
+            block = stream.read(block_chars)
+            eof = not block
+            buffer = buffer[pos:] + block
+            pos = 0
+            continue
+        if match is None:
+            if pos < len(buffer):
+                raise JSONStreamError(f"Unexpected input: {buffer[pos:pos + 20]!r}")
+            break
+        pos = match.end()
+        kind = match.lastgroup
+        raw = match.group()
+
+        if kind == "ws":
+            yield Token(raw)
+        elif kind == "string":
+            decoded = _decode(raw)
+            top = stack[-1] if stack else None
+            if top is not None and top.expects_key:
+                top.key = decoded
+                top.expects_key = False
+                yield Token(raw)
+            else:
+                yield Token(raw, decoded, tuple(frame.key for frame in stack))
+        elif kind == "literal":
+            if not _LITERAL.fullmatch(raw):
+                raise JSONStreamError(f"Unexpected literal: {raw[:20]!r}")
+            yield Token(raw)
+        else:
+            if raw in "{[":
+                stack.append(_Frame(raw == "{"))
+            elif raw in "}]":
+                if not stack or stack[-1].is_object != (raw == "}"):
+                    raise JSONStreamError(f"Unbalanced {raw!r}")
+                stack.pop()
+            elif raw == ",":
+                if not stack:
+                    raise JSONStreamError("Unexpected ','")
+                if stack[-1].is_object:
+                    stack[-1].expects_key = True
+                else:
+                    stack[-1].key += 1
+            yield Token(raw)
+    if stack:
+        raise JSONStreamError("Unexpected end of input")
+
+
+def path_context(path: Tuple[PathKey, ...], depth: int = 2) -> List[str]:
+    """Context words of a leaf: the words of its last *depth* keys ("billing.emailAddress" -> billing, email, address)."""
+    keys = [key for key in path if isinstance(key, str)][-depth:]
+    words: List[str] = []
+    for key in keys:
+        key = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", key)
+        words.extend(w for w in re.split(r"[\W_]+", key.lower()) if w)
+    return words
+
+
+def encode(value: str) -> str:
+    """A string as a JSON token."""
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _decode(raw: str) -> str:
+    try:
+        return json.loads(raw)
+    except ValueError as e:
+        raise JSONStreamError(f"Invalid string {raw[:20]!r}: {e}")
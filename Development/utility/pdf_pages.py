@@ -0,0 +1,149 @@
+"""
+Page-level PDF operations shared by the sequential and the page-parallel paths.
+
+Everything here works on a page range of an open document and only needs
+PyMuPDF, so PDFPagePool workers can import it without loading the service
+layer. Running the same functions over the whole document or over shards is
+what keeps both paths' extraction identical.
+"""
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+# Ligatures are expanded so NER sees "fi", not U+FB01 (each part keeps a bbox)
+_RAWDICT_FLAGS = (fitz.TEXTFLAGS_RAWDICT & ~fitz.TEXT_PRESERVE_LIGATURES) if fitz else 0
+
+Rect = Tuple[float, float, float, float]
+# page number -> [(rect, tag), ...]
+RedactionPlan = Dict[int, List[Tuple[Rect, str]]]
+# [(page number, [(line text, character bboxes), ...]), ...]
+PageLines = List[Tuple[int, List[Tuple[str, array]]]]
+
+# Fixed save options: no timestamps or random /ID, so equal input gives equal bytes
+SAVE_OPTIONS = dict(garbage=3, deflate=True, no_new_id=True)
+
+
+# ============================================================
+# Page geometry
+# ============================================================
+def extract_page_lines(page) -> Iterator[Tuple[str, array]]:
+    """Yield ``(line text, character bboxes)`` for every non-blank text line of *page*."""
+    for block in page.get_text("rawdict", flags=_RAWDICT_FLAGS)["blocks"]:
+        if block.get("type", 0) != 0:
+            continue  # image block
+        for line in block["lines"]:
+            chars = [char for span in line["spans"] for char in span["chars"]]
+            text = "".join(char["c"] for char in chars)
+            if not text.strip():
+                continue
+            bboxes = array("f")
+            for char in chars:
+                bboxes.extend(char["bbox"])
+            yield text, bboxes
+
+
+def span_rect(line_text: str, bboxes: array, start: int, end: int) -> Optional[Rect]:
+    """Union of the boxes of characters ``[start, end)``, ignoring edge whitespace."""
+    while start < end and line_text[start].isspace():
+        start += 1
+    while end > start and line_text[end - 1].isspace():
+        end -= 1
+    if start >= end:
+        return None
+    x0 = min(bboxes[4 * i] for i in range(start, end))
+    y0 = min(bboxes[4 * i + 1] for i in range(start, end))
+    x1 = max(bboxes[4 * i + 2] for i in range(start, end))
+    y1 = max(bboxes[4 * i + 3] for i in range(start, end))
+    return x0, y0, x1, y1
+
+
+# ============================================================
+# Page ranges
+# ============================================================
+def extract_pages(doc, first: int, stop: int) -> PageLines:
+    """Text lines with their geometry for pages ``[first, stop)`` of *doc*."""
+    return [(page_num, list(extract_page_lines(doc[page_num]))) for page_num in range(first, stop)]
+
+
+def plan_redactions(extracted, spans: Sequence) -> RedactionPlan:
+    """
+    Turn anonymize_text() spans into redaction rectangles grouped by page.
+
+    *extracted* is the ExtractedDocument built from extract_pages(): each
+    segment is a line located by ``(page number, character bboxes)``.
+    """
+    plan: RedactionPlan = {}
+    for index, line_spans in extracted.segment_spans(spans):
+        page_num, bboxes = extracted.locations[index]
+        line_text = extracted.segment_text(index)
+        for start, end, tag in line_spans:
+            rect = span_rect(line_text, bboxes, start, end)
+            if rect is not None:
+                plan.setdefault(page_num, []).append((rect, tag))
+    return plan
+
+
+def redact_pages(doc, plan: RedactionPlan) -> int:
+    """Apply *plan* to *doc*, one apply_redactions() per page; returns the count."""
+    redactions = 0
+    for page_num in sorted(plan):
+        page = doc[page_num]
+        for rect, tag in plan[page_num]:
+            # Add redaction annotation with the tag as replacement text
+            page.add_redact_annot(
+                fitz.Rect(rect),
+                text=tag,
+                fill=(1, 1, 1),  # White background
+                text_color=(0, 0, 0)  # Black text
+            )
+            redactions += 1
+        page.apply_redactions()
+    return redactions
+
+
+def save_range(doc, first: int, stop: int, out=None) -> Optional[bytes]:
+    """
+    Keep only pages ``[first, stop)`` of *doc* and save them to the path
+    *out*, or return them as bytes. Destructive: *doc* must not be used after.
+    """
+    doc.select(list(range(first, stop)))
+    if out is None:
+        return doc.tobytes(**SAVE_OPTIONS)
+    doc.save(out, **SAVE_OPTIONS)
+    return None
+
+
+def merge_ranges(original_path: str, parts: Iterable[Union[str, bytes]], out_path: str) -> None:
+    """
+    Concatenate page-range PDFs (paths or bytes, in page order) into *out_path*.
+
+    Document-level metadata and the outline are copied from the original,
+    which insert_pdf() does not carry over.
+    """
+    with fitz.open(original_path) as original, fitz.open() as merged:
+        for part in parts:
+            opened = fitz.open(part) if isinstance(part, str) else fitz.open(stream=part, filetype="pdf")
+            with opened:
+                merged.insert_pdf(opened)
+        merged.set_metadata(original.metadata)
+        toc = original.get_toc(simple=False)
+        if toc:
+            merged.set_toc(toc)
+        merged.save(out_path, **SAVE_OPTIONS)
+
+
+def shard_ranges(page_count: int, shards: int) -> List[Tuple[int, int]]:
+    """Split ``[0, page_count)`` into *shards* contiguous, near-equal ranges."""
+    shards = max(1, min(shards, page_count))
+    size, extra = divmod(page_count, shards)
+    ranges = []
+    first = 0
+    for i in range(shards):
+        stop = first + size + (1 if i < extra else 0)
+        ranges.append((first, stop))
+        first = stop
+    return ranges
@@ -0,0 +1,172 @@
+"""
+Span and chunk helpers for PII detection.
+
+Pure functions (no Presidio imports) so they can run in the API process while
+the chunks themselves are analyzed in worker processes. Entities only need
+``entity_type``, ``start``, ``end`` and ``score`` attributes.
+"""
+from typing import Dict, List, Tuple
+import re
+
+# Boundary patterns, most preferred first. A chunk boundary is placed at the
+# end of the last match inside the search window.
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t\r\f\v]*\n\s*")
+_SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s+")
+_WHITESPACE = re.compile(r"\s+")
+_BOUNDARY_PATTERNS = (_PARAGRAPH_BREAK, _SENTENCE_END, _WHITESPACE)
+
+
+def snap_boundary(text: str, lo: int, hi: int) -> int:
+    """
+    Return a split position in ``(lo, hi]`` that does not cut through a word.
+
+    Prefers a paragraph break, then a sentence end, then any whitespace.
+    Falls back to *hi* when the window has none of them.
+    """
+    if hi >= len(text):
+        return len(text)
+    window = text[lo:hi]
+    for pattern in _BOUNDARY_PATTERNS:
+        last = None
+        for last in pattern.finditer(window):
+            pass
+        if last is not None and last.end() > 0:
+            return lo + last.end()
+    return hi
+
+
+def _context_start(text: str, core_start: int, overlap: int) -> int:
+    """Start of the leading context: *overlap* chars back, moved to a word start."""
+    pos = max(0, core_start - overlap)
+    if pos == 0:
+        return 0
+    match = _WHITESPACE.search(text, pos, core_start)
+    return match.end() if match else core_start
+
+
+def _context_end(text: str, core_end: int, overlap: int) -> int:
+    """End of the trailing context: *overlap* chars on, moved back to a word end."""
+    pos = min(len(text), core_end + overlap)
+    if pos == len(text):
+        return pos
+    last = None
+    for last in _WHITESPACE.finditer(text, core_end, pos):
+        pass
+    return last.start() if last and last.start() > core_end else pos
+
+
+def create_chunks(text: str, chunk_size: int, chunk_overlap: int) -> List[Dict]:
+    """
+    Split *text* into chunks of at most *chunk_size* characters.
+
+    Each chunk owns a *core* region ``[core_start, core_end)`` whose ends sit
+    on paragraph/sentence boundaries; cores tile the text exactly. Around the
+    core the chunk carries up to *chunk_overlap* characters of context on both
+    sides, so entities starting in the core are seen whole and with their
+    surrounding words. Only entities starting inside the core are kept for a
+    chunk (see ``owns_entity``), which makes the merged result match a
+    single-pass analysis for entities shorter than the overlap.
+
+    Returns:
+        List of dicts with chunk_number, text, start_offset, end_offset,
+        length, core_start and core_end (all offsets into *text*)
+    """
+    text_length = len(text)
+    overlap = max(0, min(chunk_overlap, chunk_size // 4))
+    core_size = max(1, chunk_size - 2 * overlap)
+
+    chunks: List[Dict] = []
+    core_start = 0
+    while core_start < text_length:
+        target = core_start + core_size
+        if target >= text_length:
+            core_end = text_length
+        else:
+            # Search the last quarter of the core for a clean split point
+            core_end = snap_boundary(text, core_start + (3 * core_size) // 4, target)
+
+        start = _context_start(text, core_start, overlap)
+        end = _context_end(text, core_end, overlap)
+
+        chunks.append({
+            "chunk_number": len(chunks) + 1,
+            "text": text[start:end],
+            "start_offset": start,
+            "end_offset": end,
+            "length": end - start,
+            "core_start": core_start,
+            "core_end": core_end,
+        })
+        core_start = core_end
+
+    return chunks
+
+
+def owns_entity(chunk: Dict, absolute_start: int) -> bool:
+    """True if an entity starting at *absolute_start* belongs to *chunk*."""
+    return chunk["core_start"] <= absolute_start < chunk["core_end"]
+
+
+def merge_duplicate_spans(entities: List) -> List:
+    """
+    Exact interval merge: keep one entity per (entity_type, start, end).
+
+    When the same span is reported more than once the highest score wins.
+    The result is ordered by (start, end, entity_type).
+    """
+    best: Dict[tuple, object] = {}
+    for entity in entities:
+        key = (entity.entity_type, entity.start, entity.end)
+        current = best.get(key)
+        if current is None or entity.score > current.score:
+            best[key] = entity
+    return [best[key] for key in sorted(best, key=lambda k: (k[1], k[2], k[0]))]
+
+
+def resolve_overlaps(entities: List) -> List:
+    """
+    Resolve overlapping entities; on overlap the highest score wins.
+
+    Sweep line over entities sorted by (start, end, -score). Because the kept
+    spans never overlap and arrive in start order, a new entity can only
+    overlap the most recently kept one, so each step is O(1) and the whole
+    pass is O(n log n) for the sort. On equal scores the earlier span stays.
+
+    Returns:
+        Non-overlapping entities ordered by start
+    """
+    if not entities:
+        return []
+
+    resolved: List = []
+    for entity in sorted(entities, key=lambda x: (x.start, x.end, -x.score)):
+        if resolved:
+            last = resolved[-1]
+            if entity.start < last.end and entity.end > last.start:
+                if entity.score > last.score:
+                    resolved[-1] = entity
+                continue
+        resolved.append(entity)
+    return resolved
+
+
+def original_spans(replacements: List[Tuple[int, int, str]], tag_to_value: Dict[str, str]) -> List[Tuple[int, int, str]]:
+    """
+    Map replacements made in an anonymized text back to original offsets.
+
+    *replacements* are ``(start, end, tag)`` positions in the anonymized
+    text (Presidio's normalized OperatorResult items); *tag_to_value* gives
+    the original value behind each tag, so the text between replacements is
+    unchanged and each replaced value's length is known. One linear pass.
+
+    Returns:
+        ``(start, end, tag)`` spans in the original text, ordered by start
+    """
+    spans: List[Tuple[int, int, str]] = []
+    shift = 0  # original offset minus anonymized offset
+    for start, end, tag in sorted(replacements):
+        length = len(tag_to_value[tag])
+        original_start = start + shift
+        spans.append((original_start, original_start + length, tag))
+        shift += length - (end - start)
+    return spans
@@ -17,6 +17,7 @@ CSV_DATA_PATH = os.getenv("CSV_DATA_PATH", _default_csv_path)
 
 # CSV file names
 PII_RECORDS_CSV = "pii_records.csv"
+PII_JOBS_CSV = "pii_jobs.csv"
 
 
 def get_storage_mode() -> str:
@@ -49,6 +50,16 @@ def get_pii_csv_path() -> str:
     return os.path.join(CSV_DATA_PATH, PII_RECORDS_CSV)
 
 
+def get_jobs_csv_path() -> str:
+    """
+    Get full path to PII jobs CSV file
+    
+    Returns:
+        Full path to pii_jobs.csv
+    """
+    return os.path.join(CSV_DATA_PATH, PII_JOBS_CSV)
+
+
 def is_csv_mode() -> bool:
     """
     Check if running in CSV storage mode
@@ -101,3 +112,29 @@ PII_RECORDS_HEADERS = [
     "modified_by",
     "is_active"
 ]
+
+
+# CSV Headers for pii_jobs.csv
+PII_JOBS_HEADERS = [
+    "job_id",
+    "status",
+    "assessment_id",
+    "prospect_id",
+    "caller_name",
+    "input_type",
+    "filename",
+    "source_path",
+    "company_name",
+    "company_website",
+    "callback_url",
+    "request_id",
+    "result",
+    "error",
+    "owner",
+    "lease_expires_at",
+    "created_at",
+    "created_by",
+    "modified_at",
+    "modified_by",
+    "is_active"
+]